@@ -288,6 +288,8 @@ class CloudController(object):
         enabled_services = db.service_get_all(context, False)
         enabled_services = availability_zones.set_availability_zones(context,
                 enabled_services)
+        alive_services = self.servicegroup_api.services_are_up(
+            enabled_services)
         zone_hosts = {}
         host_services = {}
         for service in enabled_services:
@@ -310,7 +312,7 @@ class CloudController(object):
                                'zoneState': ''})
 
                 for service in host_services[zone + host]:
-                    alive = self.servicegroup_api.service_is_up(service)
+                    alive = alive_services[service['id']]
                     art = (alive and ":-)") or "XXX"
                     active = 'enabled'
                     if service['disabled']:
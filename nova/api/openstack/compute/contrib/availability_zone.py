@@ -108,6 +108,8 @@ class AvailabilityZoneController(wsgi.Controller):
         enabled_services = db.service_get_all(context, False)
         enabled_services = availability_zones.set_availability_zones(context,
                 enabled_services)
+        alive_services = self.servicegroup_api.services_are_up(
+            enabled_services)
         zone_hosts = {}
         host_services = {}
         for service in enabled_services:
@@ -127,7 +129,7 @@ class AvailabilityZoneController(wsgi.Controller):
             for host in zone_hosts[zone]:
                 hosts[host] = {}
                 for service in host_services[zone + host]:
-                    alive = self.servicegroup_api.service_is_up(service)
+                    alive = alive_services[service['id']]
                     hosts[host][service['binary']] = {'available': alive,
                                       'active': True != service['disabled'],
                                       'updated_at': service['updated_at']}
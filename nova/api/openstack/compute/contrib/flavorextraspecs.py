@@ -22,6 +22,7 @@ from webob import exc
 from nova.api.openstack import extensions
 from nova.api.openstack import wsgi
 from nova.api.openstack import xmlutil
+from nova.compute import flavors
 from nova import db
 from nova import exception
 
@@ -74,6 +75,7 @@ class FlavorExtraSpecsController(object):
                                                               specs)
         except exception.MetadataLimitExceeded as error:
             raise exc.HTTPBadRequest(explanation=error.format_message())
+        flavors.invalidate_cache()
         return body
 
     @wsgi.serializers(xml=ExtraSpecTemplate)
@@ -93,6 +95,7 @@ class FlavorExtraSpecsController(object):
                                                                body)
         except exception.MetadataLimitExceeded as error:
             raise exc.HTTPBadRequest(explanation=error.format_message())
+        flavors.invalidate_cache()
         return body
 
     @wsgi.serializers(xml=ExtraSpecTemplate)
@@ -112,6 +115,7 @@ class FlavorExtraSpecsController(object):
         context = req.environ['nova.context']
         authorize(context, action='delete')
         db.instance_type_extra_specs_delete(context, flavor_id, id)
+        flavors.invalidate_cache()
 
 
 class Flavorextraspecs(extensions.ExtensionDescriptor):
@@ -97,8 +97,7 @@ class ServiceController(object):
 
         return services
 
-    def _get_service_detail(self, svc, detailed):
-        alive = self.servicegroup_api.service_is_up(svc)
+    def _get_service_detail(self, svc, alive, detailed):
         state = (alive and "up") or "down"
         active = 'enabled'
         if svc['disabled']:
@@ -114,9 +113,11 @@ class ServiceController(object):
 
     def _get_services_list(self, req, detailed):
         services = self._get_services(req)
+        alive = self.servicegroup_api.services_are_up(services)
         svcs = []
         for svc in services:
-            svcs.append(self._get_service_detail(svc, detailed))
+            svcs.append(self._get_service_detail(svc, alive[svc['id']],
+                                                 detailed))
 
         return svcs
 
@@ -18,16 +18,25 @@
 import datetime
 import urlparse
 
+from oslo.config import cfg
 from webob import exc
 
 from nova.api.openstack import extensions
 from nova.api.openstack import wsgi
 from nova.api.openstack import xmlutil
+from nova import compute
 from nova.compute import api
 from nova.compute import flavors
+from nova.compute import utils as compute_utils
 from nova import exception
 from nova.openstack.common import timeutils
 
+CONF = cfg.CONF
+CONF.import_opt('instance_usage_rollups', 'nova.utils')
+
+USAGE_TOTALS = ('total_local_gb_usage', 'total_vcpus_usage',
+                'total_memory_mb_usage', 'total_hours')
+
 authorize_show = extensions.extension_authorizer('compute',
                                                  'simple_tenant_usage:show')
 authorize_list = extensions.extension_authorizer('compute',
@@ -68,42 +77,6 @@ class SimpleTenantUsagesTemplate(xmlutil.TemplateBuilder):
 
 
 class SimpleTenantUsageController(object):
-    def _hours_for(self, instance, period_start, period_stop):
-        launched_at = instance['launched_at']
-        terminated_at = instance['terminated_at']
-        if terminated_at is not None:
-            if not isinstance(terminated_at, datetime.datetime):
-                terminated_at = timeutils.parse_strtime(terminated_at,
-                                                        "%Y-%m-%d %H:%M:%S.%f")
-
-        if launched_at is not None:
-            if not isinstance(launched_at, datetime.datetime):
-                launched_at = timeutils.parse_strtime(launched_at,
-                                                      "%Y-%m-%d %H:%M:%S.%f")
-
-        if terminated_at and terminated_at < period_start:
-            return 0
-        # nothing if it started after the usage report ended
-        if launched_at and launched_at > period_stop:
-            return 0
-        if launched_at:
-            # if instance launched after period_started, don't charge for first
-            start = max(launched_at, period_start)
-            if terminated_at:
-                # if instance stopped before period_stop, don't charge after
-                stop = min(period_stop, terminated_at)
-            else:
-                # instance is still running, so charge them up to current time
-                stop = period_stop
-            dt = stop - start
-            seconds = (dt.days * 3600 * 24 + dt.seconds +
-                       dt.microseconds / 100000.0)
-
-            return seconds / 3600.0
-        else:
-            # instance hasn't launched, so no charge
-            return 0
-
     def _get_flavor(self, context, compute_api, instance, flavors_cache):
         """Get flavor information from the instance's system_metadata,
         allowing a fallback to lookup by-id for deleted instances only.
@@ -139,12 +112,12 @@ class SimpleTenantUsageController(object):
                                                      tenant_id)
         rval = {}
         flavors = {}
+        hours = compute_utils.usage_hours(instances, period_start,
+                                          period_stop)
 
-        for instance in instances:
+        for instance, instance_hours in zip(instances, hours):
             info = {}
-            info['hours'] = self._hours_for(instance,
-                                            period_start,
-                                            period_stop)
+            info['hours'] = instance_hours
             flavor = self._get_flavor(context, compute_api, instance, flavors)
             if not flavor:
                 continue
@@ -203,6 +176,48 @@ class SimpleTenantUsageController(object):
 
         return rval.values()
 
+    def _tenant_usages_from_rollups(self, context, period_start,
+                                    period_stop):
+        """Sum up the usage of all tenants from the rollups recorded for
+        the audit periods within the range, and compute the usage for the
+        rest of it, usually just the current period, live.
+        """
+        host_api = compute.HostAPI()
+        periods = host_api.get_tenant_usage_rollups(context.elevated(),
+                                                    period_start,
+                                                    period_stop)
+        rval = {}
+
+        def add_usage(tenant_id, usage):
+            if tenant_id not in rval:
+                summary = dict((key, 0) for key in USAGE_TOTALS)
+                summary['tenant_id'] = tenant_id
+                summary['start'] = period_start
+                summary['stop'] = period_stop
+                rval[tenant_id] = summary
+            summary = rval[tenant_id]
+            for key in USAGE_TOTALS:
+                summary[key] += usage[key]
+
+        gaps = []
+        covered_until = period_start
+        for begin, end, rollups in periods:
+            if covered_until < begin:
+                gaps.append((covered_until, begin))
+            for rollup in rollups:
+                add_usage(rollup['project_id'], rollup)
+            covered_until = end
+        if covered_until < period_stop:
+            gaps.append((covered_until, period_stop))
+
+        for gap_start, gap_stop in gaps:
+            for usage in self._tenant_usages_for_period(context, gap_start,
+                                                        gap_stop,
+                                                        detailed=False):
+                add_usage(usage['tenant_id'], usage)
+
+        return rval.values()
+
     def _parse_datetime(self, dtstr):
         if not dtstr:
             return timeutils.utcnow()
@@ -242,10 +257,15 @@ class SimpleTenantUsageController(object):
         now = timeutils.utcnow()
         if period_stop > now:
             period_stop = now
-        usages = self._tenant_usages_for_period(context,
-                                                period_start,
-                                                period_stop,
-                                                detailed=detailed)
+        if CONF.instance_usage_rollups and not detailed:
+            usages = self._tenant_usages_from_rollups(context,
+                                                      period_start,
+                                                      period_stop)
+        else:
+            usages = self._tenant_usages_for_period(context,
+                                                    period_start,
+                                                    period_stop,
+                                                    detailed=detailed)
         return {'tenant_usages': usages}
 
     @wsgi.serializers(xml=SimpleTenantUsageTemplate)
@@ -31,8 +31,7 @@ class ExtendedVolumesController(servers.Controller):
         super(ExtendedVolumesController, self).__init__(*args, **kwargs)
         self.compute_api = compute.API()
 
-    def _extend_server(self, context, server, instance):
-        bdms = self.compute_api.get_instance_bdms(context, instance)
+    def _extend_server(self, server, bdms):
         volume_ids = [bdm['volume_id'] for bdm in bdms if bdm['volume_id']]
         key = "%s:volumes_attached" % ExtendedVolumes.alias
         server[key] = [{'id': volume_id} for volume_id in volume_ids]
@@ -47,7 +46,8 @@ class ExtendedVolumesController(servers.Controller):
             db_instance = req.get_db_instance(server['id'])
             # server['id'] is guaranteed to be in the cache due to
             # the core API adding it in its 'show' method.
-            self._extend_server(context, server, db_instance)
+            bdms = self.compute_api.get_instance_bdms(context, db_instance)
+            self._extend_server(server, bdms)
 
     @wsgi.extends
     def detail(self, req, resp_obj):
@@ -56,11 +56,14 @@ class ExtendedVolumesController(servers.Controller):
             # Attach our slave template to the response object
             resp_obj.attach(xml=ExtendedVolumesServersTemplate())
             servers = list(resp_obj.obj['servers'])
+            # The core API caches all of the instances in its 'detail'
+            # method, so their bdms can be fetched in one go.
+            bdms = req.prefetch_for_instances(
+                'bdms',
+                lambda uuids: self.compute_api.get_instances_bdms(context,
+                                                                  uuids))
             for server in servers:
-                db_instance = req.get_db_instance(server['id'])
-                # server['id'] is guaranteed to be in the cache due to
-                # the core API adding it in its 'detail' method.
-                self._extend_server(context, server, db_instance)
+                self._extend_server(server, bdms.get(server['id'], []))
 
 
 class ExtendedVolumes(extensions.V3APIExtensionBase):
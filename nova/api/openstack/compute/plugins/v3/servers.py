@@ -527,6 +527,7 @@ class ServersController(wsgi.Controller):
                         " extensions"))
 
     @wsgi.serializers(xml=MinimalServersTemplate)
+    @wsgi.streamed
     def index(self, req):
         """Returns a list of server names and ids for a given user."""
         try:
@@ -536,6 +537,7 @@ class ServersController(wsgi.Controller):
         return servers
 
     @wsgi.serializers(xml=ServersTemplate)
+    @wsgi.streamed
     def detail(self, req):
         """Returns a list of server details for a given user."""
         try:
@@ -82,8 +82,7 @@ class ServiceController(object):
 
         return services
 
-    def _get_service_detail(self, svc):
-        alive = self.servicegroup_api.service_is_up(svc)
+    def _get_service_detail(self, svc, alive):
         state = (alive and "up") or "down"
         active = 'enabled'
         if svc['disabled']:
@@ -98,9 +97,10 @@ class ServiceController(object):
 
     def _get_services_list(self, req):
         services = self._get_services(req)
+        alive = self.servicegroup_api.services_are_up(services)
         svcs = []
         for svc in services:
-            svcs.append(self._get_service_detail(svc))
+            svcs.append(self._get_service_detail(svc, alive[svc['id']]))
 
         return svcs
 
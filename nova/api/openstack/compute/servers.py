@@ -466,6 +466,7 @@ class Controller(wsgi.Controller):
         self.neutron_attempted = False
 
     @wsgi.serializers(xml=MinimalServersTemplate)
+    @wsgi.streamed
     def index(self, req):
         """Returns a list of server names and ids for a given user."""
         try:
@@ -475,6 +476,7 @@ class Controller(wsgi.Controller):
         return servers
 
     @wsgi.serializers(xml=ServersTemplate)
+    @wsgi.streamed
     def detail(self, req):
         """Returns a list of server details for a given user."""
         try:
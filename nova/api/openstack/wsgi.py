@@ -24,6 +24,7 @@ from lxml import etree
 import webob
 
 from nova.api.openstack import xmlutil
+from nova import context as nova_context
 from nova import exception
 from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
@@ -132,6 +133,23 @@ class Request(webob.Request):
     def get_db_flavor(self, flavorid):
         return self.get_db_item('flavors', flavorid)
 
+    def prefetch_for_instances(self, key, loader):
+        """
+        Allow API extensions to load data related to the instances
+        cached in this request with one call, rather than one per
+        instance.
+
+        The first call for a key passes the uuids of all of the cached
+        instances to loader, which must return a dict keyed by instance
+        uuid.  The dict is kept for the rest of the request, so every
+        extension asking for the same key shares it.
+        """
+        prefetched = self._extension_data.setdefault('prefetched', {})
+        if key not in prefetched:
+            instances = self._extension_data['db_items'].get('instances', {})
+            prefetched[key] = loader(instances.keys())
+        return prefetched[key]
+
     def best_match_content_type(self):
         """Determine the requested response content-type."""
         if 'nova.best_content_type' not in self.environ:
@@ -327,9 +345,55 @@ class DictSerializer(ActionDispatcher):
 class JSONDictSerializer(DictSerializer):
     """Default JSON request body serialization."""
 
+    # Size of the chunks yielded by iter_serialize()
+    chunk_size = 64 * 1024
+
     def default(self, data):
         return jsonutils.dumps(data)
 
+    def iter_serialize(self, data):
+        """Serialize data in chunks, producing the same document as
+        serialize().
+
+        Lists directly under the top level keys are encoded one item at
+        a time, so a large listing is never held as a single string.  The
+        data itself is still built in full beforehand, so the memory used
+        still grows with the length of the listing.
+        """
+        if not isinstance(data, dict):
+            yield self.serialize(data)
+            return
+
+        buf = []
+        size = 0
+        for piece in self._iter_pieces(data):
+            buf.append(piece)
+            size += len(piece)
+            if size >= self.chunk_size:
+                yield ''.join(buf)
+                buf = []
+                size = 0
+        if buf:
+            yield ''.join(buf)
+
+    def _iter_pieces(self, data):
+        yield '{'
+        for i, (key, value) in enumerate(data.iteritems()):
+            if i:
+                yield ', '
+            yield jsonutils.dumps(key)
+            yield ': '
+            if isinstance(value, list):
+                yield '['
+                for j, item in enumerate(value):
+                    if j:
+                        yield ', '
+                    yield jsonutils.dumps(item)
+                yield ']'
+            else:
+                yield jsonutils.dumps(value)
+        yield '}'
+
 
 class XMLDictSerializer(DictSerializer):
 
@@ -483,6 +547,20 @@ def response(code):
     return decorator
 
 
+def streamed(func):
+    """Marks a method whose response body may be streamed.
+
+    Intended for listings, which can be large enough that serializing
+    the whole body before sending any of it is noticeable.  Only the
+    encoded body is streamed, the method still returns the whole listing
+    and extensions still see all of it.  Like response(), the method is
+    not wrapped.
+    """
+
+    func.wsgi_stream = True
+    return func
+
+
 class ResponseObject(object):
     """Bundles a response object with appropriate serializers.
 
@@ -491,16 +569,22 @@ class ResponseObject(object):
     optional.
     """
 
-    def __init__(self, obj, code=None, headers=None, **serializers):
+    def __init__(self, obj, code=None, headers=None, stream=False,
+                 **serializers):
         """Binds serializers with an object.
 
         Takes keyword arguments akin to the @serializer() decorator
         for specifying serializers.  Serializers specified will be
         given preference over default serializers or method-specific
         serializers on return.
+
+        If stream is True and the chosen serializer can serialize
+        incrementally, the body is sent in chunks as it is produced
+        rather than being built in full first.
         """
 
         self.obj = obj
+        self.stream = stream
         self.serializers = serializers
         self._default_code = 200
         self._code = code
@@ -600,7 +684,10 @@ class ResponseObject(object):
             response.headers[hdr] = str(value)
         response.headers['Content-Type'] = content_type
         if self.obj is not None:
-            response.body = serializer.serialize(self.obj)
+            if self.stream and hasattr(serializer, 'iter_serialize'):
+                response.app_iter = serializer.iter_serialize(self.obj)
+            else:
+                response.body = serializer.serialize(self.obj)
 
         return response
 
@@ -899,8 +986,21 @@ class Resource(wsgi.Application):
         #            function.  If we try to audit __call__(), we can
         #            run into troubles due to the @webob.dec.wsgify()
         #            decorator.
-        return self._process_stack(request, action, action_args,
-                               content_type, body, accept)
+        context = request.environ.get('nova.context')
+        if (request.method not in ('GET', 'HEAD') or context is None or
+                getattr(context, 'identity_map', False) is not None):
+            return self._process_stack(request, action, action_args,
+                                       content_type, body, accept)
+
+        # Nothing is changed by a read-only request, so the controller
+        # and its extensions can share everything loaded through the
+        # compute API while handling it.
+        context.identity_map = nova_context.IdentityMap()
+        try:
+            return self._process_stack(request, action, action_args,
+                                       content_type, body, accept)
+        finally:
+            context.identity_map = None
 
     def _process_stack(self, request, action, action_args,
                        content_type, body, accept):
@@ -981,6 +1081,8 @@ class Resource(wsgi.Application):
                 resp_obj._bind_method_serializers(serializers)
                 if hasattr(meth, 'wsgi_code'):
                     resp_obj._default_code = meth.wsgi_code
+                if getattr(meth, 'wsgi_stream', False):
+                    resp_obj.stream = True
                 resp_obj.preserialize(accept, self.default_serializers)
 
                 # Process post-processing extensions
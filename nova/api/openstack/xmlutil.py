@@ -32,6 +32,11 @@ XMLNS_V11 = 'http://docs.openstack.org/compute/api/v1.1'
 XMLNS_COMMON_V10 = 'http://docs.openstack.org/common/api/v1.0'
 XMLNS_ATOM = 'http://www.w3.org/2005/Atom'
 
+# Compiled templates, keyed by the root elements of a master template
+# and its attached slaves.  Changing any template element empties it.
+_COMPILED_TEMPLATES = {}
+_MAX_COMPILED_TEMPLATES = 500
+
 
 def validate_schema(xml, schema_name, version='v1.1'):
     if isinstance(xml, str):
@@ -224,6 +229,7 @@ class TemplateElement(object):
 
         self._children.append(elem)
         self._childmap[elem.tag] = elem
+        _COMPILED_TEMPLATES.clear()
 
     def extend(self, elems):
         """Append children to the element."""
@@ -245,6 +251,7 @@ class TemplateElement(object):
         # Update the children
         self._children.extend(elemlist)
         self._childmap.update(elemmap)
+        _COMPILED_TEMPLATES.clear()
 
     def insert(self, idx, elem):
         """Insert a child element at the given index."""
@@ -258,6 +265,7 @@ class TemplateElement(object):
 
         self._children.insert(idx, elem)
         self._childmap[elem.tag] = elem
+        _COMPILED_TEMPLATES.clear()
 
     def remove(self, elem):
         """Remove a child element."""
@@ -271,6 +279,7 @@ class TemplateElement(object):
 
         self._children.remove(elem)
         del self._childmap[elem.tag]
+        _COMPILED_TEMPLATES.clear()
 
     def get(self, key):
         """Get an attribute.
@@ -301,6 +310,7 @@ class TemplateElement(object):
             value = Selector(value)
 
         self.attrib[key] = value
+        _COMPILED_TEMPLATES.clear()
 
     def keys(self):
         """Return the attribute names."""
@@ -458,9 +468,11 @@ class TemplateElement(object):
             value = Selector(value)
 
         self._text = value
+        _COMPILED_TEMPLATES.clear()
 
     def _text_del(self):
         self._text = None
+        _COMPILED_TEMPLATES.clear()
 
     text = property(_text_get, _text_set, _text_del)
 
@@ -614,9 +626,41 @@ class Template(object):
         siblings = self._siblings()
         nsmap = self._nsmap()
 
+        # Use the compiled form of the template where we can
+        compiled = self._compiled(siblings)
+        if compiled is not None:
+            elems = compiled.render(None, obj, nsmap)
+            return elems[0][0] if elems else None
+
         # Form the element tree
         return self._serialize(None, obj, siblings, nsmap)
 
+    def _compiled(self, siblings):
+        """Return the compiled form of the template.
+
+        Returns None if the template or its elements customize
+        serialization in ways the compiled form doesn't know about.
+
+        :param siblings: The root element and the roots of any slave
+                         templates.
+        """
+
+        key = tuple(siblings)
+        try:
+            return _COMPILED_TEMPLATES[key]
+        except KeyError:
+            pass
+
+        if (_overrides(self, Template, '_serialize') or
+                not all(_compilable(sibling) for sibling in siblings)):
+            return None
+        compiled = _CompiledElement(siblings)
+
+        if len(_COMPILED_TEMPLATES) >= _MAX_COMPILED_TEMPLATES:
+            _COMPILED_TEMPLATES.clear()
+        _COMPILED_TEMPLATES[key] = compiled
+        return compiled
+
     def _siblings(self):
         """Hook method for computing root siblings.
 
@@ -667,6 +711,164 @@ class Template(object):
         return "%r: %s" % (self, self.root.tree())
 
 
+def _overrides(obj, cls, name):
+    """Determine whether obj overrides a method of cls."""
+
+    return getattr(type(obj), name).__func__ is not \
+        getattr(cls, name).__func__
+
+
+def _compilable(elem):
+    """Determine whether a template element tree can be compiled."""
+
+    for name in ('render', '_render', 'apply'):
+        if _overrides(elem, TemplateElement, name):
+            return False
+    return all(_compilable(child) for child in elem)
+
+
+def _compile_selector(selector):
+    """Compile a selector into a plain function.
+
+    Selectors consisting only of keys, which is the overwhelming
+    majority, are turned into direct indexing.  Anything else is
+    returned as it is.
+    """
+
+    if (selector is None or type(selector) is not Selector or
+            [elem for elem in selector.chain if callable(elem)]):
+        return selector
+
+    chain = selector.chain
+    if not chain:
+        return lambda obj, do_raise=False: obj
+
+    if len(chain) == 1:
+        key = chain[0]
+
+        def select(obj, do_raise=False):
+            try:
+                return obj[key]
+            except (KeyError, IndexError):
+                if do_raise:
+                    raise KeyError(key)
+                return None
+        return select
+
+    def select_chain(obj, do_raise=False):
+        for key in chain:
+            try:
+                obj = obj[key]
+            except (KeyError, IndexError):
+                if do_raise:
+                    raise KeyError(key)
+                return None
+        return obj
+    return select_chain
+
+
+class _CompiledElement(object):
+    """A template element merged with its slaves' elements.
+
+    Everything Template._serialize() works out for each datum--which
+    patches apply, the children of all the siblings and their own
+    siblings--is worked out once, and selectors are compiled, so
+    rendering only selects data and creates etree elements.
+    """
+
+    def __init__(self, siblings):
+        """Compile a template element and its siblings.
+
+        :param siblings: The TemplateElement instances against which
+                         data is rendered; the first is the one
+                         selecting the data.
+        """
+
+        master = siblings[0]
+        self.tag = master.tag
+        self.tag_is_callable = callable(master.tag)
+        self.selector = _compile_selector(master.selector)
+        self.subselector = _compile_selector(master.subselector)
+        self.will_render = master.will_render
+
+        # Only the last text set on an element survives
+        self.text = None
+        for sibling in siblings:
+            if sibling.text is not None:
+                self.text = _compile_selector(sibling.text)
+
+        self.attrib = []
+        for sibling in siblings:
+            for key, value in sibling.attrib.items():
+                self.attrib.append((key, _compile_selector(value)))
+
+        self.children = []
+        seen = set()
+        for idx, sibling in enumerate(siblings):
+            for child in sibling:
+                if child.tag in seen:
+                    continue
+                seen.add(child.tag)
+
+                nieces = [child]
+                for sib in siblings[idx + 1:]:
+                    if child.tag in sib:
+                        nieces.append(sib[child.tag])
+                self.children.append(_CompiledElement(nieces))
+
+    def _element(self, parent, datum, nsmap):
+        tagname = self.tag(datum) if self.tag_is_callable else self.tag
+        if parent is None:
+            elem = etree.Element(tagname, nsmap=nsmap)
+        elif nsmap is None:
+            elem = etree.SubElement(parent, tagname)
+        else:
+            elem = etree.SubElement(parent, tagname, nsmap=nsmap)
+        if datum is None:
+            return elem
+
+        if self.text is not None:
+            elem.text = unicode(self.text(datum))
+        set_attr = elem.set
+        for key, value in self.attrib:
+            try:
+                set_attr(key, unicode(value(datum, True)))
+            except KeyError:
+                # Attribute has no value, so don't include it
+                pass
+        return elem
+
+    def render(self, parent, obj, nsmap=None):
+        """Render an object and its children.
+
+        Returns a list of two-item tuples of etree.Element instances
+        and their data, as TemplateElement.render() does.
+        """
+
+        data = None if obj is None else self.selector(obj)
+        if not self.will_render(data):
+            return []
+        elif data is None:
+            elems = [(self._element(parent, None, nsmap), None)]
+        else:
+            if not isinstance(data, list):
+                data = [data]
+            elif parent is None:
+                raise ValueError(_('root element selecting a list'))
+
+            elems = []
+            subselector = self.subselector
+            for datum in data:
+                if subselector is not None:
+                    datum = subselector(datum)
+                elems.append((self._element(parent, datum, nsmap), datum))
+
+        for child in self.children:
+            for elem, datum in elems:
+                child.render(elem, datum)
+        return elems
+
+
 class MasterTemplate(Template):
     """Represent a master template.
 
@@ -18,24 +18,181 @@
 Base RPC client and server common to all services.
 """
 
+import time
+
+from eventlet import semaphore
 from oslo.config import cfg
 
 from nova.openstack.common import jsonutils
+from nova.openstack.common import log as logging
 from nova.openstack.common import rpc
+from nova.openstack.common.rpc import common as rpc_common
+from nova.openstack.common.rpc import dispatcher as rpc_dispatcher
 import nova.openstack.common.rpc.proxy as rpc_proxy
-
+from nova import rpcstats
+
+
+rpc_opts = [
+    cfg.ListOpt('rpc_priority_methods',
+                default=['service_heartbeat', 'service_update', 'ping'],
+                help='RPC methods which are sent to a separate priority '
+                     'topic of a service. Services consume their priority '
+                     'topics on a connection of their own, so heartbeats '
+                     'and status calls are not held up by a backlog of '
+                     'other messages. Has to be the same for all services. '
+                     'Methods of APIs with a version cap set in '
+                     '[upgrade_levels] are sent to the normal topic, as the '
+                     'services receiving them may be older'),
+    cfg.ListOpt('rpc_method_concurrency',
+                default=[],
+                help='Per method limits on concurrently running RPC '
+                     'messages, as a list of method:limit pairs. Messages '
+                     'over the limit wait for their turn in a thread of '
+                     'the rpc_thread_pool_size pool'),
+    ]
 
 CONF = cfg.CONF
+CONF.register_opts(rpc_opts)
 rpcapi_cap_opt = cfg.StrOpt('baseapi',
         default=None,
         help='Set a version cap for messages sent to the base api in any '
              'service')
 CONF.register_opt(rpcapi_cap_opt, 'upgrade_levels')
 
+LOG = logging.getLogger(__name__)
+
 _NAMESPACE = 'baseapi'
 
 
-class BaseAPI(rpc_proxy.RpcProxy):
+def get_priority_topic(topic):
+    """Return the topic the methods in rpc_priority_methods are sent to
+    instead of topic.
+    """
+    return 'priority.%s' % topic
+
+
+def parse_method_limits():
+    """Parse rpc_method_concurrency into a {method: limit} dict."""
+    limits = {}
+    for item in CONF.rpc_method_concurrency:
+        method, _sep, limit = item.partition(':')
+        method = method.strip()
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if not method or limit < 1:
+            LOG.warn(_('Ignoring invalid rpc_method_concurrency entry: %s'),
+                     item)
+            continue
+        limits[method] = limit
+    return limits
+
+
+class RpcProxy(rpc_proxy.RpcProxy):
+    """Base class for the client side of the rpc APIs of nova services.
+
+    Messages for the methods in rpc_priority_methods are sent to the
+    priority topic of the topic they are for, unless a version cap is set
+    for the API. If rpc_stats_sink is set, messages are stamped with the
+    time they are sent, and the time calls take to return is reported.
+    """
+
+    def _get_topic_for(self, msg, topic):
+        topic = self._get_topic(topic)
+        # NOTE: A version cap means the receiving service may be older and
+        #       not consume its priority topics yet.
+        if (self.version_cap is None and
+                msg.get('method') in CONF.rpc_priority_methods):
+            return get_priority_topic(topic)
+        return topic
+
+    def call(self, context, msg, topic=None, version=None, timeout=None):
+        msg = rpcstats.stamp_message(msg)
+        method = msg.get('method')
+        started_at = time.time()
+        try:
+            result = super(RpcProxy, self).call(
+                context, msg, self._get_topic_for(msg, topic), version,
+                timeout)
+        except rpc_common.Timeout:
+            rpcstats.incr(self.topic, method, 'timeout')
+            raise
+        rpcstats.record_elapsed(self.topic, method, 'reply', started_at)
+        return result
+
+    def multicall(self, context, msg, topic=None, version=None,
+                  timeout=None):
+        msg = rpcstats.stamp_message(msg)
+        return super(RpcProxy, self).multicall(
+            context, msg, self._get_topic_for(msg, topic), version, timeout)
+
+    def cast(self, context, msg, topic=None, version=None):
+        msg = rpcstats.stamp_message(msg)
+        return super(RpcProxy, self).cast(context, msg,
+                                          self._get_topic_for(msg, topic),
+                                          version)
+
+    def fanout_cast(self, context, msg, topic=None, version=None):
+        msg = rpcstats.stamp_message(msg)
+        return super(RpcProxy, self).fanout_cast(context, msg, topic,
+                                                 version)
+
+    def cast_to_server(self, context, server_params, msg, topic=None,
+                       version=None):
+        msg = rpcstats.stamp_message(msg)
+        return super(RpcProxy, self).cast_to_server(context, server_params,
+                                                    msg, topic, version)
+
+    def fanout_cast_to_server(self, context, server_params, msg, topic=None,
+                              version=None):
+        msg = rpcstats.stamp_message(msg)
+        return super(RpcProxy, self).fanout_cast_to_server(
+            context, server_params, msg, topic, version)
+
+
+class RpcDispatcher(rpc_dispatcher.RpcDispatcher):
+    """Dispatches rpc messages, running no more messages for a method at
+    once than rpc_method_concurrency allows.
+
+    If rpc_stats_sink is set, the time messages spent queued and being
+    handled is reported under service_name.
+    """
+
+    def __init__(self, callbacks, serializer=None, service_name=None):
+        super(RpcDispatcher, self).__init__(callbacks, serializer)
+        self.service_name = service_name
+        self.running = 0
+        self.semaphores = dict(
+            (method, semaphore.Semaphore(limit))
+            for method, limit in parse_method_limits().iteritems())
+
+    def dispatch(self, ctxt, version, method, namespace, **kwargs):
+        # NOTE: The timestamp is popped even if no sink is configured here,
+        #       as the sender may have one.
+        sent_at = kwargs.pop(rpcstats.SENT_AT, None)
+        rpcstats.record_queue_time(self.service_name, method, sent_at)
+        self.running += 1
+        try:
+            rpcstats.gauge('%s.running' % (self.service_name or 'unknown'),
+                           self.running)
+            sem = self.semaphores.get(method)
+            if sem is None:
+                return self._dispatch(ctxt, version, method, namespace,
+                                      kwargs)
+            with sem:
+                return self._dispatch(ctxt, version, method, namespace,
+                                      kwargs)
+        finally:
+            self.running -= 1
+
+    def _dispatch(self, ctxt, version, method, namespace, kwargs):
+        with rpcstats.timed(self.service_name, method, 'handler'):
+            return super(RpcDispatcher, self).dispatch(ctxt, version, method,
+                                                       namespace, **kwargs)
+
+
+class BaseAPI(RpcProxy):
     """Client side of the base rpc API.
 
     API version history:
@@ -21,10 +21,9 @@ import urlparse
 
 from oslo.config import cfg
 
+from nova import baserpc
 from nova.cells import driver
 from nova.openstack.common import rpc
-from nova.openstack.common.rpc import dispatcher as rpc_dispatcher
-from nova.openstack.common.rpc import proxy as rpc_proxy
 
 cell_rpc_driver_opts = [
         cfg.StrOpt('rpc_driver_queue_base',
@@ -89,7 +88,8 @@ class CellsRPCDriver(driver.BaseCellsDriver):
         # NOTE(comstud): We do not need to use the object serializer
         # on this because object serialization is taken care for us in
         # the messaging module.
-        dispatcher = rpc_dispatcher.RpcDispatcher([proxy_manager])
+        dispatcher = baserpc.RpcDispatcher([proxy_manager],
+                                           service_name=topic_base)
         for msg_type in msg_runner.get_message_types():
             topic = '%s.%s' % (topic_base, msg_type)
             self._start_consumer(dispatcher, topic)
@@ -108,7 +108,7 @@ class CellsRPCDriver(driver.BaseCellsDriver):
         self.intercell_rpcapi.send_message_to_cell(cell_state, message)
 
 
-class InterCellRPCAPI(rpc_proxy.RpcProxy):
+class InterCellRPCAPI(baserpc.RpcProxy):
     """Client side of the Cell<->Cell RPC API.
 
     The CellsRPCDriver uses this to make calls to another cell.
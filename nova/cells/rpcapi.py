@@ -24,11 +24,11 @@ messging module.
 
 from oslo.config import cfg
 
+from nova import baserpc
 from nova import exception
 from nova.objects import base as objects_base
 from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
-from nova.openstack.common.rpc import proxy as rpc_proxy
 
 
 LOG = logging.getLogger(__name__)
@@ -42,7 +42,7 @@ rpcapi_cap_opt = cfg.StrOpt('cells',
 CONF.register_opt(rpcapi_cap_opt, 'upgrade_levels')
 
 
-class CellsAPI(rpc_proxy.RpcProxy):
+class CellsAPI(baserpc.RpcProxy):
     '''Cells client-side RPC API
 
     API version history:
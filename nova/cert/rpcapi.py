@@ -20,7 +20,7 @@ Client side of the cert manager RPC API.
 
 from oslo.config import cfg
 
-import nova.openstack.common.rpc.proxy
+from nova import baserpc
 
 rpcapi_opts = [
     cfg.StrOpt('cert_topic',
@@ -37,7 +37,7 @@ rpcapi_cap_opt = cfg.StrOpt('cert',
 CONF.register_opt(rpcapi_cap_opt, 'upgrade_levels')
 
 
-class CertAPI(nova.openstack.common.rpc.proxy.RpcProxy):
+class CertAPI(baserpc.RpcProxy):
     '''Client side of the cert rpc API.
 
     API version history:
@@ -56,6 +56,7 @@
 import netaddr
 import os
 import sys
+import time
 
 from oslo.config import cfg
 
@@ -76,6 +77,7 @@ from nova.openstack.common import rpc
 from nova import quota
 from nova import servicegroup
 from nova import version
+from nova.virt.libvirt import imagecache
 
 CONF = cfg.CONF
 CONF.import_opt('network_manager', 'nova.service')
@@ -669,8 +671,9 @@ class ServiceCommands(object):
                     _('Status'),
                     _('State'),
                     _('Updated_At'))
+        alive_services = servicegroup_api.services_are_up(services)
         for svc in services:
-            alive = servicegroup_api.service_is_up(svc)
+            alive = alive_services[svc['id']]
             art = (alive and ":-)") or "XXX"
             active = 'enabled'
             if svc['disabled']:
@@ -1131,6 +1134,51 @@ class GetLogCommands(object):
             print _('No nova entries in syslog!')
 
 
+class ImageCacheCommands(object):
+    """Show the image cache of compute nodes."""
+
+    @args('--host', metavar='<host>',
+            help='Compute node, this host if not given')
+    def report(self, host=None):
+        """Show the base images cached on a compute node, as found by the
+        last image cache manager pass of that node.
+        """
+        index = imagecache.read_index(host)
+        if not index:
+            print _('No image cache index at %s') % (
+                imagecache.get_index_filename(host))
+            return(1)
+
+        now = time.time()
+        print _('Image cache of %(host)s in %(base_dir)s, '
+                '%(age)d seconds old') % {
+                    'host': index['host'],
+                    'base_dir': index['base_dir'],
+                    'age': now - index['updated_at']}
+        print_format = "%-44s %-8s %10s %10s %-10s %s"
+        print print_format % (_('Name'),
+                              _('State'),
+                              _('Size (MB)'),
+                              _('Idle (h)'),
+                              _('Checksum'),
+                              _('Instances'))
+        totals = {}
+        for name, image in sorted(index['images'].iteritems()):
+            size_mb = image['size'] / (1024 * 1024)
+            print print_format % (name,
+                                  image['state'],
+                                  size_mb,
+                                  int(now - image['last_used']) / 3600,
+                                  image['checksum'] or '-',
+                                  ','.join(image['instances']) or '-')
+            count, total_mb = totals.get(image['state'], (0, 0))
+            totals[image['state']] = (count + 1, total_mb + size_mb)
+
+        for state, (count, total_mb) in sorted(totals.iteritems()):
+            print _('%(state)s: %(count)d images, %(total_mb)d MB') % {
+                'state': state, 'count': count, 'total_mb': total_mb}
+
+
 class CellCommands(object):
     """Commands for managing cells."""
 
@@ -1209,6 +1257,7 @@ CATEGORIES = {
     'flavor': InstanceTypeCommands,
     'floating': FloatingIpCommands,
     'host': HostCommands,
+    'imagecache': ImageCacheCommands,
     'instance_type': InstanceTypeCommands,
     'logs': GetLogCommands,
     'network': NetworkCommands,
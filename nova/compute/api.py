@@ -39,6 +39,7 @@ from nova.compute import task_states
 from nova.compute import utils as compute_utils
 from nova.compute import vm_states
 from nova.consoleauth import rpcapi as consoleauth_rpcapi
+from nova import context as nova_context
 from nova import crypto
 from nova import db
 from nova.db import base
@@ -1437,23 +1438,34 @@ class API(base.Base):
         """Get an instance type by instance type id."""
         return flavors.get_flavor(instance_type_id, ctxt=context)
 
-    def get(self, context, instance_id, want_objects=False):
-        """Get a single instance with the given instance_id."""
+    def _get_instance(self, context, instance_id):
         # NOTE(ameade): we still need to support integer ids for ec2
         expected_attrs = ['metadata', 'system_metadata',
                           'security_groups', 'info_cache']
         try:
             if uuidutils.is_uuid_like(instance_id):
-                instance = instance_obj.Instance.get_by_uuid(
+                return instance_obj.Instance.get_by_uuid(
                     context, instance_id, expected_attrs=expected_attrs)
             elif utils.is_int_like(instance_id):
-                instance = instance_obj.Instance.get_by_id(
+                return instance_obj.Instance.get_by_id(
                     context, instance_id, expected_attrs=expected_attrs)
             else:
                 raise exception.InstanceNotFound(instance_id=instance_id)
         except exception.InvalidID:
             raise exception.InstanceNotFound(instance_id=instance_id)
 
+    def get(self, context, instance_id, want_objects=False):
+        """Get a single instance with the given instance_id."""
+        identity_map = nova_context.get_identity_map(context)
+        if identity_map is None:
+            instance = self._get_instance(context, instance_id)
+        else:
+            instance = identity_map.get('instances', instance_id)
+            if instance is None:
+                instance = self._get_instance(context, instance_id)
+                identity_map.add('instances', instance_id, instance)
+                identity_map.add('instances', instance.uuid, instance)
+
         check_policy(context, 'get', instance)
 
         if not want_objects:
@@ -1565,10 +1577,18 @@ class API(base.Base):
 
         fields = ['metadata', 'system_metadata', 'info_cache',
                   'security_groups']
-        return instance_obj.InstanceList.get_by_filters(
+        instances = instance_obj.InstanceList.get_by_filters(
             context, filters=filters, sort_key=sort_key, sort_dir=sort_dir,
             limit=limit, marker=marker, expected_attrs=fields)
 
+        # Later lookups of these instances during the request, e.g. by
+        # extensions, can use the ones just loaded
+        identity_map = nova_context.get_identity_map(context)
+        if identity_map is not None:
+            for instance in instances:
+                identity_map.add('instances', instance.uuid, instance)
+        return instances
+
     @wrap_check_policy
     @check_instance_state(vm_state=[vm_states.ACTIVE, vm_states.PAUSED])
     def live_snapshot(self, context, instance, name, extra_properties=None,
@@ -2565,12 +2585,43 @@ class API(base.Base):
 
     def get_instance_bdms(self, context, instance, legacy=True):
         """Get all bdm tables for specified instance."""
-        bdms = self.db.block_device_mapping_get_all_by_instance(context,
-                instance['uuid'])
+        identity_map = nova_context.get_identity_map(context)
+        bdms = None
+        if identity_map is not None:
+            bdms = identity_map.get('bdms', instance['uuid'])
+        if bdms is None:
+            bdms = self.db.block_device_mapping_get_all_by_instance(context,
+                    instance['uuid'])
+            if identity_map is not None:
+                identity_map.add('bdms', instance['uuid'], bdms)
         if legacy:
             return block_device.legacy_mapping(bdms)
         return bdms
 
+    def get_instances_bdms(self, context, instance_uuids, legacy=True):
+        """Get the bdms of several instances, keyed by instance uuid."""
+        identity_map = nova_context.get_identity_map(context)
+        bdms = {}
+        missing = []
+        for instance_uuid in instance_uuids:
+            if identity_map is not None:
+                bdms[instance_uuid] = identity_map.get('bdms', instance_uuid)
+            if bdms.get(instance_uuid) is None:
+                bdms[instance_uuid] = []
+                missing.append(instance_uuid)
+        if missing:
+            for bdm in self.db.block_device_mapping_get_all_by_instance_uuids(
+                    context, missing):
+                bdms[bdm['instance_uuid']].append(bdm)
+            if identity_map is not None:
+                for instance_uuid in missing:
+                    identity_map.add('bdms', instance_uuid,
+                                     bdms[instance_uuid])
+        if legacy:
+            return dict((instance_uuid, block_device.legacy_mapping(items))
+                        for instance_uuid, items in bdms.iteritems())
+        return bdms
+
     def is_volume_backed_instance(self, context, instance, bdms):
         if not instance['image_ref']:
             return True
@@ -2737,6 +2788,48 @@ class HostAPI(base.Base):
                                         host=host,
                                         state=state)
 
+    def get_tenant_usage_rollups(self, context, period_beginning,
+                                 period_ending):
+        """Return the usage recorded for audit periods within a range.
+
+        Only periods for which every compute host recorded its usage are
+        included.  Returns a sorted list of non-overlapping
+        (beginning, ending, rollups) tuples.
+        """
+        task_logs = self.db.task_log_get_all_in_range(context,
+                                                      'tenant_usage_rollup',
+                                                      period_beginning,
+                                                      period_ending,
+                                                      state='DONE')
+        done_hosts = {}
+        for task_log in task_logs:
+            period = (task_log['period_beginning'], task_log['period_ending'])
+            done_hosts.setdefault(period, set()).add(task_log['host'])
+
+        rollups = {}
+        for rollup in self.db.tenant_usage_rollup_get_all(context,
+                                                          period_beginning,
+                                                          period_ending):
+            period = (rollup['period_beginning'], rollup['period_ending'])
+            rollups.setdefault(period, []).append(rollup)
+
+        services = self.service_get_all(context,
+                                        filters={'topic': CONF.compute_topic})
+        periods = []
+        for begin, end in sorted(done_hosts):
+            # Hosts added since the period ended did not record it.
+            hosts = set(service['host'] for service in services
+                        if not service['created_at'] or
+                        service['created_at'] < end)
+            if not hosts.issubset(done_hosts[(begin, end)]):
+                continue
+            # Skip periods overlapping others, should the audit period
+            # have been changed.
+            if periods and begin < periods[-1][1]:
+                continue
+            periods.append((begin, end, rollups.get((begin, end), [])))
+        return periods
+
     def compute_node_get(self, context, compute_id):
         """Return compute node entry for particular integer ID."""
         return self.db.compute_node_get(context, int(compute_id))
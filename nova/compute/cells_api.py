@@ -664,6 +664,13 @@ class HostAPI(compute_api.HostAPI):
                                                   host=host,
                                                   state=state)
 
+    def get_tenant_usage_rollups(self, context, period_beginning,
+                                 period_ending):
+        """Usage rollups are recorded in the child cells, so there are
+        none to return here.
+        """
+        return []
+
     def compute_node_get(self, context, compute_id):
         """Get a compute node from a particular cell by its integer ID.
         compute_id should be in the format of 'path!to!cell@ID'.
@@ -20,6 +20,7 @@
 
 """Built-in instance properties."""
 
+import copy
 import re
 import uuid
 
@@ -39,6 +40,15 @@ flavor_opts = [
                deprecated_name='default_instance_type',
                default='m1.small',
                help='default flavor to use, testing only'),
+    cfg.IntOpt('flavor_cache_time',
+               default=0,
+               help='number of seconds each process caches flavors looked '
+                    'up by id or flavor id, 0 to disable. Changes made '
+                    'through other processes take up to that long to be '
+                    'seen'),
+    cfg.IntOpt('flavor_cache_size',
+               default=1000,
+               help='maximum number of flavors each process caches'),
 ]
 
 CONF = cfg.CONF
@@ -48,6 +58,8 @@ LOG = logging.getLogger(__name__)
 
 INVALID_NAME_REGEX = re.compile("[^\w\.\- ]")
 
+_FLAVOR_CACHE = None
+
 
 def _int_or_none(val):
     if val is not None:
@@ -132,7 +144,9 @@ def create(name, memory, vcpus, root_gb, ephemeral_gb=0, flavorid=None,
         raise exception.InvalidInput(reason=_("is_public must be a boolean"))
 
     try:
-        return db.instance_type_create(context.get_admin_context(), kwargs)
+        flavor = db.instance_type_create(context.get_admin_context(), kwargs)
+        invalidate_cache()
+        return flavor
     except db_exc.DBError as e:
         LOG.exception(_('DB error: %s') % e)
         raise exception.InstanceTypeCreateFailed()
@@ -143,6 +157,7 @@ def destroy(name):
     try:
         assert name is not None
         db.instance_type_destroy(context.get_admin_context(), name)
+        invalidate_cache()
     except (AssertionError, exception.NotFound):
         LOG.exception(_('Instance type %s not found for deletion') % name)
         raise exception.InstanceTypeNotFoundByName(instance_type_name=name)
@@ -171,6 +186,69 @@ def get_default_flavor():
     return get_flavor_by_name(name)
 
 
+def _get_cache():
+    """Return this process' flavor cache, or None if it is disabled."""
+    global _FLAVOR_CACHE
+    cache_time = CONF.flavor_cache_time
+    if cache_time <= 0:
+        return None
+    if (_FLAVOR_CACHE is None or _FLAVOR_CACHE.ttl != cache_time or
+            _FLAVOR_CACHE.max_size != CONF.flavor_cache_size):
+        _FLAVOR_CACHE = utils.ExpiringLRUCache(CONF.flavor_cache_size,
+                                               cache_time, name='Flavor')
+    return _FLAVOR_CACHE
+
+
+def invalidate_cache():
+    """Forget the flavors cached by this process.
+
+    Needs to be called whenever a flavor, its extra specs or the projects
+    with access to it change.
+    """
+    if _FLAVOR_CACHE is not None:
+        _FLAVOR_CACHE.clear()
+
+
+def get_cache_stats():
+    """Return the hit and miss counts etc. of this process' flavor cache,
+    or None if it is disabled.
+    """
+    cache = _get_cache()
+    if cache is not None:
+        return cache.stats()
+
+
+def _get_flavor(ctxt, kind, key, load):
+    """Look up a flavor in the request's identity map and this process'
+    flavor cache, and load it with load() if it is in neither.
+    """
+    identity_map = context.get_identity_map(ctxt)
+    if identity_map is not None:
+        flavor = identity_map.get(kind, key)
+        if flavor is not None:
+            return flavor
+
+    flavor = None
+    cache = _get_cache()
+    if cache is not None:
+        # Non-admins only see public flavors and those their project
+        # has been given access to
+        cache_key = (kind, key, ctxt.read_deleted,
+                     None if ctxt.is_admin else ctxt.project_id)
+        flavor = cache.get(cache_key)
+        if flavor is not None:
+            flavor = copy.deepcopy(flavor)
+
+    if flavor is None:
+        flavor = load()
+        if cache is not None:
+            cache.set(cache_key, copy.deepcopy(flavor))
+
+    if identity_map is not None:
+        identity_map.add(kind, key, flavor)
+    return flavor
+
+
 def get_flavor(instance_type_id, ctxt=None, inactive=False):
     """Retrieves single flavor by id."""
     if instance_type_id is None:
@@ -182,7 +260,8 @@ def get_flavor(instance_type_id, ctxt=None, inactive=False):
     if inactive:
         ctxt = ctxt.elevated(read_deleted="yes")
 
-    return db.instance_type_get(ctxt, instance_type_id)
+    return _get_flavor(ctxt, 'flavors', instance_type_id,
+                       lambda: db.instance_type_get(ctxt, instance_type_id))
 
 
 def get_flavor_by_name(name, ctxt=None):
@@ -206,7 +285,9 @@ def get_flavor_by_flavor_id(flavorid, ctxt=None, read_deleted="yes"):
     if ctxt is None:
         ctxt = context.get_admin_context(read_deleted=read_deleted)
 
-    return db.instance_type_get_by_flavor_id(ctxt, flavorid, read_deleted)
+    return _get_flavor(ctxt, 'flavors_by_flavorid', (flavorid, read_deleted),
+                       lambda: db.instance_type_get_by_flavor_id(
+                           ctxt, flavorid, read_deleted))
 
 
 def get_flavor_access_by_flavor_id(flavorid, ctxt=None):
@@ -222,7 +303,9 @@ def add_flavor_access(flavorid, projectid, ctxt=None):
     if ctxt is None:
         ctxt = context.get_admin_context()
 
-    return db.instance_type_access_add(ctxt, flavorid, projectid)
+    access = db.instance_type_access_add(ctxt, flavorid, projectid)
+    invalidate_cache()
+    return access
 
 
 def remove_flavor_access(flavorid, projectid, ctxt=None):
@@ -230,7 +313,9 @@ def remove_flavor_access(flavorid, projectid, ctxt=None):
     if ctxt is None:
         ctxt = context.get_admin_context()
 
-    return db.instance_type_access_remove(ctxt, flavorid, projectid)
+    access = db.instance_type_access_remove(ctxt, flavorid, projectid)
+    invalidate_cache()
+    return access
 
 
 def extract_flavor(instance, prefix=''):
@@ -110,6 +110,11 @@ compute_opts = [
     cfg.IntOpt('network_allocate_retries',
                default=0,
                help="Number of times to retry network allocation on failures"),
+    cfg.FloatOpt('lifecycle_event_batch_interval',
+                 default=0.5,
+                 help='Number of seconds to collect lifecycle events from the '
+                      'hypervisor before handling them together. 0 handles '
+                      'each event as it arrives'),
     ]
 
 interval_opts = [
@@ -374,6 +379,7 @@ class ComputeManager(manager.SchedulerDependentManager):
         self.consoleauth_rpcapi = consoleauth.rpcapi.ConsoleAuthAPI()
         self.cells_rpcapi = cells_rpcapi.CellsAPI()
         self._resource_tracker_dict = {}
+        self._lifecycle_events = {}
 
         super(ComputeManager, self).__init__(service_name="compute",
                                              *args, **kwargs)
@@ -697,38 +703,80 @@ class ComputeManager(manager.SchedulerDependentManager):
                 LOG.warning(_('Hypervisor driver does not support '
                               'firewall rules'), instance=instance)
 
-    def handle_lifecycle_event(self, event):
-        LOG.info(_("Lifecycle event %(state)d on VM %(uuid)s") %
-                  {'state': event.get_transition(),
-                   'uuid': event.get_instance_uuid()})
+    def handle_lifecycle_events(self, events):
+        """Sync the power state of the instances the lifecycle events are
+        for, fetching them from the database together.
+        """
+        vm_power_states = {}
+        for event in events:
+            LOG.info(_("Lifecycle event %(state)d on VM %(uuid)s") %
+                      {'state': event.get_transition(),
+                       'uuid': event.get_instance_uuid()})
+            if event.get_transition() == virtevent.EVENT_LIFECYCLE_STOPPED:
+                vm_power_state = power_state.SHUTDOWN
+            elif event.get_transition() == virtevent.EVENT_LIFECYCLE_STARTED:
+                vm_power_state = power_state.RUNNING
+            elif event.get_transition() == virtevent.EVENT_LIFECYCLE_PAUSED:
+                vm_power_state = power_state.PAUSED
+            elif event.get_transition() == virtevent.EVENT_LIFECYCLE_RESUMED:
+                vm_power_state = power_state.RUNNING
+            else:
+                LOG.warning(_("Unexpected power state %d") %
+                            event.get_transition())
+                continue
+            vm_power_states[event.get_instance_uuid()] = vm_power_state
+
+        if not vm_power_states:
+            return
+
         context = nova.context.get_admin_context()
-        instance = instance_obj.Instance.get_by_uuid(
-            context, event.get_instance_uuid())
-        vm_power_state = None
-        if event.get_transition() == virtevent.EVENT_LIFECYCLE_STOPPED:
-            vm_power_state = power_state.SHUTDOWN
-        elif event.get_transition() == virtevent.EVENT_LIFECYCLE_STARTED:
-            vm_power_state = power_state.RUNNING
-        elif event.get_transition() == virtevent.EVENT_LIFECYCLE_PAUSED:
-            vm_power_state = power_state.PAUSED
-        elif event.get_transition() == virtevent.EVENT_LIFECYCLE_RESUMED:
-            vm_power_state = power_state.RUNNING
-        else:
-            LOG.warning(_("Unexpected power state %d") %
-                        event.get_transition())
+        instances = instance_obj.InstanceList.get_by_filters(
+            context, {'uuid': vm_power_states.keys(), 'deleted': False})
+        fetched_at = timeutils.utcnow()
+        for instance in instances:
+            # NOTE: The instances were just fetched, so there is no need to
+            #       fetch each of them again. Syncing an instance can take a
+            #       while though (e.g. stopping it), and instances handled
+            #       later in a large batch would be compared against stale
+            #       data, so each one is fetched again once the list is
+            #       older than the batch interval (at least a second).
+            refresh = timeutils.is_older_than(
+                fetched_at, max(CONF.lifecycle_event_batch_interval, 1))
+            try:
+                self._sync_instance_power_state(
+                    context, instance,
+                    vm_power_states.pop(instance['uuid']), refresh=refresh)
+            except Exception:
+                LOG.exception(_("Failed to handle lifecycle event"),
+                              instance=instance)
 
-        if vm_power_state is not None:
-            self._sync_instance_power_state(context,
-                                            instance,
-                                            vm_power_state)
+        for instance_uuid in vm_power_states:
+            LOG.debug(_("Event arrived for non-existent instance %s. The "
+                        "instance was probably deleted.") % instance_uuid)
+
+    def _handle_collected_lifecycle_events(self):
+        events = self._lifecycle_events.values()
+        self._lifecycle_events = {}
+        try:
+            self.handle_lifecycle_events(events)
+        except Exception:
+            LOG.exception(_("Failed to handle lifecycle events"))
 
     def handle_events(self, event):
         if isinstance(event, virtevent.LifecycleEvent):
-            try:
-                self.handle_lifecycle_event(event)
-            except exception.InstanceNotFound:
-                LOG.debug(_("Event %s arrived for non-existent instance. The "
-                            "instance was probably deleted.") % event)
+            if CONF.lifecycle_event_batch_interval <= 0:
+                self.handle_lifecycle_events([event])
+                return
+
+            # NOTE: Events arrive together when many instances change state
+            #       at once, e.g. when the host shuts down. They are collected
+            #       for a short while and handled together, and only the last
+            #       event of each instance matters.
+            if not self._lifecycle_events:
+                greenthread.spawn_after(
+                    CONF.lifecycle_event_batch_interval,
+                    self._handle_collected_lifecycle_events)
+            self._lifecycle_events[event.get_instance_uuid()] = event
         else:
             LOG.debug(_("Ignoring event %s") % event)
 
@@ -3962,6 +4010,8 @@ class ComputeManager(manager.SchedulerDependentManager):
                                 'on host %s') % self.host,
                               instance=instance)
                 errors += 1
+        if CONF.instance_usage_rollups:
+            self._record_tenant_usage_rollup(context, instances, begin, end)
         compute_utils.finish_instance_usage_audit(context,
                                       self.conductor_api,
                                       begin, end,
@@ -3973,6 +4023,16 @@ class ComputeManager(manager.SchedulerDependentManager):
                                       num_instances,
                                       time.time() - start_time))
 
+    def _record_tenant_usage_rollup(self, context, instances, begin, end):
+        """Record the usage of this host's instances by project."""
+        usages = compute_utils.tenant_usage_totals(instances, begin, end)
+        try:
+            self.conductor_api.tenant_usage_rollup_update(context, self.host,
+                                                          begin, end, usages)
+        except Exception:
+            LOG.exception(_('Failed to record tenant usage rollup '
+                            'for host %s') % self.host)
+
     @periodic_task.periodic_task
     def _poll_bandwidth_usage(self, context):
         prev_time, start_time = utils.last_completed_audit_period()
@@ -4156,7 +4216,8 @@ class ComputeManager(manager.SchedulerDependentManager):
                                             db_instance,
                                             vm_power_state)
 
-    def _sync_instance_power_state(self, context, db_instance, vm_power_state):
+    def _sync_instance_power_state(self, context, db_instance, vm_power_state,
+                                   refresh=True):
         """Align instance power state between the database and hypervisor.
 
         If the instance is not found on the hypervisor, but is in the database,
@@ -4165,7 +4226,8 @@ class ComputeManager(manager.SchedulerDependentManager):
 
         # We re-query the DB to get the latest instance info to minimize
         # (not eliminate) race condition.
-        db_instance.refresh()
+        if refresh:
+            db_instance.refresh()
         db_power_state = db_instance.power_state
         vm_state = db_instance.vm_state
 
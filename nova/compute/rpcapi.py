@@ -20,12 +20,11 @@ Client side of the compute RPC API.
 
 from oslo.config import cfg
 
+from nova import baserpc
 from nova import exception
 from nova.objects import base as objects_base
 from nova.openstack.common import jsonutils
 from nova.openstack.common import rpc
-import nova.openstack.common.rpc
-import nova.openstack.common.rpc.proxy
 
 rpcapi_opts = [
     cfg.StrOpt('compute_topic',
@@ -63,7 +62,7 @@ def _compute_topic(topic, ctxt, host, instance):
     return rpc.queue_get_for(ctxt, topic, host)
 
 
-class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
+class ComputeAPI(baserpc.RpcProxy):
     '''Client side of the compute rpc API.
 
     API version history:
@@ -668,7 +667,7 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                 topic=_compute_topic(self.topic, ctxt, None, instance))
 
 
-class SecurityGroupAPI(nova.openstack.common.rpc.proxy.RpcProxy):
+class SecurityGroupAPI(baserpc.RpcProxy):
     '''Client side of the security group rpc API.
 
     API version history:
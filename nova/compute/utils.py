@@ -16,6 +16,8 @@
 
 """Compute-related Utilities and helpers."""
 
+import calendar
+import datetime
 import re
 import string
 import traceback
@@ -304,6 +306,75 @@ def finish_instance_usage_audit(context, conductor, begin, end, host, errors,
                                 host, errors, message)
 
 
+def _usage_seconds(timestamp):
+    if not isinstance(timestamp, datetime.datetime):
+        # Instances are either primitives from the conductor or rows
+        # fetched with the database's own time format.
+        try:
+            timestamp = timeutils.parse_strtime(timestamp)
+        except ValueError:
+            timestamp = timeutils.parse_strtime(timestamp,
+                                                "%Y-%m-%d %H:%M:%S.%f")
+    return calendar.timegm(timestamp.timetuple()) + (
+        timestamp.microsecond / 1000000.0)
+
+
+def usage_hours(instances, period_start, period_stop):
+    """Return the hours each of the instances ran for within a period.
+
+    Instances which never launched, or did not run during the period,
+    count for zero hours.  The period bounds are converted once and the
+    hours worked out on plain numbers, which is considerably cheaper than
+    datetime arithmetic when there are many instances.
+    """
+    start = _usage_seconds(period_start)
+    stop = _usage_seconds(period_stop)
+    hours = []
+    for instance in instances:
+        if not instance['launched_at']:
+            hours.append(0)
+            continue
+        launched_at = max(_usage_seconds(instance['launched_at']), start)
+        terminated_at = stop
+        if instance['terminated_at']:
+            terminated_at = min(_usage_seconds(instance['terminated_at']),
+                                stop)
+        hours.append(max(terminated_at - launched_at, 0) / 3600.0)
+    return hours
+
+
+def tenant_usage_totals(instances, period_start, period_stop):
+    """Sum up the usage of the instances within a period by project.
+
+    Returns a dict of project id to the totals reported by simple tenant
+    usage.  Instances without flavor information are skipped.
+    """
+    totals = {}
+    hours = usage_hours(instances, period_start, period_stop)
+    for instance, instance_hours in zip(instances, hours):
+        if not instance_hours:
+            continue
+        try:
+            flavor = flavors.extract_flavor(instance)
+        except KeyError:
+            continue
+        usage = totals.setdefault(instance['project_id'],
+                                  {'instances': 0,
+                                   'total_hours': 0,
+                                   'total_vcpus_usage': 0,
+                                   'total_memory_mb_usage': 0,
+                                   'total_local_gb_usage': 0})
+        usage['instances'] += 1
+        usage['total_hours'] += instance_hours
+        usage['total_vcpus_usage'] += flavor['vcpus'] * instance_hours
+        usage['total_memory_mb_usage'] += (flavor['memory_mb'] *
+                                           instance_hours)
+        usage['total_local_gb_usage'] += ((flavor['root_gb'] +
+                                           flavor['ephemeral_gb']) *
+                                          instance_hours)
+    return totals
+
+
 def usage_volume_info(vol_usage):
     def null_safe_str(s):
         return str(s) if s else ''
@@ -277,6 +277,9 @@ class LocalAPI(object):
     def service_update(self, context, service, values):
         return self._manager.service_update(context, service, values)
 
+    def service_heartbeat(self, context, service):
+        return self._manager.service_heartbeat(context, service)
+
     def task_log_get(self, context, task_name, begin, end, host, state=None):
         return self._manager.task_log_get(context, task_name, begin, end,
                                           host, state)
@@ -293,6 +296,10 @@ class LocalAPI(object):
                                                begin, end, host,
                                                errors, message)
 
+    def tenant_usage_rollup_update(self, context, host, begin, end, usages):
+        return self._manager.tenant_usage_rollup_update(context, host,
+                                                        begin, end, usages)
+
     def notify_usage_exists(self, context, instance, current_period=False,
                             ignore_missing_network_data=True,
                             system_metadata=None, extra_usage_info=None):
@@ -68,7 +68,7 @@ class ConductorManager(manager.Manager):
     namespace.  See the ComputeTaskManager class for details.
     """
 
-    RPC_API_VERSION = '1.54'
+    RPC_API_VERSION = '1.56'
 
     def __init__(self, *args, **kwargs):
         super(ConductorManager, self).__init__(service_name='conductor',
@@ -448,6 +448,9 @@ class ConductorManager(manager.Manager):
         svc = self.db.service_update(context, service['id'], values)
         return jsonutils.to_primitive(svc)
 
+    def service_heartbeat(self, context, service):
+        self.db.service_heartbeat(context, service['id'])
+
     def task_log_get(self, context, task_name, begin, end, host, state=None):
         result = self.db.task_log_get(context, task_name, begin, end, host,
                                       state)
@@ -466,6 +469,10 @@ class ConductorManager(manager.Manager):
                                            begin, end, host, errors, message)
         return jsonutils.to_primitive(result)
 
+    def tenant_usage_rollup_update(self, context, host, begin, end, usages):
+        self.db.tenant_usage_rollup_update(context.elevated(), host,
+                                           begin, end, usages)
+
     def notify_usage_exists(self, context, instance, current_period=False,
                             ignore_missing_network_data=True,
                             system_metadata=None, extra_usage_info=None):
@@ -16,10 +16,10 @@
 
 from oslo.config import cfg
 
+from nova import baserpc
 from nova.objects import base as objects_base
 from nova.openstack.common import jsonutils
 from nova.openstack.common.rpc import common as rpc_common
-import nova.openstack.common.rpc.proxy
 
 CONF = cfg.CONF
 
@@ -29,7 +29,7 @@ rpcapi_cap_opt = cfg.StrOpt('conductor',
 CONF.register_opt(rpcapi_cap_opt, 'upgrade_levels')
 
 
-class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
+class ConductorAPI(baserpc.RpcProxy):
     """Client side of the conductor RPC API
 
     API version history:
@@ -106,6 +106,8 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
     1.52 - Pass instance objects for compute_confirm_resize
     1.53 - Added compute_reboot
     1.54 - Added 'update_cells' argument to bw_usage_update
+    1.55 - Added service_heartbeat
+    1.56 - Added tenant_usage_rollup_update
     """
 
     BASE_RPC_API_VERSION = '1.0'
@@ -402,6 +404,14 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
         msg = self.make_msg('service_update', service=service_p, values=values)
         return self.call(context, msg, version='1.34')
 
+    def service_heartbeat(self, context, service):
+        if not self.can_send_version('1.55'):
+            values = {'report_count': service['report_count'] + 1}
+            return self.service_update(context, service, values)
+        service_p = jsonutils.to_primitive(service)
+        msg = self.make_msg('service_heartbeat', service=service_p)
+        return self.call(context, msg, version='1.55')
+
     def task_log_get(self, context, task_name, begin, end, host, state=None):
         msg = self.make_msg('task_log_get', task_name=task_name,
                             begin=begin, end=end, host=host, state=state)
@@ -421,6 +431,11 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                             message=message)
         return self.call(context, msg, version='1.37')
 
+    def tenant_usage_rollup_update(self, context, host, begin, end, usages):
+        msg = self.make_msg('tenant_usage_rollup_update', host=host,
+                            begin=begin, end=end, usages=usages)
+        return self.call(context, msg, version='1.56')
+
     def notify_usage_exists(self, context, instance, current_period=False,
                             ignore_missing_network_data=True,
                             system_metadata=None, extra_usage_info=None):
@@ -512,7 +527,7 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
         return self.call(context, msg, version='1.53')
 
 
-class ComputeTaskAPI(nova.openstack.common.rpc.proxy.RpcProxy):
+class ComputeTaskAPI(baserpc.RpcProxy):
     """Client side of the conductor 'compute' namespaced RPC API
 
     API version history:
@@ -20,7 +20,7 @@ Client side of the console RPC API.
 
 from oslo.config import cfg
 
-import nova.openstack.common.rpc.proxy
+from nova import baserpc
 
 rpcapi_opts = [
     cfg.StrOpt('console_topic',
@@ -37,7 +37,7 @@ rpcapi_cap_opt = cfg.StrOpt('console',
 CONF.register_opt(rpcapi_cap_opt, 'upgrade_levels')
 
 
-class ConsoleAPI(nova.openstack.common.rpc.proxy.RpcProxy):
+class ConsoleAPI(baserpc.RpcProxy):
     '''Client side of the console rpc API.
 
     API version history:
@@ -20,7 +20,7 @@ Client side of the consoleauth RPC API.
 
 from oslo.config import cfg
 
-import nova.openstack.common.rpc.proxy
+from nova import baserpc
 
 CONF = cfg.CONF
 
@@ -30,7 +30,7 @@ rpcapi_cap_opt = cfg.StrOpt('consoleauth',
 CONF.register_opt(rpcapi_cap_opt, 'upgrade_levels')
 
 
-class ConsoleAuthAPI(nova.openstack.common.rpc.proxy.RpcProxy):
+class ConsoleAuthAPI(baserpc.RpcProxy):
     '''Client side of the consoleauth rpc API.
 
     API version history:
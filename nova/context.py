@@ -94,6 +94,9 @@ class RequestContext(object):
         self.quota_class = quota_class
         self.user_name = user_name
         self.project_name = project_name
+        # Set by the API for the duration of read-only requests; see
+        # get_identity_map().  Never sent over RPC.
+        self.identity_map = None
         self.is_admin = is_admin
         if self.is_admin is None:
             self.is_admin = policy.check_is_admin(self)
@@ -144,6 +147,7 @@ class RequestContext(object):
         """Return a version of this context with admin flag set."""
         context = copy.copy(self)
         context.is_admin = True
+        context.identity_map = None
 
         if 'admin' not in context.roles:
             context.roles.append('admin')
@@ -167,6 +171,40 @@ class RequestContext(object):
         return self.user_id
 
 
+class IdentityMap(object):
+    """Objects loaded on behalf of a request, keyed by kind and id.
+
+    Lets the controller handling an API request and all of its
+    extensions share a single copy of each instance, flavor and list of
+    block device mappings, rather than each loading its own.
+    """
+
+    def __init__(self):
+        self._objects = {}
+
+    def get(self, kind, key):
+        return self._objects.get((kind, key))
+
+    def add(self, kind, key, obj):
+        self._objects[(kind, key)] = obj
+
+    def discard(self, kind, key):
+        self._objects.pop((kind, key), None)
+
+
+def get_identity_map(context):
+    """Return the identity map lookups made with a context may use.
+
+    Only the contexts of read-only API requests have one, and only
+    lookups made with the request's own view of the database may use
+    it, as elevated contexts and those reading deleted rows can see
+    rows the request itself can't.
+    """
+    if getattr(context, 'read_deleted', None) != 'no':
+        return None
+    return getattr(context, 'identity_map', None)
+
+
 def get_admin_context(read_deleted="no"):
     return RequestContext(user_id=None,
                           project_id=None,
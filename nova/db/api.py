@@ -169,6 +169,15 @@ def service_update(context, service_id, values):
     return IMPL.service_update(context, service_id, values)
 
 
+def service_heartbeat(context, service_id):
+    """Record a heartbeat for a service with a single UPDATE.
+
+    Raises ServiceNotFound if the service does not exist.
+
+    """
+    return IMPL.service_heartbeat(context, service_id)
+
+
 ###################
 
 
@@ -1054,6 +1063,25 @@ def quota_reserve(context, resources, quotas, deltas, expire,
                               until_refresh, max_age, project_id=project_id)
 
 
+def quota_reserve_conditional(context, resources, quotas, deltas, expire,
+                              until_refresh, max_age, project_id=None):
+    """Check quotas and create reservations without locking usages."""
+    return IMPL.quota_reserve_conditional(context, resources, quotas, deltas,
+                                          expire, until_refresh, max_age,
+                                          project_id=project_id)
+
+
+def quota_usage_get_stale_projects(context, max_age=0):
+    """Return the projects with negative or old quota usages."""
+    return IMPL.quota_usage_get_stale_projects(context, max_age=max_age)
+
+
+def quota_usage_refresh(context, resources, project_id, until_refresh=None):
+    """Recount the quota usages of a project from its resources."""
+    return IMPL.quota_usage_refresh(context, resources, project_id,
+                                    until_refresh=until_refresh)
+
+
 def reservation_commit(context, reservations, project_id=None):
     """Commit quota reservations."""
     return IMPL.reservation_commit(context, reservations,
@@ -1130,6 +1158,12 @@ def block_device_mapping_get_all_by_instance(context, instance_uuid):
                                                          instance_uuid)
 
 
+def block_device_mapping_get_all_by_instance_uuids(context, instance_uuids):
+    """Get all block device mapping belonging to a list of instances."""
+    return IMPL.block_device_mapping_get_all_by_instance_uuids(context,
+                                                               instance_uuids)
+
+
 def block_device_mapping_destroy(context, bdm_id):
     """Destroy the block device mapping."""
     return IMPL.block_device_mapping_destroy(context, bdm_id)
@@ -1830,6 +1864,33 @@ def task_log_get(context, task_name, period_beginning,
                  period_ending, host, state)
 
 
+def task_log_get_all_in_range(context, task_name, period_beginning,
+                              period_ending, state=None):
+    """Get the task logs for periods within the given range."""
+    return IMPL.task_log_get_all_in_range(context, task_name,
+                                          period_beginning, period_ending,
+                                          state)
+
+
+####################
+
+
+def tenant_usage_rollup_update(context, host, period_beginning,
+                               period_ending, usages):
+    """Replace the usage totals of a host for an audit period.
+
+    :param usages: dict of project id to totals
+    """
+    return IMPL.tenant_usage_rollup_update(context, host, period_beginning,
+                                           period_ending, usages)
+
+
+def tenant_usage_rollup_get_all(context, period_beginning, period_ending):
+    """Get the usage totals for periods within the given range."""
+    return IMPL.tenant_usage_rollup_get_all(context, period_beginning,
+                                            period_ending)
+
+
 ####################
 
 
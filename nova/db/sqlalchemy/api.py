@@ -40,7 +40,6 @@ from sqlalchemy.orm import joinedload
 from sqlalchemy.orm import joinedload_all
 from sqlalchemy.orm import noload
 from sqlalchemy.schema import Table
-from sqlalchemy.sql.expression import asc
 from sqlalchemy.sql.expression import desc
 from sqlalchemy.sql.expression import select
 from sqlalchemy.sql import func
@@ -452,6 +451,17 @@ def service_update(context, service_id, values):
     return service_ref
 
 
+@require_admin_context
+def service_heartbeat(context, service_id):
+    result = model_query(context, models.Service, read_deleted="no").\
+                filter_by(id=service_id).\
+                update({'report_count': models.Service.report_count + 1,
+                        'updated_at': timeutils.utcnow()},
+                       synchronize_session=False)
+    if not result:
+        raise exception.ServiceNotFound(service_id=service_id)
+
+
 ###################
 
 def compute_node_get(context, compute_id):
@@ -1698,8 +1708,6 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
                          vm_state is SOFT_DELETED.
     """
 
-    sort_fn = {'desc': desc, 'asc': asc}
-
     if not session:
         session = get_session()
 
@@ -1713,9 +1721,6 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
     for column in columns_to_join:
         query_prefix = query_prefix.options(joinedload(column))
 
-    query_prefix = query_prefix.order_by(sort_fn[sort_dir](
-            getattr(models.Instance, sort_key)))
-
     # Make a copy of the filters dictionary to use going forward, as we'll
     # be modifying it and we shouldn't affect the caller's use of it.
     filters = filters.copy()
@@ -1771,13 +1776,32 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
 
     # paginate query
     if marker is not None:
-        try:
-            marker = _instance_get_by_uuid(context, marker, session=session)
-        except exception.InstanceNotFound:
-            raise exception.MarkerNotFound(marker)
+        # Only the sort key values of the marker are needed, so don't load
+        # its joined rows.
+        marker_uuid = marker
+        marker = model_query(context, models.Instance, session=session,
+                             project_only=True).\
+                        filter_by(uuid=marker_uuid).\
+                        first()
+        if marker is None:
+            raise exception.MarkerNotFound(marker_uuid)
+        # NOTE: The OR of the sort keys paginate_query filters on is exact
+        #       but opaque to most query planners. Bound the leading sort
+        #       key as well, which is implied by it, so that an index on it
+        #       is used as a range scan from the marker.
+        marker_value = getattr(marker, sort_key)
+        if marker_value is not None:
+            model_attr = getattr(models.Instance, sort_key)
+            if sort_dir == 'desc':
+                query_prefix = query_prefix.filter(model_attr <= marker_value)
+            else:
+                query_prefix = query_prefix.filter(model_attr >= marker_value)
+    sort_keys = [sort_key]
+    for key in ('created_at', 'id'):
+        if key not in sort_keys:
+            sort_keys.append(key)
     query_prefix = sqlalchemyutils.paginate_query(query_prefix,
-                           models.Instance, limit,
-                           [sort_key, 'created_at', 'id'],
+                           models.Instance, limit, sort_keys,
                            marker=marker,
                            sort_dir=sort_dir)
 
@@ -1871,6 +1895,7 @@ def regex_filter(query, model, filters):
     """
 
     regexp_op_map = {
+        'postgres': '~',
         'postgresql': '~',
         'mysql': 'REGEXP',
         'oracle': 'REGEXP_LIKE',
@@ -2826,6 +2851,36 @@ def _get_quota_usages(context, session, project_id):
     return dict((row.resource, row) for row in rows)
 
 
+def _quota_usage_sync(elevated, session, project_id, resource, usages,
+                      until_refresh):
+    """Refresh the in_use counts covered by the sync routine of resource.
+
+    usages must be locked in session.  Returns the names of the resources
+    which were refreshed.
+    """
+    updates = resource.sync(elevated, project_id, session)
+    for res, in_use in updates.items():
+        # Make sure we have a destination for the usage!
+        if res not in usages:
+            usages[res] = _quota_usage_create(elevated,
+                                              project_id,
+                                              res,
+                                              0, 0,
+                                              until_refresh or None,
+                                              session=session)
+
+        # Update the usage
+        usages[res].in_use = in_use
+        usages[res].until_refresh = until_refresh or None
+
+        # NOTE(Vek): We make the assumption that the sync
+        #            routine actually refreshes the
+        #            resources that it is the sync routine
+        #            for.  We don't check, because this is
+        #            a best-effort mechanism.
+    return set(updates.keys())
+
+
 @require_context
 @_retry_on_deadlock
 def quota_reserve(context, resources, quotas, deltas, expire,
@@ -2869,35 +2924,13 @@ def quota_reserve(context, resources, quotas, deltas, expire,
 
             # OK, refresh the usage
             if refresh:
-                # Grab the sync routine
-                sync = resources[resource].sync
-
-                updates = sync(elevated, project_id, session)
-                for res, in_use in updates.items():
-                    # Make sure we have a destination for the usage!
-                    if res not in usages:
-                        usages[res] = _quota_usage_create(elevated,
-                                                         project_id,
-                                                         res,
-                                                         0, 0,
-                                                         until_refresh or None,
-                                                         session=session)
-
-                    # Update the usage
-                    usages[res].in_use = in_use
-                    usages[res].until_refresh = until_refresh or None
-
-                    # Because more than one resource may be refreshed
-                    # by the call to the sync routine, and we don't
-                    # want to double-sync, we make sure all refreshed
-                    # resources are dropped from the work set.
-                    work.discard(res)
-
-                    # NOTE(Vek): We make the assumption that the sync
-                    #            routine actually refreshes the
-                    #            resources that it is the sync routine
-                    #            for.  We don't check, because this is
-                    #            a best-effort mechanism.
+                # Because more than one resource may be refreshed by the
+                # call to the sync routine, and we don't want to
+                # double-sync, we make sure all refreshed resources are
+                # dropped from the work set.
+                work -= _quota_usage_sync(elevated, session, project_id,
+                                          resources[resource], usages,
+                                          until_refresh)
 
         # Check for deltas that would go negative
         unders = [res for res, delta in deltas.items()
@@ -2963,6 +2996,114 @@ def quota_reserve(context, resources, quotas, deltas, expire,
     return reservations
 
 
+@require_context
+@_retry_on_deadlock
+def quota_reserve_conditional(context, resources, quotas, deltas, expire,
+                              until_refresh, max_age, project_id=None):
+    """Reserve without locking or refreshing the project's usages.
+
+    Each positive delta is applied by a single UPDATE which only matches
+    while the new total stays within the quota, and the reservations are
+    inserted in one statement.  Usages which don't exist yet or are known
+    to be out of sync still go through quota_reserve(), which refreshes
+    them inline; otherwise keeping in_use accurate is left to
+    quota_usage_refresh().
+    """
+    elevated = context.elevated()
+    if project_id is None:
+        project_id = context.project_id
+
+    session = get_session()
+    with session.begin():
+        rows = model_query(elevated, models.QuotaUsage, read_deleted="no",
+                           session=session).\
+                       filter_by(project_id=project_id).\
+                       filter(models.QuotaUsage.resource.in_(deltas.keys())).\
+                       all()
+        usages = dict((row.resource, row) for row in rows)
+        needs_sync = (len(usages) != len(deltas) or
+                      any(usage.in_use < 0 for usage in usages.values()))
+
+        if not needs_sync:
+            # Update the usages in a fixed order so that concurrent
+            # reservations for the same resources can't deadlock.
+            overs = []
+            for res in sorted(deltas.keys()):
+                delta = deltas[res]
+                # NOTE: As in quota_reserve(), only positive deltas are
+                #       checked against the quota or held as reserved.
+                if delta <= 0:
+                    continue
+                query = model_query(elevated, models.QuotaUsage,
+                                    read_deleted="no", session=session).\
+                                filter_by(id=usages[res].id)
+                if quotas[res] >= 0:
+                    query = query.filter(models.QuotaUsage.in_use +
+                                         models.QuotaUsage.reserved +
+                                         delta <= quotas[res])
+                if not query.update(
+                        {'reserved': models.QuotaUsage.reserved + delta},
+                        synchronize_session=False):
+                    overs.append(res)
+
+            # Raising here rolls back the usages already updated.
+            if overs:
+                usages = dict((k, dict(in_use=v.in_use, reserved=v.reserved))
+                              for k, v in usages.items())
+                raise exception.OverQuota(overs=sorted(overs), quotas=quotas,
+                                          usages=usages)
+
+            now = timeutils.utcnow()
+            values = [dict(uuid=str(uuid.uuid4()),
+                           usage_id=usages[res].id,
+                           project_id=project_id,
+                           resource=res,
+                           delta=delta,
+                           expire=expire,
+                           created_at=now,
+                           deleted=0)
+                      for res, delta in deltas.items()]
+            session.execute(models.Reservation.__table__.insert(), values)
+            return [value['uuid'] for value in values]
+
+    return quota_reserve(context, resources, quotas, deltas, expire,
+                         until_refresh, max_age, project_id=project_id)
+
+
+@require_admin_context
+def quota_usage_get_stale_projects(context, max_age=0):
+    """Return the ids of projects which have usages to refresh."""
+    stale = models.QuotaUsage.in_use < 0
+    if max_age:
+        cutoff = timeutils.utcnow() - datetime.timedelta(seconds=max_age)
+        stale = or_(stale, func.coalesce(models.QuotaUsage.updated_at,
+                                         models.QuotaUsage.created_at) <
+                           cutoff)
+    rows = model_query(context, models.QuotaUsage.project_id,
+                       base_model=models.QuotaUsage, read_deleted="no").\
+                   filter(stale).\
+                   distinct().\
+                   all()
+    return [row[0] for row in rows]
+
+
+@require_admin_context
+@_retry_on_deadlock
+def quota_usage_refresh(context, resources, project_id, until_refresh=None):
+    session = get_session()
+    with session.begin():
+        usages = _get_quota_usages(context, session, project_id)
+        work = set(res for res in usages
+                   if hasattr(resources.get(res), 'sync'))
+        while work:
+            resource = work.pop()
+            work -= _quota_usage_sync(context, session, project_id,
+                                      resources[resource], usages,
+                                      until_refresh)
+        for usage_ref in usages.values():
+            usage_ref.save(session=session)
+
+
 def _quota_reservations_query(session, context, reservations):
     """Return the relevant reservations."""
 
@@ -3221,6 +3362,16 @@ def block_device_mapping_get_all_by_instance(context, instance_uuid):
                  all()
 
 
+@require_context
+def block_device_mapping_get_all_by_instance_uuids(context, instance_uuids):
+    if not instance_uuids:
+        return []
+    return _block_device_mapping_get_query(context).\
+                 filter(models.BlockDeviceMapping.instance_uuid.in_(
+                     instance_uuids)).\
+                 all()
+
+
 @require_context
 def block_device_mapping_destroy(context, bdm_id):
     _block_device_mapping_get_query(context).\
@@ -5176,6 +5327,70 @@ def task_log_end_task(context, task_name, period_beginning, period_ending,
             raise exception.TaskNotRunning(task_name=task_name, host=host)
 
 
+@require_admin_context
+def task_log_get_all_in_range(context, task_name, period_beginning,
+                              period_ending, state=None):
+    query = model_query(context, models.TaskLog).\
+                     filter_by(task_name=task_name).\
+                     filter(models.TaskLog.period_beginning >=
+                            period_beginning).\
+                     filter(models.TaskLog.period_ending <= period_ending)
+    if state is not None:
+        query = query.filter_by(state=state)
+    return query.all()
+
+
+###################
+
+
+@require_admin_context
+def tenant_usage_rollup_update(context, host, period_beginning,
+                               period_ending, usages):
+    session = get_session()
+    with session.begin():
+        model_query(context, models.TenantUsageRollup, session=session).\
+                filter_by(host=host).\
+                filter_by(period_beginning=period_beginning).\
+                filter_by(period_ending=period_ending).\
+                soft_delete(synchronize_session=False)
+
+        for project_id, usage in usages.iteritems():
+            rollup = models.TenantUsageRollup()
+            rollup.update(usage)
+            rollup.host = host
+            rollup.project_id = project_id
+            rollup.period_beginning = period_beginning
+            rollup.period_ending = period_ending
+            session.add(rollup)
+
+        # The task log marks the host's rollup for the period as complete,
+        # including when the host had nothing running.
+        task = _task_log_get_query(context, 'tenant_usage_rollup',
+                                   period_beginning, period_ending, host,
+                                   session=session).first()
+        if task is None:
+            task = models.TaskLog()
+            task.task_name = 'tenant_usage_rollup'
+            task.period_beginning = period_beginning
+            task.period_ending = period_ending
+            task.host = host
+        task.state = 'DONE'
+        task.task_items = len(usages)
+        task.errors = 0
+        task.message = 'Usage of %d projects recorded.' % len(usages)
+        session.add(task)
+
+
+@require_admin_context
+def tenant_usage_rollup_get_all(context, period_beginning, period_ending):
+    return model_query(context, models.TenantUsageRollup).\
+                    filter(models.TenantUsageRollup.period_beginning >=
+                           period_beginning).\
+                    filter(models.TenantUsageRollup.period_ending <=
+                           period_ending).\
+                    all()
+
+
 def _get_default_deleted_value(table):
     # TODO(dripton): It would be better to introspect the actual default value
     # from the column, but I don't see a way to do that in the low-level APIs
@@ -0,0 +1,45 @@
+# Copyright 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Index, MetaData, Table
+
+
+TABLE_NAME = 'instances'
+INDEXES = [
+    ('instances_deleted_created_at_idx',
+     ('deleted', 'created_at', 'id')),
+    ('instances_project_id_deleted_created_at_idx',
+     ('project_id', 'deleted', 'created_at', 'id')),
+]
+
+
+def _indexes(migrate_engine):
+    meta = MetaData(bind=migrate_engine)
+    instances = Table(TABLE_NAME, meta, autoload=True)
+    return [Index(name, *[instances.c[column] for column in columns])
+            for name, columns in INDEXES]
+
+
+def upgrade(migrate_engine):
+    """Add indexes matching the default sort order of server listings, so
+    that each page of a marker/limit listing is a range scan.
+    """
+    for idx in _indexes(migrate_engine):
+        idx.create(migrate_engine)
+
+
+def downgrade(migrate_engine):
+    for idx in _indexes(migrate_engine):
+        idx.drop(migrate_engine)
@@ -0,0 +1,72 @@
+# Copyright 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from migrate.changeset import UniqueConstraint
+from sqlalchemy import Column
+from sqlalchemy import DateTime
+from sqlalchemy import Float
+from sqlalchemy import Index
+from sqlalchemy import Integer
+from sqlalchemy import MetaData
+from sqlalchemy import String
+from sqlalchemy import Table
+
+from nova.db.sqlalchemy import api as db
+from nova.db.sqlalchemy import utils
+
+
+TABLE_NAME = 'tenant_usage_rollups'
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    rollups = Table(TABLE_NAME, meta,
+        Column('created_at', DateTime),
+        Column('updated_at', DateTime),
+        Column('deleted_at', DateTime),
+        Column('deleted', Integer),
+        Column('id', Integer, primary_key=True, nullable=False),
+        Column('host', String(length=255), nullable=False),
+        Column('project_id', String(length=255), nullable=False),
+        Column('period_beginning', DateTime, nullable=False),
+        Column('period_ending', DateTime, nullable=False),
+        Column('instances', Integer),
+        Column('total_hours', Float),
+        Column('total_vcpus_usage', Float),
+        Column('total_memory_mb_usage', Float),
+        Column('total_local_gb_usage', Float),
+        UniqueConstraint('host', 'project_id', 'period_beginning',
+                         'period_ending', 'deleted',
+                         name='uniq_tenant_usage_rollups0host0project_id0'
+                              'period_beginning0period_ending0deleted'),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8',
+    )
+    rollups.create()
+    utils.create_shadow_table(migrate_engine, table=rollups)
+
+    Index('tenant_usage_rollups_period_idx',
+          rollups.c.period_beginning,
+          rollups.c.period_ending).create(migrate_engine)
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    for name in (TABLE_NAME, db._SHADOW_TABLE_PREFIX + TABLE_NAME):
+        Table(name, meta, autoload=True).drop()
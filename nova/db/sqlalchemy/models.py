@@ -162,7 +162,11 @@ class Instance(BASE, NovaBase):
         Index('instances_task_state_updated_at_idx',
               'task_state', 'updated_at'),
         Index('instances_host_node_deleted_idx',
-              'host', 'node', 'deleted')
+              'host', 'node', 'deleted'),
+        Index('instances_deleted_created_at_idx',
+              'deleted', 'created_at', 'id'),
+        Index('instances_project_id_deleted_created_at_idx',
+              'project_id', 'deleted', 'created_at', 'id')
     )
     injected_files = []
 
@@ -1129,6 +1133,31 @@ class TaskLog(BASE, NovaBase):
     errors = Column(Integer(), default=0, nullable=True)
 
 
+class TenantUsageRollup(BASE, NovaBase):
+    """Usage of a project's instances on a host during an audit period."""
+    __tablename__ = 'tenant_usage_rollups'
+    __table_args__ = (
+        schema.UniqueConstraint(
+            'host', 'project_id', 'period_beginning', 'period_ending',
+            'deleted',
+            name='uniq_tenant_usage_rollups0host0project_id0'
+                 'period_beginning0period_ending0deleted'
+        ),
+        Index('tenant_usage_rollups_period_idx',
+              'period_beginning', 'period_ending'),
+    )
+    id = Column(Integer, primary_key=True, nullable=False, autoincrement=True)
+    host = Column(String(255), nullable=False)
+    project_id = Column(String(255), nullable=False)
+    period_beginning = Column(DateTime, nullable=False)
+    period_ending = Column(DateTime, nullable=False)
+    instances = Column(Integer, default=0)
+    total_hours = Column(Float, default=0)
+    total_vcpus_usage = Column(Float, default=0)
+    total_memory_mb_usage = Column(Float, default=0)
+    total_local_gb_usage = Column(Float, default=0)
+
+
 class InstanceGroupMember(BASE, NovaBase):
     """Represents the members for an instance group."""
     __tablename__ = 'instance_group_member'
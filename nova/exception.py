@@ -209,6 +209,11 @@ class ImageNotAuthorized(NovaException):
     message = _("Not authorized for image %(image_id)s.")
 
 
+class ImageChecksumMismatch(NovaException):
+    message = _("Checksum of the data downloaded for image %(image_id)s "
+                "is %(actual)s, expected %(expected)s.")
+
+
 class Invalid(NovaException):
     message = _("Unacceptable parameters.")
     code = 400
@@ -20,21 +20,30 @@
 from __future__ import absolute_import
 
 import copy
+import functools
+import hashlib
 import itertools
+import os
 import random
 import shutil
+import socket
 import sys
 import time
+import urllib
 import urlparse
 
+from eventlet import greenpool
+from eventlet import greenthread
 import glanceclient
 import glanceclient.exc
 from oslo.config import cfg
 
 from nova import exception
+from nova.openstack.common import fileutils
 from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
 from nova.openstack.common import timeutils
+from nova import utils
 
 glance_opts = [
     cfg.StrOpt('glance_host',
@@ -64,6 +73,34 @@ glance_opts = [
                 help='A list of url scheme that can be downloaded directly '
                      'via the direct_url.  Currently supported schemes: '
                      '[file].'),
+    cfg.BoolOpt('link_direct_url_files',
+                default=False,
+                help='Hard link images with a file direct_url into place '
+                     'instead of copying them, when they are on the same '
+                     'filesystem. Only safe if the files glance stores '
+                     'images in are never modified'),
+    cfg.IntOpt('image_metadata_cache_time',
+               default=0,
+               help='number of seconds each process caches the metadata '
+                    'of active images, 0 to disable. Changes made through '
+                    'other processes or directly in glance take up to that '
+                    'long to be seen'),
+    cfg.IntOpt('image_metadata_cache_size',
+               default=1000,
+               help='maximum number of images each process caches the '
+                    'metadata of'),
+    cfg.IntOpt('glance_download_parallelism',
+               default=1,
+               help='Number of ranges of an image to download at the same '
+                    'time, spread across the glance api servers. More than '
+                    '1 also lets an interrupted download of an image to a '
+                    'file resume where it left off. Needs glance api '
+                    'servers which honour Range requests, otherwise images '
+                    'are downloaded in one piece'),
+    cfg.IntOpt('glance_download_part_size',
+               default=32,
+               help='Size in MB of the ranges images are downloaded in when '
+                    'glance_download_parallelism is more than 1'),
     ]
 
 LOG = logging.getLogger(__name__)
@@ -72,6 +109,8 @@ CONF.register_opts(glance_opts)
 CONF.import_opt('auth_strategy', 'nova.api.auth')
 CONF.import_opt('my_ip', 'nova.netconf')
 
+_DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
 
 def generate_glance_url():
     """Generate the URL to glance."""
@@ -165,6 +204,19 @@ class GlanceClientWrapper(object):
                                      self.host, self.port,
                                      self.use_ssl, version)
 
+    def get_clients(self, context, version):
+        """
+        Return a (host, port, client) tuple for each glance api server,
+        or just for the static one if there is one.
+        """
+        if self.client is not None:
+            return [(self.host, self.port, self.client)]
+        api_servers = itertools.islice(get_api_servers(),
+                                       len(CONF.glance_api_servers))
+        return [(host, port,
+                 _create_glance_client(context, host, port, use_ssl, version))
+                for host, port, use_ssl in api_servers]
+
     def call(self, context, version, method, *args, **kwargs):
         """
         Call a glance client method.  If we get a connection error,
@@ -195,6 +247,249 @@ class GlanceClientWrapper(object):
                 time.sleep(1)
 
 
+_IMAGE_CACHE = None
+
+
+def _get_image_cache():
+    """Return this process' image metadata cache, or None if it is
+    disabled.
+    """
+    global _IMAGE_CACHE
+    cache_time = CONF.image_metadata_cache_time
+    if cache_time <= 0:
+        return None
+    if (_IMAGE_CACHE is None or _IMAGE_CACHE.ttl != cache_time or
+            _IMAGE_CACHE.max_size != CONF.image_metadata_cache_size):
+        _IMAGE_CACHE = utils.ExpiringLRUCache(
+            CONF.image_metadata_cache_size, cache_time,
+            name='Image metadata')
+    return _IMAGE_CACHE
+
+
+def invalidate_image_cache():
+    """Forget the image metadata cached by this process."""
+    if _IMAGE_CACHE is not None:
+        _IMAGE_CACHE.clear()
+
+
+def get_image_cache_stats():
+    """Return the hit and miss counts etc. of this process' image
+    metadata cache, or None if it is disabled.
+    """
+    cache = _get_image_cache()
+    if cache is not None:
+        return cache.stats()
+
+
+def _copy_file(src_path, dst_path):
+    """Copy a local image file to dst_path without reading it through
+    python.
+    """
+    if CONF.link_direct_url_files:
+        try:
+            fileutils.delete_if_exists(dst_path)
+            os.link(src_path, dst_path)
+            return
+        except OSError as e:
+            LOG.debug(_('Could not link %(src_path)s to %(dst_path)s, '
+                        'copying it instead: %(error)s'),
+                      {'src_path': src_path, 'dst_path': dst_path,
+                       'error': e})
+    # cp shares the blocks of the source with a reflink where the
+    # filesystem supports it, otherwise it copies the data in the kernel
+    # and leaves holes for runs of zeros.
+    utils.execute('cp', '--reflink=auto', '--sparse=always',
+                  src_path, dst_path)
+
+
+def discard_partial_download(path):
+    """Forget which ranges of an image downloaded to path have been
+    written, so that downloading to path again starts over.
+    """
+    fileutils.delete_if_exists('%s.ranges' % path)
+
+
+class _RangesNotSupported(Exception):
+    """The glance api server answered a Range request with the whole
+    image.
+    """
+    pass
+
+
+class _RangedDownload(object):
+    """Downloads an image to a file in fixed size ranges, several at a time.
+
+    The ranges written so far are recorded in a .ranges file beside the
+    image file, so that downloading the same image to the same path again
+    after a failure only fetches the missing ranges.
+    """
+
+    def __init__(self, path, image_id, size, checksum, part_size):
+        self.path = path
+        self.state_path = '%s.ranges' % path
+        self.image_id = image_id
+        self.size = size
+        self.checksum = checksum
+        self.part_size = part_size
+        self.num_parts = (size + part_size - 1) // part_size
+        self.done = self._load_done()
+        self.failed = False
+
+    def _state(self, done):
+        return {'image_id': self.image_id,
+                'size': self.size,
+                'checksum': self.checksum,
+                'part_size': self.part_size,
+                'done': sorted(done)}
+
+    def _load_done(self):
+        """Return the ranges written by an earlier attempt, as long as it
+        was downloading the same image in the same size ranges.
+        """
+        if not os.path.exists(self.path):
+            return set()
+        try:
+            with open(self.state_path) as f:
+                state = jsonutils.loads(f.read())
+            if state == self._state(state['done']):
+                LOG.info(_('Resuming download of image %(image_id)s to '
+                           '%(path)s, %(done)d of %(num_parts)d ranges '
+                           'already written'),
+                         {'image_id': self.image_id, 'path': self.path,
+                          'done': len(state['done']),
+                          'num_parts': self.num_parts})
+                return set(state['done'])
+        except (IOError, ValueError, KeyError, TypeError):
+            pass
+        return set()
+
+    def _save(self):
+        tmp_path = '%s.tmp' % self.state_path
+        with open(tmp_path, 'w') as f:
+            f.write(jsonutils.dumps(self._state(self.done)))
+        os.rename(tmp_path, self.state_path)
+
+    def discard(self):
+        """Forget which ranges have been written."""
+        self.done = set()
+        fileutils.delete_if_exists(self.state_path)
+
+    def _fetch_range(self, client, start, end):
+        url = '/v1/images/%s' % urllib.quote(str(self.image_id))
+        headers = {'Range': 'bytes=%d-%d' % (start, end)}
+        resp, _body = client.images.api.raw_request('GET', url,
+                                                    headers=headers)
+        if resp.status != 206:
+            resp.close()
+            raise _RangesNotSupported()
+
+        # NOTE: the response is read directly, the body iterator of
+        # glanceclient would checksum every range as well.
+        expected = end - start + 1
+        written = 0
+        with open(self.path, 'r+b') as f:
+            f.seek(start)
+            while written <= expected:
+                chunk = resp.read(_DOWNLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written <= expected:
+                    f.write(chunk)
+            if written != expected:
+                raise IOError(_('Expected %(expected)d bytes of image '
+                                '%(image_id)s from offset %(start)d, got '
+                                '%(written)d') %
+                              {'expected': expected, 'written': written,
+                               'image_id': self.image_id, 'start': start})
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _fetch(self, clients, index):
+        """Fetch one range, retrying it on the next server on failure."""
+        if index in self.done or self.failed:
+            return index
+
+        start = index * self.part_size
+        end = min(start + self.part_size, self.size) - 1
+        retry_excs = (glanceclient.exc.ServiceUnavailable,
+                      glanceclient.exc.InvalidEndpoint,
+                      glanceclient.exc.CommunicationError,
+                      IOError, socket.error)
+        num_attempts = 1 + CONF.glance_num_retries
+        for attempt in xrange(1, num_attempts + 1):
+            host, port, client = clients[(index + attempt - 1) % len(clients)]
+            try:
+                self._fetch_range(client, start, end)
+                break
+            except retry_excs as e:
+                msg = _("Error fetching bytes %(start)d-%(end)d of image "
+                        "%(image_id)s from glance server "
+                        "'%(host)s:%(port)s', %(extra)s.")
+                params = {'start': start, 'end': end,
+                          'image_id': self.image_id,
+                          'host': host, 'port': port}
+                if attempt == num_attempts:
+                    params['extra'] = 'done trying'
+                    LOG.exception(msg, params)
+                    raise exception.GlanceConnectionFailed(
+                            host=host, port=port, reason=str(e))
+                params['extra'] = 'retrying'
+                LOG.exception(msg, params)
+                time.sleep(1)
+            except Exception:
+                self.failed = True
+                raise
+
+        self.done.add(index)
+        self._save()
+        return index
+
+    def _hash(self, f, index, md5):
+        start = index * self.part_size
+        remaining = min(self.part_size, self.size - start)
+        f.seek(start)
+        while remaining:
+            chunk = f.read(min(remaining, _DOWNLOAD_CHUNK_SIZE))
+            if not chunk:
+                raise IOError(_('%s is shorter than expected') % self.path)
+            md5.update(chunk)
+            remaining -= len(chunk)
+            # Let the ranges still being fetched make progress
+            greenthread.sleep(0)
+
+    def run(self, clients, parallelism):
+        """Fetch the ranges not written yet and check the whole image
+        against its checksum as the ranges complete in order.
+        """
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT, 0644)
+        try:
+            os.ftruncate(fd, self.size)
+        finally:
+            os.close(fd)
+
+        md5 = hashlib.md5()
+        pool = greenpool.GreenPool(parallelism)
+        fetch = functools.partial(self._fetch, clients)
+        try:
+            with open(self.path, 'rb') as f:
+                for index in pool.imap(fetch, xrange(self.num_parts)):
+                    self._hash(f, index, md5)
+        except Exception:
+            # Stop fetching further ranges, the ones written so far are
+            # kept for the next attempt.
+            self.failed = True
+            raise
+
+        if self.checksum and md5.hexdigest() != self.checksum:
+            self.discard()
+            fileutils.delete_if_exists(self.path)
+            raise exception.ImageChecksumMismatch(image_id=self.image_id,
+                                                  expected=self.checksum,
+                                                  actual=md5.hexdigest())
+        self.discard()
+
+
 class GlanceImageService(object):
     """Provides storage and retrieval of disk image objects within Glance."""
 
@@ -233,6 +528,15 @@ class GlanceImageService(object):
 
     def show(self, context, image_id):
         """Returns a dict with image data for the given opaque image id."""
+        cache = _get_image_cache()
+        if cache is not None:
+            # Which images can be seen depends on the project and whether
+            # the user is an admin
+            key = (image_id, context.project_id, context.is_admin)
+            image_meta = cache.get(key)
+            if image_meta is not None:
+                return copy.deepcopy(image_meta)
+
         try:
             image = self._client.call(context, 1, 'get', image_id)
         except Exception:
@@ -242,6 +546,9 @@ class GlanceImageService(object):
             raise exception.ImageNotFound(image_id=image_id)
 
         base_image_meta = self._translate_from_glance(image)
+        # Images which aren't active yet are still changing
+        if cache is not None and base_image_meta.get('status') == 'active':
+            cache.set(key, copy.deepcopy(base_image_meta))
         return base_image_meta
 
     def get_location(self, context, image_id):
@@ -259,20 +566,40 @@ class GlanceImageService(object):
 
         return getattr(image_meta, 'direct_url', None)
 
-    def download(self, context, image_id, data=None):
-        """Calls out to Glance for data and writes data."""
-        if 'file' in CONF.allowed_direct_url_schemes:
-            location = self.get_location(context, image_id)
+    def _get_direct_file(self, context, image_id):
+        """Return the path of the file glance stores the image's data in,
+        if this host is allowed to read it directly.
+        """
+        if 'file' not in CONF.allowed_direct_url_schemes:
+            return None
+        location = self.get_location(context, image_id)
+        if location:
             o = urlparse.urlparse(location)
             if o.scheme == "file":
-                with open(o.path, "r") as f:
-                    # FIXME(jbresnah) a system call to cp could have
-                    # significant performance advantages, however we
-                    # do not have the path to files at this point in
-                    # the abstraction.
-                    shutil.copyfileobj(f, data)
+                return o.path
+        return None
+
+    def download(self, context, image_id, data=None, dst_path=None):
+        """Calls out to Glance for data and writes it to data, or to the
+        file at dst_path.  Returns an iterator over the data if neither is
+        given.
+        """
+        if data is not None or dst_path is not None:
+            src_path = self._get_direct_file(context, image_id)
+            if src_path is not None:
+                if dst_path is not None:
+                    _copy_file(src_path, dst_path)
+                else:
+                    with open(src_path, "r") as f:
+                        shutil.copyfileobj(f, data)
                 return
 
+        if dst_path is not None:
+            if CONF.glance_download_parallelism > 1:
+                return self._download_ranges(context, image_id, dst_path)
+            with open(dst_path, 'wb') as data:
+                return self.download(context, image_id, data)
+
         try:
             image_chunks = self._client.call(context, 1, 'data', image_id)
         except Exception:
@@ -284,6 +611,33 @@ class GlanceImageService(object):
             for chunk in image_chunks:
                 data.write(chunk)
 
+    def _download_ranges(self, context, image_id, dst_path):
+        """Download an image to dst_path in ranges, fetching several at a
+        time across the glance api servers.  What has been written is kept
+        if the download fails, so that it can be resumed.
+        """
+        image_meta = self.show(context, image_id)
+        if not image_meta.get('size'):
+            with open(dst_path, 'wb') as data:
+                return self.download(context, image_id, data)
+
+        part_size = CONF.glance_download_part_size * 1024 * 1024
+        download = _RangedDownload(dst_path, image_id, image_meta['size'],
+                                   image_meta.get('checksum'), part_size)
+        clients = self._client.get_clients(context, 1)
+        try:
+            download.run(clients, CONF.glance_download_parallelism)
+        except _RangesNotSupported:
+            LOG.info(_('Glance does not support Range requests, downloading '
+                       'image %s in one piece'), image_id)
+            download.discard()
+            with open(dst_path, 'wb') as data:
+                return self.download(context, image_id, data)
+        except (exception.NovaException, IOError):
+            raise
+        except Exception:
+            _reraise_translated_image_exception(image_id)
+
     def create(self, context, image_meta, data=None):
         """Store the image data and return the new image object."""
         sent_service_image_meta = self._translate_to_glance(image_meta)
@@ -315,6 +669,7 @@ class GlanceImageService(object):
         except Exception:
             _reraise_translated_image_exception(image_id)
         else:
+            invalidate_image_cache()
             return self._translate_from_glance(image_meta)
 
     def delete(self, context, image_id):
@@ -331,6 +686,7 @@ class GlanceImageService(object):
             raise exception.ImageNotFound(image_id=image_id)
         except glanceclient.exc.HTTPForbidden:
             raise exception.ImageNotAuthorized(image_id=image_id)
+        invalidate_image_cache()
         return True
 
     @staticmethod
@@ -60,7 +60,6 @@ from nova.db import base
 from nova.objects import base as objects_base
 from nova.openstack.common import log as logging
 from nova.openstack.common import periodic_task
-from nova.openstack.common.rpc import dispatcher as rpc_dispatcher
 from nova.scheduler import rpcapi as scheduler_rpcapi
 
 
@@ -93,7 +92,8 @@ class Manager(base.Base, periodic_task.PeriodicTasks):
         base_rpc = baserpc.BaseRPCAPI(self.service_name, backdoor_port)
         apis.extend([self, base_rpc])
         serializer = objects_base.NovaObjectSerializer()
-        return rpc_dispatcher.RpcDispatcher(apis, serializer)
+        return baserpc.RpcDispatcher(apis, serializer,
+                                     service_name=self.service_name)
 
     def periodic_tasks(self, context, raise_on_error=False):
         """Tasks to be run at a periodic interval."""
@@ -122,6 +122,22 @@ linux_net_opts = [
                default='DROP',
                help=('The table that iptables to jump to when a packet is '
                      'to be dropped.')),
+    cfg.BoolOpt('iptables_incremental_apply',
+                default=False,
+                help='Only rewrite the chains of this service whose rules '
+                     'changed since they were last applied, with '
+                     'iptables-restore --noflush, instead of saving and '
+                     'restoring whole tables. Whole tables are still '
+                     'restored when the shared chains change, when '
+                     'iptables_top_regex or iptables_bottom_regex are set, '
+                     'and every iptables_full_apply_interval seconds. Rules '
+                     'of this service which something else removed, e.g. '
+                     'by flushing the tables, are only put back then'),
+    cfg.IntOpt('iptables_full_apply_interval',
+               default=600,
+               help='Number of seconds after which the next apply '
+                    'restores the whole tables again when '
+                    'iptables_incremental_apply is set'),
     ]
 
 CONF = cfg.CONF
@@ -333,6 +349,11 @@ class IptablesManager(object):
 
         self.iptables_apply_deferred = False
 
+        # What was last applied with each command, see _table_state(),
+        # and when the whole tables were last restored
+        self.applied_state = {}
+        self.applied_at = {}
+
         # Add a nova-filter-top chain. It's intended to be shared
         # among the various nova components. It sits at the very top
         # of FORWARD and OUTPUT.
@@ -410,19 +431,119 @@ class IptablesManager(object):
             s += [('ip6tables', self.ipv6)]
 
         for cmd, tables in s:
-            all_tables, _err = self.execute('%s-save' % (cmd,), '-c',
-                                                run_as_root=True,
-                                                attempts=5)
-            all_lines = all_tables.split('\n')
-            for table_name, table in tables.iteritems():
-                start, end = self._find_table(all_lines, table_name)
-                all_lines[start:end] = self._modify_rules(
-                        all_lines[start:end], table, table_name)
-            self.execute('%s-restore' % (cmd,), '-c', run_as_root=True,
-                         process_input='\n'.join(all_lines),
-                         attempts=5)
+            if not (CONF.iptables_incremental_apply and
+                    self._apply_changed_chains(cmd, tables)):
+                self._apply_tables(cmd, tables)
         LOG.debug(_("IPTablesManager.apply completed with success"))
 
+    def _apply_tables(self, cmd, tables):
+        """Save the whole tables, put our rules in and restore them."""
+        state = dict((table_name, self._table_state(table))
+                     for table_name, table in tables.iteritems())
+        all_tables, _err = self.execute('%s-save' % (cmd,), '-c',
+                                            run_as_root=True,
+                                            attempts=5)
+        all_lines = all_tables.split('\n')
+        for table_name, table in tables.iteritems():
+            start, end = self._find_table(all_lines, table_name)
+            all_lines[start:end] = self._modify_rules(
+                    all_lines[start:end], table, table_name)
+        self.execute('%s-restore' % (cmd,), '-c', run_as_root=True,
+                     process_input='\n'.join(all_lines),
+                     attempts=5)
+        self.applied_at[cmd] = timeutils.utcnow()
+        self.applied_state[cmd] = dict(
+            (table_name, (shared, dict((chain, hash(lines))
+                                       for chain, lines in chains.items())))
+            for table_name, (shared, chains) in state.items())
+
+    @staticmethod
+    def _table_state(table):
+        """Return a hash of the unwrapped chains and rules of a table,
+        which are shared with other services, and the lines of each of its
+        wrapped chains in the order _modify_rules() writes them.
+        """
+        rules = ([rule for rule in table.rules if rule.top] +
+                 [rule for rule in table.rules if not rule.top])
+        shared = hash((tuple(sorted(table.unwrapped_chains)),
+                       tuple(str(rule) for rule in rules if not rule.wrap)))
+        chains = dict((chain, []) for chain in table.chains)
+        for rule in rules:
+            if rule.wrap:
+                chains[rule.chain].append('-A %s-%s %s' % (
+                    binary_name, rule.chain, rule.rule))
+        # Like _modify_rules(), the last of duplicate rules wins
+        for chain, lines in chains.items():
+            seen = set()
+            unique = []
+            for line in reversed(lines):
+                if line not in seen:
+                    seen.add(line)
+                    unique.append(line)
+            unique.reverse()
+            chains[chain] = tuple(unique)
+        return shared, chains
+
+    def _apply_changed_chains(self, cmd, tables):
+        """Rewrite only the wrapped chains which changed since the tables
+        were last applied, leaving everything else in place.
+
+        Returns False if the whole tables have to be applied instead.
+        """
+        applied = self.applied_state.get(cmd)
+        if (applied is None or CONF.iptables_top_regex or
+                CONF.iptables_bottom_regex):
+            return False
+        # Only restoring the whole tables puts back our rules if something
+        # else removed them, since the chains which did not change are not
+        # looked at.
+        if timeutils.is_older_than(self.applied_at[cmd],
+                                   CONF.iptables_full_apply_interval):
+            return False
+
+        new_state = {}
+        lines = []
+        for table_name, table in tables.iteritems():
+            if table.remove_rules or table.remove_chains:
+                return False
+            shared, chains = self._table_state(table)
+            old_shared, old_hashes = applied.get(table_name, (None, {}))
+            if shared != old_shared:
+                return False
+
+            hashes = dict((chain, hash(chain_lines))
+                          for chain, chain_lines in chains.items())
+            changed = sorted(chain for chain in hashes
+                             if hashes[chain] != old_hashes.get(chain))
+            removed = sorted(set(old_hashes) - set(hashes))
+            new_state[table_name] = (shared, hashes)
+            if not changed and not removed:
+                continue
+
+            # Declaring a chain creates it, or flushes it if it exists
+            lines.append('*%s' % table_name)
+            lines += [':%s-%s - [0:0]' % (binary_name, chain)
+                      for chain in changed + removed]
+            for chain in changed:
+                lines += chains[chain]
+            lines += ['-X %s-%s' % (binary_name, chain)
+                      for chain in removed]
+            lines.append('COMMIT')
+
+        if lines:
+            try:
+                self.execute('%s-restore' % (cmd,), '--noflush',
+                             run_as_root=True,
+                             process_input='\n'.join(lines) + '\n',
+                             attempts=5)
+            except processutils.ProcessExecutionError:
+                LOG.exception(_('Failed to apply the changed %s chains, '
+                                'applying the whole tables'), cmd)
+                self.applied_state.pop(cmd, None)
+                return False
+        self.applied_state[cmd] = new_state
+        return True
+
     def _find_table(self, lines, table_name):
         if len(lines) < 3:
             # length only <2 when fake iptables
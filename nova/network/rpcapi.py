@@ -20,9 +20,9 @@ Client side of the network RPC API.
 
 from oslo.config import cfg
 
+from nova import baserpc
 from nova.openstack.common import jsonutils
 from nova.openstack.common import rpc
-from nova.openstack.common.rpc import proxy as rpc_proxy
 
 rpcapi_opts = [
     cfg.StrOpt('network_topic',
@@ -43,7 +43,7 @@ rpcapi_cap_opt = cfg.StrOpt('network',
 CONF.register_opt(rpcapi_cap_opt, 'upgrade_levels')
 
 
-class NetworkAPI(rpc_proxy.RpcProxy):
+class NetworkAPI(baserpc.RpcProxy):
     '''Client side of the network rpc API.
 
     API version history:
@@ -18,6 +18,9 @@
 """Policy Engine For Nova."""
 
 import os.path
+import re
+import time
+import weakref
 
 from oslo.config import cfg
 
@@ -41,12 +44,25 @@ CONF.register_opts(policy_opts)
 _POLICY_PATH = None
 _POLICY_CACHE = {}
 
+# The rules compiled so far, and the rules object they were compiled from
+_COMPILED_RULES = {}
+_COMPILED_FROM = None
+_GENERATION = 0
+
+# Decisions made for each context, so that checking the same action
+# against the same target again during a request is a dict lookup.
+_DECISIONS = weakref.WeakKeyDictionary()
+_MAX_DECISIONS = 1000
+
+_TARGET_KEYS = re.compile(r'%\(([^)]*)\)')
+
 
 def reset():
     global _POLICY_PATH
     global _POLICY_CACHE
     _POLICY_PATH = None
     _POLICY_CACHE = {}
+    _reset_compiled(None)
     policy.reset()
 
 
@@ -59,13 +75,217 @@ def init():
             _POLICY_PATH = CONF.find_file(_POLICY_PATH)
         if not _POLICY_PATH:
             raise exception.ConfigNotFound(path=CONF.policy_file)
+    # Checking whether the file changed on every call is a noticeable
+    # part of a policy check, and its mtime only has a resolution of a
+    # second anyway.
+    now = time.time()
+    if _POLICY_CACHE and now - _POLICY_CACHE.get('checked_at', 0) < 1:
+        return
     utils.read_cached_file(_POLICY_PATH, _POLICY_CACHE,
                            reload_func=_set_rules)
+    _POLICY_CACHE['checked_at'] = now
 
 
 def _set_rules(data):
     default_rule = CONF.policy_default_rule
-    policy.set_rules(policy.Rules.load_json(data, default_rule))
+    rules = policy.Rules.load_json(data, default_rule)
+    policy.set_rules(rules)
+    _reset_compiled(rules)
+    for action in rules:
+        _compiled_rule(action)
+
+
+class _CompiledRule(object):
+    """A rule compiled into a plain function of (target, creds).
+
+    cred_keys and target_keys are the credentials and target items the
+    rule depends on, or None if it may depend on anything, e.g. because
+    it asks a remote server.
+    """
+
+    def __init__(self, func, cred_keys=(), target_keys=()):
+        self.func = func
+        self.cred_keys = cred_keys
+        self.target_keys = target_keys
+
+    def __call__(self, target, creds):
+        try:
+            return self.func(target, creds)
+        except KeyError:
+            # Fail closed, as policy.check() does
+            return False
+
+
+def _union(compiled_rules, attr):
+    keys = set()
+    for rule in compiled_rules:
+        rule_keys = getattr(rule, attr)
+        if rule_keys is None:
+            return None
+        keys.update(rule_keys)
+    return tuple(sorted(keys))
+
+
+def _compile_all(checks, rules, compiling):
+    compiled = [_compile(check, rules, compiling) for check in checks]
+    return ([rule.func for rule in compiled],
+            _union(compiled, 'cred_keys'),
+            _union(compiled, 'target_keys'))
+
+
+def _compile(check, rules, compiling):
+    """Translate a tree of policy checks into nested closures.
+
+    Sub-rules referenced with rule: are inlined and role names lowered
+    once, so that evaluating a rule does no lookups beyond the target
+    and credentials.  Checks the compiler doesn't know are called as
+    they are.
+    """
+    if isinstance(check, policy.TrueCheck):
+        return _CompiledRule(lambda target, creds: True)
+
+    if isinstance(check, policy.FalseCheck):
+        return _CompiledRule(lambda target, creds: False)
+
+    if isinstance(check, policy.NotCheck):
+        rule = _compile(check.rule, rules, compiling)
+        func = rule.func
+        return _CompiledRule(lambda target, creds: not func(target, creds),
+                             rule.cred_keys, rule.target_keys)
+
+    if isinstance(check, policy.AndCheck):
+        funcs, cred_keys, target_keys = _compile_all(check.rules, rules,
+                                                     compiling)
+
+        def and_check(target, creds):
+            for func in funcs:
+                if not func(target, creds):
+                    return False
+            return True
+        return _CompiledRule(and_check, cred_keys, target_keys)
+
+    if isinstance(check, policy.OrCheck):
+        funcs, cred_keys, target_keys = _compile_all(check.rules, rules,
+                                                     compiling)
+
+        def or_check(target, creds):
+            for func in funcs:
+                if func(target, creds):
+                    return True
+            return False
+        return _CompiledRule(or_check, cred_keys, target_keys)
+
+    if isinstance(check, policy.RuleCheck):
+        if check.match in compiling:
+            # A rule referencing itself can't be inlined
+            return _CompiledRule(check, None, None)
+        try:
+            referenced = rules[check.match]
+        except KeyError:
+            return _CompiledRule(lambda target, creds: False)
+        return _compile(referenced, rules, compiling + (check.match,))
+
+    if isinstance(check, policy.RoleCheck):
+        role = check.match.lower()
+
+        def role_check(target, creds):
+            for cred_role in creds['roles']:
+                if cred_role.lower() == role:
+                    return True
+            return False
+        return _CompiledRule(role_check, ('roles',))
+
+    if isinstance(check, IsAdminCheck):
+        expected = check.expected
+        return _CompiledRule(lambda target, creds:
+                                 creds['is_admin'] == expected,
+                             ('is_admin',))
+
+    if type(check) is policy.GenericCheck:
+        kind = check.kind
+        match = check.match
+        if '%' not in match:
+            def generic_check(target, creds):
+                if kind in creds:
+                    return match == unicode(creds[kind])
+                return False
+            return _CompiledRule(generic_check, (kind,))
+
+        def generic_template_check(target, creds):
+            value = match % target
+            if kind in creds:
+                return value == unicode(creds[kind])
+            return False
+        return _CompiledRule(generic_template_check, (kind,),
+                             tuple(sorted(set(_TARGET_KEYS.findall(match)))))
+
+    return _CompiledRule(check, None, None)
+
+
+def _reset_compiled(rules):
+    global _COMPILED_RULES
+    global _COMPILED_FROM
+    global _GENERATION
+    _COMPILED_RULES = {}
+    _COMPILED_FROM = rules
+    _GENERATION += 1
+
+
+def _compiled_rule(action):
+    """Return the compiled rule for an action, or None if there are no
+    rules.
+    """
+    # Rules may also be set directly with policy.set_rules()
+    rules = policy._rules
+    if rules is not _COMPILED_FROM:
+        _reset_compiled(rules)
+    if not rules:
+        return None
+
+    compiled = _COMPILED_RULES.get(action)
+    if compiled is None:
+        try:
+            check = rules[action]
+        except KeyError:
+            compiled = _CompiledRule(lambda target, creds: False)
+        else:
+            compiled = _compile(check, rules, (action,))
+        _COMPILED_RULES[action] = compiled
+    return compiled
+
+
+def _hashable(value):
+    if isinstance(value, list):
+        return tuple(value)
+    return value
+
+
+def _check(context, action, target):
+    compiled = _compiled_rule(action)
+    if compiled is None:
+        # No rules to reference means we're going to fail closed
+        return False
+
+    if compiled.cred_keys is None or compiled.target_keys is None:
+        return compiled(target, context.to_dict())
+
+    key = (_GENERATION, action,
+           tuple([_hashable(getattr(context, k, None))
+                  for k in compiled.cred_keys]),
+           tuple([_hashable(target.get(k)) for k in compiled.target_keys]))
+    try:
+        decisions = _DECISIONS.get(context)
+        if decisions is None or len(decisions) >= _MAX_DECISIONS:
+            decisions = _DECISIONS[context] = {}
+        return decisions[key]
+    except KeyError:
+        result = compiled(target, context.to_dict())
+        decisions[key] = result
+        return result
+    except TypeError:
+        # Either the context can't be weakly referenced or something in
+        # the key can't be hashed
+        return compiled(target, context.to_dict())
 
 
 def enforce(context, action, target, do_raise=True):
@@ -92,14 +312,11 @@ def enforce(context, action, target, do_raise=True):
     """
     init()
 
-    credentials = context.to_dict()
-
-    # Add the exception arguments if asked to do a raise
-    extra = {}
-    if do_raise:
-        extra.update(exc=exception.PolicyNotAuthorized, action=action)
+    result = _check(context, action, target)
+    if do_raise and not result:
+        raise exception.PolicyNotAuthorized(action=action)
 
-    return policy.check(action, target, credentials, **extra)
+    return result
 
 
 def check_is_admin(context):
@@ -112,7 +329,10 @@ def check_is_admin(context):
     credentials = context.to_dict()
     target = credentials
 
-    return policy.check('context_is_admin', target, credentials)
+    compiled = _compiled_rule('context_is_admin')
+    if compiled is None:
+        return False
+    return compiled(target, credentials)
 
 
 @policy.register('is_admin')
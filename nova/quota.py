@@ -80,6 +80,18 @@ quota_opts = [
     cfg.StrOpt('quota_driver',
                default='nova.quota.DbQuotaDriver',
                help='default driver to use for quota checks'),
+    cfg.IntOpt('quota_cache_time',
+               default=0,
+               help='number of seconds each process caches the quota limits '
+                    'of a project for reservations and limit checks, 0 to '
+                    'disable'),
+    cfg.BoolOpt('quota_conditional_reserve',
+                default=False,
+                help='reserve resources with one conditional update per '
+                     'resource instead of locking all of the project\'s '
+                     'usages. Usages are then refreshed by a periodic task '
+                     'in the scheduler rather than during reservations, and '
+                     'until_refresh is ignored'),
     ]
 
 CONF = cfg.CONF
@@ -93,6 +105,10 @@ class DbQuotaDriver(object):
     database.
     """
 
+    def __init__(self):
+        # (project_id, quota_class, resource names) -> (expires, limits)
+        self._limits_cache = {}
+
     def get_by_project(self, context, project_id, resource):
         """Get a specific quota by project."""
 
@@ -240,12 +256,28 @@ class DbQuotaDriver(object):
             unknown = desired - set(sub_resources.keys())
             raise exception.QuotaResourceUnknown(unknown=sorted(unknown))
 
+        cache_time = CONF.quota_cache_time
+        if cache_time > 0:
+            now = timeutils.utcnow_ts()
+            key = (project_id, context.quota_class,
+                   frozenset(sub_resources.keys()))
+            cached = self._limits_cache.get(key)
+            if cached is not None and cached[0] > now:
+                return dict(cached[1])
+
         # Grab and return the quotas (without usages)
         quotas = self.get_project_quotas(context, sub_resources,
                                          project_id,
                                          context.quota_class, usages=False)
+        limits = dict((k, v['limit']) for k, v in quotas.items())
+
+        if cache_time > 0:
+            for old_key, (expires, _limits) in self._limits_cache.items():
+                if expires <= now:
+                    del self._limits_cache[old_key]
+            self._limits_cache[key] = (now + cache_time, dict(limits))
 
-        return dict((k, v['limit']) for k, v in quotas.items())
+        return limits
 
     def limit_check(self, context, resources, values, project_id=None):
         """Check simple quota limits.
@@ -355,9 +387,13 @@ class DbQuotaDriver(object):
         #            which means access to the session.  Since the
         #            session isn't available outside the DBAPI, we
         #            have to do the work there.
-        return db.quota_reserve(context, resources, quotas, deltas, expire,
-                                CONF.until_refresh, CONF.max_age,
-                                project_id=project_id)
+        if CONF.quota_conditional_reserve:
+            quota_reserve = db.quota_reserve_conditional
+        else:
+            quota_reserve = db.quota_reserve
+        return quota_reserve(context, resources, quotas, deltas, expire,
+                             CONF.until_refresh, CONF.max_age,
+                             project_id=project_id)
 
     def commit(self, context, reservations, project_id=None):
         """Commit reservations.
@@ -442,6 +478,27 @@ class DbQuotaDriver(object):
 
         db.reservation_expire(context)
 
+    def reconcile(self, context, resources):
+        """Refresh usages which are out of sync or older than max_age.
+
+        This is only needed with quota_conditional_reserve, as otherwise
+        reserve() refreshes usages itself.
+
+        :param context: The request context, for access checks.
+        :param resources: A dictionary of the registered resources.
+        """
+        if not CONF.quota_conditional_reserve:
+            return
+
+        for project_id in db.quota_usage_get_stale_projects(context,
+                                                            CONF.max_age):
+            try:
+                db.quota_usage_refresh(context, resources, project_id,
+                                       until_refresh=CONF.until_refresh)
+            except Exception:
+                LOG.exception(_("Failed to refresh quota usages of project "
+                                "%s"), project_id)
+
 
 class NoopQuotaDriver(object):
     """Driver that turns quotas calls into no-ops and pretends that quotas
@@ -641,6 +698,14 @@ class NoopQuotaDriver(object):
         """
         pass
 
+    def reconcile(self, context, resources):
+        """Refresh usages which are out of sync or older than max_age.
+
+        :param context: The request context, for access checks.
+        :param resources: A dictionary of the registered resources.
+        """
+        pass
+
 
 class BaseResource(object):
     """Describe a single resource for quota checking."""
@@ -1058,6 +1123,14 @@ class QuotaEngine(object):
 
         self._driver.expire(context)
 
+    def reconcile(self, context):
+        """Refresh usages which are out of sync or older than max_age.
+
+        :param context: The request context, for access checks.
+        """
+
+        self._driver.reconcile(context, self._resources)
+
     @property
     def resources(self):
         return sorted(self._resources.keys())
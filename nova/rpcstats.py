@@ -0,0 +1,200 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Latency instrumentation for RPC messages.
+
+nova.baserpc reports the following measurements to the configured sink:
+
+    <topic>.<method>.queue    ms from the sender sending the message to the
+                              dispatcher picking it up
+    <topic>.<method>.handler  ms spent running the method
+    <topic>.<method>.reply    ms from sending a call to its reply, measured
+                              on the caller
+    <topic>.<method>.timeout  count of calls that timed out
+    <topic>.running           messages being handled by a service
+
+Queue times are computed from a wall clock timestamp the sender adds to the
+message arguments, so they are only as accurate as the clock synchronization
+between the hosts involved.
+"""
+
+import contextlib
+import re
+import socket
+import time
+
+from oslo.config import cfg
+
+from nova.openstack.common.gettextutils import _
+from nova.openstack.common import importutils
+from nova.openstack.common import log as logging
+
+
+LOG = logging.getLogger(__name__)
+
+rpcstats_opts = [
+    cfg.StrOpt('rpc_stats_sink',
+               default=None,
+               help='Class to report RPC latency statistics to, e.g. '
+                    'nova.rpcstats.StatsdSink. Statistics are not collected '
+                    'if unset. Only set it once all services are upgraded, '
+                    'as the services sending messages add an argument to '
+                    'them which older services do not expect'),
+    cfg.StrOpt('rpc_statsd_host',
+               default='127.0.0.1',
+               help='Host of the statsd daemon used by StatsdSink'),
+    cfg.IntOpt('rpc_statsd_port',
+               default=8125,
+               help='UDP port of the statsd daemon used by StatsdSink'),
+    cfg.StrOpt('rpc_statsd_prefix',
+               default='rpc',
+               help='Prefix for the metric names sent by StatsdSink'),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(rpcstats_opts)
+
+SENT_AT = '_rpc_sent_at'
+
+_BAD_NAME_CHARS = re.compile(r'[^\w.\-]')
+
+_SINK = None
+
+
+class StatsSink(object):
+    """Base class for statistics sinks.  Discards everything it is given."""
+
+    def timing(self, name, msecs):
+        """Record a duration in milliseconds."""
+        pass
+
+    def gauge(self, name, value):
+        """Record the current value of something."""
+        pass
+
+    def incr(self, name, count=1):
+        """Increment a counter."""
+        pass
+
+
+class StatsdSink(StatsSink):
+    """Sends statistics to a statsd daemon over UDP.
+
+    Sends are fire and forget; a missing or slow daemon never blocks or
+    fails an RPC.
+    """
+
+    def __init__(self):
+        self.addr = (CONF.rpc_statsd_host, CONF.rpc_statsd_port)
+        self.prefix = CONF.rpc_statsd_prefix
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def _send(self, name, value, kind):
+        name = _BAD_NAME_CHARS.sub('_', name)
+        if self.prefix:
+            name = '%s.%s' % (self.prefix, name)
+        try:
+            self.sock.sendto('%s:%s|%s' % (name, value, kind), self.addr)
+        except socket.error:
+            pass
+
+    def timing(self, name, msecs):
+        self._send(name, '%.3f' % msecs, 'ms')
+
+    def gauge(self, name, value):
+        self._send(name, value, 'g')
+
+    def incr(self, name, count=1):
+        self._send(name, count, 'c')
+
+
+def get_sink():
+    """Return the sink configured by rpc_stats_sink, or None."""
+    global _SINK
+    if _SINK is None and CONF.rpc_stats_sink:
+        try:
+            _SINK = importutils.import_object(CONF.rpc_stats_sink)
+        except Exception:
+            LOG.exception(_('Unable to load rpc stats sink %s'),
+                          CONF.rpc_stats_sink)
+            _SINK = StatsSink()
+    return _SINK
+
+
+def reset():
+    """Forget the loaded sink, so it is loaded from the config again."""
+    global _SINK
+    _SINK = None
+
+
+def metric_name(topic, method, stat):
+    return '%s.%s.%s' % (topic or 'unknown', method or 'unknown', stat)
+
+
+def stamp_message(msg):
+    """Return msg with the time it is sent added to its arguments.
+
+    msg is returned unchanged if no sink is configured.
+    """
+    if get_sink() is None:
+        return msg
+    msg = dict(msg)
+    msg['args'] = dict(msg.get('args') or {})
+    msg['args'][SENT_AT] = time.time()
+    return msg
+
+
+def record_queue_time(topic, method, sent_at):
+    """Report the time since a message was stamped by its sender."""
+    sink = get_sink()
+    if sink is None or not sent_at:
+        return
+    try:
+        msecs = (time.time() - float(sent_at)) * 1000
+    except (TypeError, ValueError):
+        return
+    sink.timing(metric_name(topic, method, 'queue'), max(msecs, 0))
+
+
+def record_elapsed(topic, method, stat, started_at):
+    """Report the time since started_at."""
+    sink = get_sink()
+    if sink is not None:
+        sink.timing(metric_name(topic, method, stat),
+                    (time.time() - started_at) * 1000)
+
+
+@contextlib.contextmanager
+def timed(topic, method, stat):
+    """Report how long the body of the with statement took."""
+    started_at = time.time()
+    try:
+        yield
+    finally:
+        record_elapsed(topic, method, stat, started_at)
+
+
+def incr(topic, method, stat):
+    sink = get_sink()
+    if sink is not None:
+        sink.incr(metric_name(topic, method, stat))
+
+
+def gauge(name, value):
+    sink = get_sink()
+    if sink is not None:
+        sink.gauge(name, value)
@@ -129,9 +129,10 @@ class Scheduler(object):
         """Return the list of hosts that have a running service for topic."""
 
         services = db.service_get_all_by_topic(context, topic)
+        alive = self.servicegroup_api.services_are_up(services)
         return [service['host']
                 for service in services
-                if self.servicegroup_api.service_is_up(service)]
+                if alive[service['id']]]
 
     def group_hosts(self, context, group):
         """Return the list of hosts that have VM's from the group."""
@@ -20,8 +20,8 @@ Client side of the scheduler manager RPC API.
 
 from oslo.config import cfg
 
+from nova import baserpc
 from nova.openstack.common import jsonutils
-import nova.openstack.common.rpc.proxy
 
 rpcapi_opts = [
     cfg.StrOpt('scheduler_topic',
@@ -38,7 +38,7 @@ rpcapi_cap_opt = cfg.StrOpt('scheduler',
 CONF.register_opt(rpcapi_cap_opt, 'upgrade_levels')
 
 
-class SchedulerAPI(nova.openstack.common.rpc.proxy.RpcProxy):
+class SchedulerAPI(baserpc.RpcProxy):
     '''Client side of the scheduler rpc API.
 
     API version history:
@@ -25,6 +25,7 @@ import sys
 
 from oslo.config import cfg
 
+from nova import baserpc
 from nova import conductor
 from nova import context
 from nova import exception
@@ -185,6 +186,17 @@ class Service(service.Service):
         # Consume from all consumers in a thread
         self.conn.consume_in_thread()
 
+        if CONF.rpc_priority_methods:
+            # NOTE: The priority topics are consumed on a connection of
+            #       their own, whose thread pool stays free when the one of
+            #       the connection above is busy with a backlog.
+            self.priority_conn = rpc.create_connection(new=True)
+            for topic in (self.topic, node_topic):
+                self.priority_conn.create_consumer(
+                    baserpc.get_priority_topic(topic), rpc_dispatcher,
+                    fanout=False)
+            self.priority_conn.consume_in_thread()
+
         self.manager.post_start_hook()
 
         LOG.debug(_("Join ServiceGroup membership for this service %s")
@@ -274,6 +286,10 @@ class Service(service.Service):
             self.conn.close()
         except Exception:
             pass
+        try:
+            self.priority_conn.close()
+        except Exception:
+            pass
 
         super(Service, self).stop()
 
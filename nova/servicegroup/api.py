@@ -92,6 +92,18 @@ class API(object):
         LOG.debug(msg, member)
         return self._driver.is_up(member)
 
+    def services_are_up(self, members):
+        """Check which of the given members are up.
+
+        Returns a dict mapping the id of each member to True or False.
+        Callers with a list of services should use this rather than calling
+        service_is_up() for each one, so that drivers which need to look up
+        liveness can do it in bulk.
+        """
+        LOG.debug(_('Check which of %d ServiceGroup members are up'),
+                  len(members))
+        return self._driver.are_up(members)
+
     def leave(self, member_id, group_id):
         """Explicitly remove the given member from the ServiceGroup
         monitoring.
@@ -126,6 +138,14 @@ class ServiceGroupDriver(object):
         """Check whether the given member is up."""
         raise NotImplementedError()
 
+    def are_up(self, members):
+        """Check whether each of the given members is up.
+
+        Returns a dict keyed by member id.  Drivers that can check many
+        members with one lookup should override this.
+        """
+        return dict((member['id'], self.is_up(member)) for member in members)
+
     def leave(self, member_id, group_id):
         """Remove the given member from the ServiceGroup monitoring."""
         raise NotImplementedError()
@@ -53,41 +53,56 @@ class DbDriver(api.ServiceGroupDriver):
         """Moved from nova.utils
         Check whether a service is up based on last heartbeat.
         """
+        last_heartbeat = self._last_heartbeat(service_ref)
+        # Timestamps in DB are UTC.
+        elapsed = utils.total_seconds(timeutils.utcnow() - last_heartbeat)
+        LOG.debug('DB_Driver.is_up last_heartbeat = %(lhb)s elapsed = %(el)s',
+                  {'lhb': str(last_heartbeat), 'el': str(elapsed)})
+        return abs(elapsed) <= CONF.service_down_time
+
+    def are_up(self, service_refs):
+        """Check a list of services against a single timestamp.
+
+        The heartbeat times are already part of the service records, so this
+        needs no further lookups.
+        """
+        now = timeutils.utcnow()
+        result = {}
+        for service_ref in service_refs:
+            elapsed = utils.total_seconds(
+                now - self._last_heartbeat(service_ref))
+            result[service_ref['id']] = abs(elapsed) <= CONF.service_down_time
+        return result
+
+    @staticmethod
+    def _last_heartbeat(service_ref):
         last_heartbeat = service_ref['updated_at'] or service_ref['created_at']
         if isinstance(last_heartbeat, basestring):
             # NOTE(russellb) If this service_ref came in over rpc via
             # conductor, then the timestamp will be a string and needs to be
             # converted back to a datetime.
             last_heartbeat = timeutils.parse_strtime(last_heartbeat)
-        # Timestamps in DB are UTC.
-        elapsed = utils.total_seconds(timeutils.utcnow() - last_heartbeat)
-        LOG.debug('DB_Driver.is_up last_heartbeat = %(lhb)s elapsed = %(el)s',
-                  {'lhb': str(last_heartbeat), 'el': str(elapsed)})
-        return abs(elapsed) <= CONF.service_down_time
+        return last_heartbeat
 
     def get_all(self, group_id):
         """
         Returns ALL members of the given group
         """
         LOG.debug(_('DB_Driver: get_all members of the %s group') % group_id)
-        rs = []
         ctxt = context.get_admin_context()
         services = self.conductor_api.service_get_all_by_topic(ctxt, group_id)
-        for service in services:
-            if self.is_up(service):
-                rs.append(service['host'])
-        return rs
+        alive = self.are_up(services)
+        return [service['host'] for service in services
+                if alive[service['id']]]
 
     def _report_state(self, service):
         """Update the state of this service in the datastore."""
         ctxt = context.get_admin_context()
-        state_catalog = {}
         try:
-            report_count = service.service_ref['report_count'] + 1
-            state_catalog['report_count'] = report_count
-
-            service.service_ref = self.conductor_api.service_update(ctxt,
-                    service.service_ref, state_catalog)
+            # NOTE: service_heartbeat bumps report_count and updated_at in
+            # one UPDATE, without reading the service record back.
+            self.conductor_api.service_heartbeat(ctxt, service.service_ref)
+            service.service_ref['report_count'] += 1
 
             # TODO(termie): make this pattern be more elegant.
             if getattr(service, 'model_disconnected', False):
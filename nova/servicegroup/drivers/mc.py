@@ -27,7 +27,16 @@ from nova.openstack.common import timeutils
 from nova.servicegroup import api
 
 
+mc_driver_opts = [
+    cfg.IntOpt('memcached_servicegroup_cache_time',
+               default=5,
+               help='Number of seconds the memcached servicegroup driver '
+                    'remembers whether a service is up before asking '
+                    'memcached again. 0 disables the cache'),
+    ]
+
 CONF = cfg.CONF
+CONF.register_opts(mc_driver_opts)
 CONF.import_opt('service_down_time', 'nova.service')
 CONF.import_opt('memcached_servers', 'nova.openstack.common.memorycache')
 
@@ -36,6 +45,15 @@ LOG = logging.getLogger(__name__)
 
 
 class MemcachedDriver(api.ServiceGroupDriver):
+    """Memcached driver for the service group API.
+
+    Liveness is kept in a local cache of key -> (fetched_at, is_up) so that
+    is_up() and get_all() are mostly in memory lookups.  Entries older than
+    memcached_servicegroup_cache_time are fetched again, all of the stale
+    keys of a call in one get_multi where the client supports it, so a
+    service can be reported up for at most that long after its memcached key
+    has expired.
+    """
 
     def __init__(self, *args, **kwargs):
         test = kwargs.get('test')
@@ -44,6 +62,7 @@ class MemcachedDriver(api.ServiceGroupDriver):
         self.mc = memorycache.get_client()
         self.db_allowed = kwargs.get('db_allowed', True)
         self.conductor_api = conductor.API(use_local=self.db_allowed)
+        self._cache = {}
 
     def join(self, member_id, group_id, service=None):
         """Join the given service with its group."""
@@ -60,12 +79,57 @@ class MemcachedDriver(api.ServiceGroupDriver):
             service.tg.add_timer(report_interval, self._report_state,
                                  report_interval, service)
 
+    @staticmethod
+    def _key(service_ref):
+        return str("%(topic)s:%(host)s" % service_ref)
+
+    def _get_multi(self, keys):
+        """Return a dict of the given keys which are set in memcached.
+
+        The in memory client used without memcached_servers has no
+        get_multi, so the keys are looked up one at a time there.
+        """
+        if hasattr(self.mc, 'get_multi'):
+            return self.mc.get_multi(keys)
+        found = {}
+        for key in keys:
+            value = self.mc.get(key)
+            if value is not None:
+                found[key] = value
+        return found
+
+    def _alive(self, keys):
+        """Return the subset of the given keys which are up."""
+        cache_time = CONF.memcached_servicegroup_cache_time
+        if cache_time <= 0:
+            return set(self._get_multi(list(set(keys))))
+
+        now = timeutils.utcnow_ts()
+        stale = set()
+        for key in keys:
+            entry = self._cache.get(key)
+            if entry is None or now - entry[0] >= cache_time:
+                stale.add(key)
+        if stale:
+            found = self._get_multi(list(stale))
+            for key in stale:
+                self._cache[key] = (now, key in found)
+        return set(key for key in keys if self._cache[key][1])
+
     def is_up(self, service_ref):
         """Moved from nova.utils
         Check whether a service is up based on last heartbeat.
         """
-        key = "%(topic)s:%(host)s" % service_ref
-        return self.mc.get(str(key)) is not None
+        key = self._key(service_ref)
+        return key in self._alive([key])
+
+    def are_up(self, service_refs):
+        """Check a list of services with at most one memcached lookup."""
+        keys = dict((service_ref['id'], self._key(service_ref))
+                    for service_ref in service_refs)
+        alive = self._alive(keys.values())
+        return dict((service_id, key in alive)
+                    for service_id, key in keys.iteritems())
 
     def get_all(self, group_id):
         """
@@ -73,25 +137,26 @@ class MemcachedDriver(api.ServiceGroupDriver):
         """
         LOG.debug(_('Memcached_Driver: get_all members of the %s group') %
                   group_id)
-        rs = []
         ctxt = context.get_admin_context()
         services = self.conductor_api.service_get_all_by_topic(ctxt, group_id)
-        for service in services:
-            if self.is_up(service):
-                rs.append(service['host'])
-        return rs
+        alive = self.are_up(services)
+        return [service['host'] for service in services
+                if alive[service['id']]]
 
     def _report_state(self, service):
         """Update the state of this service in the datastore."""
         ctxt = context.get_admin_context()
         try:
-            key = "%(topic)s:%(host)s" % service.service_ref
+            key = self._key(service.service_ref)
             # memcached has data expiration time capability.
             # set(..., time=CONF.service_down_time) uses it and
             # reduces key-deleting code.
             self.mc.set(str(key),
                         timeutils.utcnow(),
                         time=CONF.service_down_time)
+            if CONF.memcached_servicegroup_cache_time > 0:
+                # There is no need to ask memcached about ourselves.
+                self._cache[key] = (timeutils.utcnow_ts(), True)
 
             # TODO(termie): make this pattern be more elegant.
             if getattr(service, 'model_disconnected', False):
@@ -14,9 +14,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import functools
 import os
 
 import eventlet
+from eventlet import event
 from oslo.config import cfg
 
 from nova import exception
@@ -53,7 +55,14 @@ LOG = logging.getLogger(__name__)
 
 
 class ZooKeeperDriver(api.ServiceGroupDriver):
-    """ZooKeeper driver for the service group API."""
+    """ZooKeeper driver for the service group API.
+
+    The members of each group that has been looked at are kept in a local
+    set, which the MembershipMonitor for the group replaces whenever its
+    child watch fires.  is_up() and get_all() therefore never talk to
+    ZooKeeper, and are only as stale as the delivery of the last watch
+    event.
+    """
 
     def __init__(self, *args, **kwargs):
         """Create the zk session object."""
@@ -66,6 +75,9 @@ class ZooKeeperDriver(api.ServiceGroupDriver):
                                               zklog_fd=null)
         self._memberships = {}
         self._monitors = {}
+        # group -> set of members, or None while ZooKeeper is unreachable
+        self._members = {}
+        self._members_ready = {}
         # Make sure the prefix exists
         try:
             self._session.create(CONF.zookeeper.sg_prefix, "",
@@ -112,31 +124,49 @@ class ZooKeeperDriver(api.ServiceGroupDriver):
     def is_up(self, service_ref):
         group_id = service_ref['topic']
         member_id = service_ref['host']
-        all_members = self.get_all(group_id)
-        return member_id in all_members
+        return member_id in self._get_members(group_id)
+
+    def are_up(self, service_refs):
+        """Check a list of services against the cached group members."""
+        result = {}
+        for service_ref in service_refs:
+            members = self._get_members(service_ref['topic'])
+            result[service_ref['id']] = service_ref['host'] in members
+        return result
 
     def get_all(self, group_id):
         """Return all members in a list, or a ServiceGroupUnavailable
         exception.
         """
-        monitor = self._monitors.get(group_id, None)
-        if monitor is None:
+        return list(self._get_members(group_id))
+
+    def _members_changed(self, group_id, members):
+        """MembershipMonitor callback, run whenever the child watch fires."""
+        LOG.debug(_('ZooKeeperDriver: members of the %(gr)s group are now '
+                    '%(members)s'), {'gr': group_id, 'members': members})
+        self._members[group_id] = members
+        ready = self._members_ready[group_id]
+        if members is not None and not ready.ready():
+            ready.send()
+
+    def _get_members(self, group_id):
+        if group_id not in self._monitors:
+            self._members_ready[group_id] = event.Event()
             path = "%s/%s" % (CONF.zookeeper.sg_prefix, group_id)
-            monitor = membership.MembershipMonitor(self._session, path)
-            self._monitors[group_id] = monitor
+            callback = functools.partial(self._members_changed, group_id)
+            self._monitors[group_id] = membership.MembershipMonitor(
+                self._session, path, cb_func=callback)
+        ready = self._members_ready[group_id]
+        if not ready.ready():
             # Note(maoy): When initialized for the first time, it takes a
             # while to retrieve all members from zookeeper. To prevent
-            # None to be returned, we sleep 5 sec max to wait for data to
-            # be ready.
-            for _retry in range(50):
-                eventlet.sleep(0.1)
-                all_members = monitor.get_all()
-                if all_members is not None:
-                    return all_members
-        all_members = monitor.get_all()
-        if all_members is None:
+            # None to be returned, we wait 5 sec max for data to be ready.
+            with eventlet.Timeout(5, False):
+                ready.wait()
+        members = self._members.get(group_id)
+        if members is None:
             raise exception.ServiceGroupUnavailable(driver="ZooKeeperDriver")
-        return all_members
+        return members
 
 
 class FakeLoopingCall(loopingcall.LoopingCallBase):
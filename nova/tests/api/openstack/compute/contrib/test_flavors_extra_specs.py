@@ -18,6 +18,7 @@
 import webob
 
 from nova.api.openstack.compute.contrib import flavorextraspecs
+from nova.compute import flavors
 import nova.db
 from nova import exception
 from nova import test
@@ -127,6 +128,24 @@ class FlavorsExtraSpecsTest(test.TestCase):
 
         self.assertEqual('value1', res_dict['extra_specs']['key1'])
 
+    def test_writes_invalidate_flavor_cache(self):
+        self.stubs.Set(nova.db,
+                       'instance_type_extra_specs_update_or_create',
+                       return_create_flavor_extra_specs)
+        self.stubs.Set(nova.db, 'instance_type_extra_specs_delete',
+                       delete_flavor_extra_specs)
+        self.mox.StubOutWithMock(flavors, 'invalidate_cache')
+        flavors.invalidate_cache()
+        flavors.invalidate_cache()
+        flavors.invalidate_cache()
+        self.mox.ReplayAll()
+
+        req = fakes.HTTPRequest.blank('/v2/fake/flavors/1/os-extra_specs',
+                                      use_admin_context=True)
+        self.controller.create(req, 1, {"extra_specs": {"key1": "value1"}})
+        self.controller.update(req, 1, 'key1', {"key1": "value2"})
+        self.controller.delete(req, 1, 'key1')
+
     def test_create_no_admin(self):
         self.stubs.Set(nova.db,
                        'instance_type_extra_specs_update_or_create',
@@ -335,10 +335,10 @@ class ServicesTest(test.TestCase):
     # This test is just to verify that the servicegroup API gets used when
     # calling this API.
     def test_services_with_exception(self):
-        def dummy_is_up(self, dummy):
+        def dummy_are_up(self, dummy):
             raise KeyError()
 
-        self.stubs.Set(db_driver.DbDriver, 'is_up', dummy_is_up)
+        self.stubs.Set(db_driver.DbDriver, 'are_up', dummy_are_up)
         req = FakeRequestWithHostService()
         self.assertRaises(KeyError, self.controller.index, req)
 
@@ -133,6 +133,45 @@ class SimpleTenantUsageTest(test.TestCase):
         future = NOW + datetime.timedelta(hours=HOURS)
         self._test_verify_index(START, future)
 
+    def test_verify_index_from_rollups(self):
+        # The first half of the range has been rolled up, the rest is
+        # computed live.
+        middle = START + datetime.timedelta(hours=HOURS / 2)
+        hours = SERVERS * HOURS / 2
+        rollups = [{'project_id': 'faketenant_%s' % i,
+                    'total_hours': hours,
+                    'total_local_gb_usage': (ROOT_GB + EPHEMERAL_GB) * hours,
+                    'total_memory_mb_usage': MEMORY_MB * hours,
+                    'total_vcpus_usage': VCPUS * hours}
+                   for i in xrange(TENANTS)]
+        self.stubs.Set(api.HostAPI, 'get_tenant_usage_rollups',
+                       lambda *a: [(START, middle, rollups)])
+
+        live_periods = []
+
+        def fake_get_active_by_window(_self, context, begin, end, project_id):
+            live_periods.append((begin, end))
+            return fake_instance_get_active_by_window_joined(
+                _self, context, begin, end, project_id)
+
+        self.stubs.Set(api.API, "get_active_by_window",
+                       fake_get_active_by_window)
+        self.flags(instance_usage_rollups=True)
+
+        self._test_verify_index(START, STOP)
+        self.assertEqual([(middle, STOP)], live_periods)
+
+    def test_verify_detailed_index_ignores_rollups(self):
+        def fake_get_tenant_usage_rollups(*args):
+            self.fail('Rollups should not be used')
+
+        self.stubs.Set(api.HostAPI, 'get_tenant_usage_rollups',
+                       fake_get_tenant_usage_rollups)
+        self.flags(instance_usage_rollups=True)
+
+        usages = self._get_tenant_usages('1')
+        self.assertEqual(TENANTS, len(usages))
+
     def test_verify_show(self):
         self._test_verify_show(START, STOP)
 
@@ -49,7 +49,8 @@ def return_security_group(context, instance_id, security_group_id):
 def fake_service_get_all(context, disabled=None):
     def __fake_service(binary, availability_zone,
                        created_at, updated_at, host, disabled):
-        return {'binary': binary,
+        return {'id': '%s-%s' % (host, binary),
+                'binary': binary,
                 'availability_zone': availability_zone,
                 'available_zones': availability_zone,
                 'created_at': created_at,
@@ -85,8 +86,9 @@ def fake_service_get_all(context, disabled=None):
                                "fake_host-2", False)]
 
 
-def fake_service_is_up(self, service):
-    return service['binary'] != u"nova-network"
+def fake_services_are_up(self, services):
+    return dict((service['id'], service['binary'] != u"nova-network")
+                for service in services)
 
 
 def fake_set_availability_zones(context, services):
@@ -99,7 +101,8 @@ class AvailabilityZoneApiTest(test.TestCase):
         self.stubs.Set(db, 'service_get_all', fake_service_get_all)
         self.stubs.Set(availability_zones, 'set_availability_zones',
                        fake_set_availability_zones)
-        self.stubs.Set(servicegroup.API, 'service_is_up', fake_service_is_up)
+        self.stubs.Set(servicegroup.API, 'services_are_up',
+                       fake_services_are_up)
 
     def test_filtered_availability_zones(self):
         az = availability_zone.AvailabilityZoneController()
@@ -4,6 +4,7 @@ import inspect
 import webob
 
 from nova.api.openstack import wsgi
+from nova import context
 from nova import exception
 from nova import test
 from nova.tests.api.openstack import fakes
@@ -97,6 +98,26 @@ class RequestTest(test.TestCase):
                  'uuid1': instances[1],
                  'uuid2': instances[2]})
 
+    def test_prefetch_for_instances(self):
+        request = wsgi.Request.blank('/foo')
+        request.cache_db_instances([{'uuid': 'uuid0'}, {'uuid': 'uuid1'}])
+        calls = []
+
+        def loader(instance_uuids):
+            calls.append(sorted(instance_uuids))
+            return dict((uuid, uuid.upper()) for uuid in instance_uuids)
+
+        expected = {'uuid0': 'UUID0', 'uuid1': 'UUID1'}
+        self.assertEqual(request.prefetch_for_instances('foo', loader),
+                         expected)
+        self.assertEqual(request.prefetch_for_instances('foo', loader),
+                         expected)
+        self.assertEqual(calls, [['uuid0', 'uuid1']])
+
+    def test_prefetch_for_instances_none_cached(self):
+        request = wsgi.Request.blank('/foo')
+        self.assertEqual(request.prefetch_for_instances('foo', dict), {})
+
 
 class ActionDispatcherTest(test.TestCase):
     def test_dispatch(self):
@@ -142,6 +163,21 @@ class JSONDictSerializerTest(test.TestCase):
         result = result.replace('\n', '').replace(' ', '')
         self.assertEqual(result, expected_json)
 
+    def test_iter_serialize(self):
+        input_dict = {'servers': [{'id': i, 'name': 'server-%d' % i}
+                                  for i in range(100)],
+                      'servers_links': [{'rel': 'next', 'href': 'x'}],
+                      'count': 100}
+        serializer = wsgi.JSONDictSerializer()
+        serializer.chunk_size = 256
+        chunks = list(serializer.iter_serialize(input_dict))
+        self.assertTrue(len(chunks) > 1)
+        self.assertEqual(serializer.serialize(input_dict), ''.join(chunks))
+
+    def test_iter_serialize_not_dict(self):
+        serializer = wsgi.JSONDictSerializer()
+        self.assertEqual(['[1, 2]'], list(serializer.iter_serialize([1, 2])))
+
 
 class TextDeserializerTest(test.TestCase):
     def test_dispatch_default(self):
@@ -463,6 +499,33 @@ class ResourceTest(test.TestCase):
         self.assertEqual(response.body, '{"foo": "bar"}')
         self.assertEqual(response.status_int, 200)
 
+    def test_identity_map_for_read_requests(self):
+        identity_maps = []
+
+        class Controller(wsgi.Controller):
+            def index(self, req):
+                context = req.environ['nova.context']
+                identity_maps.append(context.identity_map)
+                return {'foo': 'bar'}
+
+            def create(self, req, body):
+                context = req.environ['nova.context']
+                identity_maps.append(context.identity_map)
+                return {'foo': 'bar'}
+
+        app = fakes.TestRouter(Controller())
+        req = fakes.HTTPRequest.blank('/tests')
+        req.get_response(app)
+        self.assertTrue(isinstance(identity_maps[0], context.IdentityMap))
+        self.assertEqual(None, req.environ['nova.context'].identity_map)
+
+        req = fakes.HTTPRequest.blank('/tests')
+        req.method = 'POST'
+        req.content_type = 'application/json'
+        req.body = '{"body": {}}'
+        req.get_response(app)
+        self.assertEqual(None, identity_maps[1])
+
     def test_no_request_id_with_str_response_body(self):
         class Controller(wsgi.Controller):
             def index(self, req):
@@ -992,6 +1055,35 @@ class ResponseObjectTest(test.TestCase):
             self.assertEqual(response.status_int, 202)
             self.assertEqual(response.body, mtype)
 
+    def test_serialize_stream(self):
+        robj = wsgi.ResponseObject({'servers': [{'id': 1}, {'id': 2}]},
+                                   stream=True,
+                                   json=wsgi.JSONDictSerializer,
+                                   xml=wsgi.XMLDictSerializer)
+        request = wsgi.Request.blank('/tests/123')
+
+        response = robj.serialize(request, 'application/json')
+        self.assertEqual(None, response.content_length)
+        self.assertEqual('{"servers": [{"id": 1}, {"id": 2}]}',
+                         response.body)
+
+        # Serializers which can't stream still set the whole body
+        response = robj.serialize(request, 'application/xml')
+        self.assertNotEqual(None, response.content_length)
+
+    def test_streamed_decorator(self):
+        class Controller(object):
+            @wsgi.streamed
+            def index(self, req):
+                return {'servers': [{'id': 1}]}
+
+        req = webob.Request.blank('/tests')
+        app = fakes.TestRouter(Controller())
+        response = req.get_response(app)
+        self.assertEqual(200, response.status_int)
+        self.assertEqual(None, response.content_length)
+        self.assertEqual('{"servers": [{"id": 1}]}', response.body)
+
 
 class ValidBodyTest(test.TestCase):
 
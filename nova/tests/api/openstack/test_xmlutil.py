@@ -708,6 +708,89 @@ class TemplateTest(test.TestCase):
         templ = xmlutil.Template(None)
         self.assertEqual(templ.serialize(None), '')
 
+    def _compiled_test_template(self):
+        class NoEmptyTemplateElement(xmlutil.TemplateElement):
+            def will_render(self, datum):
+                return bool(datum)
+
+        root = xmlutil.TemplateElement('{%s}test' % xmlutil.XMLNS_V11,
+                                       selector='test', name='name')
+        root.set('missing')
+        server = xmlutil.SubTemplateElement(root, 'server',
+                                            selector='servers',
+                                            id='id', status='status')
+        meta = NoEmptyTemplateElement('metadata', selector='metadata')
+        server.append(meta)
+        xmlutil.SubTemplateElement(meta, lambda obj, do_raise=False: obj[0],
+                                   selector=xmlutil.get_items).text = 1
+        xmlutil.make_links(server, 'links')
+        fault = xmlutil.SubTemplateElement(server, 'fault', selector='fault')
+        fault.text = xmlutil.EmptyStringSelector('message')
+        master = xmlutil.MasterTemplate(root, 1, nsmap={
+                None: xmlutil.XMLNS_V11, 'atom': xmlutil.XMLNS_ATOM})
+
+        root_slave = xmlutil.TemplateElement('{%s}test' % xmlutil.XMLNS_V11,
+                                             selector='test')
+        server_slave = xmlutil.SubTemplateElement(root_slave, 'server',
+                                                  selector='servers')
+        server_slave.set('{ext}status', 'ext_status')
+        server_slave.set('status', 'ext_status')
+        slave = xmlutil.SlaveTemplate(root_slave, 1, nsmap=dict(e='ext'))
+        master.attach(slave)
+        return master
+
+    def test_serialize_compiled(self):
+        obj = {
+            'test': {
+                'name': 'foobar',
+                'servers': [
+                    {'id': 1, 'status': 'ACTIVE', 'ext_status': 'up',
+                     'metadata': {'a': 1, 'b': 'two'},
+                     'links': [{'rel': 'self', 'href': 'http://x/1'}],
+                     'fault': {'code': 500}},
+                    {'id': 2, 'status': 'ERROR', 'metadata': {},
+                     'links': []},
+                    ],
+                },
+            }
+        master = self._compiled_test_template()
+
+        siblings = master._siblings()
+        self.assertNotEqual(master._compiled(siblings), None)
+        expected = etree.tostring(master._serialize(None, obj, siblings,
+                                                    master._nsmap()),
+                                  encoding='UTF-8', xml_declaration=True)
+        self.assertEqual(master.serialize(obj), expected)
+
+    def test_compiled_template_reused(self):
+        master = self._compiled_test_template()
+        compiled = master._compiled(master._siblings())
+
+        copied = master.copy()
+        self.assertTrue(copied._compiled(copied._siblings()) is compiled)
+
+    def test_compiled_template_changed(self):
+        master = self._compiled_test_template()
+        obj = {'test': {'name': 'foobar', 'servers': []}}
+        self.assertFalse('other=' in master.serialize(obj))
+
+        master.root.set('other', 'name')
+        self.assertTrue('other="foobar"' in master.serialize(obj))
+
+    def test_custom_render_not_compiled(self):
+        class CustomTemplateElement(xmlutil.TemplateElement):
+            def apply(self, elem, obj):
+                elem.text = 'custom'
+
+        root = xmlutil.TemplateElement('test', selector='test')
+        xmlutil.SubTemplateElement(root, 'child').append(
+            CustomTemplateElement('custom', selector='custom'))
+        templ = xmlutil.Template(root)
+
+        self.assertEqual(templ._compiled(templ._siblings()), None)
+        result = templ.make_tree({'test': {'custom': {}}})
+        self.assertEqual(result[0][0].text, 'custom')
+
 
 class MasterTemplateBuilder(xmlutil.TemplateBuilder):
     def construct(self):
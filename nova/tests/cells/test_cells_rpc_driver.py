@@ -18,11 +18,11 @@ Tests For Cells RPC Communication Driver
 
 from oslo.config import cfg
 
+from nova import baserpc
 from nova.cells import messaging
 from nova.cells import rpc_driver
 from nova import context
 from nova.openstack.common import rpc
-from nova.openstack.common.rpc import dispatcher as rpc_dispatcher
 from nova import test
 from nova.tests.cells import fakes
 
@@ -53,9 +53,10 @@ class CellsRPCDriverTestCase(test.TestCase):
                 call_info['intercell_dispatcher'] = _self
 
         class FakeRPCDispatcher(object):
-            def __init__(_self, proxy_objs):
+            def __init__(_self, proxy_objs, service_name):
                 self.assertEqual([call_info['intercell_dispatcher']],
                                  proxy_objs)
+                self.assertEqual('cells.intercell42', service_name)
                 call_info['rpc_dispatcher'] = _self
 
         class FakeRPCConn(object):
@@ -75,7 +76,7 @@ class CellsRPCDriverTestCase(test.TestCase):
         self.stubs.Set(rpc, 'create_connection', _fake_create_connection)
         self.stubs.Set(rpc_driver, 'InterCellRPCDispatcher',
                        FakeInterCellRPCDispatcher)
-        self.stubs.Set(rpc_dispatcher, 'RpcDispatcher', FakeRPCDispatcher)
+        self.stubs.Set(baserpc, 'RpcDispatcher', FakeRPCDispatcher)
 
         self.driver.start_consumers(fake_msg_runner)
 
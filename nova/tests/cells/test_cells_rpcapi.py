@@ -49,11 +49,12 @@ class CellsAPITestCase(test.TestCase):
         self.stubs.Set(rpc, rpc_method, fake_rpc_method)
         return call_info
 
-    def _check_result(self, call_info, method, args, version=None):
+    def _check_result(self, call_info, method, args, version=None,
+                      topic=None):
         if version is None:
             version = self.cells_rpcapi.BASE_RPC_API_VERSION
         self.assertEqual(self.fake_context, call_info['context'])
-        self.assertEqual(self.fake_topic, call_info['topic'])
+        self.assertEqual(topic or self.fake_topic, call_info['topic'])
         self.assertEqual(method, call_info['msg']['method'])
         msg_version = call_info['msg']['version']
         self.assertTrue(isinstance(msg_version, basestring),
@@ -285,9 +286,11 @@ class CellsAPITestCase(test.TestCase):
             'host_name': 'fake-host-name',
             'binary': 'nova-api',
             'params_to_update': {'disabled': True}}
+        # service_update is in the default rpc_priority_methods
         self._check_result(call_info, 'service_update',
                            expected_args,
-                           version='1.7')
+                           version='1.7',
+                           topic='priority.%s' % self.fake_topic)
         self.assertEqual(result, 'fake_response')
 
     def test_proxy_rpc_to_manager(self):
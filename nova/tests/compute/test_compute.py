@@ -5084,6 +5084,7 @@ class ComputeTestCase(BaseTestCase):
         self.compute._sync_power_states(ctxt)
 
     def _test_lifecycle_event(self, lifecycle_event, power_state):
+        self.flags(lifecycle_event_batch_interval=0)
         instance = self._create_fake_instance()
         uuid = instance['uuid']
 
@@ -5092,7 +5093,7 @@ class ComputeTestCase(BaseTestCase):
             self.compute._sync_instance_power_state(
                 mox.IgnoreArg(),
                 mox.ContainsKeyValue('uuid', uuid),
-                power_state)
+                power_state, refresh=False)
         self.mox.ReplayAll()
         self.compute.handle_events(LifecycleEvent(uuid, lifecycle_event))
         self.mox.VerifyAll()
@@ -5112,9 +5113,58 @@ class ComputeTestCase(BaseTestCase):
     def test_lifecycle_event_non_existent_instance(self):
         # No error raised for non-existent instance because of inherent race
         # between database updates and hypervisor events. See bug #1180501.
+        self.flags(lifecycle_event_batch_interval=0)
         event = LifecycleEvent('does-not-exist', EVENT_LIFECYCLE_STOPPED)
         self.compute.handle_events(event)
 
+    def test_lifecycle_events_handled_together(self):
+        uuid1 = self._create_fake_instance()['uuid']
+        uuid2 = self._create_fake_instance()['uuid']
+        spawned = []
+        self.stubs.Set(compute_manager.greenthread, 'spawn_after',
+                       lambda seconds, func: spawned.append(func))
+        for uuid, transition in ((uuid1, EVENT_LIFECYCLE_STARTED),
+                                 (uuid2, EVENT_LIFECYCLE_STOPPED),
+                                 (uuid1, EVENT_LIFECYCLE_STOPPED),
+                                 ('does-not-exist', EVENT_LIFECYCLE_STOPPED)):
+            self.compute.handle_events(LifecycleEvent(uuid, transition))
+        self.assertEqual(len(spawned), 1)
+
+        synced = {}
+
+        def fake_sync(context, instance, vm_power_state, refresh=True):
+            self.assertFalse(refresh)
+            synced[instance['uuid']] = vm_power_state
+
+        self.stubs.Set(self.compute, '_sync_instance_power_state', fake_sync)
+        self.mox.StubOutWithMock(instance_obj.Instance, 'get_by_uuid')
+        self.mox.ReplayAll()
+        spawned[0]()
+
+        self.assertEqual(synced, {uuid1: power_state.SHUTDOWN,
+                                  uuid2: power_state.SHUTDOWN})
+        self.assertEqual(self.compute._lifecycle_events, {})
+
+    def test_lifecycle_events_refresh_stale_instances(self):
+        self.flags(lifecycle_event_batch_interval=0.5)
+        uuid1 = self._create_fake_instance()['uuid']
+        uuid2 = self._create_fake_instance()['uuid']
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        refreshed = []
+
+        def fake_sync(context, instance, vm_power_state, refresh=True):
+            refreshed.append(refresh)
+            # Syncing the first instance takes longer than the bound
+            timeutils.advance_time_seconds(2)
+
+        self.stubs.Set(self.compute, '_sync_instance_power_state', fake_sync)
+        self.compute.handle_lifecycle_events(
+            [LifecycleEvent(uuid1, EVENT_LIFECYCLE_STOPPED),
+             LifecycleEvent(uuid2, EVENT_LIFECYCLE_STOPPED)])
+
+        self.assertEqual(refreshed, [False, True])
+
 
 class ComputeAPITestCase(BaseTestCase):
 
@@ -6734,6 +6784,43 @@ class ComputeAPITestCase(BaseTestCase):
         self.assertEquals(unify_instance(expected),
                           unify_instance(instance))
 
+    def test_get_uses_identity_map(self):
+        exp_instance = self._create_fake_instance()
+        self.context.identity_map = context.IdentityMap()
+
+        instance = self.compute_api.get(self.context, exp_instance['uuid'],
+                                        want_objects=True)
+
+        self.mox.StubOutWithMock(db, 'instance_get_by_uuid')
+        self.mox.ReplayAll()
+        self.assertTrue(instance is self.compute_api.get(
+            self.context, exp_instance['uuid'], want_objects=True))
+        self.assertEqual(exp_instance['uuid'], self.compute_api.get(
+            self.context, exp_instance['uuid'])['uuid'])
+
+    def test_get_all_fills_identity_map(self):
+        exp_instance = self._create_fake_instance()
+        self.context.identity_map = context.IdentityMap()
+
+        instances = self.compute_api.get_all(self.context, want_objects=True)
+
+        self.mox.StubOutWithMock(db, 'instance_get_by_uuid')
+        self.mox.ReplayAll()
+        self.assertTrue(instances[0] is self.compute_api.get(
+            self.context, exp_instance['uuid'], want_objects=True))
+
+    def test_get_elevated_skips_identity_map(self):
+        exp_instance = self._create_fake_instance()
+        self.context.identity_map = context.IdentityMap()
+        self.compute_api.get(self.context, exp_instance['uuid'])
+
+        self.mox.StubOutWithMock(db, 'instance_get_by_uuid')
+        db.instance_get_by_uuid(mox.IgnoreArg(), exp_instance['uuid'],
+                                columns_to_join=mox.IgnoreArg()
+                                ).AndReturn(exp_instance)
+        self.mox.ReplayAll()
+        self.compute_api.get(self.context.elevated(), exp_instance['uuid'])
+
     def test_get_all_by_name_regexp(self):
         # Test searching instances by name (display_name).
         c = context.get_admin_context()
@@ -8212,6 +8299,44 @@ class ComputeAPITestCase(BaseTestCase):
         self.assertEqual(expected,
                          self.compute_api.get_instance_bdms({}, instance))
 
+    def test_get_instances_bdms(self):
+        bdms = [{'instance_uuid': 'uuid1', 'device_name': 'vda'},
+                {'instance_uuid': 'uuid1', 'device_name': 'vdb'},
+                {'instance_uuid': 'uuid2', 'device_name': 'vda'}]
+        self.mox.StubOutWithMock(self.compute_api.db,
+                       'block_device_mapping_get_all_by_instance_uuids')
+        self.compute_api.db.block_device_mapping_get_all_by_instance_uuids(
+            self.context, ['uuid1', 'uuid2', 'uuid3']).AndReturn(bdms)
+        self.mox.ReplayAll()
+
+        self.assertEqual({'uuid1': bdms[:2], 'uuid2': bdms[2:], 'uuid3': []},
+                         self.compute_api.get_instances_bdms(
+                             self.context, ['uuid1', 'uuid2', 'uuid3'],
+                             legacy=False))
+
+    def test_get_bdms_uses_identity_map(self):
+        bdms = [{'instance_uuid': 'uuid1', 'device_name': 'vda'},
+                {'instance_uuid': 'uuid2', 'device_name': 'vda'}]
+        self.context.identity_map = context.IdentityMap()
+        self.mox.StubOutWithMock(self.compute_api.db,
+                       'block_device_mapping_get_all_by_instance_uuids')
+        self.mox.StubOutWithMock(self.compute_api.db,
+                       'block_device_mapping_get_all_by_instance')
+        self.compute_api.db.block_device_mapping_get_all_by_instance(
+            self.context, 'uuid1').AndReturn(bdms[:1])
+        self.compute_api.db.block_device_mapping_get_all_by_instance_uuids(
+            self.context, ['uuid2']).AndReturn(bdms[1:])
+        self.mox.ReplayAll()
+
+        self.assertEqual(bdms[:1], self.compute_api.get_instance_bdms(
+            self.context, {'uuid': 'uuid1'}, legacy=False))
+        self.assertEqual({'uuid1': bdms[:1], 'uuid2': bdms[1:]},
+                         self.compute_api.get_instances_bdms(
+                             self.context, ['uuid1', 'uuid2'],
+                             legacy=False))
+        self.assertEqual(bdms[1:], self.compute_api.get_instance_bdms(
+            self.context, {'uuid': 'uuid2'}, legacy=False))
+
 
 def fake_rpc_method(context, topic, msg, do_cast=True):
     pass
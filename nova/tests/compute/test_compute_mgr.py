@@ -464,6 +464,32 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
         self.mox.ReplayAll()
         self.compute._instance_usage_audit(self.context)
 
+    def test_instance_usage_audit_rollups(self):
+        instances = [{'uuid': 'foo'}]
+        self.flags(instance_usage_audit=True, instance_usage_rollups=True)
+        self.stubs.Set(compute_utils, 'has_audit_been_run',
+                       lambda *a, **k: False)
+        self.stubs.Set(self.compute.conductor_api,
+                       'instance_get_active_by_window_joined',
+                       lambda *a, **k: instances)
+        self.stubs.Set(self.compute.conductor_api, 'notify_usage_exists',
+                       lambda *a, **k: None)
+        self.stubs.Set(compute_utils, 'start_instance_usage_audit',
+                       lambda *a, **k: None)
+        self.stubs.Set(compute_utils, 'finish_instance_usage_audit',
+                       lambda *a, **k: None)
+        begin, end = utils.last_completed_audit_period()
+
+        self.mox.StubOutWithMock(compute_utils, 'tenant_usage_totals')
+        self.mox.StubOutWithMock(self.compute.conductor_api,
+                                 'tenant_usage_rollup_update')
+        compute_utils.tenant_usage_totals(instances, begin, end).AndReturn(
+            'fake-usages')
+        self.compute.conductor_api.tenant_usage_rollup_update(
+            self.context, self.compute.host, begin, end, 'fake-usages')
+        self.mox.ReplayAll()
+        self.compute._instance_usage_audit(self.context)
+
     def _get_sync_instance(self, power_state, vm_state, task_state=None):
         instance = instance_obj.Instance()
         instance.uuid = 'fake-uuid'
@@ -17,6 +17,7 @@
 
 """Tests For miscellaneous util methods used with compute."""
 
+import datetime
 import string
 
 from oslo.config import cfg
@@ -31,10 +32,12 @@ from nova.network import api as network_api
 from nova.openstack.common import importutils
 from nova.openstack.common.notifier import api as notifier_api
 from nova.openstack.common.notifier import test_notifier
+from nova.openstack.common import timeutils
 from nova import test
 from nova.tests import fake_instance_actions
 from nova.tests import fake_network
 import nova.tests.image.fake
+from nova import utils
 
 CONF = cfg.CONF
 CONF.import_opt('compute_manager', 'nova.service')
@@ -439,3 +442,64 @@ class UsageInfoTestCase(test.TestCase):
                                                     "create.start",
                                                     aggregate_payload)
         self.assertEquals(len(test_notifier.NOTIFICATIONS), 0)
+
+
+class TenantUsageTestCase(test.TestCase):
+    def setUp(self):
+        super(TenantUsageTestCase, self).setUp()
+        self.start = datetime.datetime(2013, 1, 1)
+        self.stop = datetime.datetime(2013, 1, 2)
+        self.flavor = flavors.get_default_flavor()
+
+    def _instance(self, project_id, launched_at, terminated_at=None):
+        sys_meta = utils.dict_to_metadata(
+            flavors.save_flavor_info({}, self.flavor))
+        return {'project_id': project_id,
+                'launched_at': launched_at,
+                'terminated_at': terminated_at,
+                'system_metadata': sys_meta}
+
+    def test_usage_hours(self):
+        hour = datetime.timedelta(hours=1)
+        instances = [
+            # ran for the whole period
+            self._instance('p1', self.start - hour),
+            # launched part way through
+            self._instance('p1', self.stop - 2 * hour),
+            # terminated part way through
+            self._instance('p1', self.start - hour, self.start + 3 * hour),
+            # terminated before the period
+            self._instance('p1', self.start - 2 * hour, self.start - hour),
+            # launched after the period
+            self._instance('p1', self.stop + hour),
+            # never launched
+            self._instance('p1', None),
+            # as primitives from the conductor
+            self._instance('p1', timeutils.strtime(self.start + hour),
+                           timeutils.strtime(self.start + 2 * hour)),
+        ]
+        self.assertEqual([24, 2, 3, 0, 0, 0, 1],
+                         compute_utils.usage_hours(instances, self.start,
+                                                   self.stop))
+
+    def test_tenant_usage_totals(self):
+        instances = [self._instance('p1', self.start),
+                     self._instance('p1', self.start + datetime.timedelta(
+                         hours=12)),
+                     self._instance('p2', self.start),
+                     self._instance('p3', self.stop)]
+        del instances[2]['system_metadata']
+
+        totals = compute_utils.tenant_usage_totals(instances, self.start,
+                                                   self.stop)
+        self.assertEqual(['p1'], totals.keys())
+        hours = 36
+        self.assertEqual({'instances': 2,
+                          'total_hours': hours,
+                          'total_vcpus_usage': self.flavor['vcpus'] * hours,
+                          'total_memory_mb_usage':
+                              self.flavor['memory_mb'] * hours,
+                          'total_local_gb_usage':
+                              (self.flavor['root_gb'] +
+                               self.flavor['ephemeral_gb']) * hours},
+                         totals['p1'])
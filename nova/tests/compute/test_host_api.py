@@ -13,10 +13,13 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import datetime
+
 from nova.cells import utils as cells_utils
 from nova import compute
 from nova.compute import rpcapi as compute_rpcapi
 from nova import context
+from nova import db
 from nova.openstack.common import rpc
 from nova import test
 
@@ -249,6 +252,47 @@ class ComputeHostAPITestCase(test.TestCase):
                 state='fake-state')
         self.assertEqual('fake-response', result)
 
+    def test_get_tenant_usage_rollups(self):
+        day = datetime.timedelta(days=1)
+        jan1 = datetime.datetime(2013, 1, 1)
+        jan2, jan3, jan4 = jan1 + day, jan1 + 2 * day, jan1 + 3 * day
+        for host, created_at in (('host1', jan1 - day),
+                                 ('host2', jan1 - day),
+                                 ('host3', jan2 + day / 2)):
+            db.service_create(self.ctxt, {'host': host,
+                                          'topic': 'compute',
+                                          'binary': 'nova-compute',
+                                          'created_at': created_at})
+        usage = {'project1': {'instances': 1,
+                              'total_hours': 24,
+                              'total_vcpus_usage': 24,
+                              'total_memory_mb_usage': 24,
+                              'total_local_gb_usage': 24}}
+        recorded = {
+            # host3 didn't exist yet, so this period is complete
+            (jan1, jan2): ['host1', 'host2'],
+            # host2 and host3 haven't recorded this one
+            (jan2, jan3): ['host1'],
+            (jan3, jan4): ['host1', 'host2', 'host3'],
+            # overlaps the other periods
+            (jan1, jan4): ['host1', 'host2', 'host3'],
+        }
+        for (begin, end), hosts in recorded.iteritems():
+            for host in hosts:
+                db.tenant_usage_rollup_update(self.ctxt, host, begin, end,
+                                              usage if host != 'host3'
+                                              else {})
+
+        result = self.host_api.get_tenant_usage_rollups(self.ctxt, jan1,
+                                                        jan4)
+
+        self.assertEqual([(jan1, jan2), (jan3, jan4)],
+                         [(begin, end) for begin, end, _r in result])
+        self.assertEqual(['host1', 'host2'],
+                         sorted(r['host'] for r in result[0][2]))
+        self.assertEqual(['host1', 'host2'],
+                         sorted(r['host'] for r in result[1][2]))
+
 
 class ComputeHostAPICellsTestCase(ComputeHostAPITestCase):
     def setUp(self):
@@ -381,3 +425,7 @@ class ComputeHostAPICellsTestCase(ComputeHostAPITestCase):
                 'fake-begin', 'fake-end', host='fake-host',
                 state='fake-state')
         self.assertEqual('fake-response', result)
+
+    def test_get_tenant_usage_rollups(self):
+        self.assertEqual([], self.host_api.get_tenant_usage_rollups(
+            self.ctxt, 'fake-begin', 'fake-end'))
@@ -474,6 +474,14 @@ class _BaseTestCase(object):
             self.context, 'task', 'begin', 'end', 'host', 'errors', 'message')
         self.assertEqual(result, 'result')
 
+    def test_tenant_usage_rollup_update(self):
+        self.mox.StubOutWithMock(db, 'tenant_usage_rollup_update')
+        db.tenant_usage_rollup_update(self.context.elevated(), 'host',
+                                      'begin', 'end', {'project': {}})
+        self.mox.ReplayAll()
+        self.conductor.tenant_usage_rollup_update(
+            self.context, 'host', 'begin', 'end', {'project': {}})
+
     def test_notify_usage_exists(self):
         info = {
             'audit_period_beginning': 'start',
@@ -613,6 +621,13 @@ class _BaseTestCase(object):
         self.mox.ReplayAll()
         self.conductor.compute_reboot(self.context, 'instance', 'fake-type')
 
+    def test_service_heartbeat(self):
+        self.mox.StubOutWithMock(db, 'service_heartbeat')
+        db.service_heartbeat(self.context, 'fake-id')
+        self.mox.ReplayAll()
+        self.conductor.service_heartbeat(self.context,
+                                         {'id': 'fake-id', 'report_count': 1})
+
 
 class ConductorTestCase(_BaseTestCase, test.TestCase):
     """Conductor Manager Tests."""
@@ -818,6 +833,15 @@ class ConductorRPCAPITestCase(_BaseTestCase, test.TestCase):
         self.conductor_manager = self.conductor_service.manager
         self.conductor = conductor_rpcapi.ConductorAPI()
 
+    def test_service_heartbeat_grizzly_conductor(self):
+        self.conductor.version_cap = '1.48'
+        service = {'id': 'fake-id', 'report_count': 1}
+        self.mox.StubOutWithMock(db, 'service_heartbeat')
+        self.mox.StubOutWithMock(db, 'service_update')
+        db.service_update(self.context, 'fake-id', {'report_count': 2})
+        self.mox.ReplayAll()
+        self.conductor.service_heartbeat(self.context, service)
+
     def test_block_device_mapping_update_or_create(self):
         fake_bdm = {'id': 'fake-id'}
         self.mox.StubOutWithMock(db, 'block_device_mapping_create')
@@ -415,6 +415,15 @@ class NotDbApiTestCase(DbTestCase):
                                                 {'display_name': '%test%'})
         self.assertEqual(2, len(result))
 
+    def test_regex_filter_postgresql(self):
+        for connection in ('postgresql://', 'postgresql+psycopg2://',
+                           'postgres://'):
+            self.flags(sql_connection=connection)
+            query = sqlalchemy_api.regex_filter(
+                db_session.get_session().query(models.Instance),
+                models.Instance, {'display_name': 'test.*'})
+            self.assertIn('instances.display_name ~ ', str(query))
+
     def test_instance_get_all_by_filters_paginate(self):
         test1 = self.create_instance_with_args(display_name='test1')
         test2 = self.create_instance_with_args(display_name='test2')
@@ -1466,6 +1475,24 @@ class InstanceTestCase(DbTestCase):
         result = db.instance_get_all_by_filters(self.context, {})
         self.assertEqual(2, len(result))
 
+    def test_instance_get_all_by_filters_paginate_same_created_at(self):
+        created_at = datetime.datetime(2013, 1, 1)
+        uuids = set(self.create_instance_with_args(
+                        created_at=created_at)['uuid'] for i in range(5))
+        for sort_dir in ('asc', 'desc'):
+            seen = []
+            marker = None
+            while True:
+                page = db.instance_get_all_by_filters(
+                    self.context, {}, 'created_at', sort_dir,
+                    limit=2, marker=marker)
+                if not page:
+                    break
+                seen.extend(inst['uuid'] for inst in page)
+                marker = page[-1]['uuid']
+            self.assertEqual(5, len(seen))
+            self.assertEqual(uuids, set(seen))
+
     def test_instance_get_all_by_filters_regex(self):
         self.create_instance_with_args(display_name='test1')
         self.create_instance_with_args(display_name='teeeest2')
@@ -1934,6 +1961,23 @@ class ServiceTestCase(test.TestCase, ModelsObjectComparatorMixin):
         self.assertRaises(exception.ServiceNotFound,
                           db.service_update, self.ctxt, 100500, {})
 
+    def test_service_heartbeat(self):
+        service = self._create_service({})
+        now = timeutils.utcnow()
+        timeutils.set_time_override(now)
+        self.addCleanup(timeutils.clear_time_override)
+        db.service_heartbeat(self.ctxt, service['id'])
+        updated_service = db.service_get(self.ctxt, service['id'])
+        self.assertEqual(service['report_count'] + 1,
+                         updated_service['report_count'])
+        self.assertEqual(now, updated_service['updated_at'])
+
+    def test_service_heartbeat_not_found_exception(self):
+        service = self._create_service({})
+        db.service_destroy(self.ctxt, service['id'])
+        self.assertRaises(exception.ServiceNotFound,
+                          db.service_heartbeat, self.ctxt, service['id'])
+
     def test_service_get(self):
         service1 = self._create_service({})
         self._create_service({'host': 'some_other_fake_host'})
@@ -4104,6 +4148,83 @@ class TaskLogTestCase(test.TestCase):
                                  self.end, self.host)
         self.assertEqual(result['errors'], 1)
 
+    def test_task_log_get_all_in_range(self):
+        earlier = self.begin - datetime.timedelta(seconds=5)
+        db.task_log_begin_task(self.context, self.task_name, earlier,
+                               self.begin, self.host, message=self.message)
+        result = db.task_log_get_all_in_range(self.context, self.task_name,
+                                              earlier, self.end)
+        self.assertEqual(2, len(result))
+        result = db.task_log_get_all_in_range(self.context, self.task_name,
+                                              self.begin, self.end)
+        self.assertEqual(1, len(result))
+        self.assertEqual(self.begin, result[0]['period_beginning'])
+        result = db.task_log_get_all_in_range(self.context, self.task_name,
+                                              earlier, self.end,
+                                              state='DONE')
+        self.assertEqual([], result)
+
+
+class TenantUsageRollupTestCase(test.TestCase):
+
+    def setUp(self):
+        super(TenantUsageRollupTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        self.begin = datetime.datetime(2013, 1, 1)
+        self.end = datetime.datetime(2013, 1, 2)
+        self.usage = {'instances': 2,
+                      'total_hours': 48.0,
+                      'total_vcpus_usage': 96.0,
+                      'total_memory_mb_usage': 49152.0,
+                      'total_local_gb_usage': 960.0}
+
+    def test_tenant_usage_rollup_update(self):
+        db.tenant_usage_rollup_update(self.context, 'host1', self.begin,
+                                      self.end, {'project1': self.usage})
+        rollups = db.tenant_usage_rollup_get_all(self.context, self.begin,
+                                                 self.end)
+        self.assertEqual(1, len(rollups))
+        self.assertEqual('host1', rollups[0]['host'])
+        self.assertEqual('project1', rollups[0]['project_id'])
+        for key, value in self.usage.iteritems():
+            self.assertEqual(value, rollups[0][key])
+
+        task_log = db.task_log_get(self.context, 'tenant_usage_rollup',
+                                   self.begin, self.end, 'host1')
+        self.assertEqual('DONE', task_log['state'])
+        self.assertEqual(1, task_log['task_items'])
+
+    def test_tenant_usage_rollup_update_replaces(self):
+        db.tenant_usage_rollup_update(self.context, 'host1', self.begin,
+                                      self.end, {'project1': self.usage})
+        db.tenant_usage_rollup_update(self.context, 'host1', self.begin,
+                                      self.end, {'project2': self.usage})
+        rollups = db.tenant_usage_rollup_get_all(self.context, self.begin,
+                                                 self.end)
+        self.assertEqual(['project2'], [r['project_id'] for r in rollups])
+
+    def test_tenant_usage_rollup_update_nothing_running(self):
+        db.tenant_usage_rollup_update(self.context, 'host1', self.begin,
+                                      self.end, {})
+        self.assertEqual([], db.tenant_usage_rollup_get_all(
+            self.context, self.begin, self.end))
+        task_log = db.task_log_get(self.context, 'tenant_usage_rollup',
+                                   self.begin, self.end, 'host1')
+        self.assertEqual('DONE', task_log['state'])
+
+    def test_tenant_usage_rollup_get_all_in_range(self):
+        later = self.end + datetime.timedelta(days=1)
+        db.tenant_usage_rollup_update(self.context, 'host1', self.begin,
+                                      self.end, {'project1': self.usage})
+        db.tenant_usage_rollup_update(self.context, 'host1', self.end,
+                                      later, {'project1': self.usage})
+        self.assertEqual(2, len(db.tenant_usage_rollup_get_all(
+            self.context, self.begin, later)))
+        rollups = db.tenant_usage_rollup_get_all(self.context, self.end,
+                                                 later)
+        self.assertEqual(1, len(rollups))
+        self.assertEqual(self.end, rollups[0]['period_beginning'])
+
 
 class BlockDeviceMappingTestCase(test.TestCase):
     def setUp(self):
@@ -4248,6 +4369,23 @@ class BlockDeviceMappingTestCase(test.TestCase):
         bmd = db.block_device_mapping_get_all_by_instance(self.ctxt, uuid2)
         self.assertEqual(len(bmd), 2)
 
+    def test_block_device_mapping_get_all_by_instance_uuids(self):
+        uuid1 = self.instance['uuid']
+        uuid2 = db.instance_create(self.ctxt, {})['uuid']
+        uuid3 = db.instance_create(self.ctxt, {})['uuid']
+
+        for values in [{'instance_uuid': uuid1, 'device_name': 'first'},
+                       {'instance_uuid': uuid2, 'device_name': 'second'},
+                       {'instance_uuid': uuid3, 'device_name': 'third'}]:
+            self._create_bdm(values)
+
+        bdms = db.block_device_mapping_get_all_by_instance_uuids(
+            self.ctxt, [uuid1, uuid3])
+        self.assertEqual(['first', 'third'],
+                         sorted(bdm['device_name'] for bdm in bdms))
+        self.assertEqual([], db.block_device_mapping_get_all_by_instance_uuids(
+            self.ctxt, []))
+
     def test_block_device_mapping_destroy(self):
         bdm = self._create_bdm({})
         db.block_device_mapping_destroy(self.ctxt, bdm['id'])
@@ -4914,6 +5052,103 @@ class QuotaTestCase(test.TestCase, ModelsObjectComparatorMixin):
         self.assertRaises(exception.QuotaExists, db.quota_create, self.ctxt,
                           'project1', 'resource1', 42)
 
+    def _reservable_resources(self, in_use):
+        def sync(elevated, project_id, session):
+            return dict(in_use)
+        return dict((res, ReservableResource(res, sync, 'quota_%s' % res))
+                    for res in in_use)
+
+    def _reserve_conditional(self, resources, deltas, quotas=None):
+        quotas = quotas or dict((res, 10) for res in deltas)
+        expire = timeutils.utcnow() + datetime.timedelta(days=1)
+        return db.quota_reserve_conditional(self.ctxt, resources, quotas,
+                                            deltas, expire, 0, 0, 'p1')
+
+    def test_quota_reserve_conditional(self):
+        resources = self._reservable_resources(dict(res0=1, res1=2))
+        # The first reservation has no usages to update and syncs them
+        self._reserve_conditional(resources, dict(res0=1, res1=1))
+        self.mox.StubOutWithMock(sqlalchemy_api, 'quota_reserve')
+        self.mox.ReplayAll()
+
+        reservations = self._reserve_conditional(resources,
+                                                 dict(res0=2, res1=-1))
+
+        self.assertEqual(2, len(reservations))
+        deltas = dict((r.resource, r.delta) for r in
+                      [db.reservation_get(self.ctxt, uuid)
+                       for uuid in reservations])
+        self.assertEqual(dict(res0=2, res1=-1), deltas)
+        self.assertEqual({'project_id': 'p1',
+                          'res0': {'in_use': 1, 'reserved': 3},
+                          'res1': {'in_use': 2, 'reserved': 1}},
+                         db.quota_usage_get_all_by_project(self.ctxt, 'p1'))
+
+    def test_quota_reserve_conditional_over_quota(self):
+        resources = self._reservable_resources(dict(res0=1, res1=2))
+        self._reserve_conditional(resources, dict(res0=1, res1=1))
+
+        self.assertRaises(exception.OverQuota, self._reserve_conditional,
+                          resources, dict(res0=1, res1=5),
+                          dict(res0=10, res1=7))
+
+        # res0 is updated first, but rolled back with res1
+        self.assertEqual({'project_id': 'p1',
+                          'res0': {'in_use': 1, 'reserved': 1},
+                          'res1': {'in_use': 2, 'reserved': 1}},
+                         db.quota_usage_get_all_by_project(self.ctxt, 'p1'))
+
+    def test_quota_reserve_conditional_unlimited(self):
+        resources = self._reservable_resources(dict(res0=1))
+        self._reserve_conditional(resources, dict(res0=1))
+        self._reserve_conditional(resources, dict(res0=100), dict(res0=-1))
+        usage = db.quota_usage_get(self.ctxt, 'p1', 'res0')
+        self.assertEqual(101, usage.reserved)
+
+    def test_quota_reserve_conditional_out_of_sync(self):
+        resources = self._reservable_resources(dict(res0=1))
+        self._reserve_conditional(resources, dict(res0=1))
+        db.quota_usage_update(self.ctxt, 'p1', 'res0', in_use=-1)
+        self.mox.StubOutWithMock(sqlalchemy_api, 'quota_reserve')
+        sqlalchemy_api.quota_reserve(self.ctxt, resources, mox.IgnoreArg(),
+                                     dict(res0=1), mox.IgnoreArg(), 0, 0,
+                                     project_id='p1').AndReturn(['resv'])
+        self.mox.ReplayAll()
+
+        self.assertEqual(['resv'],
+                         self._reserve_conditional(resources, dict(res0=1)))
+
+    def test_quota_usage_get_stale_projects(self):
+        resources = self._reservable_resources(dict(res0=1))
+        expire = timeutils.utcnow() + datetime.timedelta(days=1)
+        for project_id in ('p1', 'p2', 'p3'):
+            db.quota_reserve(self.ctxt, resources, dict(res0=10),
+                             dict(res0=1), expire, 0, 0, project_id)
+        db.quota_usage_update(self.ctxt, 'p2', 'res0', in_use=-1)
+
+        self.assertEqual(['p2'],
+                         db.quota_usage_get_stale_projects(self.ctxt))
+
+        timeutils.set_time_override(timeutils.utcnow() +
+                                    datetime.timedelta(hours=1))
+        self.addCleanup(timeutils.clear_time_override)
+        self.assertEqual(['p1', 'p2', 'p3'],
+                         sorted(db.quota_usage_get_stale_projects(
+                             self.ctxt, max_age=60)))
+
+    def test_quota_usage_refresh(self):
+        resources = self._reservable_resources(dict(res0=1, res1=2))
+        self._reserve_conditional(resources, dict(res0=1, res1=1))
+        db.quota_usage_update(self.ctxt, 'p1', 'res0', in_use=-1)
+        db.quota_usage_update(self.ctxt, 'p1', 'res1', in_use=7)
+
+        db.quota_usage_refresh(self.ctxt, resources, 'p1')
+
+        self.assertEqual({'project_id': 'p1',
+                          'res0': {'in_use': 1, 'reserved': 1},
+                          'res1': {'in_use': 2, 'reserved': 1}},
+                         db.quota_usage_get_all_by_project(self.ctxt, 'p1'))
+
 
 class QuotaClassTestCase(test.TestCase, ModelsObjectComparatorMixin):
 
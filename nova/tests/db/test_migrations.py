@@ -2141,6 +2141,51 @@ class TestNovaMigrations(BaseMigrationTestCase, CommonTestsMixIn):
                           cells.insert().execute,
                           {'name': 'cell_transport_123', 'deleted': 0})
 
+    def _check_201(self, engine, data):
+        instances = db_utils.get_table(engine, 'instances')
+        index_data = dict((idx.name, idx.columns.keys())
+                          for idx in instances.indexes)
+        expected = {
+            'instances_deleted_created_at_idx':
+                ['deleted', 'created_at', 'id'],
+            'instances_project_id_deleted_created_at_idx':
+                ['project_id', 'deleted', 'created_at', 'id'],
+        }
+        for name, columns in expected.iteritems():
+            self.assertIn(name, index_data)
+            if engine.name == 'postgresql':
+                # bug http://www.sqlalchemy.org/trac/ticket/2767
+                self.assertEqual(sorted(columns), sorted(index_data[name]))
+            else:
+                self.assertEqual(columns, index_data[name])
+
+    def _post_downgrade_201(self, engine):
+        instances = db_utils.get_table(engine, 'instances')
+        index_names = [idx.name for idx in instances.indexes]
+        self.assertNotIn('instances_deleted_created_at_idx', index_names)
+        self.assertNotIn('instances_project_id_deleted_created_at_idx',
+                         index_names)
+
+    def _check_202(self, engine, data):
+        for table_name in ('tenant_usage_rollups',
+                           'shadow_tenant_usage_rollups'):
+            table = db_utils.get_table(engine, table_name)
+            for column in ('host', 'project_id', 'period_beginning',
+                           'period_ending', 'instances', 'total_hours',
+                           'total_vcpus_usage', 'total_memory_mb_usage',
+                           'total_local_gb_usage'):
+                self.assertIn(column, table.c)
+
+        rollups = db_utils.get_table(engine, 'tenant_usage_rollups')
+        self.assertIn('tenant_usage_rollups_period_idx',
+                      [idx.name for idx in rollups.indexes])
+
+    def _post_downgrade_202(self, engine):
+        for table_name in ('tenant_usage_rollups',
+                           'shadow_tenant_usage_rollups'):
+            self.assertRaises(sqlalchemy.exc.NoSuchTableError,
+                              db_utils.get_table, engine, table_name)
+
 
 class TestBaremetalMigrations(BaseMigrationTestCase, CommonTestsMixIn):
     """Test sqlalchemy-migrate migrations."""
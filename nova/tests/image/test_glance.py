@@ -17,9 +17,12 @@
 
 
 import datetime
+import errno
 import filecmp
+import hashlib
 import os
 import random
+import shutil
 import tempfile
 import time
 
@@ -400,6 +403,69 @@ class TestGlanceImageService(test.TestCase):
         }
         self.assertEqual(image_meta, expected)
 
+    def _count_calls(self):
+        calls = []
+        client_call = self.service._client.call
+
+        def call(context, version, method, *args, **kwargs):
+            calls.append(method)
+            return client_call(context, version, method, *args, **kwargs)
+
+        self.stubs.Set(self.service._client, 'call', call)
+        return calls
+
+    def _create_cached_image(self, status='active'):
+        self.flags(image_metadata_cache_time=60)
+        self.stubs.Set(glance, '_IMAGE_CACHE', None)
+        client = glance_stubs.StubGlanceClient(images=[
+            {'id': 'cached', 'name': 'image1', 'is_public': True,
+             'status': status, 'properties': {}}])
+        self.service = self._create_image_service(client)
+        return 'cached'
+
+    def test_show_cached(self):
+        image_id = self._create_cached_image()
+        calls = self._count_calls()
+
+        image_meta = self.service.show(self.context, image_id)
+        image_meta['properties']['changed'] = 'by caller'
+        image_meta = self.service.show(self.context, image_id)
+
+        self.assertEqual(['get'], calls)
+        self.assertEqual({}, image_meta['properties'])
+        self.assertEqual({'size': 1, 'hits': 1, 'misses': 1, 'evictions': 0},
+                         glance.get_image_cache_stats())
+
+    def test_show_cached_per_project(self):
+        image_id = self._create_cached_image()
+        calls = self._count_calls()
+
+        self.service.show(self.context, image_id)
+        other_context = context.RequestContext('fake', 'other',
+                                               auth_token=True)
+        self.service.show(other_context, image_id)
+
+        self.assertEqual(['get', 'get'], calls)
+
+    def test_show_inactive_not_cached(self):
+        image_id = self._create_cached_image(status='saving')
+        calls = self._count_calls()
+
+        self.service.show(self.context, image_id)
+        self.service.show(self.context, image_id)
+
+        self.assertEqual(['get', 'get'], calls)
+
+    def test_update_invalidates_cache(self):
+        image_id = self._create_cached_image()
+        self.service.show(self.context, image_id)
+
+        self.service.update(self.context, image_id,
+                            {'name': 'new image name'})
+
+        image_meta = self.service.show(self.context, image_id)
+        self.assertEqual('new image name', image_meta['name'])
+
     def test_show_raises_when_no_authtoken_in_the_context(self):
         fixture = self._make_fixture(name='image1',
                                      is_public=False,
@@ -512,6 +578,54 @@ class TestGlanceImageService(test.TestCase):
         os.remove(client.s_tmpfname)
         os.remove(tmpfname)
 
+    def _create_file_url_service(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        src_path = os.path.join(tmpdir, 'src')
+        with open(src_path, 'wb') as f:
+            f.write(os.urandom(10240))
+            f.seek(1024 * 1024)
+            f.write(os.urandom(10240))
+
+        class MyGlanceStubClient(glance_stubs.StubGlanceClient):
+            """A client that returns a file url."""
+            def get(self, image_id):
+                return type('GlanceTestDirectUrlMeta', (object,),
+                            {'direct_url': 'file://' + src_path})
+
+        self.flags(allowed_direct_url_schemes=['file'])
+        return self._create_image_service(MyGlanceStubClient()), src_path
+
+    def test_download_file_url_to_path(self):
+        service, src_path = self._create_file_url_service()
+        dst_path = src_path + '.dst'
+        service.download(self.context, 1, dst_path=dst_path)
+
+        self.assertTrue(filecmp.cmp(src_path, dst_path, shallow=False))
+        self.assertNotEqual(os.stat(src_path).st_ino,
+                            os.stat(dst_path).st_ino)
+
+    def test_download_file_url_links(self):
+        self.flags(link_direct_url_files=True)
+        service, src_path = self._create_file_url_service()
+        dst_path = src_path + '.dst'
+        open(dst_path, 'w').close()
+        service.download(self.context, 1, dst_path=dst_path)
+
+        self.assertEqual(os.stat(src_path).st_ino, os.stat(dst_path).st_ino)
+
+    def test_download_file_url_copies_if_link_fails(self):
+        self.flags(link_direct_url_files=True)
+        service, src_path = self._create_file_url_service()
+        dst_path = src_path + '.dst'
+
+        def fake_link(src, dst):
+            raise OSError(errno.EXDEV, 'Invalid cross-device link')
+
+        self.stubs.Set(os, 'link', fake_link)
+        service.download(self.context, 1, dst_path=dst_path)
+        self.assertTrue(filecmp.cmp(src_path, dst_path, shallow=False))
+
     def test_client_forbidden_converts_to_imagenotauthed(self):
         class MyGlanceStubClient(glance_stubs.StubGlanceClient):
             """A client that raises a Forbidden exception."""
@@ -594,6 +708,148 @@ def _create_failing_glance_client(info):
     return MyGlanceStubClient()
 
 
+class FakeRangeHTTPClient(object):
+    """Serves the data of one image, honouring Range headers if asked to.
+    """
+
+    class Response(object):
+        def __init__(self, status, data):
+            self.status = status
+            self.data = data
+
+        def read(self, amt):
+            chunk, self.data = self.data[:amt], self.data[amt:]
+            return chunk
+
+        def close(self):
+            pass
+
+    def __init__(self, data, ranges=True, fail=None):
+        self.endpoint_hostname = 'fake_host'
+        self.endpoint_port = 9292
+        self.data = data
+        self.ranges = ranges
+        self.fail = fail or (lambda start: False)
+        self.requested = []
+
+    def raw_request(self, method, url, headers=None):
+        if not self.ranges:
+            return self.Response(200, self.data), None
+        start, end = headers['Range'][len('bytes='):].split('-')
+        start, end = int(start), int(end)
+        self.requested.append((start, end))
+        if self.fail(start):
+            raise glanceclient.exc.CommunicationError('')
+        return self.Response(206, self.data[start:end + 1]), None
+
+
+class TestGlanceRangedDownload(test.TestCase):
+
+    def setUp(self):
+        super(TestGlanceRangedDownload, self).setUp()
+        self.flags(glance_download_parallelism=2,
+                   glance_download_part_size=1)
+        self.stubs.Set(glance, '_IMAGE_CACHE', None)
+        self.stubs.Set(time, 'sleep', lambda *args: None)
+        self.context = context.RequestContext('fake', 'fake')
+        self.data = os.urandom(int(2.5 * 1024 * 1024))
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.path = os.path.join(tmpdir, 'image.part')
+
+    def _create_service(self, http_client, checksum=None):
+        client = glance_stubs.StubGlanceClient(images=[
+            {'id': 'image', 'size': len(self.data), 'status': 'active',
+             'is_public': True,
+             'checksum': checksum or hashlib.md5(self.data).hexdigest()}])
+        client.data = lambda image_id: [self.data]
+        client.images.data = client.data
+        client.images.api = http_client
+        self.stubs.Set(glance, '_create_glance_client',
+                       lambda *args: client)
+        return glance.GlanceImageService(
+                glance.GlanceClientWrapper('fake', 'fake_host', 9292))
+
+    def _read(self):
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def test_download_ranges(self):
+        http_client = FakeRangeHTTPClient(self.data)
+        service = self._create_service(http_client)
+        service.download(self.context, 'image', dst_path=self.path)
+
+        mb = 1024 * 1024
+        self.assertEqual(sorted(http_client.requested),
+                         [(0, mb - 1), (mb, 2 * mb - 1),
+                          (2 * mb, len(self.data) - 1)])
+        self.assertEqual(self._read(), self.data)
+        self.assertFalse(os.path.exists(self.path + '.ranges'))
+
+    def test_download_resumes(self):
+        self.flags(glance_num_retries=0)
+        mb = 1024 * 1024
+        http_client = FakeRangeHTTPClient(self.data,
+                                          fail=lambda start: start == mb)
+        service = self._create_service(http_client)
+        self.assertRaises(exception.GlanceConnectionFailed,
+                          service.download, self.context, 'image',
+                          dst_path=self.path)
+        self.assertTrue(os.path.exists(self.path + '.ranges'))
+
+        http_client.fail = lambda start: False
+        http_client.requested = []
+        service.download(self.context, 'image', dst_path=self.path)
+
+        self.assertNotIn((0, mb - 1), http_client.requested)
+        self.assertIn((mb, 2 * mb - 1), http_client.requested)
+        self.assertEqual(self._read(), self.data)
+        self.assertFalse(os.path.exists(self.path + '.ranges'))
+
+    def test_download_retries_range(self):
+        self.flags(glance_num_retries=1)
+        failed = []
+
+        def fail(start):
+            if start not in failed:
+                failed.append(start)
+                return True
+            return False
+
+        http_client = FakeRangeHTTPClient(self.data, fail=fail)
+        service = self._create_service(http_client)
+        service.download(self.context, 'image', dst_path=self.path)
+        self.assertEqual(len(http_client.requested), 6)
+        self.assertEqual(self._read(), self.data)
+
+    def test_download_checksum_mismatch(self):
+        http_client = FakeRangeHTTPClient(self.data)
+        service = self._create_service(http_client, checksum='bad')
+        self.assertRaises(exception.ImageChecksumMismatch,
+                          service.download, self.context, 'image',
+                          dst_path=self.path)
+        self.assertFalse(os.path.exists(self.path))
+        self.assertFalse(os.path.exists(self.path + '.ranges'))
+
+    def test_download_without_range_support(self):
+        http_client = FakeRangeHTTPClient(self.data, ranges=False)
+        service = self._create_service(http_client)
+        service.download(self.context, 'image', dst_path=self.path)
+        self.assertEqual(self._read(), self.data)
+        self.assertFalse(os.path.exists(self.path + '.ranges'))
+
+    def test_download_ignores_ranges_of_other_image(self):
+        http_client = FakeRangeHTTPClient(self.data)
+        service = self._create_service(http_client)
+        with open(self.path, 'wb') as f:
+            f.write('x' * len(self.data))
+        with open(self.path + '.ranges', 'w') as f:
+            f.write('{"image_id": "other", "done": [0, 1, 2]}')
+        service.download(self.context, 'image', dst_path=self.path)
+        self.assertEqual(len(http_client.requested), 3)
+        self.assertEqual(self._read(), self.data)
+
+
 class TestGlanceClientWrapper(test.TestCase):
 
     def setUp(self):
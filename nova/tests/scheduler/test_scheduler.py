@@ -465,17 +465,17 @@ class SchedulerTestCase(test.NoDBTestCase):
                 host, capabilities)
 
     def test_hosts_up(self):
-        service1 = {'host': 'host1'}
-        service2 = {'host': 'host2'}
+        service1 = {'id': 1, 'host': 'host1'}
+        service2 = {'id': 2, 'host': 'host2'}
         services = [service1, service2]
 
         self.mox.StubOutWithMock(db, 'service_get_all_by_topic')
-        self.mox.StubOutWithMock(servicegroup.API, 'service_is_up')
+        self.mox.StubOutWithMock(servicegroup.API, 'services_are_up')
 
         db.service_get_all_by_topic(self.context,
                 self.topic).AndReturn(services)
-        self.servicegroup_api.service_is_up(service1).AndReturn(False)
-        self.servicegroup_api.service_is_up(service2).AndReturn(True)
+        self.servicegroup_api.services_are_up(services).AndReturn(
+                {1: False, 2: True})
 
         self.mox.ReplayAll()
         result = self.driver.hosts_up(self.context, self.topic)
@@ -108,6 +108,42 @@ class DBServiceGroupTestCase(test.TestCase):
         service_id = self.servicegroup_api.get_one(self._topic)
         self.assertTrue(service_id in services)
 
+    def test_services_are_up(self):
+        fts_func = datetime.datetime.fromtimestamp
+        fake_now = 1000
+        timeutils.set_time_override(fts_func(fake_now))
+        self.addCleanup(timeutils.clear_time_override)
+        services = [{'id': 1,
+                     'updated_at': fts_func(fake_now - self.down_time),
+                     'created_at': fts_func(fake_now - 100)},
+                    {'id': 2,
+                     'updated_at': None,
+                     'created_at': fts_func(fake_now - self.down_time - 1)},
+                    {'id': 3,
+                     'updated_at': timeutils.strtime(fts_func(fake_now)),
+                     'created_at': fts_func(fake_now - 100)}]
+        result = self.servicegroup_api.services_are_up(services)
+        self.assertEqual({1: True, 2: False, 3: True}, result)
+
+    def test_report_state_heartbeat(self):
+        serv = self.useFixture(
+            ServiceFixture(self._host, self._binary, self._topic)).serv
+        serv.start()
+        service_ref = db.service_get_by_args(self._ctx,
+                                             self._host,
+                                             self._binary)
+        report_count = service_ref['report_count']
+
+        self.mox.StubOutWithMock(db, 'service_update')
+        self.mox.ReplayAll()
+        self.servicegroup_api._driver._report_state(serv)
+
+        service_ref = db.service_get_by_args(self._ctx,
+                                             self._host,
+                                             self._binary)
+        self.assertEqual(report_count + 1, service_ref['report_count'])
+        self.assertEqual(report_count + 1, serv.service_ref['report_count'])
+
     def test_service_is_up(self):
         fts_func = datetime.datetime.fromtimestamp
         fake_now = 1000
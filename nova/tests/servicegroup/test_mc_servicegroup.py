@@ -17,6 +17,7 @@
 
 import eventlet
 import fixtures
+from oslo.config import cfg
 
 from nova import context
 from nova import db
@@ -25,6 +26,10 @@ from nova import service
 from nova import servicegroup
 from nova import test
 
+CONF = cfg.CONF
+CONF.import_opt('memcached_servicegroup_cache_time',
+                'nova.servicegroup.drivers.mc')
+
 
 class ServiceFixture(fixtures.Fixture):
 
@@ -54,6 +59,7 @@ class MemcachedServiceGroupTestCase(test.TestCase):
         self.down_time = 3
         self.flags(enable_new_services=True)
         self.flags(service_down_time=self.down_time)
+        self.flags(memcached_servicegroup_cache_time=0)
         self.servicegroup_api = servicegroup.API(test=True)
         self._host = 'foo'
         self._binary = 'nova-fake'
@@ -210,3 +216,87 @@ class MemcachedServiceGroupTestCase(test.TestCase):
         self.servicegroup_api._driver.mc = None
         self.servicegroup_api._driver._report_state(serv)
         self.assertTrue(serv.model_disconnected)
+
+
+class MemcachedServiceGroupCacheTestCase(test.TestCase):
+
+    def setUp(self):
+        super(MemcachedServiceGroupCacheTestCase, self).setUp()
+        servicegroup.API._driver = None
+        self.flags(servicegroup_driver='mc')
+        self.flags(service_down_time=60)
+        self.flags(memcached_servicegroup_cache_time=5)
+        self.servicegroup_api = servicegroup.API(test=True)
+        self.driver = self.servicegroup_api._driver
+        self.mc = self.driver.mc
+        self.lookups = []
+
+        def fake_get_multi(keys):
+            self.lookups.append(sorted(keys))
+            return dict((key, self.mc.get(key)) for key in keys
+                        if self.mc.get(key) is not None)
+
+        # NOTE: The in memory client has no get_multi, memcache clients do.
+        self.mc.get_multi = fake_get_multi
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        self.services = [{'id': i, 'topic': 'unittest', 'host': 'host%d' % i}
+                         for i in range(3)]
+
+    def test_are_up_single_lookup(self):
+        self.mc.set('unittest:host0', timeutils.utcnow(), time=60)
+        self.mc.set('unittest:host2', timeutils.utcnow(), time=60)
+
+        result = self.servicegroup_api.services_are_up(self.services)
+
+        self.assertEqual({0: True, 1: False, 2: True}, result)
+        self.assertEqual([['unittest:host0', 'unittest:host1',
+                           'unittest:host2']], self.lookups)
+
+    def test_are_up_without_get_multi(self):
+        del self.mc.get_multi
+        self.mc.set('unittest:host0', timeutils.utcnow(), time=60)
+        self.mc.set('unittest:host2', timeutils.utcnow(), time=60)
+
+        result = self.servicegroup_api.services_are_up(self.services)
+
+        self.assertEqual({0: True, 1: False, 2: True}, result)
+        self.assertEqual([], self.lookups)
+
+    def test_is_up_cached_until_stale(self):
+        service = self.services[0]
+        self.assertFalse(self.servicegroup_api.service_is_up(service))
+        self.mc.set('unittest:host0', timeutils.utcnow(), time=60)
+
+        timeutils.advance_time_seconds(4)
+        self.assertFalse(self.servicegroup_api.service_is_up(service))
+        self.assertEqual(1, len(self.lookups))
+
+        timeutils.advance_time_seconds(1)
+        self.assertTrue(self.servicegroup_api.service_is_up(service))
+        self.assertEqual(2, len(self.lookups))
+
+    def test_only_stale_keys_fetched(self):
+        self.servicegroup_api.service_is_up(self.services[0])
+        timeutils.advance_time_seconds(1)
+        self.servicegroup_api.services_are_up(self.services)
+        self.assertEqual([['unittest:host0'],
+                          ['unittest:host1', 'unittest:host2']],
+                         self.lookups)
+
+    def test_get_all(self):
+        self.mc.set('unittest:host1', timeutils.utcnow(), time=60)
+        self.stubs.Set(self.driver.conductor_api, 'service_get_all_by_topic',
+                       lambda ctxt, topic: self.services)
+
+        self.assertEqual(['host1'], self.servicegroup_api.get_all('unittest'))
+        self.assertEqual(1, len(self.lookups))
+
+    def test_report_state_updates_cache(self):
+        serv = self.useFixture(
+            ServiceFixture('host0', 'nova-fake', 'unittest')).serv
+        serv.start()
+        self.driver._report_state(serv)
+
+        self.assertTrue(self.servicegroup_api.service_is_up(self.services[0]))
+        self.assertEqual([], self.lookups)
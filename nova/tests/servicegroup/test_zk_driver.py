@@ -23,10 +23,14 @@ To set up in Ubuntu 12.04:
 $ sudo apt-get install zookeeper zookeeperd python-zookeeper
 $ sudo pip install evzookeeper
 $ nosetests nova.tests.servicegroup.test_zk_driver
+
+ZKMembershipCacheTestCase uses an in memory stand-in for ZooKeeper instead,
+and always runs.
 """
 
 import eventlet
 
+from nova import exception
 from nova import servicegroup
 from nova import test
 
@@ -63,3 +67,101 @@ class ZKServiceGroupTestCase(test.TestCase):
         pulse.stop()
         eventlet.sleep(1)
         self.assertFalse(self.servicegroup_api.service_is_up(service_id))
+
+
+class FakeZKSession(object):
+    """Keeps the children of each path and the watchers on them."""
+
+    def __init__(self, *args, **kwargs):
+        self.children = {}
+        self.monitors = {}
+        self.connected = True
+
+    def create(self, path, value, acl=None, flags=0):
+        pass
+
+    def notify(self, path):
+        members = set(self.children.get(path, ())) if self.connected else None
+        for monitor in self.monitors.get(path, []):
+            monitor.cb_func(members)
+
+
+class FakeMembership(object):
+
+    def __init__(self, session, basepath, name):
+        self.session = session
+        self.basepath = basepath
+        self.name = name
+        session.children.setdefault(basepath, set()).add(name)
+        session.notify(basepath)
+
+    def leave(self):
+        self.session.children[self.basepath].discard(self.name)
+        self.session.notify(self.basepath)
+
+
+class FakeMembershipMonitor(object):
+
+    def __init__(self, session, basepath, acl=None, cb_func=None):
+        self.cb_func = cb_func
+        session.monitors.setdefault(basepath, []).append(self)
+        session.notify(basepath)
+
+
+class FakeEvZookeeper(object):
+    ZOO_OPEN_ACL_UNSAFE = {}
+    ZKSession = FakeZKSession
+
+
+class FakeMembershipModule(object):
+    Membership = FakeMembership
+    MembershipMonitor = FakeMembershipMonitor
+
+
+class FakeZookeeper(object):
+    class NodeExistsException(Exception):
+        pass
+
+
+class ZKMembershipCacheTestCase(test.TestCase):
+
+    def setUp(self):
+        super(ZKMembershipCacheTestCase, self).setUp()
+        from nova.servicegroup.drivers import zk
+        self.stubs.Set(zk, 'evzookeeper', FakeEvZookeeper)
+        self.stubs.Set(zk, 'membership', FakeMembershipModule)
+        self.stubs.Set(zk, 'zookeeper', FakeZookeeper)
+        self.driver = zk.ZooKeeperDriver()
+        self.session = self.driver._session
+        self.path = '/servicegroups/unittest'
+        self.service = {'id': 1, 'topic': 'unittest', 'host': 'serviceA'}
+
+    def test_join_leave(self):
+        self.driver.join('serviceA', 'unittest')
+        self.assertTrue(self.driver.is_up(self.service))
+        self.driver.leave('serviceA', 'unittest')
+        self.assertFalse(self.driver.is_up(self.service))
+
+    def test_watch_updates_cache(self):
+        self.assertEqual([], self.driver.get_all('unittest'))
+        self.session.children[self.path] = set(['serviceA', 'serviceB'])
+        # Nothing changes locally until the watch fires.
+        self.assertEqual([], self.driver.get_all('unittest'))
+        self.session.notify(self.path)
+        self.assertEqual(['serviceA', 'serviceB'],
+                         sorted(self.driver.get_all('unittest')))
+        self.assertEqual(1, len(self.session.monitors[self.path]))
+
+    def test_are_up(self):
+        self.driver.join('serviceA', 'unittest')
+        services = [self.service,
+                    {'id': 2, 'topic': 'unittest', 'host': 'serviceB'}]
+        self.assertEqual({1: True, 2: False}, self.driver.are_up(services))
+
+    def test_disconnected(self):
+        self.driver.join('serviceA', 'unittest')
+        self.assertTrue(self.driver.is_up(self.service))
+        self.session.connected = False
+        self.session.notify(self.path)
+        self.assertRaises(exception.ServiceGroupUnavailable,
+                          self.driver.is_up, self.service)
@@ -22,7 +22,12 @@ from oslo.config import cfg
 
 from nova import baserpc
 from nova import context
+from nova.openstack.common import rpc
+from nova.openstack.common.rpc import common as rpc_common
+from nova.openstack.common.rpc import dispatcher as rpc_dispatcher
+from nova import rpcstats
 from nova import test
+from nova.tests import test_rpcstats
 
 CONF = cfg.CONF
 
@@ -48,3 +53,179 @@ class BaseAPITestCase(test.TestCase):
         res = self.base_rpcapi.get_backdoor_port(self.context,
                 self.compute.host)
         self.assertEqual(res, self.compute.backdoor_port)
+
+
+class RpcProxyTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(RpcProxyTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        self.proxy = baserpc.RpcProxy('fake_topic', '1.0')
+        self.topics = []
+        self.msgs = []
+
+        def fake_send(context, topic, msg, *args, **kwargs):
+            self.topics.append(topic)
+            self.msgs.append(msg)
+
+        self.stubs.Set(rpc, 'call', fake_send)
+        self.stubs.Set(rpc, 'multicall', fake_send)
+        self.stubs.Set(rpc, 'cast', fake_send)
+        self.stubs.Set(rpc, 'fanout_cast', fake_send)
+
+        def fake_send_to_server(context, server_params, topic, msg):
+            fake_send(context, topic, msg)
+
+        self.stubs.Set(rpc, 'cast_to_server', fake_send_to_server)
+        self.stubs.Set(rpc, 'fanout_cast_to_server', fake_send_to_server)
+
+    def test_get_priority_topic(self):
+        self.assertEqual('priority.compute.host',
+                         baserpc.get_priority_topic('compute.host'))
+
+    def test_priority_methods_sent_to_priority_topic(self):
+        self.flags(rpc_priority_methods=['service_update'])
+        msg = self.proxy.make_msg('service_update')
+        self.proxy.call(self.context, msg)
+        self.proxy.multicall(self.context, msg)
+        self.proxy.cast(self.context, msg, topic='fake_topic.host')
+        self.assertEqual(['priority.fake_topic', 'priority.fake_topic',
+                          'priority.fake_topic.host'], self.topics)
+
+    def test_service_heartbeat_is_a_priority_method(self):
+        msg = self.proxy.make_msg('service_heartbeat')
+        self.proxy.call(self.context, msg)
+        self.assertEqual(['priority.fake_topic'], self.topics)
+
+    def test_priority_methods_sent_to_topic_with_version_cap(self):
+        self.flags(rpc_priority_methods=['service_update'])
+        proxy = baserpc.RpcProxy('fake_topic', '1.0', version_cap='1.0')
+        proxy.call(self.context, proxy.make_msg('service_update'))
+        self.assertEqual(['fake_topic'], self.topics)
+
+    def test_other_methods_sent_to_topic(self):
+        self.flags(rpc_priority_methods=['service_update'])
+        msg = self.proxy.make_msg('run_instance')
+        self.proxy.call(self.context, msg)
+        self.proxy.multicall(self.context, msg)
+        self.proxy.cast(self.context, msg, topic='fake_topic.host')
+        self.assertEqual(['fake_topic', 'fake_topic', 'fake_topic.host'],
+                         self.topics)
+
+    def _use_fake_sink(self):
+        rpcstats.reset()
+        self.addCleanup(rpcstats.reset)
+        self.flags(rpc_stats_sink='nova.tests.test_rpcstats.FakeSink')
+        return rpcstats.get_sink()
+
+    def test_messages_not_stamped_without_sink(self):
+        rpcstats.reset()
+        self.addCleanup(rpcstats.reset)
+        msg = self.proxy.make_msg('foo', bar=1)
+        self.proxy.call(self.context, msg)
+        self.proxy.cast(self.context, msg)
+        for sent in self.msgs:
+            self.assertEqual({'bar': 1}, sent['args'])
+
+    def test_messages_stamped_with_sink(self):
+        self._use_fake_sink()
+        self.proxy.call(self.context, self.proxy.make_msg('foo', bar=1))
+        self.proxy.multicall(self.context, self.proxy.make_msg('foo'))
+        self.proxy.cast(self.context, self.proxy.make_msg('foo'))
+        self.proxy.fanout_cast(self.context, self.proxy.make_msg('foo'))
+        self.proxy.cast_to_server(self.context, {},
+                                  self.proxy.make_msg('foo'))
+        self.proxy.fanout_cast_to_server(self.context, {},
+                                         self.proxy.make_msg('foo'))
+        self.assertEqual(1, self.msgs[0]['args']['bar'])
+        for sent in self.msgs:
+            self.assertTrue(sent['args'][rpcstats.SENT_AT])
+
+    def test_call_reply_time(self):
+        sink = self._use_fake_sink()
+        self.proxy.call(self.context, self.proxy.make_msg('foo'))
+        self.assertEqual(['fake_topic.foo.reply'],
+                         [name for name, msecs in sink.timings])
+
+    def test_call_timeout_counted(self):
+        sink = self._use_fake_sink()
+
+        def fake_call(*args, **kwargs):
+            raise rpc_common.Timeout()
+
+        self.stubs.Set(rpc, 'call', fake_call)
+        self.assertRaises(rpc_common.Timeout, self.proxy.call, self.context,
+                          self.proxy.make_msg('foo'))
+        self.assertEqual([('fake_topic.foo.timeout', 1)], sink.counts)
+        self.assertEqual([], sink.timings)
+
+
+class RpcDispatcherTestCase(test.NoDBTestCase):
+
+    def test_parse_method_limits(self):
+        self.flags(rpc_method_concurrency=['run_instance:2',
+                                           ' snapshot_instance : 1'])
+        self.assertEqual({'run_instance': 2, 'snapshot_instance': 1},
+                         baserpc.parse_method_limits())
+
+    def test_parse_method_limits_ignores_invalid_entries(self):
+        self.flags(rpc_method_concurrency=['run_instance', 'foo:bar',
+                                           ':3', 'bar:0', 'baz:4'])
+        self.assertEqual({'baz': 4}, baserpc.parse_method_limits())
+
+    def test_method_limit(self):
+        self.flags(rpc_method_concurrency=['foo:1'])
+        dispatcher = baserpc.RpcDispatcher([])
+        sem = dispatcher.semaphores['foo']
+        running = []
+
+        def fake_dispatch(self, ctxt, version, method, namespace, **kwargs):
+            running.append(sem.locked())
+            return method
+
+        self.stubs.Set(rpc_dispatcher.RpcDispatcher, 'dispatch',
+                       fake_dispatch)
+
+        self.assertEqual('foo', dispatcher.dispatch(None, '1.0', 'foo', None))
+        self.assertEqual('bar', dispatcher.dispatch(None, '1.0', 'bar', None))
+        self.assertEqual([True, False], running)
+        self.assertFalse(sem.locked())
+        self.assertEqual(['foo'], dispatcher.semaphores.keys())
+
+    def _fake_dispatch(self, results):
+        def fake_dispatch(_self, ctxt, version, method, namespace, **kwargs):
+            results.append(kwargs)
+
+        self.stubs.Set(rpc_dispatcher.RpcDispatcher, 'dispatch',
+                       fake_dispatch)
+
+    def test_sent_at_removed_without_sink(self):
+        rpcstats.reset()
+        self.addCleanup(rpcstats.reset)
+        results = []
+        self._fake_dispatch(results)
+        dispatcher = baserpc.RpcDispatcher([], service_name='compute')
+        kwargs = {'bar': 1, rpcstats.SENT_AT: 100.0}
+
+        dispatcher.dispatch(None, '1.0', 'foo', None, **kwargs)
+
+        self.assertEqual([{'bar': 1}], results)
+
+    def test_stats(self):
+        rpcstats.reset()
+        self.addCleanup(rpcstats.reset)
+        self.flags(rpc_stats_sink='nova.tests.test_rpcstats.FakeSink')
+        sink = rpcstats.get_sink()
+        self.assertTrue(isinstance(sink, test_rpcstats.FakeSink))
+        results = []
+        self._fake_dispatch(results)
+        dispatcher = baserpc.RpcDispatcher([], service_name='compute')
+        kwargs = {'bar': 1, rpcstats.SENT_AT: 100.0}
+
+        dispatcher.dispatch(None, '1.0', 'foo', None, **kwargs)
+
+        self.assertEqual([{'bar': 1}], results)
+        self.assertEqual(['compute.foo.queue', 'compute.foo.handler'],
+                         [name for name, msecs in sink.timings])
+        self.assertEqual([('compute.running', 1)], sink.gauges)
+        self.assertEqual(0, dispatcher.running)
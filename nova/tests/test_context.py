@@ -101,3 +101,29 @@ class ContextTestCase(test.TestCase):
         ctxt = context.RequestContext('111', '222',
                 service_catalog=service_catalog)
         self.assertEquals(ctxt.service_catalog, volume_catalog)
+
+    def test_identity_map(self):
+        identity_map = context.IdentityMap()
+        identity_map.add('instances', 'fake-uuid', 'instance')
+        self.assertEqual('instance',
+                         identity_map.get('instances', 'fake-uuid'))
+        self.assertEqual(None, identity_map.get('flavors', 'fake-uuid'))
+
+        identity_map.discard('instances', 'fake-uuid')
+        identity_map.discard('instances', 'fake-uuid')
+        self.assertEqual(None, identity_map.get('instances', 'fake-uuid'))
+
+    def test_get_identity_map(self):
+        ctxt = context.RequestContext('111', '222')
+        self.assertEqual(None, context.get_identity_map(ctxt))
+
+        ctxt.identity_map = context.IdentityMap()
+        self.assertTrue(context.get_identity_map(ctxt) is
+                        ctxt.identity_map)
+        self.assertEqual(None, ctxt.to_dict().get('identity_map'))
+
+        # Elevated contexts and those reading deleted rows may see more
+        # than the request itself
+        self.assertEqual(None, context.get_identity_map(ctxt.elevated()))
+        ctxt.read_deleted = 'yes'
+        self.assertEqual(None, context.get_identity_map(ctxt))
@@ -201,6 +201,72 @@ class InstanceTypeTestCase(test.TestCase):
                 "test1", read_deleted="no")
         self.assertEqual("instance_type1_redo", instance_type["name"])
 
+    def test_get_flavor_uses_identity_map(self):
+        ctxt = context.get_admin_context()
+        ctxt.identity_map = context.IdentityMap()
+        default_instance_type = flavors.get_default_flavor()
+
+        fetched = flavors.get_flavor(default_instance_type['id'], ctxt=ctxt)
+        by_flavorid = flavors.get_flavor_by_flavor_id(
+            default_instance_type['flavorid'], ctxt=ctxt)
+
+        self.mox.StubOutWithMock(db, 'instance_type_get')
+        self.mox.StubOutWithMock(db, 'instance_type_get_by_flavor_id')
+        self.mox.ReplayAll()
+        self.assertTrue(fetched is flavors.get_flavor(
+            default_instance_type['id'], ctxt=ctxt))
+        self.assertTrue(by_flavorid is flavors.get_flavor_by_flavor_id(
+            default_instance_type['flavorid'], ctxt=ctxt))
+
+    def _enable_cache(self):
+        self.flags(flavor_cache_time=60)
+        self.stubs.Set(flavors, '_FLAVOR_CACHE', None)
+
+    def test_flavor_cache(self):
+        self._enable_cache()
+        default_instance_type = flavors.get_default_flavor()
+        ctxt = context.get_admin_context()
+
+        fetched = flavors.get_flavor(default_instance_type['id'], ctxt=ctxt)
+        fetched['extra_specs']['changed'] = 'by caller'
+
+        self.mox.StubOutWithMock(db, 'instance_type_get')
+        self.mox.ReplayAll()
+        cached = flavors.get_flavor(default_instance_type['id'], ctxt=ctxt)
+        self.assertEqual(default_instance_type, cached)
+        self.assertEqual({'size': 1, 'hits': 1, 'misses': 1, 'evictions': 0},
+                         flavors.get_cache_stats())
+
+    def test_flavor_cache_per_project(self):
+        self._enable_cache()
+        flavorid = flavors.get_default_flavor()['flavorid']
+
+        for project_id in ('project1', 'project2', 'project1'):
+            ctxt = context.RequestContext('user', project_id)
+            flavors.get_flavor_by_flavor_id(flavorid, ctxt=ctxt)
+        stats = flavors.get_cache_stats()
+        self.assertEqual(2, stats['misses'])
+        self.assertEqual(1, stats['hits'])
+
+    def test_flavor_cache_invalidated(self):
+        self._enable_cache()
+        flavors.create('cached', 256, 1, 120, 100, 'cached1')
+
+        ctxt = context.get_admin_context()
+        flavors.get_flavor_by_flavor_id('cached1', ctxt=ctxt)
+        flavors.add_flavor_access('cached1', 'project1', ctxt)
+        self.assertEqual(0, flavors.get_cache_stats()['size'])
+
+        flavors.get_flavor_by_flavor_id('cached1', ctxt=ctxt)
+        flavors.destroy('cached')
+        self.assertEqual(0, flavors.get_cache_stats()['size'])
+        self.assertRaises(exception.FlavorNotFound,
+                          flavors.get_flavor_by_flavor_id, 'cached1',
+                          ctxt=ctxt, read_deleted='no')
+
+    def test_flavor_cache_disabled(self):
+        self.assertEqual(None, flavors.get_cache_stats())
+
 
 class InstanceTypeToolsTest(test.TestCase):
     def _dict_to_metadata(self, data):
@@ -18,6 +18,8 @@
 """Unit Tests for network code."""
 
 from nova.network import linux_net
+from nova.openstack.common import processutils
+from nova.openstack.common import timeutils
 from nova import test
 
 
@@ -253,3 +255,108 @@ class IptablesManagerTestCase(test.TestCase):
                                                self.manager.ipv4['filter'],
                                                'filter')
         self.assertEqual(current_lines, new_lines)
+
+
+class IptablesIncrementalApplyTestCase(test.TestCase):
+
+    binary_name = linux_net.get_binary_name()
+
+    def setUp(self):
+        super(IptablesIncrementalApplyTestCase, self).setUp()
+        self.flags(iptables_incremental_apply=True, use_ipv6=False)
+        self.calls = []
+        self.fail_noflush = False
+        self.manager = linux_net.IptablesManager(execute=self._execute)
+        self.table = self.manager.ipv4['filter']
+        self.table.add_chain('inst-1')
+        self.table.add_rule('inst-1', '-s 10.0.0.1 -j ACCEPT')
+        self.manager.apply()
+        self.calls = []
+
+    def _execute(self, *cmd, **kwargs):
+        self.calls.append((cmd, kwargs.get('process_input')))
+        if cmd == ('iptables-save', '-c'):
+            return '\n'.join(IptablesManagerTestCase.sample_filter), ''
+        if '--noflush' in cmd and self.fail_noflush:
+            raise processutils.ProcessExecutionError()
+        return '', ''
+
+    def test_first_apply_restores_whole_tables(self):
+        manager = linux_net.IptablesManager(execute=self._execute)
+        manager.apply()
+        self.assertEqual([cmd for cmd, _input in self.calls],
+                         [('iptables-save', '-c'),
+                          ('iptables-restore', '-c')])
+
+    def test_nothing_changed(self):
+        self.manager.apply()
+        self.assertEqual(self.calls, [])
+
+    def test_changed_chain_rewritten(self):
+        self.table.add_rule('inst-1', '-s 10.0.0.2 -j ACCEPT')
+        self.manager.apply()
+        self.assertEqual(self.calls, [
+            (('iptables-restore', '--noflush'),
+             '*filter\n'
+             ':%(bn)s-inst-1 - [0:0]\n'
+             '-A %(bn)s-inst-1 -s 10.0.0.1 -j ACCEPT\n'
+             '-A %(bn)s-inst-1 -s 10.0.0.2 -j ACCEPT\n'
+             'COMMIT\n' % {'bn': self.binary_name})])
+
+    def test_removed_chain_deleted(self):
+        self.table.add_rule('local', '-d 10.0.0.3 -j $inst-1')
+        self.manager.apply()
+        self.calls = []
+
+        self.table.remove_chain('inst-1')
+        self.manager.apply()
+        self.assertEqual(self.calls, [
+            (('iptables-restore', '--noflush'),
+             '*filter\n'
+             ':%(bn)s-local - [0:0]\n'
+             ':%(bn)s-inst-1 - [0:0]\n'
+             '-X %(bn)s-inst-1\n'
+             'COMMIT\n' % {'bn': self.binary_name})])
+
+    def test_shared_chain_change_restores_whole_tables(self):
+        self.table.add_rule('nova-filter-top', '-j ACCEPT', wrap=False)
+        self.manager.apply()
+        self.assertEqual([cmd for cmd, _input in self.calls],
+                         [('iptables-save', '-c'),
+                          ('iptables-restore', '-c')])
+
+    def test_failure_restores_whole_tables(self):
+        self.fail_noflush = True
+        self.table.add_rule('inst-1', '-s 10.0.0.2 -j ACCEPT')
+        self.manager.apply()
+        self.assertEqual([cmd for cmd, _input in self.calls],
+                         [('iptables-restore', '--noflush'),
+                          ('iptables-save', '-c'),
+                          ('iptables-restore', '-c')])
+
+    def test_whole_tables_restored_after_interval(self):
+        timeutils.set_time_override(timeutils.utcnow())
+        self.addCleanup(timeutils.clear_time_override)
+        self.table.add_rule('inst-1', '-s 10.0.0.2 -j ACCEPT')
+        self.manager.apply()
+        self.calls = []
+
+        timeutils.advance_time_seconds(601)
+        self.manager.apply()
+        self.assertEqual([cmd for cmd, _input in self.calls],
+                         [('iptables-save', '-c'),
+                          ('iptables-restore', '-c')])
+
+        self.calls = []
+        self.table.add_rule('inst-1', '-s 10.0.0.3 -j ACCEPT')
+        self.manager.apply()
+        self.assertEqual([cmd for cmd, _input in self.calls],
+                         [('iptables-restore', '--noflush')])
+
+    def test_disabled(self):
+        self.flags(iptables_incremental_apply=False)
+        self.table.add_rule('inst-1', '-s 10.0.0.2 -j ACCEPT')
+        self.manager.apply()
+        self.assertEqual([cmd for cmd, _input in self.calls],
+                         [('iptables-save', '-c'),
+                          ('iptables-restore', '-c')])
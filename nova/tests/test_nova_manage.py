@@ -18,6 +18,7 @@
 import fixtures
 import StringIO
 import sys
+import time
 
 from nova.cmd import manage
 from nova import context
@@ -402,3 +403,43 @@ class ServiceCommandsTestCase(test.TestCase):
 
     def test_service_disable_invalid_params(self):
         self.assertEqual(2, self.commands.disable('nohost', 'noservice'))
+
+
+class ImageCacheCommandsTestCase(test.TestCase):
+    def setUp(self):
+        super(ImageCacheCommandsTestCase, self).setUp()
+        self.commands = manage.ImageCacheCommands()
+        self.useFixture(fixtures.MonkeyPatch('sys.stdout',
+                                             StringIO.StringIO()))
+
+    def test_report(self):
+        now = time.time()
+        index = {'host': 'compute1',
+                 'base_dir': '/instances/_base',
+                 'updated_at': now,
+                 'images': {'a' * 40: {'state': 'active',
+                                       'size': 20 * 1024 * 1024,
+                                       'last_used': now,
+                                       'checksum': 'ok',
+                                       'instances': ['inst-1', 'inst-2']},
+                            'swap_512': {'state': 'unused',
+                                         'size': 512 * 1024 * 1024,
+                                         'last_used': now - 7200,
+                                         'checksum': None,
+                                         'instances': []}}}
+        self.stubs.Set(manage.imagecache, 'read_index',
+                       lambda host: host == 'compute1' and index or {})
+
+        self.assertEqual(None, self.commands.report('compute1'))
+        lines = sys.stdout.getvalue().splitlines()
+        self.assertEqual(lines[2].split(),
+                         ['a' * 40, 'active', '20', '0', 'ok',
+                          'inst-1,inst-2'])
+        self.assertEqual(lines[3].split(),
+                         ['swap_512', 'unused', '512', '2', '-', '-'])
+        self.assertEqual(lines[4], 'active: 1 images, 20 MB')
+        self.assertEqual(lines[5], 'unused: 1 images, 512 MB')
+
+    def test_report_no_index(self):
+        self.stubs.Set(manage.imagecache, 'read_index', lambda host: {})
+        self.assertEqual(1, self.commands.report('compute2'))
@@ -147,6 +147,98 @@ class PolicyTestCase(test.TestCase):
         policy.enforce(admin_context, uppercase_action, self.target)
 
 
+class CompiledPolicyTestCase(test.TestCase):
+    def setUp(self):
+        super(CompiledPolicyTestCase, self).setUp()
+        self.rules = {
+            "admin": "role:admin or is_admin:True",
+            "owner": "project_id:%(project_id)s",
+            "admin_or_owner": "rule:admin or rule:owner",
+            "example:owner_not_admin": "rule:owner and not rule:admin",
+            "example:user": "user_id:%(user_id)s and role:member",
+            "example:missing": "rule:nonexistent",
+            "example:http": "http://www.example.com/%(project_id)s",
+            "example:literal": "project_id:fake",
+        }
+        self.policy.set_rules(self.rules)
+        self.context = context.RequestContext('fake', 'fake', roles=['member'])
+        self.to_dict_calls = 0
+        to_dict = self.context.to_dict
+
+        def counting_to_dict():
+            self.to_dict_calls += 1
+            return to_dict()
+        self.stubs.Set(self.context, 'to_dict', counting_to_dict)
+
+    def test_compiled_rules_match_check_tree(self):
+        contexts = [
+            self.context,
+            context.RequestContext('fake', 'other', roles=['member']),
+            context.RequestContext('other', 'fake', roles=['Member']),
+            context.RequestContext('admin', 'admin', roles=['ADMIN']),
+            context.RequestContext('admin', 'fake', is_admin=True),
+        ]
+        targets = [{}, {'project_id': 'fake'}, {'project_id': 'other'},
+                   {'project_id': 'fake', 'user_id': 'fake'}]
+        for action in self.rules:
+            if action == 'example:http':
+                continue
+            for ctxt in contexts:
+                for target in targets:
+                    expected = common_policy.check(action, target,
+                                                   ctxt.to_dict())
+                    self.assertEqual(expected,
+                                     policy.enforce(ctxt, action, target,
+                                                    do_raise=False),
+                                     '%s %s %s' % (action, ctxt.to_dict(),
+                                                   target))
+
+    def test_decisions_memoized(self):
+        target = {'project_id': 'fake', 'name': 'a'}
+        policy.enforce(self.context, 'example:owner_not_admin', target)
+        self.assertEqual(1, self.to_dict_calls)
+        # Target items the rule doesn't look at don't matter
+        target = {'project_id': 'fake', 'name': 'b'}
+        policy.enforce(self.context, 'example:owner_not_admin', target)
+        self.assertEqual(1, self.to_dict_calls)
+
+        self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                          self.context, 'example:owner_not_admin',
+                          {'project_id': 'other'})
+        self.assertEqual(2, self.to_dict_calls)
+
+    def test_decisions_follow_credentials(self):
+        target = {'project_id': 'fake'}
+        policy.enforce(self.context, 'example:owner_not_admin', target)
+        self.context.roles = ['member', 'admin']
+        self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                          self.context, 'example:owner_not_admin', target)
+
+    def test_decisions_follow_rules(self):
+        target = {'project_id': 'fake'}
+        policy.enforce(self.context, 'example:owner_not_admin', target)
+        self.policy.set_rules({'example:owner_not_admin': '!'})
+        self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                          self.context, 'example:owner_not_admin', target)
+
+    def test_http_check_not_memoized(self):
+        urls = []
+
+        def fakeurlopen(url, post_data):
+            urls.append(url)
+            return StringIO.StringIO("True")
+        self.stubs.Set(urllib2, 'urlopen', fakeurlopen)
+
+        for i in range(2):
+            policy.enforce(self.context, 'example:http',
+                           {'project_id': 'fake'})
+        self.assertEqual(['http://www.example.com/fake'] * 2, urls)
+
+    def test_missing_target_key_fails_closed(self):
+        self.assertEqual(False, policy.enforce(self.context, 'example:user',
+                                               {}, do_raise=False))
+
+
 class DefaultPolicyTestCase(test.TestCase):
 
     def setUp(self):
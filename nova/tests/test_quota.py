@@ -307,6 +307,9 @@ class FakeDriver(object):
     def expire(self, context):
         self.called.append(('expire', context))
 
+    def reconcile(self, context, resources):
+        self.called.append(('reconcile', context, resources))
+
 
 class BaseResourceTestCase(test.TestCase):
     def test_no_flag(self):
@@ -703,6 +706,16 @@ class QuotaEngineTestCase(test.TestCase):
                 ('expire', context),
                 ])
 
+    def test_reconcile(self):
+        context = FakeContext(None, None)
+        driver = FakeDriver()
+        quota_obj = self._make_quota_obj(driver)
+        quota_obj.reconcile(context)
+
+        self.assertEqual(driver.called, [
+                ('reconcile', context, quota_obj._resources),
+                ])
+
     def test_resources(self):
         quota_obj = self._make_quota_obj(None)
 
@@ -1233,6 +1246,48 @@ class DbQuotaDriverTestCase(test.TestCase):
                 security_group_rules=20,
                 ))
 
+    def test_get_quotas_cached(self):
+        self.flags(quota_cache_time=60)
+        self._stub_get_project_quotas()
+        context = FakeContext('test_project', 'test_class')
+        result = self.driver._get_quotas(context, quota.QUOTAS._resources,
+                                         ['instances', 'cores'], True)
+        result['instances'] = 42
+        self.assertEqual(self.driver._get_quotas(context,
+                                                 quota.QUOTAS._resources,
+                                                 ['instances', 'cores'],
+                                                 True),
+                         dict(instances=10, cores=20))
+        self.assertEqual(self.calls, ['get_project_quotas'])
+
+        # A different project, class or set of resources is a miss
+        self.driver._get_quotas(context, quota.QUOTAS._resources,
+                                ['instances', 'cores'], True,
+                                project_id='other_project')
+        self.driver._get_quotas(FakeContext('test_project', 'other_class'),
+                                quota.QUOTAS._resources,
+                                ['instances', 'cores'], True)
+        self.driver._get_quotas(context, quota.QUOTAS._resources,
+                                ['instances'], True)
+        self.assertEqual(len(self.calls), 4)
+
+    def test_get_quotas_cache_expires(self):
+        self.flags(quota_cache_time=60)
+        self._stub_get_project_quotas()
+        context = FakeContext('test_project', 'test_class')
+        self.driver._get_quotas(context, quota.QUOTAS._resources,
+                                ['instances'], True)
+        timeutils.advance_time_seconds(59)
+        self.driver._get_quotas(context, quota.QUOTAS._resources,
+                                ['instances'], True)
+        self.assertEqual(self.calls, ['get_project_quotas'])
+
+        timeutils.advance_time_seconds(1)
+        self.driver._get_quotas(context, quota.QUOTAS._resources,
+                                ['instances'], True)
+        self.assertEqual(self.calls, ['get_project_quotas'] * 2)
+        self.assertEqual(len(self.driver._limits_cache), 1)
+
     def test_limit_check_under(self):
         self._stub_get_project_quotas()
         self.assertRaises(exception.InvalidQuotaValue,
@@ -1367,6 +1422,63 @@ class DbQuotaDriverTestCase(test.TestCase):
                 ])
         self.assertEqual(result, ['resv-1', 'resv-2', 'resv-3'])
 
+    def test_reserve_conditional(self):
+        self._stub_get_project_quotas()
+        self._stub_quota_reserve()
+
+        def fake_quota_reserve_conditional(context, resources, quotas,
+                                           deltas, expire, until_refresh,
+                                           max_age, project_id=None):
+            self.calls.append(('quota_reserve_conditional', expire,
+                               until_refresh, max_age))
+            return ['resv-1']
+        self.stubs.Set(db, 'quota_reserve_conditional',
+                       fake_quota_reserve_conditional)
+        self.flags(quota_conditional_reserve=True)
+        expire = timeutils.utcnow() + datetime.timedelta(seconds=120)
+        result = self.driver.reserve(FakeContext('test_project', 'test_class'),
+                                     quota.QUOTAS._resources,
+                                     dict(instances=2), expire=expire)
+
+        self.assertEqual(self.calls, [
+                'get_project_quotas',
+                ('quota_reserve_conditional', expire, 0, 0),
+                ])
+        self.assertEqual(result, ['resv-1'])
+
+    def _stub_quota_usage_refresh(self):
+        def fake_quota_usage_get_stale_projects(context, max_age=0):
+            self.calls.append(('quota_usage_get_stale_projects', max_age))
+            return ['project1', 'project2']
+
+        def fake_quota_usage_refresh(context, resources, project_id,
+                                     until_refresh=None):
+            self.calls.append(('quota_usage_refresh', project_id))
+            if project_id == 'project1':
+                raise exception.QuotaUsageNotFound(project_id=project_id)
+
+        self.stubs.Set(db, 'quota_usage_get_stale_projects',
+                       fake_quota_usage_get_stale_projects)
+        self.stubs.Set(db, 'quota_usage_refresh', fake_quota_usage_refresh)
+
+    def test_reconcile(self):
+        self._stub_quota_usage_refresh()
+        self.flags(quota_conditional_reserve=True, max_age=3600)
+        self.driver.reconcile(FakeContext(None, None),
+                              quota.QUOTAS._resources)
+
+        self.assertEqual(self.calls, [
+                ('quota_usage_get_stale_projects', 3600),
+                ('quota_usage_refresh', 'project1'),
+                ('quota_usage_refresh', 'project2'),
+                ])
+
+    def test_reconcile_inline_refresh(self):
+        self._stub_quota_usage_refresh()
+        self.driver.reconcile(FakeContext(None, None),
+                              quota.QUOTAS._resources)
+        self.assertEqual(self.calls, [])
+
     def test_usage_reset(self):
         calls = []
 
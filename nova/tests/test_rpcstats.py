@@ -0,0 +1,150 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the RPC latency instrumentation."""
+
+import socket
+import time
+
+from nova import rpcstats
+from nova import test
+
+
+class FakeSink(rpcstats.StatsSink):
+    def __init__(self):
+        self.timings = []
+        self.gauges = []
+        self.counts = []
+
+    def timing(self, name, msecs):
+        self.timings.append((name, msecs))
+
+    def gauge(self, name, value):
+        self.gauges.append((name, value))
+
+    def incr(self, name, count=1):
+        self.counts.append((name, count))
+
+
+class FakeSocket(object):
+    def __init__(self, fail=False):
+        self.sent = []
+        self.fail = fail
+
+    def sendto(self, data, addr):
+        if self.fail:
+            raise socket.error('connection refused')
+        self.sent.append((data, addr))
+
+
+class RpcStatsTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(RpcStatsTestCase, self).setUp()
+        rpcstats.reset()
+        self.addCleanup(rpcstats.reset)
+
+    def _use_fake_sink(self):
+        self.flags(rpc_stats_sink='nova.tests.test_rpcstats.FakeSink')
+        return rpcstats.get_sink()
+
+    def test_no_sink_by_default(self):
+        self.assertEqual(None, rpcstats.get_sink())
+
+    def test_get_sink(self):
+        sink = self._use_fake_sink()
+        self.assertTrue(isinstance(sink, FakeSink))
+        self.assertEqual(sink, rpcstats.get_sink())
+
+    def test_get_sink_falls_back_to_discarding(self):
+        self.flags(rpc_stats_sink='nova.tests.test_rpcstats.NoSuchSink')
+        sink = rpcstats.get_sink()
+        self.assertEqual(rpcstats.StatsSink, type(sink))
+
+    def test_stamp_message_without_sink(self):
+        msg = {'method': 'foo', 'args': {'bar': 1}}
+        self.assertEqual(msg, rpcstats.stamp_message(msg))
+        self.assertEqual({'bar': 1}, msg['args'])
+
+    def test_stamp_message(self):
+        self._use_fake_sink()
+        msg = {'method': 'foo', 'args': {'bar': 1}}
+        self.stubs.Set(time, 'time', lambda: 100.0)
+
+        stamped = rpcstats.stamp_message(msg)
+
+        self.assertEqual({'bar': 1, rpcstats.SENT_AT: 100.0},
+                         stamped['args'])
+        self.assertEqual({'bar': 1}, msg['args'])
+
+    def test_record_queue_time(self):
+        sink = self._use_fake_sink()
+        self.stubs.Set(time, 'time', lambda: 100.25)
+
+        rpcstats.record_queue_time('compute', 'run_instance', 100.0)
+        rpcstats.record_queue_time('compute', 'run_instance', 101.0)
+
+        self.assertEqual([('compute.run_instance.queue', 250.0),
+                          ('compute.run_instance.queue', 0)], sink.timings)
+
+    def test_record_queue_time_ignores_bad_stamps(self):
+        sink = self._use_fake_sink()
+
+        rpcstats.record_queue_time('compute', 'run_instance', None)
+        rpcstats.record_queue_time('compute', 'run_instance', 'foo')
+
+        self.assertEqual([], sink.timings)
+
+    def test_timed(self):
+        sink = self._use_fake_sink()
+        now = [100.0]
+        self.stubs.Set(time, 'time', lambda: now[0])
+
+        with rpcstats.timed(None, 'foo', 'handler'):
+            now[0] += 0.5
+
+        self.assertEqual([('unknown.foo.handler', 500.0)], sink.timings)
+
+    def test_statsd_sink(self):
+        self.flags(rpc_statsd_host='statsd', rpc_statsd_port=1234,
+                   rpc_statsd_prefix='nova')
+        sink = rpcstats.StatsdSink()
+        sink.sock = FakeSocket()
+
+        sink.timing('compute.run instance.queue', 1.5)
+        sink.gauge('compute.running', 3)
+        sink.incr('compute.foo.timeout')
+
+        addr = ('statsd', 1234)
+        self.assertEqual([('nova.compute.run_instance.queue:1.500|ms', addr),
+                          ('nova.compute.running:3|g', addr),
+                          ('nova.compute.foo.timeout:1|c', addr)],
+                         sink.sock.sent)
+
+    def test_statsd_sink_without_prefix(self):
+        self.flags(rpc_statsd_prefix='')
+        sink = rpcstats.StatsdSink()
+        sink.sock = FakeSocket()
+
+        sink.incr('foo')
+
+        self.assertEqual('foo:1|c', sink.sock.sent[0][0])
+
+    def test_statsd_sink_ignores_socket_errors(self):
+        sink = rpcstats.StatsdSink()
+        sink.sock = FakeSocket(fail=True)
+
+        sink.timing('foo', 1)
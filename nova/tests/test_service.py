@@ -173,6 +173,37 @@ class ServiceTestCase(test.TestCase):
                                'nova.tests.test_service.FakeManager')
         serv.start()
 
+    def test_priority_topics_consumed_on_own_connection(self):
+        self._service_start_mocks()
+        self.mox.ReplayAll()
+
+        serv = service.Service(self.host,
+                               self.binary,
+                               self.topic,
+                               'nova.tests.test_service.FakeManager')
+        serv.start()
+        self.addCleanup(serv.stop)
+
+        self.assertNotEqual(serv.conn, serv.priority_conn)
+        self.assertEqual(['priority.fake', 'priority.fake.foo'],
+                         [c.topic for c in serv.priority_conn.consumers])
+        self.assertEqual([], [c.topic for c in serv.conn.consumers
+                              if c.topic.startswith('priority.')])
+
+    def test_no_priority_connection_without_priority_methods(self):
+        self.flags(rpc_priority_methods=[])
+        self._service_start_mocks()
+        self.mox.ReplayAll()
+
+        serv = service.Service(self.host,
+                               self.binary,
+                               self.topic,
+                               'nova.tests.test_service.FakeManager')
+        serv.start()
+        self.addCleanup(serv.stop)
+
+        self.assertFalse(hasattr(serv, 'priority_conn'))
+
 
 class TestWSGIService(test.TestCase):
 
@@ -806,6 +806,70 @@ class IntLikeTestCase(test.TestCase):
         self.assertFalse(utils.is_int_like("a1"))
 
 
+class ExpiringLRUCacheTestCase(test.TestCase):
+    def setUp(self):
+        super(ExpiringLRUCacheTestCase, self).setUp()
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+
+    def test_get_set(self):
+        cache = utils.ExpiringLRUCache(10, 60)
+        self.assertEqual(None, cache.get('a'))
+        cache.set('a', 1)
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual({'size': 1, 'hits': 1, 'misses': 1, 'evictions': 0},
+                         cache.stats())
+
+    def test_least_recently_used_evicted(self):
+        cache = utils.ExpiringLRUCache(2, 60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(2, len(cache))
+        self.assertEqual(None, cache.get('b'))
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(3, cache.get('c'))
+        self.assertEqual(1, cache.stats()['evictions'])
+
+    def test_evictions_logged(self):
+        logged = []
+        self.stubs.Set(utils.LOG, 'debug',
+                       lambda msg, args: logged.append(args))
+        cache = utils.ExpiringLRUCache(1, 60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual([], logged)
+
+        cache = utils.ExpiringLRUCache(1, 60, name='Test')
+        cache.set('a', 1)
+        cache.set('b', 2)
+
+        self.assertEqual([{'name': 'Test',
+                           'stats': {'size': 1, 'hits': 0, 'misses': 0,
+                                     'evictions': 1}}], logged)
+
+    def test_expired(self):
+        cache = utils.ExpiringLRUCache(10, 60)
+        cache.set('a', 1)
+        timeutils.advance_time_seconds(59)
+        self.assertEqual(1, cache.get('a'))
+        timeutils.advance_time_seconds(1)
+        self.assertEqual(None, cache.get('a'))
+        self.assertEqual(0, len(cache))
+
+    def test_discard_and_clear(self):
+        cache = utils.ExpiringLRUCache(10, 60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.discard('a')
+        cache.discard('a')
+        self.assertEqual(None, cache.get('a'))
+        cache.clear()
+        self.assertEqual(None, cache.get('b'))
+
+
 class MetadataToDictTestCase(test.TestCase):
     def test_metadata_to_dict(self):
         self.assertEqual(utils.metadata_to_dict(
@@ -98,7 +98,7 @@ def create_cow_image(backing_file, path):
     pass
 
 
-def get_disk_backing_file(path):
+def get_disk_backing_file(path, basename=True, cached=False):
     return disk_backing_files.get(path, None)
 
 
@@ -136,6 +136,9 @@ class ImageCacheManagerTestCase(test.TestCase):
         for ent in image_cache_manager.unexplained_images:
             self.assertTrue(ent.startswith(base_dir))
 
+        self.assertEqual(image_cache_manager.disk_templates,
+                         [os.path.join(base_dir, 'ephemeral_0_20_None')])
+
         self.assertEquals(len(image_cache_manager.originals), 2)
 
         expected = os.path.join(base_dir,
@@ -784,6 +787,11 @@ class ImageCacheManagerTestCase(test.TestCase):
             if path == '/instance_path/_base':
                 return base_file_list
 
+            if path in ['/instance_path/instance-1',
+                        '/instance_path/instance-2',
+                        '/instance_path/instance-3']:
+                return ['disk', 'console.log']
+
             self.fail('Unexpected directory listed: %s' % path)
 
         self.stubs.Set(os, 'listdir', lambda x: listdir(x))
@@ -871,12 +879,122 @@ class ImageCacheManagerTestCase(test.TestCase):
         for rem in [fq_path('e97222e91fc4241f49a7f520d1dcf446751129b3_sm'),
                     fq_path('e09c675c2d1cfac32dae3c2d83689c8c94bc693b_sm'),
                     fq_path(hashed_42),
-                    fq_path('%s_10737418240' % hashed_1)]:
+                    fq_path('%s_10737418240' % hashed_1),
+                    fq_path('ephemeral_0_20_None')]:
             self.assertTrue(rem in image_cache_manager.removable_base_files)
 
         # Ensure there are no "corrupt" images as well
         self.assertTrue(len(image_cache_manager.corrupt_base_files), 0)
 
+    def test_verify_base_images_disk_templates(self):
+        with utils.tempdir() as tmpdir:
+            self.flags(instances_path=tmpdir)
+            self.flags(remove_unused_base_images=True)
+            self.flags(remove_unused_resized_minimum_age_seconds=0)
+            base_dir = os.path.join(tmpdir, '_base')
+            instance_dir = os.path.join(tmpdir, 'instance-1')
+            os.mkdir(base_dir)
+            os.mkdir(instance_dir)
+
+            ephemeral = os.path.join(base_dir,
+                                     'ephemeral_20_linux_1a2b3c4_ephemeral0')
+            swap = os.path.join(base_dir, 'swap_512')
+            for path in (ephemeral, swap,
+                         os.path.join(instance_dir, 'disk.local'),
+                         os.path.join(instance_dir, 'disk.config')):
+                open(path, 'w').close()
+            os.utime(ephemeral, (1000000, 1000000))
+
+            def get_disk_backing_file(path):
+                self.assertTrue(path.endswith('/disk.local'))
+                return os.path.basename(ephemeral)
+
+            self.stubs.Set(virtutils, 'get_disk_backing_file',
+                           get_disk_backing_file)
+
+            image_cache_manager = imagecache.ImageCacheManager()
+            image_cache_manager.verify_base_images(
+                None, [{'name': 'instance-1',
+                        'uuid': '123',
+                        'host': CONF.host,
+                        'vm_state': '',
+                        'task_state': ''}])
+
+            self.assertEqual(image_cache_manager.removable_base_files, [swap])
+            self.assertFalse(os.path.exists(swap))
+            self.assertTrue(os.path.exists(ephemeral))
+            self.assertTrue(os.path.getmtime(ephemeral) > 1000000)
+
+    def test_checksum_base_files_max_mb_per_pass(self):
+        with utils.tempdir() as tmpdir:
+            self.flags(instances_path=tmpdir)
+            self.flags(checksum_base_images=True)
+            self.flags(checksum_max_mb_per_pass=1)
+            base_dir = os.path.join(tmpdir, '_base')
+            os.mkdir(base_dir)
+
+            contents = {}
+            for name in ('a', 'b', 'c'):
+                path = os.path.join(base_dir, name * 40)
+                contents[path] = name * (600 * 1024)
+                with open(path, 'w') as f:
+                    f.write(contents[path])
+            first, recent, last = sorted(contents)
+            imagecache.write_stored_info(recent, field='sha1', value='x')
+
+            image_cache_manager = imagecache.ImageCacheManager()
+            image_cache_manager._checksum_base_files(contents.keys())
+
+            self.assertEqual(
+                image_cache_manager.checksums,
+                {first: hashlib.sha1(contents[first]).hexdigest()})
+            self.assertEqual(image_cache_manager.deferred_checksums,
+                             set([last]))
+
+            # Deferred files are neither verified nor given a checksum
+            self.assertEqual(
+                image_cache_manager._verify_checksum('c', last), None)
+            self.assertEqual(imagecache.read_stored_checksum(last),
+                             (None, None))
+
+    def test_verify_base_images_writes_index(self):
+        with utils.tempdir() as tmpdir:
+            self.flags(instances_path=tmpdir)
+            self.flags(checksum_base_images=True)
+            base_dir = os.path.join(tmpdir, '_base')
+            os.mkdir(base_dir)
+            os.mkdir(os.path.join(tmpdir, 'instance-1'))
+            base_file = os.path.join(base_dir, hashlib.sha1('1').hexdigest())
+            with open(base_file, 'w') as f:
+                f.write('image data')
+
+            instances = [{'image_ref': '1',
+                          'name': 'instance-1',
+                          'uuid': '123',
+                          'host': CONF.host,
+                          'vm_state': '',
+                          'task_state': ''}]
+            image_cache_manager = imagecache.ImageCacheManager()
+            image_cache_manager.verify_base_images(None, instances)
+
+            self.assertEqual(imagecache.read_stored_checksum(
+                base_file, timestamped=False),
+                hashlib.sha1('image data').hexdigest())
+            image = imagecache.read_index()['images'][
+                os.path.basename(base_file)]
+            self.assertEqual(image['state'], 'active')
+            self.assertEqual(image['size'], len('image data'))
+            self.assertEqual(image['checksum'], None)
+            self.assertEqual(image['instances'], ['instance-1'])
+
+            # The next pass verifies the checksum written by the first
+            image_cache_manager.verify_base_images(None, instances)
+            index = imagecache.read_index()
+            self.assertEqual(index['host'], CONF.host)
+            self.assertEqual(
+                index['images'][os.path.basename(base_file)]['checksum'],
+                'ok')
+
     def test_verify_base_images_no_base(self):
         self.flags(instances_path='/tmp/no/such/dir/name/please')
         image_cache_manager = imagecache.ImageCacheManager()
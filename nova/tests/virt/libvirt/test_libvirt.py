@@ -1564,6 +1564,88 @@ class LibvirtConnTestCase(test.TestCase):
         self.assertEquals(snapshot['disk_format'], 'qcow2')
         self.assertEquals(snapshot['name'], snapshot_name)
 
+    def _snapshot_shutdown_instance(self, disk_type, backing_file=None):
+        expected_calls = [
+            {'args': (),
+             'kwargs':
+                 {'task_state': task_states.IMAGE_PENDING_UPLOAD}},
+            {'args': (),
+             'kwargs':
+                 {'task_state': task_states.IMAGE_UPLOADING,
+                  'expected_state': task_states.IMAGE_PENDING_UPLOAD}}]
+        func_call_matcher = matchers.FunctionCallMatcher(expected_calls)
+
+        self.flags(libvirt_snapshots_directory='./')
+        image_service = nova.tests.image.fake.FakeImageService()
+        instance_ref = db.instance_create(self.context, self.test_instance)
+        recv_meta = image_service.create(context, {'name': 'test-snap',
+                                                   'is_public': False,
+                                                   'status': 'creating',
+                                                   'properties': {}})
+        uploaded = []
+
+        def fake_update(context, image_id, metadata, data=None):
+            uploaded.append(data.read())
+
+        self.stubs.Set(image_service, 'update', fake_update)
+
+        class ShutdownDomain(FakeVirtDomain):
+            def info(self):
+                return [libvirt_driver.libvirt.VIR_DOMAIN_SHUTOFF,
+                        None, None, None, None]
+
+        extracted = []
+
+        def fake_extract(disk_path, source_fmt, snapshot_name, out_path,
+                         dest_fmt):
+            extracted.append(disk_path)
+            libvirt_driver.libvirt_utils.files[out_path] = 'extracted'
+
+        self.stubs.Set(libvirt_driver.libvirt_utils, 'extract_snapshot',
+                       fake_extract)
+        self.stubs.Set(libvirt_driver.libvirt_utils, 'disk_type', disk_type)
+        self.stubs.Set(libvirt_driver.libvirt_utils, 'disk_backing_files',
+                       {'filename': backing_file})
+        self.stubs.Set(libvirt_driver.libvirt_utils, 'files',
+                       {'filename': 'disk data'})
+        self.stubs.Set(libvirt_driver.utils, 'execute', self.fake_execute)
+
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        conn._conn.lookupByName = lambda name: ShutdownDomain()
+        conn.snapshot(self.context, instance_ref, recv_meta['id'],
+                      func_call_matcher.call)
+
+        self.assertIsNone(func_call_matcher.match())
+        return extracted, uploaded
+
+    def test_snapshot_of_shutdown_instance_uploads_raw_disk(self):
+        extracted, uploaded = self._snapshot_shutdown_instance('raw')
+        self.assertEqual(extracted, [])
+        self.assertEqual(uploaded, ['disk data'])
+
+    def test_snapshot_of_shutdown_instance_uploads_qcow2_disk(self):
+        extracted, uploaded = self._snapshot_shutdown_instance('qcow2')
+        self.assertEqual(extracted, [])
+        self.assertEqual(uploaded, ['disk data'])
+
+    def test_snapshot_of_shutdown_instance_with_compression(self):
+        self.flags(libvirt_snapshot_compression=True)
+        extracted, uploaded = self._snapshot_shutdown_instance('qcow2')
+        self.assertEqual(extracted, ['filename'])
+        self.assertEqual(uploaded, ['extracted'])
+
+    def test_snapshot_of_shutdown_raw_instance_with_compression(self):
+        self.flags(libvirt_snapshot_compression=True)
+        extracted, uploaded = self._snapshot_shutdown_instance('raw')
+        self.assertEqual(extracted, [])
+        self.assertEqual(uploaded, ['disk data'])
+
+    def test_snapshot_of_shutdown_instance_with_backing_file(self):
+        extracted, uploaded = self._snapshot_shutdown_instance(
+            'qcow2', backing_file='base')
+        self.assertEqual(extracted, ['filename'])
+        self.assertEqual(uploaded, ['extracted'])
+
     def test_lxc_snapshot_in_qcow2_format(self):
         expected_calls = [
             {'args': (),
@@ -2871,6 +2953,76 @@ class LibvirtConnTestCase(test.TestCase):
                    None)
         self.assertTrue(self.create_image_called)
 
+    def test_run_image_stages_in_parallel(self):
+        events = []
+
+        def stage(name, delay):
+            def run():
+                events.append(('start', name))
+                greenthread.sleep(delay)
+                events.append(('end', name))
+            return run
+
+        stages = [('root', stage('root', 0.02), ()),
+                  ('disk.local', stage('disk.local', 0), ()),
+                  ('inject', stage('inject', 0), ['root'])]
+        timings = libvirt_driver.LibvirtDriver._run_image_stages(stages)
+
+        self.assertEqual([name for name, _seconds in timings],
+                         ['root', 'disk.local', 'inject'])
+        self.assertTrue(timings[0][1] >= 0.02)
+        self.assertEqual(events, [('start', 'root'),
+                                  ('start', 'disk.local'),
+                                  ('end', 'disk.local'),
+                                  ('end', 'root'),
+                                  ('start', 'inject'),
+                                  ('end', 'inject')])
+
+    def test_run_image_stages_waits_for_all_on_failure(self):
+        done = []
+
+        def fail():
+            raise test.TestingException()
+
+        def slow():
+            greenthread.sleep(0.01)
+            done.append('disk.local')
+
+        stages = [('root', fail, ()),
+                  ('disk.local', slow, ()),
+                  ('inject', lambda: done.append('inject'), ['root'])]
+        self.assertRaises(test.TestingException,
+                          libvirt_driver.LibvirtDriver._run_image_stages,
+                          stages)
+        self.assertEqual(done, ['disk.local'])
+
+    def test_run_image_stages_one_after_another(self):
+        self.flags(libvirt_parallel_image_creation=False)
+        self.stubs.Set(libvirt_driver.greenthread, 'spawn',
+                       lambda *args: self.fail('stage spawned'))
+        events = []
+        stages = [('root', lambda: events.append('root'), ()),
+                  ('disk.swap', lambda: events.append('disk.swap'), ())]
+        timings = libvirt_driver.LibvirtDriver._run_image_stages(stages)
+        self.assertEqual(events, ['root', 'disk.swap'])
+        self.assertEqual([name for name, _seconds in timings],
+                         ['root', 'disk.swap'])
+
+    def test_ephemeral_template_name(self):
+        get_name = libvirt_driver.LibvirtDriver._get_ephemeral_template_name
+        name = get_name(20, 'ephemeral0', 'linux')
+        self.assertTrue(name.startswith('ephemeral_20_linux_'))
+        self.assertTrue(name.endswith('_ephemeral0'))
+        self.assertEqual(name, get_name(20, 'ephemeral0', 'linux'))
+        self.assertTrue(get_name(20, 'ephemeral0', None).startswith(
+            'ephemeral_20_default_'))
+
+        self.assertNotEqual(name, get_name(20, 'ephemeral1', 'linux'))
+        self.assertNotEqual(name, get_name(10, 'ephemeral0', 'linux'))
+        self.assertNotEqual(name, get_name(20, 'ephemeral0', 'windows'))
+        self.flags(default_ephemeral_format='ext4')
+        self.assertNotEqual(name, get_name(20, 'ephemeral0', 'linux'))
+
     def test_spawn_from_volume_calls_cache(self):
         self.cache_called_for_disk = False
 
@@ -2981,7 +3133,8 @@ class LibvirtConnTestCase(test.TestCase):
         wantFiles = [
             {'filename': '356a192b7913b04c54574d18c28d46e6395428ab',
              'size': 10 * 1024 * 1024 * 1024},
-            {'filename': 'ephemeral_20_default',
+            {'filename': conn._get_ephemeral_template_name(
+                20, 'ephemeral0', None),
              'size': 20 * 1024 * 1024 * 1024},
             ]
         self.assertEquals(gotFiles, wantFiles)
@@ -3042,7 +3195,8 @@ class LibvirtConnTestCase(test.TestCase):
         wantFiles = [
             {'filename': '356a192b7913b04c54574d18c28d46e6395428ab',
              'size': 10 * 1024 * 1024 * 1024},
-            {'filename': 'ephemeral_20_default',
+            {'filename': conn._get_ephemeral_template_name(
+                20, 'ephemeral0', None),
              'size': 20 * 1024 * 1024 * 1024},
             {'filename': 'swap_500',
              'size': 500 * 1024 * 1024},
@@ -3485,7 +3639,7 @@ class LibvirtConnTestCase(test.TestCase):
                                  'disk_size': '10737418240',
                                  'over_committed_disk_size': '0'}]}
 
-        def get_info(instance_name):
+        def get_info(instance_name, xml=None):
             return jsonutils.dumps(fake_disks.get(instance_name))
         self.stubs.Set(conn, 'get_instance_disk_info', get_info)
 
@@ -3927,6 +4081,47 @@ class LibvirtConnTestCase(test.TestCase):
                   }
         self.assertEqual(actual, expect)
 
+    def test_get_domains_usage_looks_at_each_domain_once(self):
+        driver = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), True)
+        lookups = []
+
+        class UsageFakeDomain(object):
+            def __init__(self, dom_id):
+                self.dom_id = dom_id
+
+            def vcpus(self):
+                return ([1] * self.dom_id, [True] * self.dom_id)
+
+            def name(self):
+                return 'instance-%d' % self.dom_id
+
+            def XMLDesc(self, flags):
+                return '<domain id="%d"/>' % self.dom_id
+
+        def fake_lookup_by_id(dom_id):
+            lookups.append(dom_id)
+            return UsageFakeDomain(dom_id)
+
+        disk_infos = []
+
+        def fake_get_instance_disk_info(instance_name, xml=None):
+            disk_infos.append((instance_name, xml))
+            return jsonutils.dumps([{'over_committed_disk_size': 10}])
+
+        self.stubs.Set(driver, 'list_instance_ids', lambda: [1, 2])
+        self.stubs.Set(driver, '_lookup_by_id', fake_lookup_by_id)
+        driver._conn.listDefinedDomains = lambda: ['instance-3']
+        self.stubs.Set(driver, 'get_instance_disk_info',
+                       fake_get_instance_disk_info)
+
+        usage = driver._get_domains_usage()
+        self.assertEqual(usage['vcpus_used'], 3)
+        self.assertEqual(usage['disk_over_committed_size'], 30)
+        self.assertEqual(lookups, [1, 2])
+        self.assertEqual(disk_infos, [('instance-1', '<domain id="1"/>'),
+                                      ('instance-2', '<domain id="2"/>'),
+                                      ('instance-3', None)])
+
     def test_failing_vcpu_count(self):
         """Domain can fail to return the vcpu description in case it's
         just starting up or shutting down. Make sure None is handled
@@ -4572,6 +4767,234 @@ class IptablesFirewallTestCase(test.TestCase):
         self.fw.instances[instance_ref['id']] = instance_ref
         self.fw.do_refresh_security_group_rules("fake")
 
+    def _stub_grantee_group_rule(self):
+        self.flags(firewall_use_ipsets=True)
+        grantee_group = {'id': 2, 'instances': []}
+        rules = [{'cidr': None, 'protocol': 'tcp', 'from_port': 80,
+                  'to_port': 80, 'grantee_group': grantee_group}]
+        self.stubs.Set(self.fw._virtapi, 'security_group_get_by_instance',
+                       lambda ctxt, instance: [{'id': 1}])
+        self.stubs.Set(self.fw._virtapi,
+                       'security_group_rule_get_by_security_group',
+                       lambda ctxt, security_group: rules)
+        self.member_ips = ['10.0.0.2', '10.0.0.3']
+        self.stubs.Set(self.fw, '_security_group_member_ips',
+                       lambda ctxt, group, version: self.member_ips)
+        self.ipset_calls = []
+
+        def fake_execute(*cmd, **kwargs):
+            self.ipset_calls.append((cmd, kwargs.get('process_input')))
+
+        self.stubs.Set(base_firewall.utils, 'execute', fake_execute)
+
+    def test_instance_rules_with_ipsets(self):
+        self._stub_grantee_group_rule()
+        instance = {'id': 1, 'uuid': 'fake-uuid'}
+        network_info = _fake_network_info(self.stubs, 1)
+        ipv4_rules, ipv6_rules = self.fw.instance_rules(instance,
+                                                        network_info)
+
+        self.assertIn('-j ACCEPT -p tcp --dport 80 '
+                      '-m set --match-set nova-sg-2-v4 src', ipv4_rules)
+        self.assertFalse([rule for rule in ipv4_rules if '10.0.0.' in rule])
+        self.assertEqual(len(self.ipset_calls), 1)
+        cmd, process_input = self.ipset_calls[0]
+        self.assertEqual(cmd, ('ipset', 'restore', '-exist'))
+        self.assertEqual(process_input.split('\n'), [
+            'create nova-sg-2-v4 hash:ip family inet',
+            'create nova-sg-2-v4-new hash:ip family inet',
+            'flush nova-sg-2-v4-new',
+            'add nova-sg-2-v4-new 10.0.0.2',
+            'add nova-sg-2-v4-new 10.0.0.3',
+            'swap nova-sg-2-v4-new nova-sg-2-v4',
+            'destroy nova-sg-2-v4-new',
+            ''])
+        self.assertEqual(self.fw.instance_ipsets, {1: set(['nova-sg-2-v4'])})
+
+    def test_refresh_security_group_members_updates_ipset(self):
+        self._stub_grantee_group_rule()
+        instance = {'id': 1, 'uuid': 'fake-uuid'}
+        self.fw.instance_rules(instance, _fake_network_info(self.stubs, 1))
+        self.ipset_calls = []
+        self.stubs.Set(self.fw, 'do_refresh_security_group_rules',
+                       lambda security_group: self.fail('chains rebuilt'))
+
+        self.member_ips = ['10.0.0.3', '10.0.0.4']
+        self.fw.refresh_security_group_members(2)
+        self.assertEqual(self.ipset_calls, [
+            (('ipset', 'restore', '-exist'),
+             'add nova-sg-2-v4 10.0.0.4\ndel nova-sg-2-v4 10.0.0.2\n')])
+
+        # No rules on this host refer to other groups
+        self.ipset_calls = []
+        self.fw.refresh_security_group_members(3)
+        self.assertEqual(self.ipset_calls, [])
+
+    def test_refresh_ipset_granted_by_two_groups(self):
+        self._stub_grantee_group_rule()
+        grantee_group = {'id': 2, 'instances': []}
+        group_rules = {
+            1: [{'cidr': None, 'protocol': 'tcp', 'from_port': 80,
+                 'to_port': 80, 'grantee_group': grantee_group}],
+            4: [{'cidr': None, 'protocol': 'tcp', 'from_port': 22,
+                 'to_port': 22, 'grantee_group': grantee_group}],
+        }
+        self.stubs.Set(self.fw._virtapi, 'security_group_get_by_instance',
+                       lambda ctxt, instance: [{'id': instance['id']}])
+        self.stubs.Set(self.fw._virtapi,
+                       'security_group_rule_get_by_security_group',
+                       lambda ctxt, security_group:
+                           group_rules[security_group['id']])
+        self.stubs.Set(self.fw.iptables, 'apply', lambda: None)
+        network_info = _fake_network_info(self.stubs, 1)
+        for instance in ({'id': 1, 'uuid': 'fake-uuid1'},
+                         {'id': 4, 'uuid': 'fake-uuid4'}):
+            self.fw.instances[instance['id']] = instance
+            self.fw.network_infos[instance['id']] = network_info
+            self.fw.instance_rules(instance, network_info)
+
+        # Group 4, whose rules were generated last, drops its rule. Group 1
+        # still grants access to group 2.
+        group_rules[4] = []
+        self.member_ips = ['10.0.0.3', '10.0.0.4']
+        self.ipset_calls = []
+        self.fw.refresh_security_group_members(2)
+
+        self.assertEqual(self.ipset_calls, [
+            (('ipset', 'restore', '-exist'),
+             'add nova-sg-2-v4 10.0.0.4\ndel nova-sg-2-v4 10.0.0.2\n')])
+        self.assertEqual(self.fw.instance_ipsets,
+                         {1: set(['nova-sg-2-v4']), 4: set()})
+
+        # The ipset is still kept up to date for group 1
+        self.member_ips = ['10.0.0.5']
+        self.ipset_calls = []
+        self.fw.refresh_security_group_members(2)
+
+        self.assertEqual(self.ipset_calls, [
+            (('ipset', 'restore', '-exist'),
+             'add nova-sg-2-v4 10.0.0.5\ndel nova-sg-2-v4 10.0.0.3\n'
+             'del nova-sg-2-v4 10.0.0.4\n')])
+
+        # Once no group grants access any more, refreshes are ignored
+        group_rules[1] = []
+        self.fw.refresh_security_group_members(2)
+        self.ipset_calls = []
+        self.fw.refresh_security_group_members(2)
+        self.assertEqual(self.ipset_calls, [])
+
+    def test_release_ipsets(self):
+        self._stub_grantee_group_rule()
+        network_info = _fake_network_info(self.stubs, 1)
+        instances = [{'id': 1, 'uuid': 'fake-uuid1'},
+                     {'id': 2, 'uuid': 'fake-uuid2'}]
+        for instance in instances:
+            self.fw.instance_rules(instance, network_info)
+        self.ipset_calls = []
+
+        self.fw.release_ipsets(instances[0])
+        self.assertEqual(self.ipset_calls, [])
+        self.fw.release_ipsets(instances[1])
+        self.assertEqual(self.ipset_calls,
+                         [(('ipset', 'destroy', 'nova-sg-2-v4'), None)])
+        self.assertEqual(self.fw.ipsets, {})
+
+    def _stub_security_groups(self):
+        grantee_group = {'id': 3, 'instances': []}
+        self.group_rules = {
+            1: [{'cidr': '10.0.0.0/24', 'protocol': 'tcp', 'from_port': 22,
+                 'to_port': 22, 'grantee_group': None}],
+            2: [{'cidr': None, 'protocol': 'tcp', 'from_port': 80,
+                 'to_port': 80, 'grantee_group': grantee_group},
+                {'cidr': None, 'protocol': 'udp', 'from_port': 53,
+                 'to_port': 53, 'grantee_group': grantee_group}],
+        }
+        instance_groups = {1: [1, 2], 2: [1], 3: [2]}
+        self.stubs.Set(self.fw._virtapi, 'security_group_get_by_instance',
+                       lambda ctxt, instance: [
+                           {'id': group_id} for group_id
+                           in instance_groups[instance['id']]])
+        self.rule_gets = []
+
+        def fake_rule_get(ctxt, security_group):
+            self.rule_gets.append(security_group['id'])
+            return self.group_rules[security_group['id']]
+
+        self.stubs.Set(self.fw._virtapi,
+                       'security_group_rule_get_by_security_group',
+                       fake_rule_get)
+        self.member_ips = []
+
+        def fake_member_ips(ctxt, group, version):
+            self.member_ips.append((group['id'], version))
+            return ['10.1.0.2']
+
+        self.stubs.Set(self.fw, '_security_group_member_ips',
+                       fake_member_ips)
+        self.stubs.Set(self.fw.iptables, 'apply', lambda: None)
+
+        self.instances = {}
+        for instance_id in (1, 2, 3):
+            instance = {'id': instance_id, 'uuid': 'fake-uuid%d' % instance_id}
+            self.instances[instance_id] = instance
+            self.fw.prepare_instance_filter(instance,
+                                            _fake_network_info(self.stubs, 1))
+        self.refreshed = {}
+
+        def fake_refresh(instance, ipv4_rules, ipv6_rules):
+            self.refreshed[instance['id']] = ipv4_rules
+
+        self.stubs.Set(self.fw, '_inner_do_refresh_rules', fake_refresh)
+
+    def test_security_group_rules_shared_by_instances(self):
+        self._stub_security_groups()
+        self.assertEqual(self.rule_gets, [1, 2])
+        self.assertEqual(self.member_ips, [(3, 4)])
+
+        ipv4_rules, ipv6_rules = self.fw.instance_rules(
+            self.instances[1], _fake_network_info(self.stubs, 1))
+        self.assertEqual(self.rule_gets, [1, 2])
+        self.assertIn('-j ACCEPT -p tcp --dport 22 -s 10.0.0.0/24',
+                      ipv4_rules)
+        self.assertIn('-j ACCEPT -p tcp --dport 80 -s 10.1.0.2', ipv4_rules)
+        self.assertIn('-j ACCEPT -p udp --dport 53 -s 10.1.0.2', ipv4_rules)
+
+    def test_refresh_security_group_rules_refetches_group(self):
+        self._stub_security_groups()
+        self.rule_gets = []
+        self.group_rules[2] = [{'cidr': '10.2.0.0/24', 'protocol': 'tcp',
+                                'from_port': 443, 'to_port': 443,
+                                'grantee_group': None}]
+
+        self.fw.refresh_security_group_rules(2)
+        self.assertEqual(self.rule_gets, [2])
+        self.assertEqual(sorted(self.refreshed), [1, 3])
+        self.assertIn('-j ACCEPT -p tcp --dport 443 -s 10.2.0.0/24',
+                      self.refreshed[3])
+
+    def test_refresh_security_group_members_without_ipsets(self):
+        self._stub_security_groups()
+        self.rule_gets = []
+        self.member_ips = []
+
+        self.fw.refresh_security_group_members(3)
+        self.assertEqual(self.rule_gets, [2])
+        self.assertEqual(self.member_ips, [(3, 4)])
+        self.assertEqual(sorted(self.refreshed), [1, 3])
+
+        self.fw.refresh_security_group_members(4)
+        self.assertEqual(self.rule_gets, [2])
+
+    def test_unfilter_instance_forgets_unused_security_groups(self):
+        self._stub_security_groups()
+        self.stubs.Set(self.fw.nwfilter, 'unfilter_instance',
+                       lambda instance, network_info: None)
+        network_info = _fake_network_info(self.stubs, 1)
+        self.fw.unfilter_instance(self.instances[3], network_info)
+        self.assertEqual(sorted(self.fw.security_group_rules), [1, 2])
+        self.fw.unfilter_instance(self.instances[1], network_info)
+        self.assertEqual(sorted(self.fw.security_group_rules), [1])
+
     def test_unfilter_instance_undefines_nwfilter(self):
         admin_ctxt = context.get_admin_context()
 
@@ -5748,10 +6171,10 @@ class LibvirtVolumeUsageTestCase(test.TestCase):
                       'device_name': 'vda'}]
 
     def test_get_all_volume_usage(self):
-        def fake_block_stats(instance_name, disk):
-            return (169L, 688640L, 0L, 0L, -1L)
-
-        self.stubs.Set(self.conn, 'block_stats', fake_block_stats)
+        stats = (169L, 688640L, 0L, 0L, -1L)
+        self.stubs.Set(self.conn._domain_stats, 'get_snapshot',
+                       lambda: {self.ins_ref['name']: {
+                           'blocks': {'vda': stats, 'vde': stats}}})
         vol_usage = self.conn.get_all_volume_usage(self.c,
               [dict(instance=self.ins_ref, instance_bdms=self.bdms)])
 
@@ -5777,6 +6200,147 @@ class LibvirtVolumeUsageTestCase(test.TestCase):
         self.assertEqual(vol_usage, [])
 
 
+class StatsFakeDomain(object):
+
+    def __init__(self, dom_id):
+        self.dom_id = dom_id
+        self.xml_reads = 0
+
+    def ID(self):
+        return self.dom_id
+
+    def UUIDString(self):
+        return 'uuid-%d' % self.dom_id
+
+    def name(self):
+        return 'instance-%d' % self.dom_id
+
+    def XMLDesc(self, flags):
+        self.xml_reads += 1
+        return """
+            <domain type='kvm'>
+                <devices>
+                    <disk type='file'>
+                        <source file='filename'/>
+                        <target dev='vda' bus='virtio'/>
+                    </disk>
+                    <interface type='bridge'>
+                        <mac address='fa:16:3e:00:00:0%d'/>
+                        <target dev='tap%d'/>
+                    </interface>
+                </devices>
+            </domain>
+            """ % (self.dom_id, self.dom_id)
+
+    def info(self):
+        return [power_state.RUNNING, 2048L, 1024L, 1, 5000L]
+
+    def blockStats(self, disk):
+        return (1L, 512L, 2L, 1024L, -1L)
+
+    def interfaceStats(self, interface):
+        return (100L, 1L, 0L, 0L, 200L, 2L, 0L, 0L)
+
+
+class LibvirtDomainStatsTestCase(test.TestCase):
+    """Test for the usage counters collected from all domains."""
+
+    def setUp(self):
+        super(LibvirtDomainStatsTestCase, self).setUp()
+        self.conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        self.domains = dict((dom_id, StatsFakeDomain(dom_id))
+                            for dom_id in (1, 2))
+        self.stubs.Set(self.conn, 'list_instance_ids',
+                       lambda: sorted(self.domains))
+        self.stubs.Set(self.conn, '_lookup_by_id',
+                       lambda dom_id: self.domains[dom_id])
+
+    def test_snapshot(self):
+        snapshot = self.conn._domain_stats.get_snapshot()
+        self.assertEqual(sorted(snapshot), ['instance-1', 'instance-2'])
+        self.assertEqual(snapshot['instance-1'], {
+            'uuid': 'uuid-1',
+            'max_memory': 2048L,
+            'memory': 1024L,
+            'cpu_time': 5000L,
+            'blocks': {'vda': (1L, 512L, 2L, 1024L, -1L)},
+            'interfaces': {'tap1': {
+                'mac_address': 'fa:16:3e:00:00:01',
+                'stats': (100L, 1L, 0L, 0L, 200L, 2L, 0L, 0L)}}})
+
+    def test_snapshot_reused(self):
+        snapshot = self.conn._domain_stats.get_snapshot()
+        self.domains[3] = StatsFakeDomain(3)
+        self.assertIs(self.conn._domain_stats.get_snapshot(), snapshot)
+
+        self.flags(libvirt_domain_stats_max_age=0)
+        snapshot = self.conn._domain_stats.get_snapshot()
+        self.assertIn('instance-3', snapshot)
+
+    def test_devices_parsed_once_per_domain_start(self):
+        self.flags(libvirt_domain_stats_max_age=0)
+        stats = self.conn._domain_stats
+        stats.get_snapshot()
+        stats.get_snapshot()
+        self.assertEqual(self.domains[1].xml_reads, 1)
+
+        stats.forget_devices('uuid-1')
+        stats.get_snapshot()
+        self.assertEqual(self.domains[1].xml_reads, 2)
+
+        # Started again with a new ID
+        self.domains[1].dom_id = 5
+        stats.get_snapshot()
+        self.assertEqual(self.domains[1].xml_reads, 3)
+        self.assertEqual(self.domains[2].xml_reads, 1)
+
+    def test_snapshot_from_all_domain_stats(self):
+        domain = self.domains[1]
+        record = {'cpu.time': 5000L,
+                  'balloon.current': 1024L,
+                  'balloon.maximum': 2048L,
+                  'block.count': 1,
+                  'block.0.name': 'vda',
+                  'block.0.rd.reqs': 1L,
+                  'block.0.rd.bytes': 512L,
+                  'block.0.wr.reqs': 2L,
+                  'block.0.wr.bytes': 1024L,
+                  'net.count': 1,
+                  'net.0.name': 'tap1',
+                  'net.0.rx.bytes': 100L,
+                  'net.0.rx.pkts': 1L,
+                  'net.0.rx.errs': 0L,
+                  'net.0.rx.drop': 0L,
+                  'net.0.tx.bytes': 200L,
+                  'net.0.tx.pkts': 2L,
+                  'net.0.tx.errs': 0L,
+                  'net.0.tx.drop': 0L}
+        self.conn._conn.getAllDomainStats = (
+            lambda stats, flags: [(domain, record)])
+        self.stubs.Set(self.conn, '_lookup_by_id',
+                       lambda dom_id: self.fail('domain looked up'))
+
+        snapshot = self.conn._domain_stats.get_snapshot()
+        self.assertEqual(snapshot, {'instance-1': {
+            'uuid': 'uuid-1',
+            'max_memory': 2048L,
+            'memory': 1024L,
+            'cpu_time': 5000L,
+            'blocks': {'vda': (1L, 512L, 2L, 1024L, -1)},
+            'interfaces': {'tap1': {
+                'mac_address': 'fa:16:3e:00:00:01',
+                'stats': (100L, 1L, 0L, 0L, 200L, 2L, 0L, 0L)}}}})
+
+    def test_get_all_bw_counters(self):
+        instances = [{'name': 'instance-2', 'uuid': 'instance-uuid-2'},
+                     {'name': 'instance-3', 'uuid': 'instance-uuid-3'}]
+        self.assertEqual(self.conn.get_all_bw_counters(instances), [
+            {'uuid': 'instance-uuid-2',
+             'mac_address': 'fa:16:3e:00:00:02',
+             'bw_in': 100L,
+             'bw_out': 200L}])
+
+
 class LibvirtNonblockingTestCase(test.TestCase):
     """Test libvirt_nonblocking option."""
 
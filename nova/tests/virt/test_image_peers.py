@@ -0,0 +1,323 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import hashlib
+import os
+import socket
+
+import fixtures
+import webob
+
+from nova import exception
+from nova.openstack.common import timeutils
+from nova import test
+from nova.virt import image_peers
+from nova.virt import images
+
+NAME = 'a' * 40
+
+
+class ImageCacheAppTestCase(test.TestCase):
+
+    def setUp(self):
+        super(ImageCacheAppTestCase, self).setUp()
+        self.flags(image_peers_shared_secret='secret')
+        self.base_dir = self.useFixture(fixtures.TempDir()).path
+        with open(os.path.join(self.base_dir, NAME), 'wb') as f:
+            f.write('image data')
+        self.app = image_peers.ImageCacheApp(self.base_dir)
+
+    def _request(self, name, method='GET', headers=None):
+        req = webob.Request.blank('/%s' % name, method=method)
+        req.headers.update(headers or image_peers._signature_headers(name))
+        return req.get_response(self.app)
+
+    def test_get(self):
+        res = self._request(NAME)
+        self.assertEqual(res.status_int, 200)
+        self.assertEqual(res.body, 'image data')
+        self.assertEqual(res.content_length, len('image data'))
+
+    def test_head(self):
+        res = self._request(NAME, method='HEAD')
+        self.assertEqual(res.status_int, 200)
+        self.assertEqual(res.content_length, len('image data'))
+
+    def test_missing_image(self):
+        res = self._request('b' * 40)
+        self.assertEqual(res.status_int, 404)
+
+    def test_only_complete_images_served(self):
+        open(os.path.join(self.base_dir, NAME + '.part'), 'w').close()
+        self.assertEqual(self._request(NAME + '.part').status_int, 404)
+        self.assertEqual(self._request('../' + NAME).status_int, 404)
+
+    def test_bad_signature(self):
+        headers = image_peers._signature_headers(NAME)
+        headers['X-Image-Signature'] = 'wrong'
+        res = self._request(NAME, headers=headers)
+        self.assertEqual(res.status_int, 403)
+
+    def test_missing_signature(self):
+        res = self._request(NAME, headers={'X-Other': 'foo'})
+        self.assertEqual(res.status_int, 403)
+
+    def test_expired_signature(self):
+        timeutils.set_time_override(timeutils.utcnow())
+        self.addCleanup(timeutils.clear_time_override)
+        headers = image_peers._signature_headers(NAME)
+
+        timeutils.advance_time_seconds(60)
+        self.assertEqual(self._request(NAME, headers=headers).status_int,
+                         200)
+        timeutils.advance_time_seconds(1)
+        self.assertEqual(self._request(NAME, headers=headers).status_int,
+                         403)
+
+    def test_extended_expiry(self):
+        headers = image_peers._signature_headers(NAME)
+        headers['X-Image-Expires'] = str(
+            int(headers['X-Image-Expires']) + 3600)
+        res = self._request(NAME, headers=headers)
+        self.assertEqual(res.status_int, 403)
+
+    def test_equal_signatures(self):
+        self.assertTrue(image_peers._equal_signatures('abc', 'abc'))
+        self.assertFalse(image_peers._equal_signatures('abc', 'abd'))
+        self.assertFalse(image_peers._equal_signatures('abc', 'ab'))
+
+    def test_put_not_allowed(self):
+        res = self._request(NAME, method='PUT')
+        self.assertEqual(res.status_int, 405)
+
+    def test_start_server_without_secret(self):
+        self.flags(image_peers_shared_secret='')
+        self.assertRaises(exception.NovaException,
+                          image_peers.start_server, self.base_dir)
+
+
+class FakeResponse(object):
+    def __init__(self, status, data):
+        self.status = status
+        self.data = data
+
+    def getheader(self, name, default=None):
+        return {'content-length': str(len(self.data))}.get(name, default)
+
+    def read(self, size):
+        chunk, self.data = self.data[:size], self.data[size:]
+        return chunk
+
+
+class FetchFromTestCase(test.TestCase):
+
+    def setUp(self):
+        super(FetchFromTestCase, self).setUp()
+        self.flags(image_peers_shared_secret='secret')
+        self.dst_path = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                                     NAME + '.part')
+        self.response = FakeResponse(200, 'image data')
+        self.connections = []
+        test_case = self
+
+        class FakeConnection(object):
+            def __init__(self, host, port, timeout=None):
+                test_case.connections.append((host, timeout))
+
+            def request(self, method, url, headers=None):
+                expires = int(headers['X-Image-Expires'])
+                test_case.assertTrue(expires > timeutils.utcnow_ts())
+                test_case.assertEqual(headers['X-Image-Signature'],
+                                      image_peers._sign(NAME, expires))
+
+            def getresponse(self):
+                return test_case.response
+
+            def close(self):
+                pass
+
+        self.stubs.Set(image_peers.httplib, 'HTTPConnection',
+                       FakeConnection)
+
+    def test_fetch_from(self):
+        self.assertTrue(image_peers._fetch_from(
+            'peer1', NAME, self.dst_path,
+            hashlib.md5('image data').hexdigest(), 5))
+        self.assertEqual(self.connections, [('peer1', 5)])
+        with open(self.dst_path) as f:
+            self.assertEqual(f.read(), 'image data')
+
+    def test_fetch_from_peer_without_image(self):
+        self.response = FakeResponse(404, '')
+        self.assertFalse(image_peers._fetch_from(
+            'peer1', NAME, self.dst_path,
+            hashlib.md5('image data').hexdigest(), 5))
+
+    def test_fetch_from_checksum_mismatch(self):
+        self.assertRaises(IOError, image_peers._fetch_from,
+                          'peer1', NAME, self.dst_path,
+                          hashlib.md5('other data').hexdigest(), 5)
+
+
+class FetchTestCase(test.TestCase):
+
+    def setUp(self):
+        super(FetchTestCase, self).setUp()
+        self.flags(host='me', image_peers_max_tries=3,
+                   image_peers_shared_secret='secret')
+        self.stubs.Set(image_peers, '_REGISTRY', None)
+        self.hosts = ['me', 'peer1', 'peer2', 'peer3', 'peer4']
+        self.stubs.Set(image_peers.servicegroup.API, 'get_all',
+                       lambda api, topic: self.hosts)
+        self.dst_path = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                                     NAME + '.part')
+        self.tried = []
+        self.timeouts = []
+        self.holders = []
+        self.checksum = hashlib.md5('image data').hexdigest()
+
+        def fake_fetch_from(host, name, dst_path, checksum, timeout):
+            self.tried.append(host)
+            self.timeouts.append(timeout)
+            if host == 'broken':
+                open(dst_path, 'w').close()
+                raise socket.error('connection reset')
+            if host not in self.holders:
+                return False
+            with open(dst_path, 'wb') as f:
+                f.write('image data')
+            return True
+
+        self.stubs.Set(image_peers, '_fetch_from', fake_fetch_from)
+
+    def test_fetch_from_peer(self):
+        self.holders = ['peer1', 'peer2', 'peer3', 'peer4']
+        self.assertTrue(image_peers.fetch(NAME, self.dst_path, self.checksum))
+        self.assertEqual(len(self.tried), 1)
+        self.assertNotIn('me', self.tried)
+        with open(self.dst_path) as f:
+            self.assertEqual(f.read(), 'image data')
+
+    def test_fetch_tries_limited_number_of_peers(self):
+        self.assertFalse(image_peers.fetch(NAME, self.dst_path, self.checksum))
+        self.assertEqual(len(self.tried), 3)
+        self.assertNotIn('me', self.tried)
+
+    def test_fetch_asks_known_holders_first(self):
+        self.holders = ['peer4']
+        self.flags(image_peers_max_tries=4)
+        self.assertTrue(image_peers.fetch(NAME, self.dst_path, self.checksum))
+
+        self.tried = []
+        self.assertTrue(image_peers.fetch(NAME, self.dst_path, self.checksum))
+        self.assertEqual(self.tried, ['peer4'])
+
+    def test_fetch_skips_broken_peer(self):
+        self.hosts = ['broken', 'peer1']
+        self.holders = ['peer1']
+        self.assertTrue(image_peers.fetch(NAME, self.dst_path, self.checksum))
+        with open(self.dst_path) as f:
+            self.assertEqual(f.read(), 'image data')
+
+    def test_fetch_keeps_partial_download(self):
+        with open(self.dst_path, 'wb') as f:
+            f.write('partial')
+        self.hosts = ['broken']
+        self.assertFalse(image_peers.fetch(NAME, self.dst_path,
+                                           self.checksum))
+        with open(self.dst_path) as f:
+            self.assertEqual(f.read(), 'partial')
+        self.assertFalse(os.path.exists(self.dst_path + '.peer'))
+
+        self.hosts = ['peer1']
+        self.holders = ['peer1']
+        self.assertTrue(image_peers.fetch(NAME, self.dst_path,
+                                          self.checksum))
+        with open(self.dst_path) as f:
+            self.assertEqual(f.read(), 'image data')
+        self.assertFalse(os.path.exists(self.dst_path + '.peer'))
+
+    def test_fetch_without_secret(self):
+        self.flags(image_peers_shared_secret='')
+        self.holders = ['peer1', 'peer2', 'peer3', 'peer4']
+        self.assertFalse(image_peers.fetch(NAME, self.dst_path,
+                                           self.checksum))
+        self.assertEqual(self.tried, [])
+
+    def test_fetch_gives_up_after_max_time(self):
+        self.flags(image_peers_max_tries=4, image_peers_max_time=20)
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        self.stubs.Set(image_peers.servicegroup.API, 'get_all',
+                       lambda api, topic: self.hosts)
+
+        real_fetch_from = image_peers._fetch_from
+
+        def slow_fetch_from(*args):
+            timeutils.advance_time_seconds(8)
+            return real_fetch_from(*args)
+
+        self.stubs.Set(image_peers, '_fetch_from', slow_fetch_from)
+        self.assertFalse(image_peers.fetch(NAME, self.dst_path,
+                                           self.checksum))
+        self.assertEqual(self.timeouts, [10, 10, 4])
+
+    def _stub_image_meta(self, **image_meta):
+        class FakeImageService(object):
+            def show(self, context, image_id):
+                return image_meta
+
+        self.stubs.Set(images.glance, 'get_remote_image_service',
+                       lambda context, href: (FakeImageService(), href))
+
+    def test_fetch_to_raw_skips_peers_for_converted_images(self):
+        self.flags(image_peers_enabled=True, force_raw_images=True)
+        self._stub_image_meta(checksum=self.checksum, disk_format='qcow2')
+        fetched = []
+        self.stubs.Set(images, 'fetch',
+                       lambda context, href, path, user, project:
+                       fetched.append(path))
+        self.stubs.Set(images, 'qemu_img_info',
+                       lambda path: images.QemuImgInfo('file format: raw'))
+        self.stubs.Set(os, 'rename', lambda src, dst: None)
+
+        self.holders = ['peer1']
+        images.fetch_to_raw(None, 'image', self.dst_path[:-len('.part')],
+                            None, None)
+        self.assertEqual(self.tried, [])
+        self.assertEqual(fetched, [self.dst_path])
+
+    def test_fetch_to_raw_falls_back_to_glance(self):
+        self.flags(image_peers_enabled=True)
+        self._stub_image_meta(checksum=self.checksum, disk_format='raw')
+        fetched = []
+        self.stubs.Set(images, 'fetch',
+                       lambda context, href, path, user, project:
+                       fetched.append(path))
+        self.stubs.Set(images, 'qemu_img_info',
+                       lambda path: images.QemuImgInfo('file format: raw'))
+        self.stubs.Set(os, 'rename', lambda src, dst: None)
+
+        path = self.dst_path[:-len('.part')]
+        images.fetch_to_raw(None, 'image', path, None, None)
+        self.assertEqual(len(self.tried), 3)
+        self.assertEqual(fetched, [self.dst_path])
+
+        self.holders = ['peer1']
+        self.hosts = ['peer1']
+        fetched = []
+        images.fetch_to_raw(None, 'image', path, None, None)
+        self.assertEqual(fetched, [])
@@ -12,7 +12,12 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import os
 
+import fixtures
+
+from nova import exception
+from nova.image import glance
 from nova import test
 from nova.virt import images
 
@@ -22,3 +27,74 @@ class QemuTestCase(test.TestCase):
         image_info = images.qemu_img_info("/path/that/does/not/exist")
         self.assertTrue(image_info)
         self.assertTrue(str(image_info))
+
+    def _test_fetch_ranged_download_fails(self, error):
+        downloads = []
+
+        class FakeImageService(object):
+            def download(self, context, image_id, data=None, dst_path=None):
+                downloads.append(dst_path)
+                raise error
+
+        self.stubs.Set(glance, 'get_remote_image_service',
+                       lambda context, href: (FakeImageService(), href))
+        self.flags(glance_download_parallelism=4)
+        path = self.useFixture(fixtures.TempDir()).path + '/image.part'
+        open(path, 'w').close()
+        open(path + '.ranges', 'w').close()
+        self.assertRaises(type(error), images.fetch,
+                          None, 'image', path, None, None)
+        self.assertEqual(downloads, [path])
+        return path
+
+    def test_fetch_ranged_download_keeps_partial_file(self):
+        path = self._test_fetch_ranged_download_fails(IOError())
+        self.assertTrue(os.path.exists(path))
+        self.assertTrue(os.path.exists(path + '.ranges'))
+
+    def test_fetch_ranged_download_deletes_unresumable_file(self):
+        path = self._test_fetch_ranged_download_fails(
+            test.TestingException())
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(os.path.exists(path + '.ranges'))
+
+    def test_fetch_to_raw_from_peer_discards_partial_download(self):
+        self.flags(image_peers_enabled=True)
+        self.stubs.Set(images, '_fetch_from_peers',
+                       lambda context, href, path, path_tmp: True)
+        self.stubs.Set(images, 'fetch', self.fail)
+        self.stubs.Set(images, 'qemu_img_info',
+                       lambda path: images.QemuImgInfo())
+        path = self.useFixture(fixtures.TempDir()).path + '/image'
+        open(path + '.part', 'w').close()
+        open(path + '.part.ranges', 'w').close()
+        self.assertRaises(exception.ImageUnacceptable, images.fetch_to_raw,
+                          None, 'image', path, None, None)
+        self.assertFalse(os.path.exists(path + '.part.ranges'))
+
+    def test_qemu_info_cached_until_image_changes(self):
+        self.stubs.Set(images, '_QEMU_IMG_INFO_CACHE',
+                       images.utils.ExpiringLRUCache(10, 60))
+        calls = []
+
+        def fake_execute(*cmd, **kwargs):
+            calls.append(cmd)
+            return 'virtual size: 1G (1073741824 bytes)\n', ''
+
+        self.stubs.Set(images.utils, 'execute', fake_execute)
+        path = self.useFixture(fixtures.TempDir()).path + '/disk'
+        with open(path, 'w') as f:
+            f.write('data')
+
+        for _i in range(2):
+            image_info = images.qemu_img_info(path, cached=True)
+            self.assertEqual(image_info.virtual_size, 1073741824)
+        self.assertEqual(len(calls), 1)
+
+        with open(path, 'a') as f:
+            f.write('more data')
+        images.qemu_img_info(path, cached=True)
+        self.assertEqual(len(calls), 2)
+
+        images.qemu_img_info(path)
+        self.assertEqual(len(calls), 3)
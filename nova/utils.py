@@ -19,6 +19,7 @@
 
 """Utilities and helper functions."""
 
+import collections
 import contextlib
 import datetime
 import functools
@@ -71,6 +72,12 @@ utils_opts = [
                default='month',
                help='time period to generate instance usages for.  '
                     'Time period must be hour, day, month or year'),
+    cfg.BoolOpt('instance_usage_rollups',
+                default=False,
+                help='Record per-project usage totals for each audit period '
+                     'when instance_usage_audit runs, and answer simple '
+                     'tenant usage summaries from them.  Works best with an '
+                     'hour or day instance_usage_audit_period'),
     cfg.StrOpt('rootwrap_config',
                default="/etc/nova/rootwrap.conf",
                help='Path to the rootwrap configuration file to use for '
@@ -976,6 +983,71 @@ class UndoManager(object):
             self._rollback()
 
 
+class ExpiringLRUCache(object):
+    """A cache of at most max_size items, each kept for at most ttl
+    seconds, dropping the least recently used items first.
+
+    Counts hits, misses and evictions, see stats().  If the cache has a
+    name, its stats are logged at debug level whenever an item is evicted.
+    """
+
+    def __init__(self, max_size, ttl, name=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.name = name
+        # key -> (expires, value), least recently used first
+        self._items = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key):
+        """Return the value cached for key, or None."""
+        try:
+            expires, value = self._items.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+        if expires <= timeutils.utcnow_ts():
+            self.misses += 1
+            return None
+        self._items[key] = (expires, value)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        """Cache value for key, evicting the least recently used items
+        if the cache is full.
+        """
+        self._items.pop(key, None)
+        self._items[key] = (timeutils.utcnow_ts() + self.ttl, value)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+            self.evictions += 1
+            if self.name:
+                LOG.debug(_('%(name)s cache full, evicted the least '
+                            'recently used item: %(stats)s'),
+                          {'name': self.name, 'stats': self.stats()})
+
+    def discard(self, key):
+        self._items.pop(key, None)
+
+    def clear(self):
+        self._items.clear()
+
+    def stats(self):
+        """Return the number of items cached, hits, misses and
+        evictions.
+        """
+        return {'size': len(self._items),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions}
+
+
 def mkfs(fs, path, label=None):
     """Format a file or block device
 
@@ -91,8 +91,15 @@ for s in CONF.virt_mkfs:
         _DEFAULT_MKFS_COMMAND = mkfs_command
 
 
+def get_mkfs_command(os_type):
+    """Return the mkfs command template ephemeral disks of os_type are
+    formatted with, or None if they are left unformatted.
+    """
+    return _MKFS_COMMAND.get(os_type, _DEFAULT_MKFS_COMMAND)
+
+
 def mkfs(os_type, fs_label, target):
-    mkfs_command = (_MKFS_COMMAND.get(os_type, _DEFAULT_MKFS_COMMAND) or
+    mkfs_command = (get_mkfs_command(os_type) or
                     '') % {'fs_label': fs_label, 'target': target}
     if mkfs_command:
         utils.execute(*mkfs_command.split(), run_as_root=True)
@@ -107,14 +114,15 @@ def resize2fs(image, check_exit_code=False, run_as_root=False):
                   run_as_root=run_as_root)
 
 
-def get_disk_size(path):
+def get_disk_size(path, cached=False):
     """Get the (virtual) size of a disk image
 
     :param path: Path to the disk image
+    :param cached: Reuse the qemu-img info of an unchanged image
     :returns: Size (in bytes) of the given disk image as it would be seen
               by a virtual machine.
     """
-    return images.qemu_img_info(path).virtual_size
+    return images.qemu_img_info(path, cached=cached).virtual_size
 
 
 def extend(image, size):
@@ -25,6 +25,7 @@ from nova import network
 from nova.network import linux_net
 from nova.openstack.common import importutils
 from nova.openstack.common import log as logging
+from nova.openstack.common import processutils
 from nova import utils
 from nova.virt import netutils
 
@@ -38,6 +39,12 @@ firewall_opts = [
     cfg.BoolOpt('allow_same_net_traffic',
                 default=True,
                 help='Whether to allow network traffic from same network'),
+    cfg.BoolOpt('firewall_use_ipsets',
+                default=False,
+                help='Match the members of a security group which another '
+                     'group grants access to with an ipset, instead of '
+                     'with an iptables rule per member. Needs the ipset '
+                     'tool and the iptables set match'),
 ]
 
 CONF = cfg.CONF
@@ -147,6 +154,9 @@ class FirewallDriver(object):
 class IptablesFirewallDriver(FirewallDriver):
     """Driver which enforces security groups through iptables rules."""
 
+    # Whether the ipsets can be managed where the iptables rules are
+    supports_ipsets = True
+
     def __init__(self, virtapi, **kwargs):
         super(IptablesFirewallDriver, self).__init__(virtapi)
         self.iptables = linux_net.iptables_manager
@@ -154,6 +164,18 @@ class IptablesFirewallDriver(FirewallDriver):
         self.network_infos = {}
         self.basically_filtered = False
 
+        # The members of each ipset, and the ipsets the rules of each
+        # instance use.
+        self.ipsets = {}
+        self.instance_ipsets = {}
+
+        # The rules generated for each security group used on this host,
+        # shared by all its instances, with the groups they grant access
+        # to, and the security groups the rules of each instance came from.
+        self.security_group_rules = {}
+        self.instance_security_groups = {}
+        self.security_group_invalidations = 0
+
         # Flags for DHCP request rule
         self.dhcp_create = False
         self.dhcp_created = False
@@ -185,6 +207,9 @@ class IptablesFirewallDriver(FirewallDriver):
             self.network_infos.pop(instance['id'])
             self.remove_filters_for_instance(instance)
             self.iptables.apply()
+            self.instance_security_groups.pop(instance['id'], None)
+            self._forget_unused_security_groups()
+            self.release_ipsets(instance)
         else:
             LOG.info(_('Attempted to unfilter instance which is not '
                      'filtered'), instance=instance)
@@ -346,6 +371,124 @@ class IptablesFirewallDriver(FirewallDriver):
                     '--dports', '%s:%s' % (rule['from_port'],
                                            rule['to_port'])]
 
+    @property
+    def use_ipsets(self):
+        return CONF.firewall_use_ipsets and self.supports_ipsets
+
+    @staticmethod
+    def _ipset_name(security_group_id, version):
+        return 'nova-sg-%s-v%d' % (security_group_id, version)
+
+    def _security_group_member_ips(self, ctxt, security_group, version):
+        # FIXME(jkoelker) This needs to be ported up into
+        #                 the compute manager which already
+        #                 has access to a nw_api handle,
+        #                 and should be the only one making
+        #                 making rpc calls.
+        nw_api = network.API()
+        capi = conductor.API()
+        ips = []
+        for instance in security_group['instances']:
+            nw_info = nw_api.get_instance_nw_info(ctxt, instance,
+                                                  conductor_api=capi)
+            ips += [ip['address'] for ip in nw_info.fixed_ips()
+                    if ip['version'] == version]
+            LOG.debug('ips: %r', ips, instance=instance)
+        return ips
+
+    def _update_ipset(self, name, version, ips):
+        """Make the ipset called name hold exactly ips.
+
+        The first time this process sees an ipset it is filled in a
+        temporary set which is then swapped in, so that rules already using
+        it keep working.  After that only the addresses which were added or
+        removed are changed.
+        """
+        ips = set(ips)
+        current = self.ipsets.get(name)
+        if current is None:
+            family = 'inet6' if version == 6 else 'inet'
+            new_name = '%s-new' % name
+            commands = ['create %s hash:ip family %s' % (name, family),
+                        'create %s hash:ip family %s' % (new_name, family),
+                        'flush %s' % new_name]
+            commands += ['add %s %s' % (new_name, ip) for ip in sorted(ips)]
+            commands += ['swap %s %s' % (new_name, name),
+                         'destroy %s' % new_name]
+        else:
+            commands = ['add %s %s' % (name, ip)
+                        for ip in sorted(ips - current)]
+            commands += ['del %s %s' % (name, ip)
+                         for ip in sorted(current - ips)]
+        if commands:
+            utils.execute('ipset', 'restore', '-exist',
+                          process_input='\n'.join(commands) + '\n',
+                          run_as_root=True)
+        self.ipsets[name] = ips
+
+    def _grantee_group_ipset(self, ctxt, rule, version):
+        grantee_group = rule['grantee_group']
+        name = self._ipset_name(grantee_group['id'], version)
+        ips = self._security_group_member_ips(ctxt, grantee_group, version)
+        self._update_ipset(name, version, ips)
+        return name
+
+    def release_ipsets(self, instance):
+        """Destroy the ipsets no longer used once the rules of an
+        unfiltered instance have been removed.
+        """
+        self.instance_ipsets.pop(instance['id'], None)
+        used = set()
+        for names in self.instance_ipsets.values():
+            used |= names
+        for name in set(self.ipsets) - used:
+            try:
+                utils.execute('ipset', 'destroy', name, run_as_root=True)
+            except processutils.ProcessExecutionError:
+                LOG.warn(_('Could not destroy ipset %s'), name)
+                continue
+            del self.ipsets[name]
+
+    def refresh_ipsets(self, security_group_id):
+        """Bring the ipsets of a security group up to date with its
+        members.
+
+        The members are read through the rules of the security groups on
+        this host granting access to the group.  The instances of granting
+        groups whose rules no longer refer to the group get their rules
+        rebuilt.
+        """
+        parents = [generated[4] for generated
+                   in self.security_group_rules.values()
+                   if security_group_id in generated[3]]
+        if not parents:
+            # None of the rules on this host refer to the group
+            return
+        ctxt = context.get_admin_context()
+        grantee_group = None
+        stale = set()
+        for parent in parents:
+            rules = self._virtapi.security_group_rule_get_by_security_group(
+                ctxt, parent)
+            grants = [rule['grantee_group'] for rule in rules
+                      if rule['grantee_group'] and
+                      rule['grantee_group']['id'] == security_group_id]
+            if not grants:
+                stale.add(parent['id'])
+            elif grantee_group is None:
+                grantee_group = grants[0]
+        if grantee_group is not None:
+            for version in (4, 6):
+                name = self._ipset_name(security_group_id, version)
+                if name in self.ipsets:
+                    ips = self._security_group_member_ips(
+                        ctxt, grantee_group, version)
+                    self._update_ipset(name, version, ips)
+        if stale:
+            for parent_id in stale:
+                self.do_refresh_security_group_rules(parent_id)
+            self.iptables.apply()
+
     def instance_rules(self, instance, network_info):
         # make sure this is legacy nw_info
         network_info = self._handle_network_info_model(network_info)
@@ -373,82 +516,144 @@ class IptablesFirewallDriver(FirewallDriver):
 
         security_groups = self._virtapi.security_group_get_by_instance(
             ctxt, instance)
+        ipsets = set()
 
         # then, security group chains and rules
         for security_group in security_groups:
-            rules = self._virtapi.security_group_rule_get_by_security_group(
-                ctxt, security_group)
+            group_ipv4_rules, group_ipv6_rules, group_ipsets = (
+                self._security_group_rules(ctxt, security_group))
+            ipv4_rules += group_ipv4_rules
+            ipv6_rules += group_ipv6_rules
+            ipsets |= group_ipsets
 
-            for rule in rules:
-                LOG.debug(_('Adding security group rule: %r'), rule,
-                          instance=instance)
+        ipv4_rules += ['-j $sg-fallback']
+        ipv6_rules += ['-j $sg-fallback']
 
-                if not rule['cidr']:
-                    version = 4
-                else:
-                    version = netutils.get_ip_version(rule['cidr'])
+        if ipsets or instance['id'] in self.instance_ipsets:
+            self.instance_ipsets[instance['id']] = ipsets
+        self.instance_security_groups[instance['id']] = set(
+            security_group['id'] for security_group in security_groups)
+        self._forget_unused_security_groups()
 
-                if version == 4:
-                    fw_rules = ipv4_rules
-                else:
-                    fw_rules = ipv6_rules
+        return ipv4_rules, ipv6_rules
 
-                protocol = rule['protocol']
+    def _security_group_rules(self, ctxt, security_group):
+        """Return the ipv4 and ipv6 rules a security group adds to the
+        chains of its instances, and the ipsets they use.
 
-                if protocol:
-                    protocol = rule['protocol'].lower()
+        The rules are generated once and shared by every instance in the
+        group, until the group is forgotten by a refresh or because no
+        instance on this host uses it any more.
+        """
+        cached = self.security_group_rules.get(security_group['id'])
+        if cached is not None:
+            return cached[:3]
 
-                if version == 6 and protocol == 'icmp':
-                    protocol = 'icmpv6'
+        invalidations = self.security_group_invalidations
+        ipv4_rules = []
+        ipv6_rules = []
+        ipsets = set()
+        grantee_ids = set()
+        member_ips = {}
 
-                args = ['-j ACCEPT']
-                if protocol:
-                    args += ['-p', protocol]
+        rules = self._virtapi.security_group_rule_get_by_security_group(
+            ctxt, security_group)
 
-                if protocol in ['udp', 'tcp']:
-                    args += self._build_tcp_udp_rule(rule, version)
-                elif protocol == 'icmp':
-                    args += self._build_icmp_rule(rule, version)
-                if rule['cidr']:
-                    LOG.debug('Using cidr %r', rule['cidr'], instance=instance)
-                    args += ['-s', rule['cidr']]
-                    fw_rules += [' '.join(args)]
-                else:
-                    if rule['grantee_group']:
-                        # FIXME(jkoelker) This needs to be ported up into
-                        #                 the compute manager which already
-                        #                 has access to a nw_api handle,
-                        #                 and should be the only one making
-                        #                 making rpc calls.
-                        nw_api = network.API()
-                        capi = conductor.API()
-                        for instance in rule['grantee_group']['instances']:
-                            nw_info = nw_api.get_instance_nw_info(
-                                ctxt,
-                                instance,
-                                conductor_api=capi)
-
-                            ips = [ip['address']
-                                for ip in nw_info.fixed_ips()
-                                    if ip['version'] == version]
-
-                            LOG.debug('ips: %r', ips, instance=instance)
-                            for ip in ips:
-                                subrule = args + ['-s %s' % ip]
-                                fw_rules += [' '.join(subrule)]
-
-                LOG.debug('Using fw_rules: %r', fw_rules, instance=instance)
+        for rule in rules:
+            LOG.debug(_('Adding security group rule: %r'), rule)
 
-        ipv4_rules += ['-j $sg-fallback']
-        ipv6_rules += ['-j $sg-fallback']
+            if not rule['cidr']:
+                version = 4
+            else:
+                version = netutils.get_ip_version(rule['cidr'])
 
-        return ipv4_rules, ipv6_rules
+            if version == 4:
+                fw_rules = ipv4_rules
+            else:
+                fw_rules = ipv6_rules
+
+            protocol = rule['protocol']
+
+            if protocol:
+                protocol = rule['protocol'].lower()
+
+            if version == 6 and protocol == 'icmp':
+                protocol = 'icmpv6'
+
+            args = ['-j ACCEPT']
+            if protocol:
+                args += ['-p', protocol]
+
+            if protocol in ['udp', 'tcp']:
+                args += self._build_tcp_udp_rule(rule, version)
+            elif protocol == 'icmp':
+                args += self._build_icmp_rule(rule, version)
+            if rule['cidr']:
+                LOG.debug('Using cidr %r', rule['cidr'])
+                args += ['-s', rule['cidr']]
+                fw_rules += [' '.join(args)]
+            elif rule['grantee_group'] and self.use_ipsets:
+                grantee_ids.add(rule['grantee_group']['id'])
+                name = self._grantee_group_ipset(ctxt, rule, version)
+                ipsets.add(name)
+                subrule = args + ['-m set --match-set %s src' % name]
+                fw_rules += [' '.join(subrule)]
+            elif rule['grantee_group']:
+                grantee_group = rule['grantee_group']
+                grantee_ids.add(grantee_group['id'])
+                key = (grantee_group['id'], version)
+                if key not in member_ips:
+                    member_ips[key] = self._security_group_member_ips(
+                        ctxt, grantee_group, version)
+                for ip in member_ips[key]:
+                    subrule = args + ['-s %s' % ip]
+                    fw_rules += [' '.join(subrule)]
+
+            LOG.debug('Using fw_rules: %r', fw_rules)
+
+        generated = (ipv4_rules, ipv6_rules, ipsets, grantee_ids,
+                     security_group)
+        # A refresh while the rules were being fetched may have made them
+        # stale already.
+        if invalidations == self.security_group_invalidations:
+            self.security_group_rules[security_group['id']] = generated
+        return generated[:3]
+
+    def _forget_security_group(self, security_group_id, members=False):
+        """Drop the cached rules of a security group, or with members the
+        cached rules of the groups granting access to its members.
+
+        :returns: the ids of the security groups whose rules were dropped
+        """
+        self.security_group_invalidations += 1
+        if members:
+            forgotten = set(group_id for group_id, generated
+                            in self.security_group_rules.items()
+                            if security_group_id in generated[3])
+        else:
+            forgotten = set([security_group_id])
+        for group_id in forgotten:
+            self.security_group_rules.pop(group_id, None)
+        return forgotten
+
+    def _forget_unused_security_groups(self):
+        # Refreshes are only sent to hosts with instances in the group, so
+        # the rules of a group no instance here uses could become stale.
+        used = set()
+        for group_ids in self.instance_security_groups.values():
+            used |= group_ids
+        for group_id in set(self.security_group_rules) - used:
+            del self.security_group_rules[group_id]
 
     def instance_filter_exists(self, instance, network_info):
         pass
 
     def refresh_security_group_members(self, security_group):
-        self.do_refresh_security_group_rules(security_group)
+        if self.use_ipsets:
+            self.refresh_ipsets(security_group)
+            return
+        forgotten = self._forget_security_group(security_group, members=True)
+        self._refresh_instances_in_security_groups(forgotten)
         self.iptables.apply()
 
     def refresh_security_group_rules(self, security_group):
@@ -466,7 +671,15 @@ class IptablesFirewallDriver(FirewallDriver):
         self.add_filters_for_instance(instance, ipv4_rules, ipv6_rules)
 
     def do_refresh_security_group_rules(self, security_group):
+        forgotten = self._forget_security_group(security_group)
+        self._refresh_instances_in_security_groups(forgotten)
+
+    def _refresh_instances_in_security_groups(self, security_group_ids):
         for instance in self.instances.values():
+            group_ids = self.instance_security_groups.get(instance['id'])
+            if group_ids is not None and not group_ids & security_group_ids:
+                # None of the rules of the instance changed
+                continue
             network_info = self.network_infos[instance['id']]
             ipv4_rules, ipv6_rules = self.instance_rules(instance,
                                                          network_info)
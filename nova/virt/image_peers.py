@@ -0,0 +1,318 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Sharing of cached images between compute nodes.
+
+Each compute node serves the complete images in its image cache directory
+over HTTP.  Before an image is fetched from glance, the compute nodes
+known to hold it, and then other compute nodes which are up, are asked
+for it in turn, so that booting many instances of a new image does not
+pull the whole image from glance once per compute node.
+"""
+
+import hashlib
+import hmac
+import httplib
+import os
+import random
+import re
+import socket
+
+from oslo.config import cfg
+import webob.dec
+import webob.exc
+
+from nova import exception
+from nova.openstack.common import fileutils
+from nova.openstack.common import log as logging
+from nova.openstack.common import timeutils
+from nova import servicegroup
+from nova import utils
+from nova import wsgi
+
+image_peers_opts = [
+    cfg.BoolOpt('image_peers_enabled',
+                default=False,
+                help='Serve the images cached on this compute node to '
+                     'other compute nodes, and fetch images from them '
+                     'before falling back to glance'),
+    cfg.StrOpt('image_peers_listen',
+               default='$my_ip',
+               help='IP address the cached images are served on. Images '
+                    'are served to anyone who can reach it, so it should '
+                    'be on a network only the compute nodes can use'),
+    cfg.IntOpt('image_peers_port',
+               default=8780,
+               help='Port the cached images are served on, the same on '
+                    'every compute node'),
+    cfg.StrOpt('image_peers_shared_secret',
+               default='',
+               help='Secret the requests for cached images are signed '
+                    'with, the same on every compute node. Must be set '
+                    'when image_peers_enabled is. Signed requests expire '
+                    'after a minute, so the clocks of the compute nodes '
+                    'have to be in sync'),
+    cfg.IntOpt('image_peers_max_tries',
+               default=8,
+               help='Maximum number of compute nodes asked for an image '
+                    'before it is fetched from glance'),
+    cfg.IntOpt('image_peers_timeout',
+               default=10,
+               help='Seconds to wait for another compute node to answer'),
+    cfg.IntOpt('image_peers_max_time',
+               default=20,
+               help='Maximum number of seconds spent asking other compute '
+                    'nodes for an image before it is fetched from glance. '
+                    'A transfer which has started is not interrupted'),
+    cfg.IntOpt('image_peers_registry_time',
+               default=600,
+               help='Number of seconds to remember which compute nodes '
+                    'hold an image'),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(image_peers_opts)
+CONF.import_opt('compute_topic', 'nova.compute.rpcapi')
+CONF.import_opt('host', 'nova.netconf')
+CONF.import_opt('my_ip', 'nova.netconf')
+
+LOG = logging.getLogger(__name__)
+
+# Only the names the image cache gives the images it fetches are served,
+# files being written or converted have a suffix.
+_NAME_RE = re.compile('^[0-9a-f]{40}$')
+_CHUNK_SIZE = 64 * 1024
+# Seconds a signed request is accepted for, so that a signature seen on
+# the network can not be used to fetch the image for long.
+_SIGNATURE_TTL = 60
+
+_REGISTRY = None
+_SERVER = None
+
+
+def _sign(name, expires):
+    return hmac.new(CONF.image_peers_shared_secret,
+                    '%s:%d' % (name, expires), hashlib.sha256).hexdigest()
+
+
+def _signature_headers(name):
+    expires = timeutils.utcnow_ts() + _SIGNATURE_TTL
+    return {'X-Image-Expires': str(expires),
+            'X-Image-Signature': _sign(name, expires)}
+
+
+def _equal_signatures(a, b):
+    """Compare two signatures in a time which does not depend on how much
+    of them matches.
+    """
+    if len(a) != len(b):
+        return False
+    result = 0
+    for x, y in zip(a, b):
+        result |= ord(x) ^ ord(y)
+    return result == 0
+
+
+def _file_iter(f):
+    try:
+        while True:
+            chunk = f.read(_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        f.close()
+
+
+class ImageCacheApp(object):
+    """Serves the complete images in an image cache directory."""
+
+    def __init__(self, base_dir):
+        self.base_dir = base_dir
+
+    @webob.dec.wsgify
+    def __call__(self, req):
+        if req.method not in ('GET', 'HEAD'):
+            raise webob.exc.HTTPMethodNotAllowed()
+
+        name = req.path_info.strip('/')
+        if not _NAME_RE.match(name):
+            raise webob.exc.HTTPNotFound()
+
+        try:
+            expires = int(req.headers.get('X-Image-Expires', ''))
+        except ValueError:
+            expires = 0
+        signature = req.headers.get('X-Image-Signature', '')
+        if (expires < timeutils.utcnow_ts() or
+                not _equal_signatures(signature, _sign(name, expires))):
+            LOG.warn(_('Invalid signature for cached image %(name)s '
+                       'requested by %(remote_addr)s'),
+                     {'name': name, 'remote_addr': req.remote_addr})
+            raise webob.exc.HTTPForbidden()
+
+        try:
+            f = open(os.path.join(self.base_dir, name), 'rb')
+        except IOError:
+            raise webob.exc.HTTPNotFound()
+
+        size = os.fstat(f.fileno()).st_size
+        if req.method == 'HEAD':
+            f.close()
+            app_iter = []
+        else:
+            app_iter = _file_iter(f)
+        return webob.Response(app_iter=app_iter,
+                              content_length=size,
+                              content_type='application/octet-stream')
+
+
+def start_server(base_dir):
+    """Start serving the images in base_dir to other compute nodes."""
+    global _SERVER
+    if not CONF.image_peers_shared_secret:
+        raise exception.NovaException(
+            _('image_peers_shared_secret must be set to serve cached '
+              'images to other compute nodes'))
+    if _SERVER is None:
+        _SERVER = wsgi.Server('nova-image-peers', ImageCacheApp(base_dir),
+                              host=CONF.image_peers_listen,
+                              port=CONF.image_peers_port)
+        _SERVER.start()
+    return _SERVER
+
+
+class PeerRegistry(object):
+    """Remembers which compute nodes are known to hold which images."""
+
+    def __init__(self):
+        self._holders = utils.ExpiringLRUCache(
+            1000, CONF.image_peers_registry_time)
+        self.servicegroup_api = servicegroup.API()
+
+    def add(self, name, host):
+        holders = self._holders.get(name) or []
+        if host not in holders:
+            self._holders.set(name, holders + [host])
+
+    def discard(self, name, host):
+        holders = self._holders.get(name)
+        if holders and host in holders:
+            self._holders.set(name, [h for h in holders if h != host])
+
+    def candidates(self, name):
+        """Return the compute nodes to ask for an image, the ones known to
+        hold it first and then others which are up, in random order.
+        """
+        holders = list(self._holders.get(name) or [])
+        others = [host for host in
+                  self.servicegroup_api.get_all(CONF.compute_topic)
+                  if host not in holders]
+        random.shuffle(holders)
+        random.shuffle(others)
+        return [host for host in holders + others
+                if host != CONF.host][:CONF.image_peers_max_tries]
+
+
+def _get_registry():
+    global _REGISTRY
+    if _REGISTRY is None:
+        _REGISTRY = PeerRegistry()
+    return _REGISTRY
+
+
+def _fetch_from(host, name, dst_path, checksum, timeout):
+    """Fetch an image from one compute node, returning False if it does
+    not hold it.
+    """
+    conn = httplib.HTTPConnection(host, CONF.image_peers_port,
+                                  timeout=timeout)
+    try:
+        conn.request('GET', '/%s' % name, headers=_signature_headers(name))
+        resp = conn.getresponse()
+        if resp.status != httplib.OK:
+            return False
+
+        expected = int(resp.getheader('content-length', -1))
+        written = 0
+        md5 = hashlib.md5()
+        with open(dst_path, 'wb') as f:
+            while True:
+                chunk = resp.read(_CHUNK_SIZE)
+                if not chunk:
+                    break
+                f.write(chunk)
+                md5.update(chunk)
+                written += len(chunk)
+        if written != expected:
+            raise IOError(_('Expected %(expected)d bytes, got %(written)d') %
+                          {'expected': expected, 'written': written})
+        if md5.hexdigest() != checksum:
+            raise IOError(_('Expected checksum %(expected)s, got '
+                            '%(actual)s') %
+                          {'expected': checksum, 'actual': md5.hexdigest()})
+        return True
+    finally:
+        conn.close()
+
+
+def fetch(name, dst_path, checksum):
+    """Fetch the image the image cache calls name from another compute
+    node into dst_path.
+
+    The image is fetched into a file of its own, and only replaces
+    dst_path once it is complete and matches checksum, so a partial
+    download already in dst_path is kept if no compute node has the image.
+
+    :param checksum: the MD5 checksum glance has for the image, which the
+                     image from the other compute node has to match.
+    :returns: True if another compute node had the image, False if it has
+              to be fetched from glance.
+    """
+    if not CONF.image_peers_shared_secret:
+        LOG.warn(_('image_peers_shared_secret is not set, not fetching '
+                   'cached images from other compute nodes'))
+        return False
+
+    registry = _get_registry()
+    peer_path = '%s.peer' % dst_path
+    started = timeutils.utcnow()
+    for host in registry.candidates(name):
+        remaining = CONF.image_peers_max_time - timeutils.delta_seconds(
+            started, timeutils.utcnow())
+        if remaining <= 0:
+            LOG.info(_('Gave up fetching cached image %s from other '
+                       'compute nodes'), name)
+            break
+        try:
+            found = _fetch_from(host, name, peer_path, checksum,
+                                min(CONF.image_peers_timeout, remaining))
+        except (IOError, socket.error, httplib.HTTPException) as e:
+            LOG.warn(_('Failed to fetch cached image %(name)s from '
+                       '%(host)s: %(error)s'),
+                     {'name': name, 'host': host, 'error': e})
+            fileutils.delete_if_exists(peer_path)
+            found = False
+
+        if found:
+            os.rename(peer_path, dst_path)
+            LOG.info(_('Fetched cached image %(name)s from %(host)s'),
+                     {'name': name, 'host': host})
+            registry.add(name, host)
+            return True
+        registry.discard(name, host)
+    return False
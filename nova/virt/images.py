@@ -23,15 +23,18 @@ Handling of VM disk images.
 
 import os
 import re
+import socket
 
 from oslo.config import cfg
 
 from nova import exception
 from nova.image import glance
+from nova.openstack.common import excutils
 from nova.openstack.common import fileutils
 from nova.openstack.common import log as logging
 from nova.openstack.common import strutils
 from nova import utils
+from nova.virt import image_peers
 
 LOG = logging.getLogger(__name__)
 
@@ -43,6 +46,12 @@ image_opts = [
 
 CONF = cfg.CONF
 CONF.register_opts(image_opts)
+CONF.import_opt('glance_download_parallelism', 'nova.image.glance')
+CONF.import_opt('image_peers_enabled', 'nova.virt.image_peers')
+
+# The qemu-img info of the disks looked at periodically, with the size and
+# modification time of each disk when qemu-img was run, keyed by path.
+_QEMU_IMG_INFO_CACHE = utils.ExpiringLRUCache(4096, 24 * 60 * 60)
 
 
 class QemuImgInfo(object):
@@ -162,8 +171,25 @@ class QemuImgInfo(object):
         return contents
 
 
-def qemu_img_info(path):
-    """Return an object containing the parsed output from qemu-img info."""
+def qemu_img_info(path, cached=False):
+    """Return an object containing the parsed output from qemu-img info.
+
+    With cached, qemu-img is only run again once the size or modification
+    time of path changed.
+    """
+    if cached:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return qemu_img_info(path)
+        key = (st.st_size, st.st_mtime)
+        hit = _QEMU_IMG_INFO_CACHE.get(path)
+        if hit is not None and hit[0] == key:
+            return hit[1]
+        info = qemu_img_info(path)
+        _QEMU_IMG_INFO_CACHE.set(path, (key, info))
+        return info
+
     if not os.path.exists(path):
         return QemuImgInfo()
 
@@ -185,14 +211,52 @@ def fetch(context, image_href, path, _user_id, _project_id):
     #             checked before we got here.
     (image_service, image_id) = glance.get_remote_image_service(context,
                                                                 image_href)
+    if CONF.glance_download_parallelism > 1:
+        # Ranged downloads keep what they have written if glance could not
+        # be reached, so that fetching the image to the same path again
+        # resumes it.  Other errors leave nothing worth resuming.
+        try:
+            image_service.download(context, image_id, dst_path=path)
+        except (exception.GlanceConnectionFailed, IOError, socket.error):
+            raise
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                fileutils.delete_if_exists(path)
+                glance.discard_partial_download(path)
+        return
     with fileutils.remove_path_on_error(path):
-        with open(path, "wb") as image_file:
-            image_service.download(context, image_id, image_file)
+        image_service.download(context, image_id, dst_path=path)
+
+
+def _fetch_from_peers(context, image_href, path, path_tmp):
+    """Fetch an image from another compute node which has it cached.
+
+    Only images which are cached as glance has them can be checked
+    against its checksum, so images other compute nodes have converted
+    to raw are always fetched from glance.
+    """
+    (image_service, image_id) = glance.get_remote_image_service(context,
+                                                                image_href)
+    image_meta = image_service.show(context, image_id)
+    if not image_meta.get('checksum'):
+        return False
+    if CONF.force_raw_images and image_meta.get('disk_format') != 'raw':
+        return False
+    return image_peers.fetch(os.path.basename(path), path_tmp,
+                             image_meta['checksum'])
 
 
 def fetch_to_raw(context, image_href, path, user_id, project_id):
     path_tmp = "%s.part" % path
-    fetch(context, image_href, path_tmp, user_id, project_id)
+    # Another compute node which has the image cached already has checked
+    # it the same way, but it is checked again below.
+    if (CONF.image_peers_enabled and
+            _fetch_from_peers(context, image_href, path, path_tmp)):
+        # The image replaced what an earlier download from glance had
+        # written to path_tmp.
+        glance.discard_partial_download(path_tmp)
+    else:
+        fetch(context, image_href, path_tmp, user_id, project_id)
 
     with fileutils.remove_path_on_error(path_tmp):
         data = qemu_img_info(path_tmp)
@@ -44,6 +44,7 @@ import errno
 import eventlet
 import functools
 import glob
+import hashlib
 import os
 import shutil
 import socket
@@ -86,6 +87,7 @@ from nova.virt.disk import api as disk
 from nova.virt import driver
 from nova.virt import event as virtevent
 from nova.virt import firewall
+from nova.virt import image_peers
 from nova.virt.libvirt import blockinfo
 from nova.virt.libvirt import config as vconfig
 from nova.virt.libvirt import firewall as libvirt_firewall
@@ -216,6 +218,16 @@ libvirt_opts = [
                 default=None,
                 help='Which pcpus can be used by vcpus of instance '
                      'e.g: "4-12,^8,15"'),
+    cfg.BoolOpt('libvirt_parallel_image_creation',
+                default=True,
+                help='Create the disks of an instance, fetch its kernel '
+                     'and ramdisk and build its config drive at the same '
+                     'time, instead of one after another'),
+    cfg.IntOpt('libvirt_domain_stats_max_age',
+               default=10,
+               help='Number of seconds the usage counters collected from '
+                    'all domains are reused for by the usage polls, 0 to '
+                    'collect them again for every poll'),
     ]
 
 CONF = cfg.CONF
@@ -227,6 +239,8 @@ CONF.import_opt('use_cow_images', 'nova.virt.driver')
 CONF.import_opt('live_migration_retry_count', 'nova.compute.manager')
 CONF.import_opt('vncserver_proxyclient_address', 'nova.vnc')
 CONF.import_opt('server_proxyclient_address', 'nova.spice', group='spice')
+CONF.import_opt('base_dir_name', 'nova.virt.libvirt.imagecache')
+CONF.import_opt('image_peers_enabled', 'nova.virt.image_peers')
 
 DEFAULT_FIREWALL_DRIVER = "%s.%s" % (
     libvirt_firewall.__name__,
@@ -332,6 +346,7 @@ class LibvirtDriver(driver.ComputeDriver):
 
         self._host_state = None
         self._event_queue = None
+        self._domain_stats = DomainStats(self)
 
         self._disk_cachemode = None
         self.image_cache_manager = imagecache.ImageCacheManager()
@@ -571,6 +586,10 @@ class LibvirtDriver(driver.ComputeDriver):
 
         self._init_events()
 
+        if CONF.image_peers_enabled:
+            image_peers.start_server(os.path.join(CONF.instances_path,
+                                                  CONF.base_dir_name))
+
     def _get_connection(self):
         with self._wrapped_conn_lock:
             wrapped_conn = self._wrapped_conn
@@ -1033,6 +1052,7 @@ class LibvirtDriver(driver.ComputeDriver):
             if state == power_state.RUNNING:
                 flags |= libvirt.VIR_DOMAIN_AFFECT_LIVE
             virt_dom.attachDeviceFlags(conf.to_xml(), flags)
+            self._domain_stats.forget_devices(instance['uuid'])
         except Exception as ex:
             if isinstance(ex, libvirt.libvirtError):
                 errcode = ex.get_error_code()
@@ -1091,6 +1111,7 @@ class LibvirtDriver(driver.ComputeDriver):
                 if state == power_state.RUNNING:
                     flags |= libvirt.VIR_DOMAIN_AFFECT_LIVE
                 virt_dom.detachDeviceFlags(xml, flags)
+                self._domain_stats.forget_devices(instance['uuid'])
         except libvirt.libvirtError as ex:
             # NOTE(vish): This is called to cleanup volumes after live
             #             migration, so we should still disconnect even if
@@ -1121,6 +1142,7 @@ class LibvirtDriver(driver.ComputeDriver):
                 if state == power_state.RUNNING:
                     flags |= libvirt.VIR_DOMAIN_AFFECT_LIVE
                 virt_dom.attachDeviceFlags(cfg.to_xml(), flags)
+                self._domain_stats.forget_devices(instance['uuid'])
             except libvirt.libvirtError:
                 LOG.error(_('attaching network adapter failed.'),
                          instance=instance)
@@ -1139,6 +1161,7 @@ class LibvirtDriver(driver.ComputeDriver):
                 if state == power_state.RUNNING:
                     flags |= libvirt.VIR_DOMAIN_AFFECT_LIVE
                 virt_dom.detachDeviceFlags(cfg.to_xml(), flags)
+                self._domain_stats.forget_devices(instance['uuid'])
             except libvirt.libvirtError as ex:
                 error_code = ex.get_error_code()
                 if error_code == libvirt.VIR_ERR_NO_DOMAIN:
@@ -1234,6 +1257,25 @@ class LibvirtDriver(driver.ComputeDriver):
         if state == power_state.SHUTDOWN:
             live_snapshot = False
 
+            # Nothing writes to the disk of an instance which is shut down,
+            # so a disk already in the format of the image is streamed to
+            # the image service as it is, without extracting a copy first.
+            # Compressed qcow2 snapshots still need qemu-img to write them.
+            compress = (CONF.libvirt_snapshot_compression and
+                        image_format == 'qcow2')
+            if (image_format == source_format and not compress and
+                    self._is_uploadable_disk(disk_path, source_format)):
+                LOG.info(_("Beginning snapshot upload from instance disk"),
+                         instance=instance)
+                update_task_state(
+                    task_state=task_states.IMAGE_PENDING_UPLOAD)
+                update_task_state(
+                    task_state=task_states.IMAGE_UPLOADING,
+                    expected_state=task_states.IMAGE_PENDING_UPLOAD)
+                self._upload_snapshot(context, instance, image_service,
+                                      image_href, metadata, disk_path)
+                return
+
         # NOTE(dkang): managedSave does not work for LXC
         if CONF.libvirt_type != 'lxc' and not live_snapshot:
             if state == power_state.RUNNING or state == power_state.PAUSED:
@@ -1283,13 +1325,34 @@ class LibvirtDriver(driver.ComputeDriver):
 
             update_task_state(task_state=task_states.IMAGE_UPLOADING,
                      expected_state=task_states.IMAGE_PENDING_UPLOAD)
-            with libvirt_utils.file_open(out_path) as image_file:
-                image_service.update(context,
-                                     image_href,
-                                     metadata,
-                                     image_file)
-                LOG.info(_("Snapshot image upload complete"),
-                         instance=instance)
+            self._upload_snapshot(context, instance, image_service,
+                                  image_href, metadata, out_path)
+
+    @staticmethod
+    def _is_uploadable_disk(disk_path, disk_format):
+        """Check whether a disk can be uploaded as an image as it is.
+
+        That is a raw file, or a qcow2 file which has no backing file.
+        """
+        if disk_format == 'raw':
+            return True
+        if disk_format == 'qcow2':
+            return libvirt_utils.get_disk_backing_file(disk_path) is None
+        return False
+
+    @staticmethod
+    def _upload_snapshot(context, instance, image_service, image_href,
+                         metadata, path):
+        """Upload a snapshot to the image service, which reads it in
+        chunks.
+        """
+        with libvirt_utils.file_open(path) as image_file:
+            image_service.update(context,
+                                 image_href,
+                                 metadata,
+                                 image_file)
+            LOG.info(_("Snapshot image upload complete"),
+                     instance=instance)
 
     def _live_snapshot(self, domain, disk_path, out_path, image_format):
         """Snapshot an instance without downtime."""
@@ -1582,23 +1645,34 @@ class LibvirtDriver(driver.ComputeDriver):
     # for xenapi(tr3buchet)
     def spawn(self, context, instance, image_meta, injected_files,
               admin_password, network_info=None, block_device_info=None):
+        timings = []
+        started_at = time.time()
         disk_info = blockinfo.get_disk_info(CONF.libvirt_type,
                                             instance,
                                             block_device_info,
                                             image_meta)
+        image_timings = []
         self._create_image(context, instance,
                            disk_info['mapping'],
                            network_info=network_info,
                            block_device_info=block_device_info,
                            files=injected_files,
-                           admin_pass=admin_password)
+                           admin_pass=admin_password,
+                           timings=image_timings)
+        timings.append(('create_image', time.time() - started_at))
+        timings.extend(image_timings)
+
+        stage_started_at = time.time()
         xml = self.to_xml(instance, network_info,
                           disk_info, image_meta,
                           block_device_info=block_device_info,
                           write_to_disk=True)
+        timings.append(('to_xml', time.time() - stage_started_at))
 
+        stage_started_at = time.time()
         self._create_domain_and_network(xml, instance, network_info,
                                         block_device_info)
+        timings.append(('create_domain', time.time() - stage_started_at))
         LOG.debug(_("Instance is running"), instance=instance)
 
         def _wait_for_boot():
@@ -1610,8 +1684,16 @@ class LibvirtDriver(driver.ComputeDriver):
                          instance=instance)
                 raise loopingcall.LoopingCallDone()
 
+        stage_started_at = time.time()
         timer = loopingcall.FixedIntervalLoopingCall(_wait_for_boot)
         timer.start(interval=0.5).wait()
+        timings.append(('wait_for_boot', time.time() - stage_started_at))
+
+        LOG.info(_('Spawned in %(total).2fs: %(stages)s'),
+                 {'total': time.time() - started_at,
+                  'stages': ', '.join('%s %.2fs' % timing
+                                      for timing in timings)},
+                 instance=instance)
 
     def _flush_libvirt_console(self, pty):
         out, err = utils.execute('dd',
@@ -1786,6 +1868,21 @@ class LibvirtDriver(driver.ComputeDriver):
         self._create_local(target, ephemeral_size)
         disk.mkfs(os_type, fs_label, target)
 
+    @staticmethod
+    def _get_ephemeral_template_name(size, fs_label, os_type):
+        """Return the name of the template in the image cache an ephemeral
+        disk is made from.
+
+        The name holds the size, os type and label of the disk and a hash
+        of the commands formatting it, so a template is only reused for the
+        disks it would have been made for.
+        """
+        fs_commands = '%s\n%s' % (CONF.default_ephemeral_format or '',
+                                  disk.get_mkfs_command(os_type) or '')
+        return 'ephemeral_%s_%s_%s_%s' % (
+            size, os_type or 'default',
+            hashlib.sha1(fs_commands).hexdigest()[:7], fs_label)
+
     @staticmethod
     def _create_swap(target, swap_mb):
         """Create a swap file of specified size."""
@@ -1805,7 +1902,13 @@ class LibvirtDriver(driver.ComputeDriver):
     def _create_image(self, context, instance,
                       disk_mapping, suffix='',
                       disk_images=None, network_info=None,
-                      block_device_info=None, files=None, admin_pass=None):
+                      block_device_info=None, files=None, admin_pass=None,
+                      timings=None):
+        """Create the disks of an instance.
+
+        :param timings: A list the (name, seconds) each stage of creating
+                        the disks took are appended to
+        """
         if not suffix:
             suffix = ''
 
@@ -1843,7 +1946,10 @@ class LibvirtDriver(driver.ComputeDriver):
                            'kernel_id': instance['kernel_id'],
                            'ramdisk_id': instance['ramdisk_id']}
 
-        if disk_images['kernel_id']:
+        # Each stage is (name, function, names of the stages it needs)
+        stages = []
+
+        def create_kernel():
             fname = imagecache.get_cache_fname(disk_images, 'kernel_id')
             raw('kernel').cache(fetch_func=libvirt_utils.fetch_image,
                                 context=context,
@@ -1860,12 +1966,12 @@ class LibvirtDriver(driver.ComputeDriver):
                                      user_id=instance['user_id'],
                                      project_id=instance['project_id'])
 
+        if disk_images['kernel_id']:
+            stages.append(('kernel', create_kernel, ()))
+
         inst_type = flavors.extract_flavor(instance)
 
-        # NOTE(ndipanov): Even if disk_mapping was passed in, which
-        # currently happens only on rescue - we still don't want to
-        # create a base image.
-        if not booted_from_volume:
+        def create_root():
             root_fname = imagecache.get_cache_fname(disk_images, 'image_id')
             size = instance['root_gb'] * 1024 * 1024 * 1024
 
@@ -1880,34 +1986,44 @@ class LibvirtDriver(driver.ComputeDriver):
                                 user_id=instance['user_id'],
                                 project_id=instance['project_id'])
 
-        # Lookup the filesystem type if required
-        os_type_with_default = instance['os_type']
-        if not os_type_with_default:
-            os_type_with_default = 'default'
+        # NOTE(ndipanov): Even if disk_mapping was passed in, which
+        # currently happens only on rescue - we still don't want to
+        # create a base image.
+        if not booted_from_volume:
+            stages.append(('root', create_root, ()))
 
         ephemeral_gb = instance['ephemeral_gb']
         if 'disk.local' in disk_mapping:
             fn = functools.partial(self._create_ephemeral,
                                    fs_label='ephemeral0',
                                    os_type=instance["os_type"])
-            fname = "ephemeral_%s_%s" % (ephemeral_gb, os_type_with_default)
+            fname = self._get_ephemeral_template_name(
+                ephemeral_gb, 'ephemeral0', instance['os_type'])
             size = ephemeral_gb * 1024 * 1024 * 1024
-            image('disk.local').cache(fetch_func=fn,
-                                      filename=fname,
-                                      size=size,
-                                      ephemeral_size=ephemeral_gb)
+            stages.append(('disk.local',
+                           functools.partial(image('disk.local').cache,
+                                             fetch_func=fn,
+                                             filename=fname,
+                                             size=size,
+                                             ephemeral_size=ephemeral_gb),
+                           ()))
 
         for eph in driver.block_device_info_get_ephemerals(block_device_info):
+            fs_label = 'ephemeral%d' % eph['num']
             fn = functools.partial(self._create_ephemeral,
-                                   fs_label='ephemeral%d' % eph['num'],
+                                   fs_label=fs_label,
                                    os_type=instance["os_type"])
             size = eph['size'] * 1024 * 1024 * 1024
-            fname = "ephemeral_%s_%s" % (eph['size'], os_type_with_default)
-            image(blockinfo.get_eph_disk(eph)).cache(
-                fetch_func=fn,
-                filename=fname,
-                size=size,
-                ephemeral_size=eph['size'])
+            fname = self._get_ephemeral_template_name(
+                eph['size'], fs_label, instance['os_type'])
+            disk_name = blockinfo.get_eph_disk(eph)
+            stages.append((disk_name,
+                           functools.partial(image(disk_name).cache,
+                                             fetch_func=fn,
+                                             filename=fname,
+                                             size=size,
+                                             ephemeral_size=eph['size']),
+                           ()))
 
         if 'disk.swap' in disk_mapping:
             mapping = disk_mapping['disk.swap']
@@ -1923,13 +2039,15 @@ class LibvirtDriver(driver.ComputeDriver):
 
             if swap_mb > 0:
                 size = swap_mb * 1024 * 1024
-                image('disk.swap').cache(fetch_func=self._create_swap,
-                                         filename="swap_%s" % swap_mb,
-                                         size=size,
-                                         swap_mb=swap_mb)
-
-        # Config drive
-        if configdrive.required_by(instance):
+                stages.append(('disk.swap',
+                               functools.partial(image('disk.swap').cache,
+                                                 fetch_func=self._create_swap,
+                                                 filename="swap_%s" % swap_mb,
+                                                 size=size,
+                                                 swap_mb=swap_mb),
+                               ()))
+
+        def create_config_drive():
             LOG.info(_('Using config drive'), instance=instance)
             extra_md = {}
             if admin_pass:
@@ -1950,6 +2068,38 @@ class LibvirtDriver(driver.ComputeDriver):
                                   'with error: %s'),
                                   e, instance=instance)
 
+        def inject_data(key, net, metadata, admin_pass, target_partition):
+            # If we're not using config_drive, inject into root fs
+            injection_path = image('disk').path
+            img_id = instance['image_ref']
+
+            for inj, val in [('key', key),
+                             ('net', net),
+                             ('metadata', metadata),
+                             ('admin_pass', admin_pass),
+                             ('files', files)]:
+                if val:
+                    LOG.info(_('Injecting %(inj)s into image '
+                               '%(img_id)s'),
+                             {'inj': inj, 'img_id': img_id},
+                             instance=instance)
+            try:
+                disk.inject_data(injection_path,
+                                 key, net, metadata, admin_pass, files,
+                                 partition=target_partition,
+                                 use_cow=CONF.use_cow_images,
+                                 mandatory=('files',))
+            except Exception as e:
+                with excutils.save_and_reraise_exception():
+                    LOG.error(_('Error injecting data into image '
+                                '%(img_id)s (%(e)s)'),
+                              {'img_id': img_id, 'e': e},
+                              instance=instance)
+
+        # Config drive
+        if configdrive.required_by(instance):
+            stages.append(('config_drive', create_config_drive, ()))
+
         # File injection
         elif CONF.libvirt_inject_partition != -2:
             target_partition = None
@@ -1973,36 +2123,61 @@ class LibvirtDriver(driver.ComputeDriver):
                 admin_pass = None
 
             if any((key, net, metadata, admin_pass, files)):
-                # If we're not using config_drive, inject into root fs
-                injection_path = image('disk').path
-                img_id = instance['image_ref']
-
-                for inj, val in [('key', key),
-                                 ('net', net),
-                                 ('metadata', metadata),
-                                 ('admin_pass', admin_pass),
-                                 ('files', files)]:
-                    if val:
-                        LOG.info(_('Injecting %(inj)s into image '
-                                   '%(img_id)s'),
-                                 {'inj': inj, 'img_id': img_id},
-                                 instance=instance)
-                try:
-                    disk.inject_data(injection_path,
-                                     key, net, metadata, admin_pass, files,
-                                     partition=target_partition,
-                                     use_cow=CONF.use_cow_images,
-                                     mandatory=('files',))
-                except Exception as e:
-                    with excutils.save_and_reraise_exception():
-                        LOG.error(_('Error injecting data into image '
-                                    '%(img_id)s (%(e)s)'),
-                                  {'img_id': img_id, 'e': e},
-                                  instance=instance)
+                stages.append(('inject',
+                               functools.partial(inject_data, key, net,
+                                                 metadata, admin_pass,
+                                                 target_partition),
+                               [name for name, _func, _needs in stages
+                                if name == 'root']))
+
+        stage_timings = self._run_image_stages(stages)
+        if timings is not None:
+            timings.extend(stage_timings)
 
         if CONF.libvirt_type == 'uml':
             libvirt_utils.chown(image('disk').path, 'root')
 
+    @staticmethod
+    def _run_image_stages(stages):
+        """Run the stages of creating the images of an instance.
+
+        With libvirt_parallel_image_creation each stage starts as soon as
+        the stages it needs are done, so that for example ephemeral disks
+        are formatted while the root disk is being fetched.  When stages
+        fail, the other stages are still waited for, and the error of the
+        first failed stage is raised.
+
+        :param stages: (name, function, names of the stages it needs)
+        :returns: (name, seconds) of the stages, in the order given
+        """
+        durations = {}
+
+        def run(name, func, needs):
+            for need in needs:
+                threads[need].wait()
+            started_at = time.time()
+            func()
+            durations[name] = time.time() - started_at
+
+        if CONF.libvirt_parallel_image_creation:
+            threads = {}
+            for name, func, needs in stages:
+                threads[name] = greenthread.spawn(run, name, func, needs)
+            exc_info = None
+            for name, _func, _needs in stages:
+                try:
+                    threads[name].wait()
+                except Exception:
+                    if exc_info is None:
+                        exc_info = sys.exc_info()
+            if exc_info is not None:
+                raise exc_info[0], exc_info[1], exc_info[2]
+        else:
+            for name, func, _needs in stages:
+                run(name, func, ())
+
+        return [(name, durations[name]) for name, _func, _needs in stages]
+
     def get_host_capabilities(self):
         """Returns an instance of config.LibvirtConfigCaps representing
            the capabilities of the host.
@@ -2757,37 +2932,95 @@ class LibvirtDriver(driver.ComputeDriver):
 
         return info
 
-    def get_vcpu_used(self):
-        """Get vcpu usage number of physical computer.
+    @staticmethod
+    def _get_host_memory_kb_avail():
+        m = open('/proc/meminfo').read().split()
+        idx1 = m.index('MemFree:')
+        idx2 = m.index('Buffers:')
+        idx3 = m.index('Cached:')
+        return int(m[idx1 + 1]) + int(m[idx2 + 1]) + int(m[idx3 + 1])
 
-        :returns: The total number of vcpu that currently used.
+    def _get_domains_usage(self, disks=True):
+        """Collect the usage of all domains in one pass over them.
 
+        :param disks: Also look at the disks of the domains
+        :returns: A dict containing:
+             :vcpus_used: The number of vcpus the running domains use
+             :xen_memory_kb_used: The memory the running domains use under
+                                  xen, in KB
+             :disk_over_committed_size: The size the disks of all domains
+                                        are over committed by
         """
-
-        total = 0
+        usage = {'vcpus_used': 0,
+                 'xen_memory_kb_used': 0,
+                 'disk_over_committed_size': 0}
         if CONF.libvirt_type == 'lxc':
-            return total + 1
+            usage['vcpus_used'] = 1
+        xen_memory = (CONF.libvirt_type == 'xen' and
+                      sys.platform.upper() in ['LINUX2', 'LINUX3'])
 
-        dom_ids = self.list_instance_ids()
-        for dom_id in dom_ids:
+        names = set()
+        for dom_id in self.list_instance_ids():
             try:
                 dom = self._lookup_by_id(dom_id)
-                vcpus = dom.vcpus()
-                if vcpus is None:
-                    LOG.debug(_("couldn't obtain the vpu count from domain id:"
-                                " %s") % dom_id)
-                else:
-                    total += len(vcpus[1])
             except exception.InstanceNotFound:
                 LOG.info(_("libvirt can't find a domain with id: %s") % dom_id)
                 continue
+
+            try:
+                if CONF.libvirt_type != 'lxc':
+                    vcpus = dom.vcpus()
+                    if vcpus is None:
+                        LOG.debug(_("couldn't obtain the vpu count from "
+                                    "domain id: %s") % dom_id)
+                    else:
+                        usage['vcpus_used'] += len(vcpus[1])
+
+                if xen_memory:
+                    dom_mem = int(dom.info()[2])
+                    if dom_id == 0:
+                        # the mem reported by dom0 is be greater of what
+                        # it is being used
+                        dom_mem -= self._get_host_memory_kb_avail()
+                    usage['xen_memory_kb_used'] += dom_mem
+
+                # We skip domains with ID 0 (hypervisors).
+                if disks and dom_id != 0:
+                    name = dom.name()
+                    names.add(name)
+                    usage['disk_over_committed_size'] += (
+                        self._get_disk_over_committed_size(
+                            name, dom.XMLDesc(0)))
+            except libvirt.libvirtError as ex:
+                # The domain went away while it was being looked at
+                LOG.info(_("Error from libvirt while looking at domain id "
+                           "%(dom_id)s: %(ex)s"), {'dom_id': dom_id, 'ex': ex})
             # NOTE(gtt116): give change to do other task.
             greenthread.sleep(0)
-        return total
 
-    def get_memory_mb_used(self):
+        if disks:
+            for name in self._conn.listDefinedDomains():
+                if name not in names:
+                    usage['disk_over_committed_size'] += (
+                        self._get_disk_over_committed_size(name))
+                    greenthread.sleep(0)
+        return usage
+
+    def get_vcpu_used(self):
+        """Get vcpu usage number of physical computer.
+
+        :returns: The total number of vcpu that currently used.
+
+        """
+        if CONF.libvirt_type == 'lxc':
+            return 1
+        return self._get_domains_usage(disks=False)['vcpus_used']
+
+    def get_memory_mb_used(self, usage=None):
         """Get the free memory size(MB) of physical computer.
 
+        :param usage: What _get_domains_usage returned, if the domains
+                      were just looked at already
         :returns: the total usage of memory(MB).
 
         """
@@ -2795,33 +3028,13 @@ class LibvirtDriver(driver.ComputeDriver):
         if sys.platform.upper() not in ['LINUX2', 'LINUX3']:
             return 0
 
-        m = open('/proc/meminfo').read().split()
-        idx1 = m.index('MemFree:')
-        idx2 = m.index('Buffers:')
-        idx3 = m.index('Cached:')
         if CONF.libvirt_type == 'xen':
-            used = 0
-            for domain_id in self.list_instance_ids():
-                try:
-                    dom_mem = int(self._lookup_by_id(domain_id).info()[2])
-                except exception.InstanceNotFound:
-                    LOG.info(_("libvirt can't find a domain with id: %s")
-                             % domain_id)
-                    continue
-                # skip dom0
-                if domain_id != 0:
-                    used += dom_mem
-                else:
-                    # the mem reported by dom0 is be greater of what
-                    # it is being used
-                    used += (dom_mem -
-                             (int(m[idx1 + 1]) +
-                              int(m[idx2 + 1]) +
-                              int(m[idx3 + 1])))
+            if usage is None:
+                usage = self._get_domains_usage(disks=False)
             # Convert it to MB
-            return used / 1024
+            return usage['xen_memory_kb_used'] / 1024
         else:
-            avail = (int(m[idx1 + 1]) + int(m[idx2 + 1]) + int(m[idx3 + 1]))
+            avail = self._get_host_memory_kb_avail()
             # Convert it to MB
             return self.get_memory_mb_total() - avail / 1024
 
@@ -2920,9 +3133,11 @@ class LibvirtDriver(driver.ComputeDriver):
            a given host.
         """
         vol_usage = []
+        snapshot = self._domain_stats.get_snapshot()
 
         for instance_bdms in compute_host_bdms:
             instance = instance_bdms['instance']
+            dom_stats = snapshot.get(instance['name'])
 
             for bdm in instance_bdms['instance_bdms']:
                 vol_stats = []
@@ -2933,7 +3148,12 @@ class LibvirtDriver(driver.ComputeDriver):
 
                 LOG.debug(_("Trying to get stats for the volume %s"),
                             volume_id)
-                vol_stats = self.block_stats(instance['name'], mountpoint)
+                if dom_stats is None:
+                    LOG.info(_('Domain of instance %s is not running. '
+                               'Cannot get block stats for device'),
+                             instance['name'])
+                    continue
+                vol_stats = dom_stats['blocks'].get(mountpoint)
 
                 if vol_stats:
                     stats = dict(volume=volume_id,
@@ -2953,6 +3173,23 @@ class LibvirtDriver(driver.ComputeDriver):
 
         return vol_usage
 
+    def get_all_bw_counters(self, instances):
+        """Return bandwidth usage counters for each interface on each
+           running VM.
+        """
+        snapshot = self._domain_stats.get_snapshot()
+        bw_counters = []
+        for instance in instances:
+            dom_stats = snapshot.get(instance['name'])
+            if dom_stats is None:
+                continue
+            for interface in dom_stats['interfaces'].values():
+                bw_counters.append({'uuid': instance['uuid'],
+                                    'mac_address': interface['mac_address'],
+                                    'bw_in': interface['stats'][0],
+                                    'bw_out': interface['stats'][4]})
+        return bw_counters
+
     def block_stats(self, instance_name, disk):
         """
         Note that this function takes an instance name.
@@ -3019,17 +3256,18 @@ class LibvirtDriver(driver.ComputeDriver):
 
             """
             disk_free_gb = disk_info_dict['free']
-            disk_over_committed = self.get_disk_over_committed_size_total()
+            disk_over_committed = usage['disk_over_committed_size']
             # Disk available least size
             available_least = disk_free_gb * (1024 ** 3) - disk_over_committed
             return (available_least / (1024 ** 3))
 
         disk_info_dict = self.get_local_gb_info()
+        usage = self._get_domains_usage()
         dic = {'vcpus': self.get_vcpu_total(),
                'memory_mb': self.get_memory_mb_total(),
                'local_gb': disk_info_dict['total'],
-               'vcpus_used': self.get_vcpu_used(),
-               'memory_mb_used': self.get_memory_mb_used(),
+               'vcpus_used': usage['vcpus_used'],
+               'memory_mb_used': self.get_memory_mb_used(usage),
                'local_gb_used': disk_info_dict['used'],
                'hypervisor_type': self.get_hypervisor_type(),
                'hypervisor_version': self.get_hypervisor_version(),
@@ -3621,8 +3859,9 @@ class LibvirtDriver(driver.ComputeDriver):
 
             disk_type = driver_nodes[cnt].get('type')
             if disk_type == "qcow2":
-                backing_file = libvirt_utils.get_disk_backing_file(path)
-                virt_size = disk.get_disk_size(path)
+                backing_file = libvirt_utils.get_disk_backing_file(
+                    path, cached=True)
+                virt_size = disk.get_disk_size(path, cached=True)
                 over_commit_size = int(virt_size) - dk_size
             else:
                 backing_file = ""
@@ -3637,27 +3876,33 @@ class LibvirtDriver(driver.ComputeDriver):
                               'over_committed_disk_size': over_commit_size})
         return jsonutils.dumps(disk_info)
 
+    def _get_disk_over_committed_size(self, i_name, xml=None):
+        """Return the over committed disk size of one instance."""
+        # Disk size that the instance uses : virtual_size - disk_size
+        disk_over_committed_size = 0
+        try:
+            disk_infos = jsonutils.loads(
+                    self.get_instance_disk_info(i_name, xml=xml))
+            for info in disk_infos:
+                disk_over_committed_size += int(
+                    info['over_committed_disk_size'])
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                LOG.error(_('Getting disk size of %(i_name)s: %(e)s'),
+                          {'i_name': i_name, 'e': e})
+            else:
+                raise
+        except exception.InstanceNotFound:
+            # Instance was deleted during the check so ignore it
+            pass
+        return disk_over_committed_size
+
     def get_disk_over_committed_size_total(self):
         """Return total over committed disk size for all instances."""
-        # Disk size that all instance uses : virtual_size - disk_size
-        instances_name = self.list_instances()
         disk_over_committed_size = 0
-        for i_name in instances_name:
-            try:
-                disk_infos = jsonutils.loads(
-                        self.get_instance_disk_info(i_name))
-                for info in disk_infos:
-                    disk_over_committed_size += int(
-                        info['over_committed_disk_size'])
-            except OSError as e:
-                if e.errno == errno.ENOENT:
-                    LOG.error(_('Getting disk size of %(i_name)s: %(e)s'),
-                              {'i_name': i_name, 'e': e})
-                else:
-                    raise
-            except exception.InstanceNotFound:
-                # Instance was deleted during the check so ignore it
-                pass
+        for i_name in self.list_instances():
+            disk_over_committed_size += self._get_disk_over_committed_size(
+                i_name)
             # NOTE(gtt116): give change to do other task.
             greenthread.sleep(0)
         return disk_over_committed_size
@@ -3895,23 +4140,6 @@ class LibvirtDriver(driver.ComputeDriver):
         self._cleanup_resize(instance, network_info)
 
     def get_diagnostics(self, instance):
-        def get_io_devices(xml_doc):
-            """get the list of io devices from the xml document."""
-            result = {"volumes": [], "ifaces": []}
-            try:
-                doc = etree.fromstring(xml_doc)
-            except Exception:
-                return result
-            blocks = [('./devices/disk', 'volumes'),
-                ('./devices/interface', 'ifaces')]
-            for block, key in blocks:
-                section = doc.findall(block)
-                for node in section:
-                    for child in node.getchildren():
-                        if child.tag == 'target' and child.get('dev'):
-                            result[key].append(child.get('dev'))
-            return result
-
         domain = self._lookup_by_name(instance['name'])
         output = {}
         # get cpu time, might launch an exception if the method
@@ -3924,9 +4152,8 @@ class LibvirtDriver(driver.ComputeDriver):
         except libvirt.libvirtError:
             pass
         # get io status
-        xml = domain.XMLDesc(0)
-        dom_io = get_io_devices(xml)
-        for disk in dom_io["volumes"]:
+        devices = DomainStats.parse_devices(domain.XMLDesc(0))
+        for disk in devices['disks']:
             try:
                 # blockStats might launch an exception if the method
                 # is not supported by the underlying hypervisor being
@@ -3939,7 +4166,7 @@ class LibvirtDriver(driver.ComputeDriver):
                 output[disk + "_errors"] = stats[4]
             except libvirt.libvirtError:
                 pass
-        for interface in dom_io["ifaces"]:
+        for interface, _mac in devices['interfaces']:
             try:
                 # interfaceStats might launch an exception if the method
                 # is not supported by the underlying hypervisor being
@@ -4031,3 +4258,164 @@ class HostState(object):
         self._stats = data
 
         return data
+
+
+class DomainStats(object):
+    """Collects the usage counters of all running domains in one pass
+    over them, for the usage polls to share.
+
+    The disks and interfaces of a domain are parsed from its XML once
+    each time it is started, which gives it a new ID, and again after
+    the driver attached or detached a device.
+    """
+    def __init__(self, driver):
+        self.driver = driver
+        # uuid -> (domain ID, devices)
+        self._devices = {}
+        self._snapshot = None
+        self._snapshot_time = 0
+
+    @staticmethod
+    def parse_devices(xml):
+        """Return the target devs of the disks, and the target devs and
+        mac addresses of the interfaces, in a domain xml.
+        """
+        devices = {'disks': [], 'interfaces': []}
+        try:
+            doc = etree.fromstring(xml)
+        except Exception:
+            return devices
+        for node in doc.findall('./devices/disk/target'):
+            if node.get('dev'):
+                devices['disks'].append(node.get('dev'))
+        for node in doc.findall('./devices/interface'):
+            target = node.find('target')
+            if target is None or not target.get('dev'):
+                continue
+            mac = node.find('mac')
+            devices['interfaces'].append(
+                (target.get('dev'),
+                 mac.get('address') if mac is not None else None))
+        return devices
+
+    def forget_devices(self, uuid):
+        """Parse the devices of a domain again next time."""
+        self._devices.pop(uuid, None)
+
+    def _get_devices(self, dom):
+        uuid = dom.UUIDString()
+        dom_id = dom.ID()
+        cached = self._devices.get(uuid)
+        if cached is not None and cached[0] == dom_id:
+            return cached[1]
+        devices = self.parse_devices(dom.XMLDesc(0))
+        self._devices[uuid] = (dom_id, devices)
+        return devices
+
+    def _collect_domain(self, dom):
+        devices = self._get_devices(dom)
+        info = dom.info()
+        stats = {'uuid': dom.UUIDString(),
+                 'max_memory': info[1],
+                 'memory': info[2],
+                 'cpu_time': info[4],
+                 'blocks': {},
+                 'interfaces': {}}
+        for disk in devices['disks']:
+            try:
+                stats['blocks'][disk] = dom.blockStats(disk)
+            except libvirt.libvirtError:
+                # blockStats fails for devices without a medium
+                pass
+        for interface, mac in devices['interfaces']:
+            try:
+                stats['interfaces'][interface] = {
+                    'mac_address': mac,
+                    'stats': dom.interfaceStats(interface)}
+            except libvirt.libvirtError:
+                pass
+        return stats
+
+    def _collect_domains(self, conn):
+        snapshot = {}
+        for dom_id in self.driver.list_instance_ids():
+            # We skip domains with ID 0 (hypervisors).
+            if dom_id == 0:
+                continue
+            try:
+                dom = self.driver._lookup_by_id(dom_id)
+                snapshot[dom.name()] = self._collect_domain(dom)
+            except (exception.InstanceNotFound, libvirt.libvirtError) as e:
+                # The domain went away while it was being looked at
+                LOG.debug(_("Could not get the stats of domain id "
+                            "%(dom_id)s: %(e)s"), {'dom_id': dom_id, 'e': e})
+            greenthread.sleep(0)
+        return snapshot
+
+    def _collect_all_domain_stats(self, conn):
+        """Collect the counters of all domains with a single call, on
+        libvirt versions which have virConnectGetAllDomainStats.
+        """
+        stats = 0
+        for name in ('STATE', 'CPU_TOTAL', 'BALLOON', 'INTERFACE', 'BLOCK'):
+            stats |= getattr(libvirt, 'VIR_DOMAIN_STATS_' + name, 0)
+        flags = getattr(libvirt, 'VIR_CONNECT_GET_ALL_DOMAINS_STATS_ACTIVE',
+                        0)
+        snapshot = {}
+        for dom, record in conn.getAllDomainStats(stats, flags):
+            blocks = {}
+            for i in range(record.get('block.count', 0)):
+                prefix = 'block.%d.' % i
+                blocks[record[prefix + 'name']] = tuple(
+                    record.get(prefix + key, -1)
+                    for key in ('rd.reqs', 'rd.bytes', 'wr.reqs',
+                                'wr.bytes', 'errors'))
+            macs = dict(self._get_devices(dom)['interfaces'])
+            interfaces = {}
+            for i in range(record.get('net.count', 0)):
+                prefix = 'net.%d.' % i
+                name = record[prefix + 'name']
+                interfaces[name] = {
+                    'mac_address': macs.get(name),
+                    'stats': tuple(record.get(prefix + key, -1)
+                                   for key in ('rx.bytes', 'rx.pkts',
+                                               'rx.errs', 'rx.drop',
+                                               'tx.bytes', 'tx.pkts',
+                                               'tx.errs', 'tx.drop'))}
+            snapshot[dom.name()] = {
+                'uuid': dom.UUIDString(),
+                'max_memory': record.get('balloon.maximum'),
+                'memory': record.get('balloon.current'),
+                'cpu_time': record.get('cpu.time'),
+                'blocks': blocks,
+                'interfaces': interfaces}
+        return snapshot
+
+    def get_snapshot(self):
+        """Return the usage counters of the running domains, keyed by
+        domain name, collected at most libvirt_domain_stats_max_age
+        seconds ago.
+        """
+        now = time.time()
+        if (self._snapshot is not None and
+                now - self._snapshot_time < CONF.libvirt_domain_stats_max_age):
+            return self._snapshot
+
+        conn = self.driver._conn
+        snapshot = None
+        if hasattr(conn, 'getAllDomainStats'):
+            try:
+                snapshot = self._collect_all_domain_stats(conn)
+            except libvirt.libvirtError as e:
+                LOG.debug(_("Could not get the stats of all domains at "
+                            "once: %s"), e)
+        if snapshot is None:
+            snapshot = self._collect_domains(conn)
+
+        running = set(stats['uuid'] for stats in snapshot.values())
+        for uuid in set(self._devices) - running:
+            del self._devices[uuid]
+
+        self._snapshot = snapshot
+        self._snapshot_time = now
+        return snapshot
@@ -302,6 +302,9 @@ class IptablesFirewallDriver(base_firewall.IptablesFirewallDriver):
             self.network_infos.pop(instance['id'])
             self.remove_filters_for_instance(instance)
             self.iptables.apply()
+            self.instance_security_groups.pop(instance['id'], None)
+            self._forget_unused_security_groups()
+            self.release_ipsets(instance)
             self.nwfilter.unfilter_instance(instance, network_info)
         else:
             LOG.info(_('Attempted to unfilter instance which is not '
@@ -28,6 +28,7 @@ import os
 import re
 import time
 
+import eventlet
 from oslo.config import cfg
 
 from nova.compute import task_states
@@ -35,6 +36,7 @@ from nova.compute import vm_states
 from nova.openstack.common import fileutils
 from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
+from nova.openstack.common import processutils
 from nova import utils
 from nova.virt.libvirt import utils as virtutils
 
@@ -73,6 +75,20 @@ imagecache_opts = [
     cfg.IntOpt('checksum_interval_seconds',
                default=3600,
                help='How frequently to checksum base images'),
+    cfg.IntOpt('checksum_max_mb_per_pass',
+               default=0,
+               help='Maximum number of MB of base images checksummed in '
+                    'one image cache manager pass, the others are '
+                    'checksummed in later passes. 0 means no limit'),
+    cfg.IntOpt('checksum_workers',
+               default=4,
+               help='Number of base images checksummed at the same time, '
+                    'each in its own process'),
+    cfg.StrOpt('image_cache_index_filename_pattern',
+               default='$instances_path/$base_dir_name/'
+                       'imagecache-%(host)s.json',
+               help='Where each compute node writes the state of the base '
+                    'images it found in its last image cache manager pass'),
     ]
 
 CONF = cfg.CONF
@@ -80,6 +96,9 @@ CONF.register_opts(imagecache_opts)
 CONF.import_opt('host', 'nova.netconf')
 CONF.import_opt('instances_path', 'nova.compute.manager')
 
+# The ephemeral and swap disks of an instance
+_BACKED_DISK_RE = re.compile('^disk\.(local|swap|eph[0-9]+)$')
+
 
 def get_cache_fname(images, key):
     """Return a filename based on the SHA1 hash of a given image ID.
@@ -131,6 +150,27 @@ def is_valid_info_file(path):
     return False
 
 
+def get_index_filename(host=None):
+    """Return the name of the index file a compute node writes the state of
+    its image cache to.
+    """
+    return (CONF.image_cache_index_filename_pattern
+            % {'host': host or CONF.host})
+
+
+def read_index(host=None):
+    """Read the index written by the last image cache manager pass of a
+    compute node.
+
+    Returns an empty dictionary if there is no index.
+    """
+    index_file = get_index_filename(host)
+    if not os.path.exists(index_file):
+        return {}
+    with open(index_file, 'r') as f:
+        return _read_possible_json(f.read(), index_file)
+
+
 def _read_possible_json(serialized, info_file):
     try:
         d = jsonutils.loads(serialized)
@@ -228,11 +268,12 @@ def read_stored_checksum(target, timestamped=True):
     return read_stored_info(target, field='sha1', timestamped=timestamped)
 
 
-def write_stored_checksum(target):
+def write_stored_checksum(target, checksum=None):
     """Write a checksum to disk for a file in _base."""
 
-    with open(target, 'r') as img_file:
-        checksum = utils.hash_file(img_file)
+    if checksum is None:
+        with open(target, 'r') as img_file:
+            checksum = utils.hash_file(img_file)
     write_stored_info(target, field='sha1', value=checksum)
 
 
@@ -250,6 +291,11 @@ class ImageCacheManager(object):
 
         self.active_base_files = []
         self.corrupt_base_files = []
+        self.disk_templates = []
+        self.image_users = {}
+        self.checksums = {}
+        self.deferred_checksums = set()
+        self.checksum_results = {}
         self.originals = []
         self.removable_base_files = []
         self.unexplained_images = []
@@ -274,7 +320,12 @@ class ImageCacheManager(object):
         """
         digest_size = hashlib.sha1().digestsize * 2
         for ent in os.listdir(base_dir):
-            if len(ent) == digest_size:
+            if ent.startswith(('ephemeral_', 'swap_')):
+                entpath = os.path.join(base_dir, ent)
+                if os.path.isfile(entpath):
+                    self.disk_templates.append(entpath)
+
+            elif len(ent) == digest_size:
                 self._store_image(base_dir, ent, original=True)
 
             elif (len(ent) > digest_size + 2 and
@@ -321,15 +372,28 @@ class ImageCacheManager(object):
                 self.image_popularity.setdefault(image_ref_str, 0)
                 self.image_popularity[image_ref_str] += 1
 
+    def _list_instance_disks(self, instance_dir):
+        """List the disks of an instance which may have a backing file."""
+        disks = ['disk']
+        if self.disk_templates:
+            # Ephemeral and swap disks are backed by templates
+            disks.extend(ent for ent in os.listdir(instance_dir)
+                         if _BACKED_DISK_RE.match(ent))
+        return disks
+
     def _list_backing_images(self):
         """List the backing images currently in use."""
         inuse_images = []
         for ent in os.listdir(CONF.instances_path):
             if ent in self.instance_names:
                 LOG.debug(_('%s is a valid instance name'), ent)
-                disk_path = os.path.join(CONF.instances_path, ent, 'disk')
-                if os.path.exists(disk_path):
-                    LOG.debug(_('%s has a disk file'), ent)
+                instance_dir = os.path.join(CONF.instances_path, ent)
+                for disk_name in self._list_instance_disks(instance_dir):
+                    disk_path = os.path.join(instance_dir, disk_name)
+                    if not os.path.exists(disk_path):
+                        continue
+                    LOG.debug(_('%(instance)s has a %(disk)s file'),
+                              {'instance': ent, 'disk': disk_name})
                     backing_file = virtutils.get_disk_backing_file(disk_path)
                     LOG.debug(_('Instance %(instance)s is backed by '
                                 '%(backing)s'),
@@ -342,6 +406,9 @@ class ImageCacheManager(object):
                                                     backing_file)
                         if backing_path not in inuse_images:
                             inuse_images.append(backing_path)
+                        users = self.image_users.setdefault(backing_path, [])
+                        if ent not in users:
+                            users.append(ent)
 
                         if backing_path in self.unexplained_images:
                             LOG.warning(_('Instance %(instance)s is using a '
@@ -409,14 +476,23 @@ class ImageCacheManager(object):
                         CONF.checksum_interval_seconds):
                     return True
 
+                if base_file in self.deferred_checksums:
+                    LOG.debug(_('image %(id)s at (%(base_file)s): image '
+                                'verification deferred to a later pass'),
+                              {'id': img_id,
+                               'base_file': base_file})
+                    return None
+
                 # NOTE(mikal): If there is no timestamp, then the checksum was
                 # performed by a previous version of the code.
                 if not stored_timestamp:
                     write_stored_info(base_file, field='sha1',
                                       value=stored_checksum)
 
-                with open(base_file, 'r') as f:
-                    current_checksum = utils.hash_file(f)
+                current_checksum = self.checksums.get(base_file)
+                if current_checksum is None:
+                    with open(base_file, 'r') as f:
+                        current_checksum = utils.hash_file(f)
 
                 if current_checksum != stored_checksum:
                     LOG.error(_('image %(id)s at (%(base_file)s): image '
@@ -437,16 +513,81 @@ class ImageCacheManager(object):
                 # NOTE(mikal): If the checksum file is missing, then we should
                 # create one. We don't create checksums when we download images
                 # from glance because that would delay VM startup.
-                if CONF.checksum_base_images and create_if_missing:
+                if base_file in self.deferred_checksums:
+                    LOG.debug(_('%(id)s (%(base_file)s): checksum deferred '
+                                'to a later pass'),
+                              {'id': img_id,
+                               'base_file': base_file})
+                elif CONF.checksum_base_images and create_if_missing:
                     LOG.info(_('%(id)s (%(base_file)s): generating checksum'),
                              {'id': img_id,
                               'base_file': base_file})
-                    write_stored_checksum(base_file)
+                    write_stored_checksum(base_file,
+                                          self.checksums.get(base_file))
 
                 return None
 
         return inner_verify_checksum()
 
+    def _hash_base_file(self, base_file):
+        """Hash a base file in a sha1sum process, so that neither the time
+        spent hashing nor the reads block other greenthreads.
+
+        Returns None if the base file could not be hashed.
+        """
+        try:
+            out, _err = utils.execute('sha1sum', base_file)
+            return out.split()[0]
+        except (processutils.ProcessExecutionError, IndexError) as e:
+            LOG.warning(_('Failed to checksum %(base_file)s: %(error)s'),
+                        {'base_file': base_file, 'error': e})
+            return None
+
+    def _checksum_base_files(self, base_files):
+        """Hash the base files due to be checksummed, several at a time.
+
+        The files checksummed longest ago come first. Once
+        checksum_max_mb_per_pass is reached the remaining files are left
+        for later passes, and _verify_checksum skips them.
+        """
+        if not CONF.checksum_base_images:
+            return
+
+        due = []
+        for base_file in set(base_files):
+            if not os.path.isfile(base_file):
+                continue
+            stored_timestamp = read_stored_checksum(base_file,
+                                                    timestamped=True)[1]
+            if (stored_timestamp and time.time() - stored_timestamp <
+                    CONF.checksum_interval_seconds):
+                continue
+            due.append((stored_timestamp or 0, base_file))
+
+        max_bytes = CONF.checksum_max_mb_per_pass * 1024 * 1024
+        total_bytes = 0
+        to_hash = []
+        for _stored_timestamp, base_file in sorted(due):
+            size = os.path.getsize(base_file)
+            if max_bytes and to_hash and total_bytes + size > max_bytes:
+                self.deferred_checksums.add(base_file)
+                continue
+            total_bytes += size
+            to_hash.append(base_file)
+
+        if self.deferred_checksums:
+            LOG.info(_('Checksumming %(count)d base images, %(deferred)d '
+                       'deferred to later passes'),
+                     {'count': len(to_hash),
+                      'deferred': len(self.deferred_checksums)})
+
+        pool = eventlet.GreenPool(max(1, CONF.checksum_workers))
+        for base_file, checksum in zip(to_hash,
+                                       pool.imap(self._hash_base_file,
+                                                 to_hash)):
+            if checksum:
+                self.checksums[base_file] = checksum
+
     def _remove_base_file(self, base_file):
         """Remove a single base file if it is old enough.
 
@@ -498,6 +639,7 @@ class ImageCacheManager(object):
             # _verify_checksum returns True if the checksum is ok, and None if
             # there is no checksum file
             checksum_result = self._verify_checksum(img_id, base_file)
+            self.checksum_results[base_file] = checksum_result
             if checksum_result is not None:
                 image_bad = not checksum_result
 
@@ -560,7 +702,9 @@ class ImageCacheManager(object):
         # in bytes). This second file is then CoW'd to the instance disk. If
         # CoW is disabled, the resize occurs as part of the copy from the
         # cache to the instance directory. Files ending in _sm are no longer
-        # created, but may remain from previous versions.
+        # created, but may remain from previous versions. Ephemeral and swap
+        # disks are made from templates named after how they are formatted
+        # (ephemeral_* and swap_*), which are removed once unused.
         self._reset_state()
 
         base_dir = os.path.join(CONF.instances_path, CONF.base_dir_name)
@@ -573,6 +717,14 @@ class ImageCacheManager(object):
         self._list_base_images(base_dir)
         self._list_running_instances(context, all_instances)
 
+        # Hash the base images of the images in use up front, so that they
+        # can be hashed several at a time
+        if CONF.checksum_base_images:
+            self._checksum_base_files(
+                [result[0] for img in self.used_images
+                 for result in self._find_base_file(
+                     base_dir, hashlib.sha1(img).hexdigest())])
+
         # Determine what images are on disk because they're in use
         for img in self.used_images:
             fingerprint = hashlib.sha1(img).hexdigest()
@@ -581,6 +733,9 @@ class ImageCacheManager(object):
                        'fingerprint': fingerprint})
             for result in self._find_base_file(base_dir, fingerprint):
                 base_file, image_small, image_resized = result
+                users = self.image_users.setdefault(base_file, [])
+                users.extend(name for name in self.used_images[img][2]
+                             if name not in users)
                 self._handle_base_image(img, base_file)
 
                 if not image_small and not image_resized:
@@ -592,6 +747,14 @@ class ImageCacheManager(object):
             if backing_path not in self.active_base_files:
                 self.active_base_files.append(backing_path)
 
+        # Templates of ephemeral and swap disks age from when they were last
+        # used, like resized images
+        for template in self.disk_templates:
+            if template in inuse_backing_images:
+                os.utime(template, None)
+            else:
+                self.removable_base_files.append(template)
+
         # Anything left is an unknown base image
         for img in self.unexplained_images:
             LOG.warning(_('Unknown base file: %s'), img)
@@ -613,5 +776,59 @@ class ImageCacheManager(object):
                 for base_file in self.removable_base_files:
                     self._remove_base_file(base_file)
 
+        self._write_index(base_dir)
+
         # That's it
         LOG.debug(_('Verification complete'))
+
+    def _write_index(self, base_dir):
+        """Write the state of the base images found in this pass, for
+        nova-manage imagecache report.
+        """
+        images = {}
+        for base_file in set(self.active_base_files +
+                             self.removable_base_files +
+                             self.corrupt_base_files +
+                             self.disk_templates):
+            if not base_file:
+                continue
+            try:
+                st = os.stat(base_file)
+            except OSError:
+                # Removed in this pass
+                continue
+
+            if base_file in self.corrupt_base_files:
+                state = 'corrupt'
+            elif base_file in self.active_base_files:
+                state = 'active'
+            else:
+                state = 'unused'
+
+            checksum = self.checksum_results.get(base_file)
+            if base_file in self.deferred_checksums:
+                checksum = 'deferred'
+            elif checksum is not None:
+                checksum = checksum and 'ok' or 'failed'
+
+            images[os.path.basename(base_file)] = {
+                'state': state,
+                'size': st.st_size,
+                'last_used': st.st_mtime,
+                'checksum': checksum,
+                'instances': sorted(self.image_users.get(base_file, [])),
+                }
+
+        index = {'host': CONF.host,
+                 'base_dir': base_dir,
+                 'updated_at': time.time(),
+                 'images': images}
+        index_file = get_index_filename()
+        try:
+            with open(index_file + '.tmp', 'w') as f:
+                f.write(jsonutils.dumps(index))
+            os.rename(index_file + '.tmp', index_file)
+        except (IOError, OSError) as e:
+            LOG.warning(_('Failed to write image cache index %(index)s: '
+                          '%(error)s'),
+                        {'index': index_file, 'error': e})
@@ -407,13 +407,14 @@ def get_disk_size(path):
     return int(size)
 
 
-def get_disk_backing_file(path, basename=True):
+def get_disk_backing_file(path, basename=True, cached=False):
     """Get the backing file of a disk image
 
     :param path: Path to the disk image
+    :param cached: Reuse the qemu-img info of an unchanged image
     :returns: a path to the image's backing store
     """
-    backing_file = images.qemu_img_info(path).backing_file
+    backing_file = images.qemu_img_info(path, cached=cached).backing_file
     if backing_file and basename:
         backing_file = os.path.basename(backing_file)
 
@@ -33,6 +33,9 @@ class Dom0IptablesFirewallDriver(firewall.IptablesFirewallDriver):
     using iptables. This class is meant to be used with the xenapi
     backend and uses xenapi plugin to enforce iptables rules in dom0.
     """
+    # The plugin only runs iptables in dom0
+    supports_ipsets = False
+
     def _plugin_execute(self, *cmd, **kwargs):
         # Prepare arguments for plugin call
         args = {}
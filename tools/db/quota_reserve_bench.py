@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Measure quota reservations per second under contention.
+
+A number of worker processes reserve and roll back an instance's worth of
+quota in a loop, all in the same project, the way concurrent boots in one
+large project do.  Compare the default reservations, which lock all of the
+project's usages, with --conditional ones:
+
+    tools/db/quota_reserve_bench.py --config-file /etc/nova/nova.conf \\
+        --workers 16 --duration 30
+    tools/db/quota_reserve_bench.py --config-file /etc/nova/nova.conf \\
+        --workers 16 --duration 30 --conditional
+
+Point it at a scratch database.  The usages and reservations of the
+benchmark project are deleted when it finishes.
+"""
+
+import gettext
+import multiprocessing
+import os
+import sys
+import time
+
+possible_topdir = os.path.normpath(os.path.join(os.path.abspath(__file__),
+                                                os.pardir,
+                                                os.pardir,
+                                                os.pardir))
+if os.path.exists(os.path.join(possible_topdir, 'nova', '__init__.py')):
+    sys.path.insert(0, possible_topdir)
+
+gettext.install('nova', unicode=1)
+
+from oslo.config import cfg
+
+from nova import config
+from nova import context
+from nova import db
+from nova import exception
+from nova.openstack.common.db.sqlalchemy import session as db_session
+from nova import quota
+
+bench_opts = [
+    cfg.IntOpt('workers',
+               default=8,
+               help='Number of processes reserving at the same time'),
+    cfg.IntOpt('duration',
+               default=10,
+               help='Number of seconds to run for'),
+    cfg.StrOpt('project',
+               default='quota-reserve-bench',
+               help='Project to reserve quota in'),
+    cfg.BoolOpt('conditional',
+                default=False,
+                help='Reserve with quota_reserve_conditional'),
+    ]
+
+CONF = cfg.CONF
+CONF.register_cli_opts(bench_opts)
+
+QUOTAS = quota.QUOTAS
+
+
+def reserve(ctxt):
+    return QUOTAS.reserve(ctxt, project_id=CONF.project,
+                          instances=1, cores=1, ram=512)
+
+
+def worker(deadline, results):
+    ctxt = context.get_admin_context()
+    done = over = failed = 0
+    while time.time() < deadline:
+        try:
+            reservations = reserve(ctxt)
+        except exception.OverQuota:
+            over += 1
+            continue
+        except Exception:
+            failed += 1
+            continue
+        QUOTAS.rollback(ctxt, reservations, project_id=CONF.project)
+        done += 1
+    results.put((done, over, failed))
+
+
+def main():
+    config.parse_args(sys.argv)
+    # Leave enough headroom that every worker can hold a reservation, so
+    # the limits are checked but never hit.
+    CONF.set_override('quota_instances', CONF.workers * 2)
+    CONF.set_override('quota_cores', CONF.workers * 2)
+    CONF.set_override('quota_ram', CONF.workers * 1024)
+    CONF.set_override('quota_conditional_reserve', CONF.conditional)
+
+    ctxt = context.get_admin_context()
+    # Create the usages up front, so that the workers measure the steady
+    # state rather than the first reservations.
+    QUOTAS.rollback(ctxt, reserve(ctxt), project_id=CONF.project)
+    # Each worker needs its own database connections.
+    db_session.cleanup()
+
+    results = multiprocessing.Queue()
+    deadline = time.time() + CONF.duration
+    workers = [multiprocessing.Process(target=worker,
+                                       args=(deadline, results))
+               for _i in range(CONF.workers)]
+    for proc in workers:
+        proc.start()
+    totals = [sum(counts) for counts in
+              zip(*[results.get() for proc in workers])]
+    for proc in workers:
+        proc.join()
+
+    db.quota_destroy_all_by_project(ctxt, CONF.project)
+
+    done, over, failed = totals
+    print '%s reservations, %d workers, %ds' % (
+        'conditional' if CONF.conditional else 'locking',
+        CONF.workers, CONF.duration)
+    print '  reserved:    %d (%.1f/s)' % (done, float(done) / CONF.duration)
+    print '  over quota:  %d' % over
+    print '  failed:      %d' % failed
+
+
+if __name__ == '__main__':
+    main()
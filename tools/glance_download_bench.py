@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Measure image download throughput from glance.
+
+A number of local servers answer the image requests of the glance v1 api
+for a generated image, each connection limited to --rate MB/s the way a
+single stream from a real glance api server is limited by its store and
+the network.  The image is downloaded to a file the way nova-compute
+fetches images into its cache, first in one piece and then in ranges
+with glance_download_parallelism set to --parallelism:
+
+    tools/glance_download_bench.py --servers 2 --size 512 --rate 50 \\
+        --parallelism 8
+"""
+
+import BaseHTTPServer
+import gettext
+import hashlib
+import multiprocessing
+import os
+import shutil
+import socket
+import SocketServer
+import sys
+import tempfile
+import time
+
+possible_topdir = os.path.normpath(os.path.join(os.path.abspath(__file__),
+                                                os.pardir,
+                                                os.pardir))
+if os.path.exists(os.path.join(possible_topdir, 'nova', '__init__.py')):
+    sys.path.insert(0, possible_topdir)
+
+gettext.install('nova', unicode=1)
+
+from oslo.config import cfg
+
+from nova import config
+from nova import context
+from nova.image import glance
+
+bench_opts = [
+    cfg.IntOpt('servers',
+               default=2,
+               help='Number of glance api servers to start'),
+    cfg.IntOpt('size',
+               default=256,
+               help='Size of the image in MB'),
+    cfg.IntOpt('rate',
+               default=50,
+               help='MB/s each connection to a server is limited to'),
+    cfg.IntOpt('parallelism',
+               default=8,
+               help='Number of ranges to download at the same time'),
+    ]
+
+CONF = cfg.CONF
+CONF.register_cli_opts(bench_opts)
+
+IMAGE_ID = 'glance-download-bench'
+CHUNK_SIZE = 64 * 1024
+
+
+class ThreadedHTTPServer(SocketServer.ThreadingMixIn,
+                         BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class ImageHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _send_meta(self, status, length):
+        image = self.server.image
+        self.send_response(status)
+        self.send_header('Content-Length', str(length))
+        self.send_header('Content-Type', 'application/octet-stream')
+        for key, value in (('id', IMAGE_ID),
+                           ('name', IMAGE_ID),
+                           ('size', image['size']),
+                           ('checksum', image['checksum']),
+                           ('status', 'active'),
+                           ('is_public', 'True'),
+                           ('deleted', 'False'),
+                           ('protected', 'False'),
+                           ('disk_format', 'raw'),
+                           ('container_format', 'bare')):
+            self.send_header('x-image-meta-%s' % key, value)
+
+    def do_HEAD(self):
+        self._send_meta(200, 0)
+        self.end_headers()
+
+    def do_GET(self):
+        size = self.server.image['size']
+        start, end = 0, size - 1
+        if 'Range' in self.headers:
+            start, end = [int(offset) for offset in
+                          self.headers['Range'][len('bytes='):].split('-')]
+            self._send_meta(206, end - start + 1)
+            self.send_header('Content-Range',
+                             'bytes %d-%d/%d' % (start, end, size))
+        else:
+            self._send_meta(200, size)
+        self.end_headers()
+
+        min_chunk_time = float(CHUNK_SIZE) / (CONF.rate * 1024 * 1024)
+        with open(self.server.image['path'], 'rb') as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining:
+                started_at = time.time()
+                chunk = f.read(min(remaining, CHUNK_SIZE))
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+                elapsed = time.time() - started_at
+                if elapsed < min_chunk_time:
+                    time.sleep(min_chunk_time - elapsed)
+
+
+def serve(sock, image):
+    server = ThreadedHTTPServer(sock.getsockname(), ImageHandler,
+                                bind_and_activate=False)
+    server.socket = sock
+    server.image = image
+    server.serve_forever()
+
+
+def make_image(path):
+    md5 = hashlib.md5()
+    with open(path, 'wb') as f:
+        for _i in xrange(CONF.size):
+            data = os.urandom(1024 * 1024)
+            md5.update(data)
+            f.write(data)
+    return {'path': path, 'size': CONF.size * 1024 * 1024,
+            'checksum': md5.hexdigest()}
+
+
+def measure(name, service, ctxt, path):
+    if os.path.exists(path):
+        os.unlink(path)
+    started_at = time.time()
+    service.download(ctxt, IMAGE_ID, dst_path=path)
+    elapsed = time.time() - started_at
+    print '  %-24s %6.2fs %8.1f MB/s' % (name, elapsed, CONF.size / elapsed)
+
+
+def main():
+    config.parse_args(sys.argv)
+    tmpdir = tempfile.mkdtemp()
+    servers = []
+    try:
+        image = make_image(os.path.join(tmpdir, 'image'))
+        api_servers = []
+        for _i in range(CONF.servers):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(('127.0.0.1', 0))
+            sock.listen(128)
+            api_servers.append('127.0.0.1:%d' % sock.getsockname()[1])
+            proc = multiprocessing.Process(target=serve, args=(sock, image))
+            proc.daemon = True
+            proc.start()
+            servers.append(proc)
+            sock.close()
+
+        # The servers have been forked, the download runs in greenthreads
+        # like it does in nova-compute.
+        import eventlet
+        eventlet.monkey_patch(os=False)
+
+        CONF.set_override('glance_api_servers', api_servers)
+        CONF.set_override('auth_strategy', 'noauth')
+        ctxt = context.get_admin_context()
+        service = glance.GlanceImageService()
+        path = os.path.join(tmpdir, 'image.part')
+
+        print '%d MB image, %d servers, %d MB/s per connection' % (
+            CONF.size, CONF.servers, CONF.rate)
+        CONF.set_override('glance_download_parallelism', 1)
+        measure('single stream', service, ctxt, path)
+        CONF.set_override('glance_download_parallelism', CONF.parallelism)
+        measure('%d ranges at a time' % CONF.parallelism, service, ctxt,
+                path)
+    finally:
+        for proc in servers:
+            proc.terminate()
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
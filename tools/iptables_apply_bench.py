@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Measure how long IptablesManager takes to apply a change to one chain.
+
+Instance chains with a number of rules each are set up the way the
+iptables firewall driver sets them up, then one instance's rules are
+changed and applied, once restoring the whole tables and once with
+iptables_incremental_apply.  iptables itself is not run, the time is what
+nova spends building the input of iptables-restore, and the size of that
+input is what iptables-restore has to parse and load into the kernel:
+
+    tools/iptables_apply_bench.py --instances 100 --instances 1000
+"""
+
+import gettext
+import os
+import sys
+import time
+
+possible_topdir = os.path.normpath(os.path.join(os.path.abspath(__file__),
+                                                os.pardir,
+                                                os.pardir))
+if os.path.exists(os.path.join(possible_topdir, 'nova', '__init__.py')):
+    sys.path.insert(0, possible_topdir)
+
+gettext.install('nova', unicode=1)
+
+from oslo.config import cfg
+
+from nova import config
+from nova.network import linux_net
+
+bench_opts = [
+    cfg.MultiStrOpt('instances',
+                    default=['10', '100', '1000'],
+                    help='Number of instance chains, may be repeated'),
+    cfg.IntOpt('rules',
+               default=20,
+               help='Number of rules in each instance chain'),
+    cfg.IntOpt('iterations',
+               default=5,
+               help='Number of applies to average over'),
+    ]
+
+CONF = cfg.CONF
+CONF.register_cli_opts(bench_opts)
+
+
+class FakeIptables(object):
+    """Remembers what was last restored, and returns it when saved."""
+
+    def __init__(self):
+        self.saved = ''
+        self.restored_bytes = 0
+
+    def execute(self, *cmd, **kwargs):
+        if cmd[0].endswith('-save'):
+            return self.saved, ''
+        process_input = kwargs['process_input']
+        self.restored_bytes = len(process_input)
+        if '--noflush' not in cmd:
+            self.saved = process_input
+        return '', ''
+
+
+def build(num_instances):
+    iptables = FakeIptables()
+    manager = linux_net.IptablesManager(execute=iptables.execute)
+    table = manager.ipv4['filter']
+    for i in xrange(num_instances):
+        chain = 'inst-%d' % i
+        table.add_chain(chain)
+        table.add_rule('local', '-d 10.%d.%d.%d -j $%s' % (
+            i >> 16, (i >> 8) & 255, i & 255, chain))
+        for j in xrange(CONF.rules):
+            table.add_rule(chain, '-s 192.168.%d.0/24 -p tcp --dport %d '
+                           '-j ACCEPT' % (j & 255, 1000 + j))
+        table.add_rule(chain, '-j $sg-fallback')
+    table.add_chain('sg-fallback')
+    table.add_rule('sg-fallback', '-j DROP')
+    manager.apply()
+    return manager, iptables
+
+
+def measure(manager, iptables):
+    table = manager.ipv4['filter']
+    elapsed = 0
+    for i in xrange(CONF.iterations):
+        rule = '-s 172.16.0.%d -j ACCEPT' % i
+        table.add_rule('inst-0', rule)
+        started_at = time.time()
+        manager.apply()
+        elapsed += time.time() - started_at
+        table.remove_rule('inst-0', rule)
+        manager.apply()
+    return elapsed / CONF.iterations, iptables.restored_bytes
+
+
+def main():
+    config.parse_args(sys.argv)
+    CONF.set_override('use_ipv6', False)
+    print '%d rules per instance chain, changing one chain' % CONF.rules
+    print '%10s %8s  %18s  %18s' % ('instances', 'rules', 'whole tables',
+                                    'changed chains')
+    for num_instances in [int(n) for n in CONF.instances]:
+        results = []
+        for incremental in (False, True):
+            CONF.set_override('iptables_incremental_apply', incremental)
+            results += measure(*build(num_instances))
+        print '%10d %8d  %7.3fs %8dB  %7.3fs %8dB' % (
+            (num_instances, num_instances * (CONF.rules + 2)) +
+            tuple(results))
+
+
+if __name__ == '__main__':
+    main()
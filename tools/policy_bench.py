@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Measure policy checks per second.
+
+Each of the given actions is checked against a project's own target the
+way the API does, first by walking the parsed check tree with
+openstack.common.policy.check(), then with the compiled rules, and
+finally through nova.policy.enforce(), which also remembers decisions
+for the request context:
+
+    tools/policy_bench.py --config-file /etc/nova/nova.conf \\
+        --action compute:get --action compute_extension:extended_status
+"""
+
+import gettext
+import os
+import sys
+import time
+
+possible_topdir = os.path.normpath(os.path.join(os.path.abspath(__file__),
+                                                os.pardir,
+                                                os.pardir))
+if os.path.exists(os.path.join(possible_topdir, 'nova', '__init__.py')):
+    sys.path.insert(0, possible_topdir)
+
+gettext.install('nova', unicode=1)
+
+from oslo.config import cfg
+
+from nova import config
+from nova import context
+from nova.openstack.common import policy as common_policy
+from nova import policy
+
+bench_opts = [
+    cfg.MultiStrOpt('action',
+                    default=['compute:get',
+                             'compute_extension:extended_status',
+                             'compute_extension:extended_server_attributes'],
+                    help='Action to check, may be repeated'),
+    cfg.IntOpt('iterations',
+               default=100000,
+               help='Number of checks of each kind to make'),
+    cfg.ListOpt('roles',
+                default=['member'],
+                help='Roles of the user making the checks'),
+    ]
+
+CONF = cfg.CONF
+CONF.register_cli_opts(bench_opts)
+
+
+def measure(name, func):
+    actions = CONF.action
+    started_at = time.time()
+    for i in xrange(CONF.iterations):
+        func(actions[i % len(actions)])
+    elapsed = time.time() - started_at
+    print '  %-14s %10.0f checks/s' % (name, CONF.iterations / elapsed)
+
+
+def main():
+    config.parse_args(sys.argv)
+    policy.init()
+
+    ctxt = context.RequestContext('bench-user', 'bench-project',
+                                  roles=CONF.roles)
+    target = {'project_id': ctxt.project_id, 'user_id': ctxt.user_id}
+
+    print '%d checks of %s' % (CONF.iterations, ', '.join(CONF.action))
+    measure('check tree',
+            lambda action: common_policy.check(action, target,
+                                               ctxt.to_dict()))
+    measure('compiled',
+            lambda action: policy._compiled_rule(action)(target,
+                                                         ctxt.to_dict()))
+    measure('enforce',
+            lambda action: policy.enforce(ctxt, action, target,
+                                          do_raise=False))
+
+
+if __name__ == '__main__':
+    main()